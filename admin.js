@@ -4,12 +4,19 @@ const API_URL = 'http://localhost:5000/api';
 // Estado de la aplicación
 let userToken = localStorage.getItem('userToken') || null;
 let currentUser = JSON.parse(localStorage.getItem('currentUser')) || null;
+let refreshToken = localStorage.getItem('refreshToken') || null;
 let currentFilter = 'todos';
 let categorias = [];
 let productos = [];
 let pedidos = [];
+let siguienteCursorPedidos = null;
+let secuenciaPedidos = null;
+let siguiendoNovedades = false;
 
-document.addEventListener('DOMContentLoaded', function() {
+document.addEventListener('DOMContentLoaded', async function() {
+    // Renovar la sesión guardada antes de comprobar los permisos
+    await refrescarSesion();
+    
     // Verificar autenticación y permisos de admin
     if (!userToken || !currentUser || !currentUser.es_admin) {
         showNotification('Acceso denegado. Debes ser administrador.', 'error');
@@ -110,9 +117,34 @@ function switchSection(section) {
     }
 }
 
+async function refrescarSesion() {
+    if (!refreshToken) return;
+    try {
+        const response = await fetch(`${API_URL}/token/refrescar`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ refresh_token: refreshToken })
+        });
+        if (response.ok) {
+            const data = await response.json();
+            userToken = data.token;
+            currentUser = data.usuario;
+            refreshToken = data.refresh_token;
+            localStorage.setItem('userToken', userToken);
+            localStorage.setItem('currentUser', JSON.stringify(currentUser));
+            localStorage.setItem('refreshToken', refreshToken);
+        }
+    } catch (error) {
+        console.error('Error al renovar la sesión:', error);
+    }
+}
+
 function logout() {
     localStorage.removeItem('userToken');
     localStorage.removeItem('currentUser');
+    localStorage.removeItem('refreshToken');
     showNotification('Sesión cerrada exitosamente', 'success');
     setTimeout(() => {
         window.location.href = 'index.html';
@@ -148,14 +180,17 @@ async function cargarEstadisticas() {
 
 // ==================== PEDIDOS ====================
 
-async function cargarPedidos() {
+async function cargarPedidos(cargarMas = false) {
     try {
-        let url = `${API_URL}/admin/pedidos`;
+        const params = new URLSearchParams();
         if (currentFilter !== 'todos') {
-            url += `?estado=${currentFilter}`;
+            params.set('estado', currentFilter);
+        }
+        if (cargarMas && siguienteCursorPedidos) {
+            params.set('cursor', siguienteCursorPedidos);
         }
         
-        const response = await fetch(url, {
+        const response = await fetch(`${API_URL}/admin/pedidos?${params}`, {
             headers: {
                 'Authorization': `Bearer ${userToken}`
             }
@@ -163,7 +198,13 @@ async function cargarPedidos() {
         
         if (!response.ok) throw new Error('Error al cargar pedidos');
         
-        pedidos = await response.json();
+        const data = await response.json();
+        pedidos = cargarMas ? pedidos.concat(data.pedidos) : data.pedidos;
+        siguienteCursorPedidos = data.siguiente_cursor;
+        if (!cargarMas) {
+            secuenciaPedidos = data.seq;
+            seguirNovedadesPedidos();
+        }
         renderPedidos();
         
     } catch (error) {
@@ -172,6 +213,91 @@ async function cargarPedidos() {
     }
 }
 
+// Después de la primera carga solo llegan los pedidos que cambiaron, por server-sent events.
+// Se lee con fetch (EventSource no permite mandar el token); cuando el servidor cierra el flujo
+// se vuelve a conectar tras el "retry" que indicó, desde la última secuencia recibida
+async function seguirNovedadesPedidos() {
+    if (siguiendoNovedades) return;
+    siguiendoNovedades = true;
+    let reintento = 2000;
+    
+    while (userToken && secuenciaPedidos !== null) {
+        try {
+            const response = await fetch(`${API_URL}/admin/pedidos/novedades/stream?since=${secuenciaPedidos}`, {
+                headers: {
+                    'Authorization': `Bearer ${userToken}`
+                }
+            });
+            
+            if (response.status === 401 || response.status === 403) break;
+            if (!response.ok) throw new Error('Error al recibir novedades');
+            
+            const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+            let pendiente = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                const mensajes = (pendiente + value).split('\n\n');
+                pendiente = mensajes.pop();
+                const eventos = [];
+                for (const mensaje of mensajes) {
+                    const campos = leerMensajeSSE(mensaje);
+                    if (campos.retry) reintento = parseInt(campos.retry);
+                    if (campos.event === 'pedido') eventos.push(JSON.parse(campos.data));
+                    if (campos.event === 'recargar') await cargarPedidos();
+                }
+                if (eventos.length) aplicarNovedadesPedidos(eventos);
+            }
+            
+        } catch (error) {
+            console.error('Error:', error);
+            reintento = Math.max(reintento, 5000);
+        }
+        await new Promise(resolve => setTimeout(resolve, reintento));
+    }
+    siguiendoNovedades = false;
+}
+
+function leerMensajeSSE(mensaje) {
+    const campos = {};
+    mensaje.split('\n').forEach(linea => {
+        const separador = linea.indexOf(':');
+        if (separador <= 0) return;
+        const valor = linea.slice(separador + 1).replace(/^ /, '');
+        const campo = linea.slice(0, separador);
+        campos[campo] = campo === 'data' && campos.data !== undefined ? `${campos.data}\n${valor}` : valor;
+    });
+    return campos;
+}
+
+function compararPedidos(a, b) {
+    return b.fecha.localeCompare(a.fecha) || b.id - a.id;
+}
+
+function aplicarNovedadesPedidos(eventos) {
+    eventos.forEach(evento => {
+        secuenciaPedidos = Math.max(secuenciaPedidos, evento.seq);
+        const pedidoId = evento.pedido ? evento.pedido.id : evento.pedido_id;
+        const indice = pedidos.findIndex(p => p.id === pedidoId);
+        const visible = evento.pedido && (currentFilter === 'todos' || evento.pedido.estado === currentFilter);
+        if (!visible) {
+            if (indice >= 0) pedidos.splice(indice, 1);
+        } else if (indice >= 0) {
+            pedidos[indice] = evento.pedido;
+        } else if (!siguienteCursorPedidos || pedidos.length === 0 || compararPedidos(evento.pedido, pedidos[pedidos.length - 1]) < 0) {
+            // Uno más viejo que la última página cargada llegará con "Cargar más"
+            pedidos.push(evento.pedido);
+            pedidos.sort(compararPedidos);
+        }
+        Object.entries(evento.stock || {}).forEach(([productoId, stock]) => {
+            const producto = productos.find(p => p.id === Number(productoId));
+            if (producto) producto.stock = stock;
+        });
+    });
+    renderPedidos();
+    if (eventos.some(evento => evento.stock && Object.keys(evento.stock).length)) renderProductos();
+}
+
 function renderPedidos() {
     const container = document.getElementById('pedidos-container');
     
@@ -211,6 +337,14 @@ function renderPedidos() {
         `;
     });
     
+    if (siguienteCursorPedidos) {
+        html += `
+            <button class="btn-secondary" onclick="cargarPedidos(true)">
+                <i class="fas fa-chevron-down"></i> Cargar más pedidos
+            </button>
+        `;
+    }
+    
     container.innerHTML = html;
 }
 
@@ -262,7 +396,8 @@ async function cambiarEstadoPedido(pedidoId, nuevoEstado) {
         if (!response.ok) throw new Error('Error al actualizar estado');
         
         showNotification('Estado actualizado exitosamente', 'success');
-        cargarPedidos();
+        // El cambio llega por las novedades; sin ellas se recarga la lista
+        if (!siguiendoNovedades) cargarPedidos();
         cargarEstadisticas();
         
     } catch (error) {
@@ -330,10 +465,19 @@ function verDetallePedido(pedidoId) {
 
 async function cargarProductos() {
     try {
-        const response = await fetch(`${API_URL}/productos`);
-        if (!response.ok) throw new Error('Error al cargar productos');
-        
-        productos = await response.json();
+        const cargados = [];
+        let cursor = null;
+        do {
+            const params = new URLSearchParams({ limite: 200, fields: 'id,nombre,descripcion,precio,talla,color,imagen_url,stock,categoria_id' });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`${API_URL}/productos?${params}`);
+            if (!response.ok) throw new Error('Error al cargar productos');
+            const data = await response.json();
+            cargados.push(...data.productos);
+            cursor = data.siguiente_cursor;
+        } while (cursor);
+
+        productos = cargados;
         renderProductos();
         
     } catch (error) {
@@ -0,0 +1,169 @@
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Pillow se importa al generar la primera variante y no al arrancar el servidor
+PIL_DISPONIBLE = importlib.util.find_spec('PIL') is not None
+
+# Las imágenes subidas se guardan una sola vez con el SHA-256 de su contenido como nombre,
+# y sus variantes redimensionadas se generan en segundo plano dentro de imagenes/variantes/.
+# Si no se pueden generar (archivo dañado) queda un <digest>.error en esa carpeta y no se reintenta:
+# el producto sigue con la imagen original.
+VARIANTES = {'miniatura': 160, 'tarjeta': 480, 'detalle': 1200}
+FORMATOS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+CARPETA_VARIANTES = 'variantes'
+LONGITUD_DIGEST = 64
+
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='variantes')
+_pendientes = {}
+_listas = set()
+_fallidas = set()
+_lock = threading.Lock()
+
+def es_imagen(datos):
+    # verify() revisa la estructura sin decodificar la imagen entera; sin Pillow no hay cómo comprobarlo
+    if not PIL_DISPONIBLE:
+        return True
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(datos)) as imagen:
+            imagen.verify()
+        return True
+    except Exception:
+        return False
+
+def calcular_digest(datos):
+    return hashlib.sha256(datos).hexdigest()
+
+def nombre_variante(digest, variante, formato):
+    return f'{CARPETA_VARIANTES}/{digest}-{variante}.{formato}'
+
+def ruta_error(digest, carpeta):
+    return os.path.join(carpeta, CARPETA_VARIANTES, f'{digest}.error')
+
+def escribir_atomico(ruta, escribir):
+    temporal = f'{ruta}.{threading.get_ident()}.tmp'
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+def guardar_imagen(datos, extension, carpeta):
+    # Devuelve (nombre, es_nueva); si el contenido ya existe no se vuelve a escribir
+    extension = 'jpg' if extension == 'jpeg' else extension
+    digest = calcular_digest(datos)
+    nombre = f'{digest}.{extension}'
+    ruta = os.path.join(carpeta, nombre)
+    if os.path.exists(ruta):
+        return nombre, False
+    def escribir(temporal):
+        with open(temporal, 'wb') as archivo:
+            archivo.write(datos)
+    escribir_atomico(ruta, escribir)
+    return nombre, True
+
+def generar_variantes(ruta_original, digest, carpeta):
+    from PIL import Image
+    os.makedirs(os.path.join(carpeta, CARPETA_VARIANTES), exist_ok=True)
+    try:
+        with Image.open(ruta_original) as original:
+            original.load()
+            if original.mode not in ('RGB', 'RGBA'):
+                original = original.convert('RGBA')
+            for variante, ancho in VARIANTES.items():
+                copia = original.copy()
+                copia.thumbnail((ancho, ancho * 4), Image.LANCZOS)
+                for formato, (tipo, opciones) in FORMATOS.items():
+                    imagen = copia
+                    if tipo == 'JPEG' and imagen.mode == 'RGBA':
+                        fondo = Image.new('RGB', imagen.size, (255, 255, 255))
+                        fondo.paste(imagen, mask=imagen.split()[3])
+                        imagen = fondo
+                    escribir_atomico(os.path.join(carpeta, nombre_variante(digest, variante, formato)), lambda temporal: imagen.save(temporal, tipo, **opciones))
+        with _lock:
+            _listas.add(digest)
+    except Exception as e:
+        # Se anota en disco para que ningún proceso lo vuelva a intentar en cada lectura del catálogo
+        print(f'ERROR VARIANTES {digest}: {str(e)}')
+        def escribir(temporal):
+            with open(temporal, 'w') as archivo:
+                # Solo el tipo: el mensaje puede traer rutas del servidor y esta carpeta se sirve
+                archivo.write(f'{type(e).__name__}\n')
+        escribir_atomico(ruta_error(digest, carpeta), escribir)
+        with _lock:
+            _fallidas.add(digest)
+    finally:
+        with _lock:
+            _pendientes.pop(digest, None)
+
+def programar_variantes(nombre, carpeta):
+    if not PIL_DISPONIBLE:
+        return None
+    digest = nombre.rsplit('.', 1)[0]
+    if not os.path.isfile(os.path.join(carpeta, nombre)):
+        return None
+    if variantes_fallidas(digest, carpeta):
+        return None
+    with _lock:
+        if digest in _listas or digest in _pendientes:
+            return _pendientes.get(digest)
+        futuro = _pool.submit(generar_variantes, os.path.join(carpeta, nombre), digest, carpeta)
+        _pendientes[digest] = futuro
+    return futuro
+
+def variantes_listas(digest, carpeta):
+    if digest in _listas:
+        return True
+    if all(os.path.exists(os.path.join(carpeta, nombre_variante(digest, v, f))) for v in VARIANTES for f in FORMATOS):
+        with _lock:
+            _listas.add(digest)
+        return True
+    return False
+
+def variantes_fallidas(digest, carpeta):
+    if digest in _fallidas:
+        return True
+    if os.path.exists(ruta_error(digest, carpeta)):
+        with _lock:
+            _fallidas.add(digest)
+        return True
+    return False
+
+def es_nombre_por_contenido(ruta):
+    # Las imágenes del almacén y sus variantes nunca cambian de contenido bajo el mismo nombre
+    return len(os.path.basename(ruta).split('.', 1)[0].split('-', 1)[0]) == LONGITUD_DIGEST
+
+def urls_imagen(imagen_url, carpeta):
+    # Para imágenes del almacén devuelve las URLs de cada variante y un srcset por formato
+    if not imagen_url:
+        return None
+    prefijo, _, archivo = imagen_url.rpartition('/')
+    digest = archivo.rsplit('.', 1)[0]
+    if len(digest) != LONGITUD_DIGEST or not variantes_listas(digest, carpeta):
+        if len(digest) == LONGITUD_DIGEST:
+            programar_variantes(archivo, carpeta)
+        return {'original': imagen_url, 'variantes': {}, 'srcset': {}}
+    base = f'{prefijo}/' if prefijo else ''
+    variantes = {v: {'ancho': ancho, **{f: base + nombre_variante(digest, v, f) for f in FORMATOS}} for v, ancho in VARIANTES.items()}
+    srcset = {f: ', '.join(f"{variantes[v][f]} {ancho}w" for v, ancho in VARIANTES.items()) for f in FORMATOS}
+    return {'original': imagen_url, 'variantes': variantes, 'srcset': srcset}
+
+if __name__ == '__main__':
+    # Migra las imágenes de los productos existentes al almacén por contenido
+    from app import app, db, Producto, BASE_DIR
+    carpeta = os.path.join(BASE_DIR, app.config['UPLOAD_FOLDER'])
+    with app.app_context():
+        migrados = 0
+        for producto in Producto.query.filter(Producto.imagen_url.like(f"{app.config['UPLOAD_FOLDER']}/%")).all():
+            ruta = os.path.join(BASE_DIR, producto.imagen_url)
+            if not os.path.isfile(ruta):
+                continue
+            with open(ruta, 'rb') as archivo:
+                nombre, _ = guardar_imagen(archivo.read(), ruta.rsplit('.', 1)[-1].lower(), carpeta)
+            programar_variantes(nombre, carpeta)
+            producto.imagen_url = f"{app.config['UPLOAD_FOLDER']}/{nombre}"
+            migrados += 1
+        db.session.commit()
+        _pool.shutdown(wait=True)
+        print(f'✅ {migrados} imágenes de productos migradas al almacén')
@@ -1,124 +1,489 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Blueprint, Flask, Request, Response, current_app, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import MultiDict
 from werkzeug.utils import secure_filename
 import jwt
 import datetime
-from functools import wraps
-import stripe
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache, wraps
+import base64
+import hashlib
+import hmac
+import importlib
+import itertools
+import json
+import math
 import os
+import busqueda
+import cambios
+import carritos
+import disponibilidad
+import facetas
+import novedades
+import similares
+import contrasenas
+import pagos
+import almacen_imagenes
+import estaticos
+import formatos
+import serializacion
+import base_datos
+from cache import CacheTTL, CacheRespuestas
+from metricas import Metricas
+from modelos import db, Usuario, Categoria, Producto, Carrito, Pedido, ItemPedido, Estadistica, VentaPeriodo, VentaProducto, EventoPago, CambioCache
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'glam-rent-cartagena-2024-super-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tienda_vestidos.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'imagenes'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
-stripe.api_key = 'sk_test_51SK66nHRBYJxFtD5oxnQMGyoZ8GnJNm3dtX3rJmdEifjDOE4GIy1xKteVJwXtIx5RWaqlKG8fxYcKbYb9D9fAJSa00vNLS43XS'
+class Peticion(Request):
+    # La importación masiva se lee por flujo, así que admite cuerpos mucho más grandes que el resto
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'tienda.importar_productos':
+            return current_app.config['IMPORTACION_MAX_BYTES']
+        return super().max_content_length
 
-CORS(app)
-db = SQLAlchemy(app)
+def configurar(app):
+    app.config['SECRET_KEY'] = 'glam-rent-cartagena-2024-super-secret-key'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///tienda_vestidos.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = 'imagenes'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+    app.config['AUTH_CACHE_TTL'] = 60
+    app.config['AUTH_CACHE_MAX'] = 10000
+    # Si es True se confía en nombre/es_admin del token y no se consulta la base de datos (los cambios de rol tardan hasta que el token expira)
+    app.config['AUTH_CONFIAR_CLAIMS'] = False
+    app.config['CACHE_RESPUESTAS_TTL'] = 60
+    app.config['CACHE_RESPUESTAS_MAX'] = 2048
+    # Cada proceso lee de cambio_cache las invalidaciones de los demás antes de servir desde sus caches.
+    # Una transacción con más grupos que esto anota "*" (vaciar todo) y un proceso con más pendientes lo vacía
+    app.config['CACHE_MAX_CAMBIOS'] = 1000
+    app.config['RESERVA_MINUTOS'] = 15
+    app.config['RESERVA_INTERVALO_LIBERACION'] = 60
+    # Alquileres por fechas: duración máxima de un alquiler, rango máximo de las consultas de
+    # disponibilidad y cada cuánto se recarga el índice en memoria (recoge lo de otros procesos)
+    app.config['ALQUILER_MAX_DIAS'] = 30
+    app.config['DISPONIBILIDAD_MAX_DIAS'] = 92
+    app.config['DISPONIBILIDAD_TTL'] = 60
+    # Facetas del catálogo: límites de los rangos de precio, cada cuántos segundos el índice en memoria
+    # lee el registro de cambios y desde cuántos cambios pendientes conviene recargarlo entero
+    app.config['FACETAS_RANGOS_PRECIO'] = (100000, 200000, 300000, 500000)
+    app.config['FACETAS_INTERVALO'] = 1
+    app.config['FACETAS_MAX_CAMBIOS'] = 5000
+    # "Vestidos parecidos": vecinos guardados por producto, peso de la señal de compras conjuntas, cada
+    # cuántos segundos se aplican los cambios y cada cuántos se reconstruye todo (recuenta las compras)
+    app.config['SIMILARES_ACTIVAS'] = os.environ.get('SIMILARES_ACTIVAS', '1') != '0'
+    app.config['SIMILARES_K'] = 12
+    app.config['SIMILARES_PESO_COMPRAS'] = 0.5
+    app.config['SIMILARES_INTERVALO'] = 30
+    app.config['SIMILARES_RECONSTRUCCION'] = 6 * 3600
+    # Cambios de productos que se conservan en el registro; un proceso más atrasado recarga sus índices
+    app.config['CAMBIOS_CONSERVAR'] = 100000
+    # Novedades de pedidos para el panel: eventos que guarda cada proceso, cada cuántos segundos lee el
+    # registro de cambios, desde cuántos pendientes se descartan (los admins recargan la lista), cuántas
+    # conexiones SSE por proceso quedan abiertas esperando, cuánto dura cada una y tras cuántos
+    # milisegundos se reconecta el navegador (las que no caben reciben lo pendiente y se cierran)
+    app.config['NOVEDADES_CAPACIDAD'] = 2000
+    app.config['NOVEDADES_INTERVALO'] = 1
+    app.config['NOVEDADES_MAX_CAMBIOS'] = 5000
+    app.config['NOVEDADES_MAX_CONEXIONES'] = 2
+    app.config['NOVEDADES_ESPERA'] = 25
+    app.config['NOVEDADES_REINTENTO_MS'] = 2000
+    # 'memoria': los carritos viven en memoria y se vuelcan a la tabla por lotes (un solo proceso o sesiones fijas por proceso);
+    # 'db': cada cambio del carrito se escribe con su propio commit
+    app.config['CARRITO_ALMACEN'] = os.environ.get('CARRITO_ALMACEN', 'memoria')
+    app.config['CARRITO_INTERVALO_VOLCADO'] = 2
+    app.config['CARRITO_INACTIVIDAD'] = 1800
+    # PAGOS_API_BASE apunta a otra pasarela compatible (p.ej. pasarela_falsa.py); vacío usa Stripe
+    app.config['PAGOS_API_BASE'] = os.environ.get('PAGOS_API_BASE')
+    app.config['PAGOS_TIMEOUT_CONEXION'] = 3
+    app.config['PAGOS_TIMEOUT_LECTURA'] = 10
+    app.config['PAGOS_REINTENTOS'] = 2
+    app.config['PAGOS_TRABAJADORES'] = 8
+    app.config['PAGOS_ESPERA'] = 15
+    # Sin secreto el webhook responde 503: cualquiera podría firmar eventos con uno conocido
+    app.config['PAGOS_WEBHOOK_SECRETO'] = os.environ.get('PAGOS_WEBHOOK_SECRETO')
+    app.config['PAGOS_LOTE_EVENTOS'] = 20
+    app.config['PAGOS_INTERVALO_EVENTOS'] = 5
+    app.config['PAGOS_MAX_INTENTOS'] = 5
+    app.config['METRICAS_ACTIVAS'] = os.environ.get('METRICAS_ACTIVAS', '1') != '0'
+    app.config['METRICAS_UMBRAL_N_MAS_1'] = 10
+    # Si se define, /metrics exige la cabecera Authorization: Bearer <METRICAS_TOKEN>;
+    # si no, solo responde a peticiones directas desde la misma máquina
+    app.config['METRICAS_TOKEN'] = os.environ.get('METRICAS_TOKEN')
+    # Hash de contraseñas en un pool de procesos acotado; los hashes con otro método se actualizan al iniciar sesión
+    app.config['HASH_METODO'] = os.environ.get('HASH_METODO', 'scrypt:32768:8:1')
+    app.config['HASH_PROCESOS'] = int(os.environ.get('HASH_PROCESOS', os.cpu_count() or 1))
+    # Con ~130 ms por hash scrypt, 8 en cola por proceso acotan la espera a ~1 s; el resto recibe 503
+    app.config['HASH_MAX_PENDIENTES'] = 8 * max(app.config['HASH_PROCESOS'], 1)
+    app.config['HASH_ESPERA'] = 5
+    app.config['TOKEN_HORAS'] = 24
+    app.config['REFRESH_DIAS'] = 30
+    # Importación y exportación masiva por flujo (CSV/JSONL)
+    app.config['IMPORTACION_LOTE'] = 1000
+    app.config['IMPORTACION_MAX_BYTES'] = 2 * 1024 * 1024 * 1024
+    app.config['IMPORTACION_MAX_ERRORES'] = 1000
+    app.config['EXPORTACION_LOTE'] = 1000
+    # Operaciones masivas de inventario: operaciones por petición y productos por operación (ids o filas)
+    app.config['INVENTARIO_MAX_OPERACIONES'] = 100
+    app.config['INVENTARIO_MAX_FILAS'] = 10000
+    # Respuestas JSON desde este tamaño van en brotli o gzip si el cliente lo acepta
+    app.config['COMPRESION_ACTIVA'] = os.environ.get('COMPRESION_ACTIVA', '1') != '0'
+    app.config['COMPRESION_MIN_BYTES'] = 1024
+
+# Las rutas se registran en el blueprint y armar_app lo monta; el comando "flask migrar" queda en el grupo raíz
+tienda = Blueprint('tienda', __name__, cli_group=None)
+lectura = base_datos.solo_lectura(db)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+CAMPOS_PRODUCTO = ('id', 'nombre', 'descripcion', 'precio', 'talla', 'color', 'imagen_url', 'stock', 'categoria_id')
+# Campos calculados a partir de una columna: 'imagenes' trae las URLs de las variantes de imagen_url
+CAMPOS_DERIVADOS = {'imagenes': 'imagen_url'}
+CAMPOS_PRODUCTO_DEFECTO = ('id', 'nombre', 'descripcion', 'precio', 'talla', 'color', 'imagen_url', 'imagenes', 'stock')
+CARPETA_IMAGENES = os.path.join(BASE_DIR, 'imagenes')
+LIMITE_PAGINA_DEFECTO = 50
+LIMITE_PAGINA_MAXIMO = 200
+LIMITE_BUSQUEDA_DEFECTO = 20
+ESTADOS_PEDIDO = ['pendiente', 'pagado', 'despachado', 'completado', 'cancelado']
+ESTADOS_VENTA = ('pagado', 'despachado', 'completado')
+# Se decide una vez por proceso en la primera búsqueda (o al migrar), no al importar el módulo
+busqueda_fts = {'activa': None, 'lock': threading.Lock()}
+manifiesto = {'actual': None, 'lock': threading.Lock()}
+# Último id de cambio_cache aplicado a las caches de este proceso
+invalidaciones_cache = {'ultimo': None, 'lock': threading.Lock()}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-class Usuario(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(200), nullable=False)
-    es_admin = db.Column(db.Boolean, default=False)
-    fecha_registro = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    carritos = db.relationship('Carrito', backref='usuario', lazy=True, cascade='all, delete-orphan')
-    pedidos = db.relationship('Pedido', backref='usuario', lazy=True)
-
-class Categoria(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), nullable=False, unique=True)
-    descripcion = db.Column(db.Text)
-    productos = db.relationship('Producto', backref='categoria', lazy=True)
-
-class Producto(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(200), nullable=False)
-    descripcion = db.Column(db.Text)
-    precio = db.Column(db.Float, nullable=False)
-    talla = db.Column(db.String(10))
-    color = db.Column(db.String(50))
-    imagen_url = db.Column(db.String(300))
-    stock = db.Column(db.Integer, default=0)
-    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'))
-
-class Carrito(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
-    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
-    cantidad = db.Column(db.Integer, default=1)
-    fecha_agregado = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    producto = db.relationship('Producto')
-
-class Pedido(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
-    fecha_pedido = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    total = db.Column(db.Float, nullable=False)
-    estado = db.Column(db.String(50), default='pendiente')
-    stripe_payment_id = db.Column(db.String(200))
-    direccion_envio = db.Column(db.Text)
-    items = db.relationship('ItemPedido', backref='pedido', lazy=True, cascade='all, delete-orphan')
-
-class ItemPedido(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    pedido_id = db.Column(db.Integer, db.ForeignKey('pedido.id'), nullable=False)
-    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
-    cantidad = db.Column(db.Integer, nullable=False)
-    precio_unitario = db.Column(db.Float, nullable=False)
-    producto = db.relationship('Producto')
-
-def token_requerido(f):
-    @wraps(f)
-    def decorador(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'mensaje': 'Token faltante'}), 401
-        try:
-            if token.startswith('Bearer '):
-                token = token.split(' ')[1]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            usuario_actual = Usuario.query.get(data['usuario_id'])
-            if not usuario_actual:
-                return jsonify({'mensaje': 'Usuario no encontrado'}), 401
-        except:
-            return jsonify({'mensaje': 'Token inválido'}), 401
-        return f(usuario_actual, *args, **kwargs)
-    return decorador
-
-def admin_requerido(f):
-    @wraps(f)
-    def decorador(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'mensaje': 'Token faltante'}), 401
+UsuarioSesion = namedtuple('UsuarioSesion', ['id', 'nombre', 'email', 'es_admin'])
+
+@db.event.listens_for(Usuario, 'after_update')
+@db.event.listens_for(Usuario, 'after_delete')
+def invalidar_usuario_cache(mapper, connection, target):
+    # Los demás procesos se enteran por el trigger que anota usuario:<id> en cambio_cache
+    cache_usuarios.delete(target.id)
+
+def marcar_invalidacion(target, *grupos):
+    # Se acumulan en la sesión y solo se invalidan al confirmar la transacción
+    sesion = db.inspect(target).session
+    if sesion is not None:
+        sesion.info.setdefault('grupos_cache', set()).update(grupos)
+
+def aplicar_invalidaciones(grupos):
+    # Grupos de la cache de respuestas, usuario:<id> de la cache de usuarios o "*" para vaciar ambas
+    if '*' in grupos:
+        indice_facetas.marcar_pendiente()
+        cache_usuarios.clear()
+        cache_respuestas.limpiar()
+        return
+    if 'productos' in grupos:
+        indice_facetas.marcar_pendiente()
+    respuestas = []
+    for grupo in grupos:
+        if grupo.startswith('usuario:'):
+            cache_usuarios.delete(int(grupo.split(':', 1)[1]))
+        else:
+            respuestas.append(grupo)
+    cache_respuestas.invalidar(*respuestas)
+
+def sincronizar_invalidaciones():
+    # Aplica lo que confirmaron otros procesos (y este mismo) desde la última vez. Basta con que la
+    # lectura sea posterior a la del registro: una respuesta que ya vea un cambio posterior solo se
+    # invalida de más en la siguiente sincronización
+    motor = db.engines.get(base_datos.BIND_LECTURA) or db.engine
+    with invalidaciones_cache['lock']:
+        # Lo habitual es que no haya nada nuevo: basta el max(id) por la conexión DBAPI, sin el costo de Core
+        conexion_dbapi = motor.raw_connection()
         try:
+            cursor = conexion_dbapi.cursor()
+            cursor.execute(f'SELECT coalesce(max(id), 0) FROM {cambios.TABLA_CACHE}')
+            registro = cursor.fetchone()[0]
+        finally:
+            conexion_dbapi.close()
+        ultimo = invalidaciones_cache['ultimo']
+        if ultimo is None:
+            # Primera vez en este proceso: sus caches están vacías
+            invalidaciones_cache['ultimo'] = registro
+            return
+        if registro <= ultimo:
+            return
+        with motor.connect() as conexion:
+            pendientes = cambios.cambios_desde(conexion, ultimo, current_app.config['CACHE_MAX_CAMBIOS'], cambios.TABLA_CACHE)
+            if pendientes is None:
+                invalidaciones_cache['ultimo'] = cambios.ultimo_cambio(conexion, cambios.TABLA_CACHE)
+                aplicar_invalidaciones({'*'})
+            elif pendientes:
+                invalidaciones_cache['ultimo'] = pendientes[-1][0]
+                aplicar_invalidaciones({grupo for _, grupo in pendientes})
+
+@db.event.listens_for(db.session, 'before_commit')
+def registrar_invalidaciones(session):
+    # Los grupos se anotan en cambio_cache en la misma transacción que los cambios. El flush va
+    # primero para que los eventos del ORM de lo pendiente ya hayan marcado sus grupos
+    session.flush()
+    grupos = session.info.get('grupos_cache')
+    if not grupos:
+        return
+    if len(grupos) > current_app.config['CACHE_MAX_CAMBIOS']:
+        grupos = session.info['grupos_cache'] = {'*'}
+    session.connection().execute(db.insert(CambioCache), [{'grupo': grupo} for grupo in sorted(grupos)])
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidar_cache_respuestas(session):
+    # Primero los índices en memoria: una respuesta que se recalcule tras invalidar ya debe verlos.
+    # Este proceso invalida en el acto; los demás, al leer cambio_cache
+    for signo, producto_id, inicio, fin, cantidad in session.info.pop('alquileres', ()):
+        indice_alquileres.agregar(producto_id, inicio, fin, signo * cantidad)
+    grupos = session.info.pop('grupos_cache', None)
+    if session.info.pop('novedades', None):
+        aviso_novedades.set()
+    if grupos:
+        aplicar_invalidaciones(grupos)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def descartar_invalidaciones(session):
+    session.info.pop('grupos_cache', None)
+    session.info.pop('alquileres', None)
+    session.info.pop('novedades', None)
+
+@db.event.listens_for(Producto, 'after_insert')
+@db.event.listens_for(Producto, 'after_delete')
+def cache_producto_creado_o_eliminado(mapper, connection, target):
+    marcar_invalidacion(target, 'productos', f'producto:{target.id}', 'categorias')
+
+@db.event.listens_for(Producto, 'after_update')
+def cache_producto_actualizado(mapper, connection, target):
+    grupos = ['productos', f'producto:{target.id}']
+    if db.inspect(target).attrs.categoria_id.history.has_changes():
+        grupos.append('categorias')
+    marcar_invalidacion(target, *grupos)
+
+@db.event.listens_for(Pedido, 'after_insert')
+@db.event.listens_for(Pedido, 'after_update')
+def avisar_novedad_pedido(mapper, connection, target):
+    # El registro de cambios lo anotan los triggers; esto solo despierta al seguidor del propio proceso
+    sesion = db.inspect(target).session
+    if sesion is not None:
+        sesion.info['novedades'] = True
+
+@db.event.listens_for(Categoria, 'after_insert')
+@db.event.listens_for(Categoria, 'after_update')
+@db.event.listens_for(Categoria, 'after_delete')
+def cache_categoria_modificada(mapper, connection, target):
+    marcar_invalidacion(target, 'categorias')
+
+def respuesta_cacheada(grupos):
+    def envoltura(f):
+        @wraps(f)
+        def decorador(*args, **kwargs):
+            sincronizar_invalidaciones()
+            clave = cache_respuestas.clave(request.path, request.args.items(multi=True), grupos(**kwargs))
+            entrada = cache_respuestas.get(clave)
+            if entrada is None:
+                respuesta = current_app.make_response(f(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta
+                entrada = cache_respuestas.set(clave, respuesta.get_data(), current_app.config['CACHE_RESPUESTAS_TTL'])
+            cuerpo, etag = entrada
+            codificacion = serializacion.elegir_codificacion() if current_app.config['COMPRESION_ACTIVA'] and len(cuerpo) >= current_app.config['COMPRESION_MIN_BYTES'] else None
+            if codificacion is not None:
+                # La versión comprimida también se guarda: los aciertos de cache no vuelven a comprimir
+                cuerpo = cache_respuestas.variante(clave, f'{etag}:{codificacion}', lambda: serializacion.comprimir(cuerpo, codificacion), current_app.config['CACHE_RESPUESTAS_TTL'])
+            respuesta = Response(cuerpo, mimetype='application/json')
+            respuesta.set_etag(etag)
+            respuesta.headers['Cache-Control'] = 'no-cache'
+            if codificacion is not None:
+                serializacion.marcar_comprimida(respuesta, codificacion)
+            elif current_app.config['COMPRESION_ACTIVA'] and len(cuerpo) >= current_app.config['COMPRESION_MIN_BYTES']:
+                respuesta.vary.add('Accept-Encoding')
+            return respuesta.make_conditional(request)
+        return decorador
+    return envoltura
+
+@tienda.after_request
+def comprimir_json(respuesta):
+    # Las respuestas de respuesta_cacheada ya llegan comprimidas desde la cache y aquí se dejan pasar
+    if current_app.config['COMPRESION_ACTIVA']:
+        return serializacion.comprimir_respuesta(respuesta, current_app.config['COMPRESION_MIN_BYTES'])
+    return respuesta
+
+def acumular(conexion, modelo, claves, deltas):
+    tabla = modelo.__table__
+    consulta = sqlite_insert(tabla).values(**claves, **deltas)
+    conexion.execute(consulta.on_conflict_do_update(index_elements=list(claves), set_={c: tabla.c[c] + consulta.excluded[c] for c in deltas}))
+
+def ajustar_contadores(conexion, deltas):
+    for clave, delta in deltas.items():
+        if delta:
+            acumular(conexion, Estadistica, {'clave': clave}, {'valor': delta})
+
+def acumular_venta(conexion, fecha, pedidos, ventas):
+    dia = fecha.date()
+    acumular(conexion, VentaPeriodo, {'tipo': 'dia', 'inicio': dia}, {'pedidos': pedidos, 'ventas': ventas})
+    acumular(conexion, VentaPeriodo, {'tipo': 'semana', 'inicio': dia - datetime.timedelta(days=dia.weekday())}, {'pedidos': pedidos, 'ventas': ventas})
+
+def acumular_items_vendidos(conexion, pedido_id, signo):
+    filas = conexion.execute(db.select(ItemPedido.producto_id, db.func.sum(ItemPedido.cantidad), db.func.sum(ItemPedido.cantidad * ItemPedido.precio_unitario)).where(ItemPedido.pedido_id == pedido_id).group_by(ItemPedido.producto_id))
+    for producto_id, unidades, ventas in filas:
+        acumular(conexion, VentaProducto, {'producto_id': producto_id}, {'unidades': signo * unidades, 'ventas': signo * ventas})
+
+def registrar_estado_pedido(conexion, pedido, anterior, nuevo):
+    deltas = {'pedidos_total': (nuevo is not None) - (anterior is not None)}
+    if anterior:
+        deltas[f'pedidos_{anterior}'] = -1
+    if nuevo:
+        deltas[f'pedidos_{nuevo}'] = deltas.get(f'pedidos_{nuevo}', 0) + 1
+    signo = (nuevo in ESTADOS_VENTA) - (anterior in ESTADOS_VENTA)
+    if signo:
+        deltas['ventas_total'] = signo * pedido.total
+        acumular_venta(conexion, pedido.fecha_pedido, signo, signo * pedido.total)
+        acumular_items_vendidos(conexion, pedido.id, signo)
+    ajustar_contadores(conexion, deltas)
+
+@db.event.listens_for(Pedido, 'after_insert')
+def estadisticas_pedido_creado(mapper, connection, target):
+    registrar_estado_pedido(connection, target, None, target.estado or 'pendiente')
+
+@db.event.listens_for(Pedido, 'after_update')
+def estadisticas_pedido_actualizado(mapper, connection, target):
+    historial = db.inspect(target).attrs.estado.history
+    if historial.deleted and historial.added and historial.deleted[0] != historial.added[0]:
+        registrar_estado_pedido(connection, target, historial.deleted[0], historial.added[0])
+
+@db.event.listens_for(Pedido, 'after_delete')
+def estadisticas_pedido_eliminado(mapper, connection, target):
+    registrar_estado_pedido(connection, target, target.estado, None)
+
+def acumular_item_si_vendido(conexion, item, signo):
+    # Los items de un pedido ya vendido cuentan en el momento; los demás se cuentan al pasar el pedido a un estado de venta
+    estado = conexion.execute(db.select(Pedido.estado).where(Pedido.id == item.pedido_id)).scalar()
+    if estado in ESTADOS_VENTA:
+        acumular(conexion, VentaProducto, {'producto_id': item.producto_id}, {'unidades': signo * item.cantidad, 'ventas': signo * item.cantidad * item.precio_unitario})
+
+@db.event.listens_for(ItemPedido, 'after_insert')
+def estadisticas_item_creado(mapper, connection, target):
+    acumular_item_si_vendido(connection, target, 1)
+
+@db.event.listens_for(ItemPedido, 'after_delete')
+def estadisticas_item_eliminado(mapper, connection, target):
+    acumular_item_si_vendido(connection, target, -1)
+
+@db.event.listens_for(Producto, 'after_insert')
+def estadisticas_producto_creado(mapper, connection, target):
+    ajustar_contadores(connection, {'productos_total': 1, 'productos_sin_stock': int((target.stock or 0) <= 0)})
+
+@db.event.listens_for(Producto, 'after_update')
+def estadisticas_producto_actualizado(mapper, connection, target):
+    historial = db.inspect(target).attrs.stock.history
+    if historial.deleted and historial.added:
+        ajustar_contadores(connection, {'productos_sin_stock': int((historial.added[0] or 0) <= 0) - int((historial.deleted[0] or 0) <= 0)})
+
+@db.event.listens_for(Producto, 'after_delete')
+def estadisticas_producto_eliminado(mapper, connection, target):
+    ajustar_contadores(connection, {'productos_total': -1, 'productos_sin_stock': -int((target.stock or 0) <= 0)})
+
+# Índice de alquileres: los cambios se acumulan en la sesión y se aplican al confirmar, igual que las invalidaciones del cache
+def registrar_alquileres(sesion, signo, filas):
+    sesion.info.setdefault('alquileres', []).extend((signo, *fila) for fila in filas)
+    sesion.info.setdefault('grupos_cache', set()).add('disponibilidad')
+
+@db.event.listens_for(ItemPedido, 'after_insert')
+def alquiler_creado(mapper, connection, target):
+    if target.fecha_inicio is not None:
+        registrar_alquileres(db.inspect(target).session, 1, [(target.producto_id, target.fecha_inicio, target.fecha_fin, target.cantidad)])
+
+@db.event.listens_for(Pedido, 'after_update')
+def alquileres_pedido_actualizado(mapper, connection, target):
+    # Un pedido cancelado deja de ocupar sus fechas; uno reactivado las vuelve a ocupar
+    historial = db.inspect(target).attrs.estado.history
+    if not (historial.deleted and historial.added) or (historial.deleted[0] == 'cancelado') == (historial.added[0] == 'cancelado'):
+        return
+    filas = connection.execute(db.select(ItemPedido.producto_id, ItemPedido.fecha_inicio, ItemPedido.fecha_fin, ItemPedido.cantidad).where(ItemPedido.pedido_id == target.id, ItemPedido.fecha_inicio.is_not(None))).all()
+    if filas:
+        registrar_alquileres(db.inspect(target).session, -1 if historial.added[0] == 'cancelado' else 1, filas)
+
+def recalcular_estadisticas():
+    # Reconstruye todas las estadísticas con agregaciones GROUP BY de una sola pasada por tabla
+    db.session.query(Estadistica).delete()
+    db.session.query(VentaPeriodo).delete()
+    db.session.query(VentaProducto).delete()
+    conexion = db.session.connection()
+    deltas = {'pedidos_total': 0, 'ventas_total': 0}
+    for estado, cantidad, total in db.session.query(Pedido.estado, db.func.count(Pedido.id), db.func.sum(Pedido.total)).group_by(Pedido.estado):
+        deltas['pedidos_total'] += cantidad
+        deltas[f'pedidos_{estado}'] = cantidad
+        if estado in ESTADOS_VENTA:
+            deltas['ventas_total'] += total or 0
+    total_productos, sin_stock = db.session.query(db.func.count(Producto.id), db.func.sum(db.case((db.func.coalesce(Producto.stock, 0) <= 0, 1), else_=0))).one()
+    deltas['productos_total'] = total_productos
+    deltas['productos_sin_stock'] = sin_stock or 0
+    ajustar_contadores(conexion, deltas)
+    for fecha, pedidos, ventas in db.session.query(db.func.date(Pedido.fecha_pedido), db.func.count(Pedido.id), db.func.sum(Pedido.total)).filter(Pedido.estado.in_(ESTADOS_VENTA)).group_by(db.func.date(Pedido.fecha_pedido)):
+        acumular_venta(conexion, datetime.datetime.fromisoformat(fecha), pedidos, ventas)
+    # La tabla quedó vacía: un solo INSERT ... SELECT en vez de un upsert por producto
+    ventas_por_producto = db.select(ItemPedido.producto_id, db.func.sum(ItemPedido.cantidad), db.func.sum(ItemPedido.cantidad * ItemPedido.precio_unitario)).join(Pedido).where(Pedido.estado.in_(ESTADOS_VENTA)).group_by(ItemPedido.producto_id)
+    conexion.execute(db.insert(VentaProducto).from_select(['producto_id', 'unidades', 'ventas'], ventas_por_producto))
+    db.session.commit()
+
+def decodificar_token(token):
+    data = cache_tokens.get(token)
+    if data is None:
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        if data.get('tipo') == 'refresh':
+            raise jwt.InvalidTokenError('Un refresh token no sirve como token de acceso')
+        cache_tokens.set(token, data, min(current_app.config['AUTH_CACHE_TTL'], data['exp'] - time.time()))
+    return data
+
+def obtener_usuario_sesion(data):
+    if current_app.config['AUTH_CONFIAR_CLAIMS'] and 'nombre' in data and 'es_admin' in data:
+        return UsuarioSesion(data['usuario_id'], data['nombre'], data.get('email'), data['es_admin'])
+    sincronizar_invalidaciones()
+    usuario = cache_usuarios.get(data['usuario_id'])
+    if usuario is None:
+        registro = db.session.get(Usuario, data['usuario_id'])
+        if not registro:
+            return None
+        usuario = UsuarioSesion(registro.id, registro.nombre, registro.email, registro.es_admin)
+        cache_usuarios.set(usuario.id, usuario)
+    return usuario
+
+def autenticacion(solo_admin=False):
+    def envoltura(f):
+        @wraps(f)
+        def decorador(*args, **kwargs):
+            token = request.headers.get('Authorization')
+            if not token:
+                return jsonify({'mensaje': 'Token faltante'}), 401
             if token.startswith('Bearer '):
                 token = token.split(' ')[1]
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            usuario_actual = Usuario.query.get(data['usuario_id'])
+            try:
+                data = decodificar_token(token)
+                usuario_actual = obtener_usuario_sesion(data)
+            except Exception:
+                return jsonify({'mensaje': 'Token inválido'}), 401
             if not usuario_actual:
                 return jsonify({'mensaje': 'Usuario no encontrado'}), 401
-            if not usuario_actual.es_admin:
+            if solo_admin and not usuario_actual.es_admin:
                 return jsonify({'mensaje': 'Acceso denegado'}), 403
-        except:
-            return jsonify({'mensaje': 'Token inválido'}), 401
-        return f(usuario_actual, *args, **kwargs)
-    return decorador
+            return f(usuario_actual, *args, **kwargs)
+        return decorador
+    return envoltura
 
-@app.route('/api/registro', methods=['POST'])
+def peticion_de_admin():
+    # Igual que @admin_requerido pero sin responder: para el modo de perfilado de las métricas
+    token = request.headers.get('Authorization', '')
+    try:
+        usuario = obtener_usuario_sesion(decodificar_token(token.split(' ')[1] if token.startswith('Bearer ') else token))
+    except Exception:
+        return False
+    return bool(usuario and usuario.es_admin)
+
+token_requerido = autenticacion()
+admin_requerido = autenticacion(solo_admin=True)
+
+@tienda.route('/api/registro', methods=['POST'])
 def registro():
     try:
         data = request.get_json()
@@ -126,59 +491,420 @@ def registro():
             return jsonify({'mensaje': 'Faltan campos requeridos'}), 400
         if Usuario.query.filter_by(email=data['email']).first():
             return jsonify({'mensaje': 'El email ya está registrado'}), 400
-        password_hash = generate_password_hash(data['password'])
+        db.session.close()
+        password_hash = pool_hash.hashear(data['password'], clave=data['email'])
         nuevo_usuario = Usuario(nombre=data['nombre'], email=data['email'], password=password_hash)
         db.session.add(nuevo_usuario)
         db.session.commit()
         return jsonify({'mensaje': 'Usuario registrado exitosamente'}), 201
+    except contrasenas.IntentosSimultaneos as e:
+        return jsonify({'mensaje': str(e)}), 429, {'Retry-After': '1'}
+    except contrasenas.PoolSaturado as e:
+        return jsonify({'mensaje': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/login', methods=['POST'])
+def sello_refresh(password_hash):
+    # Cambiar la contraseña (o actualizar su hash) invalida los refresh tokens ya emitidos
+    return hmac.new(current_app.config['SECRET_KEY'].encode('utf-8'), password_hash.encode('utf-8'), hashlib.sha256).hexdigest()[:16]
+
+def emitir_tokens(usuario, password_hash):
+    ahora = datetime.datetime.utcnow()
+    token = jwt.encode({'usuario_id': usuario.id, 'nombre': usuario.nombre, 'email': usuario.email, 'es_admin': usuario.es_admin, 'exp': ahora + datetime.timedelta(hours=current_app.config['TOKEN_HORAS'])}, current_app.config['SECRET_KEY'], algorithm="HS256")
+    refresh_token = jwt.encode({'usuario_id': usuario.id, 'tipo': 'refresh', 'sello': sello_refresh(password_hash), 'exp': ahora + datetime.timedelta(days=current_app.config['REFRESH_DIAS'])}, current_app.config['SECRET_KEY'], algorithm="HS256")
+    return {'token': token, 'refresh_token': refresh_token, 'usuario': {'id': usuario.id, 'nombre': usuario.nombre, 'email': usuario.email, 'es_admin': usuario.es_admin}}
+
+@tienda.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.get_json()
         if not data or not data.get('email') or not data.get('password'):
             return jsonify({'mensaje': 'Email y contraseña son requeridos'}), 400
         usuario = Usuario.query.filter_by(email=data['email']).first()
-        if not usuario or not check_password_hash(usuario.password, data['password']):
+        if not usuario:
+            return jsonify({'mensaje': 'Email o contraseña incorrectos'}), 401
+        sesion = UsuarioSesion(usuario.id, usuario.nombre, usuario.email, usuario.es_admin)
+        password_hash = usuario.password
+        # La conexión vuelve al pool mientras se verifica la contraseña
+        db.session.close()
+        if not pool_hash.verificar(password_hash, data['password'], clave=sesion.email):
             return jsonify({'mensaje': 'Email o contraseña incorrectos'}), 401
-        token = jwt.encode({'usuario_id': usuario.id, 'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)}, app.config['SECRET_KEY'], algorithm="HS256")
-        return jsonify({'token': token, 'usuario': {'id': usuario.id, 'nombre': usuario.nombre, 'email': usuario.email, 'es_admin': usuario.es_admin}}), 200
+        if pool_hash.necesita_rehash(password_hash):
+            try:
+                nuevo_hash = pool_hash.hashear(data['password'])
+                actualizado = db.session.execute(db.update(Usuario).where(Usuario.id == sesion.id, Usuario.password == password_hash).values(password=nuevo_hash))
+                db.session.commit()
+                if actualizado.rowcount:
+                    password_hash = nuevo_hash
+            except contrasenas.PoolSaturado:
+                # Se actualizará en el próximo login
+                pass
+        return jsonify(emitir_tokens(sesion, password_hash)), 200
+    except contrasenas.IntentosSimultaneos as e:
+        return jsonify({'mensaje': str(e)}), 429, {'Retry-After': '1'}
+    except contrasenas.PoolSaturado as e:
+        return jsonify({'mensaje': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+@tienda.route('/api/token/refrescar', methods=['POST'])
+def refrescar_token():
+    # Renueva la sesión con una verificación HMAC del refresh token, sin volver a hashear la contraseña
+    try:
+        data = request.get_json() or {}
+        try:
+            datos = jwt.decode(data.get('refresh_token', ''), current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        except jwt.InvalidTokenError:
+            return jsonify({'mensaje': 'Refresh token inválido'}), 401
+        if datos.get('tipo') != 'refresh':
+            return jsonify({'mensaje': 'Refresh token inválido'}), 401
+        usuario = db.session.get(Usuario, datos['usuario_id'])
+        if not usuario or not hmac.compare_digest(datos.get('sello', ''), sello_refresh(usuario.password)):
+            return jsonify({'mensaje': 'Refresh token inválido'}), 401
+        return jsonify(emitir_tokens(usuario, usuario.password)), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/productos', methods=['GET'])
+def imagenes_producto(imagen_url):
+    return almacen_imagenes.urls_imagen(imagen_url, CARPETA_IMAGENES)
+
+@lru_cache(maxsize=64)
+def serializador_producto(campos):
+    # Un serializador compilado por cada combinación de campos pedida con ?fields=
+    return serializacion.compilar(campos, imagenes=lambda fila: imagenes_producto(fila.imagen_url))
+
+serializar_producto = serializador_producto(CAMPOS_PRODUCTO_DEFECTO)
+
+def codificar_cursor(valores):
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+def decodificar_cursor(cursor, tipos):
+    # ValueError si no es una lista con un valor de cada tipo: un cursor armado a mano (o de otro orden) no llega al SQL
+    valores = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    if not isinstance(valores, list) or len(valores) != len(tipos) or any(isinstance(v, bool) or not isinstance(v, t) for v, t in zip(valores, tipos)):
+        raise ValueError('Cursor inválido')
+    return valores
+
+def enteros_de(args, clave):
+    # getlist(type=int) descarta en silencio lo que no es entero y el filtro dejaría de filtrar
+    try:
+        return [int(v) for v in args.getlist(clave) if v]
+    except ValueError:
+        raise ValueError(f'{clave} debe ser un entero')
+
+def filtros_facetas(args):
+    # {faceta: [valores]} pedidos; varios valores de una misma faceta (talla=M&talla=L) se combinan con OR
+    filtros = {
+        'categoria_id': enteros_de(args, 'categoria_id'),
+        'talla': [v for v in args.getlist('talla') if v],
+        'color': [v for v in args.getlist('color') if v],
+        'rango_precio': [v for v in args.getlist('rango_precio') if v],
+        'en_stock': ['1'] if args.get('en_stock', '').lower() in ('1', 'true', 'si') else [],
+    }
+    rangos = set(indice_facetas.rangos())
+    if any(rango not in rangos for rango in filtros['rango_precio']):
+        raise ValueError(f"rango_precio debe ser uno de: {', '.join(indice_facetas.rangos())}")
+    # precio_min y precio_max no son facetas, pero filtrar_productos ignoraría un valor que no es número
+    for clave in ('precio_min', 'precio_max'):
+        for valor in args.getlist(clave):
+            try:
+                float(valor or 0)
+            except ValueError:
+                raise ValueError(f'{clave} inválido: {valor!r}')
+    return {faceta: valores for faceta, valores in filtros.items() if valores}
+
+def filtrar_productos(consulta, args):
+    filtros = filtros_facetas(args)
+    if 'categoria_id' in filtros:
+        consulta = consulta.filter(Producto.categoria_id.in_(filtros['categoria_id']))
+    if 'talla' in filtros:
+        consulta = consulta.filter(Producto.talla.in_(filtros['talla']))
+    if 'color' in filtros:
+        consulta = consulta.filter(Producto.color.in_(filtros['color']))
+    if 'rango_precio' in filtros:
+        condiciones = []
+        for rango in filtros['rango_precio']:
+            desde, hasta = rango.split('-')
+            condiciones.append(db.and_(Producto.precio >= float(desde), Producto.precio < float(hasta)) if hasta else Producto.precio >= float(desde))
+        consulta = consulta.filter(db.or_(*condiciones))
+    precio_min = args.get('precio_min', type=float)
+    if precio_min is not None:
+        consulta = consulta.filter(Producto.precio >= precio_min)
+    precio_max = args.get('precio_max', type=float)
+    if precio_max is not None:
+        consulta = consulta.filter(Producto.precio <= precio_max)
+    if 'en_stock' in filtros:
+        consulta = consulta.filter(Producto.stock > 0)
+    return consulta
+
+def leer_periodo(datos, clave_inicio, clave_fin, max_dias):
+    # (inicio, fin) en fechas ISO con ambos días incluidos, None si no se pidió periodo; ValueError si es inválido
+    if not datos.get(clave_inicio) and not datos.get(clave_fin):
+        return None
+    try:
+        inicio = datetime.date.fromisoformat(datos.get(clave_inicio) or '')
+        fin = datetime.date.fromisoformat(datos.get(clave_fin) or '')
+    except (TypeError, ValueError):
+        raise ValueError(f'{clave_inicio} y {clave_fin} deben ser fechas AAAA-MM-DD')
+    if fin < inicio:
+        raise ValueError(f'{clave_fin} es anterior a {clave_inicio}')
+    if (fin - inicio).days >= max_dias:
+        raise ValueError(f'El periodo no puede superar {max_dias} días')
+    return inicio, fin
+
+def refrescar_indice_alquileres():
+    indice_alquileres.refrescar(alquileres_vigentes)
+
+def sincronizar_facetas(indice):
+    # Aplica los productos anotados en el registro de cambios desde la última sincronización; la
+    # primera vez, o si hay demasiados o se podaron, recarga el catálogo entero
+    conexion = db.session.connection()
+    columnas = [Producto.id, *[getattr(Producto, campo) for campo in facetas.CAMPOS]]
+    pendientes = None if indice.ultimo_cambio is None else cambios.cambios_desde(conexion, indice.ultimo_cambio, current_app.config['FACETAS_MAX_CAMBIOS'])
+    if pendientes is None:
+        ultimo = cambios.ultimo_cambio(conexion)
+        indice.cargar(conexion.execute(db.select(*columnas)), ultimo)
+    elif pendientes:
+        ids = {producto_id for _, producto_id in pendientes}
+        filas = {fila[0]: fila[1:] for fila in conexion.execute(db.select(*columnas).where(Producto.id.in_(ids)))}
+        for producto_id in ids:
+            indice.actualizar(producto_id, filas.get(producto_id))
+        indice.ultimo_cambio = pendientes[-1][0]
+
+def refrescar_indice_facetas():
+    indice_facetas.refrescar(sincronizar_facetas)
+
+def leer_disponibles(consulta, n, inicio, fin, cantidad):
+    # El índice da la ocupación del rango solo de los productos con algo alquilado; las filas de la
+    # página se leen por lotes en su orden y se descartan las que no tienen unidades libres, así que el
+    # costo depende del tamaño de la página y no de cuántos productos estén alquilados
+    refrescar_indice_alquileres()
+    ocupados = indice_alquileres.ocupados(inicio, fin)
+    consulta = consulta.filter(Producto.stock >= cantidad)
+    filas, desplazamiento, lote = [], 0, max(2 * n, 50)
+    while len(filas) < n:
+        bloque = consulta.limit(lote).offset(desplazamiento).all()
+        filas.extend(fila for fila in bloque if fila.stock - ocupados.get(fila.id, 0) >= cantidad)
+        if len(bloque) < lote:
+            break
+        desplazamiento += lote
+    return filas[:n]
+
+def grupos_productos():
+    # Los listados filtrados por fechas también caducan con cada alquiler nuevo o cancelado
+    return ['productos', 'disponibilidad'] if request.args.get('disponible_desde') else ['productos']
+
+@tienda.route('/api/productos', methods=['GET'])
+@respuesta_cacheada(grupos_productos)
+@lectura
 def obtener_productos():
     try:
-        productos = Producto.query.all()
-        resultado = [{'id': p.id, 'nombre': p.nombre, 'descripcion': p.descripcion, 'precio': p.precio, 'talla': p.talla, 'color': p.color, 'imagen_url': p.imagen_url, 'stock': p.stock} for p in productos]
+        campos = CAMPOS_PRODUCTO_DEFECTO
+        if request.args.get('fields'):
+            campos = tuple(c.strip() for c in request.args['fields'].split(',') if c.strip())
+            if not campos or any(c not in CAMPOS_PRODUCTO and c not in CAMPOS_DERIVADOS for c in campos):
+                return jsonify({'mensaje': 'Campos inválidos'}), 400
+        orden = request.args.get('orden', 'id')
+        if orden not in ('id', 'precio'):
+            return jsonify({'mensaje': 'Orden inválido'}), 400
+        limite = min(max(request.args.get('limite', LIMITE_PAGINA_DEFECTO, type=int), 1), LIMITE_PAGINA_MAXIMO)
+        try:
+            periodo = leer_periodo(request.args, 'disponible_desde', 'disponible_hasta', current_app.config['DISPONIBILIDAD_MAX_DIAS'])
+            filtros = filtros_facetas(request.args)
+        except ValueError as e:
+            return jsonify({'mensaje': str(e)}), 400
+        cursor = None
+        if request.args.get('cursor'):
+            try:
+                cursor = decodificar_cursor(request.args['cursor'], ((int, float), int) if orden == 'precio' else (int,))
+            except Exception:
+                return jsonify({'mensaje': 'Cursor inválido'}), 400
+        # Los filtros por faceta en orden de id se resuelven con el índice de facetas; precio_min,
+        # precio_max, las fechas y el orden por precio van a SQL
+        sin_indice = periodo or request.args.get('precio_min') or request.args.get('precio_max')
+        con_facetas = request.args.get('facetas', '').lower() in ('1', 'true', 'si')
+        if con_facetas and sin_indice:
+            return jsonify({'mensaje': 'facetas no se combina con precio_min, precio_max ni fechas: usa rango_precio'}), 400
+        columnas = tuple(dict.fromkeys([c for c in campos if c in CAMPOS_PRODUCTO] + [CAMPOS_DERIVADOS[c] for c in campos if c in CAMPOS_DERIVADOS] + ['id', 'precio'] + (['stock'] if periodo else [])))
+        consulta = db.session.query(*[getattr(Producto, c) for c in columnas])
+        if filtros or con_facetas:
+            refrescar_indice_facetas()
+        siguiente_cursor = None
+        if filtros and orden == 'id' and not sin_indice:
+            ids = indice_facetas.pagina(filtros, cursor[0] if cursor else 0, limite + 1)
+            if len(ids) > limite:
+                ids = ids[:limite]
+                siguiente_cursor = codificar_cursor([ids[-1]])
+            filas = consulta.filter(Producto.id.in_(ids)).order_by(Producto.id).all() if ids else []
+        else:
+            consulta = filtrar_productos(consulta, request.args)
+            if cursor:
+                if orden == 'precio':
+                    consulta = consulta.filter(db.tuple_(Producto.precio, Producto.id) > tuple(cursor))
+                else:
+                    consulta = consulta.filter(Producto.id > cursor[0])
+            consulta = consulta.order_by(Producto.precio, Producto.id) if orden == 'precio' else consulta.order_by(Producto.id)
+            if periodo:
+                filas = leer_disponibles(consulta, limite + 1, *periodo, max(request.args.get('cantidad', 1, type=int), 1))
+            else:
+                filas = consulta.limit(limite + 1).all()
+            if len(filas) > limite:
+                filas = filas[:limite]
+                ultima = filas[-1]
+                siguiente_cursor = codificar_cursor([ultima.precio, ultima.id] if orden == 'precio' else [ultima.id])
+        serializar = serializador_producto(campos)
+        resultado = {'productos': [serializar(fila) for fila in filas], 'siguiente_cursor': siguiente_cursor}
+        if con_facetas:
+            resultado['total'], resultado['facetas'] = indice_facetas.contar(filtros)
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/productos/buscar', methods=['GET'])
+def fts_activa():
+    # El índice lo crea "flask migrar"; aquí solo se comprueba una vez por proceso que exista
+    if busqueda_fts['activa'] is None:
+        with busqueda_fts['lock']:
+            if busqueda_fts['activa'] is None:
+                busqueda_fts['activa'] = busqueda.indice_disponible(db.session.connection())
+    return busqueda_fts['activa']
+
+@tienda.route('/api/productos/buscar', methods=['GET'])
+@respuesta_cacheada(lambda: ['productos'])
+@lectura
 def buscar_productos():
     try:
         query = request.args.get('q', '').lower()
         if not query:
             return jsonify([]), 200
-        productos = Producto.query.filter(db.or_(Producto.nombre.ilike(f'%{query}%'), Producto.descripcion.ilike(f'%{query}%'), Producto.color.ilike(f'%{query}%'))).all()
-        resultado = [{'id': p.id, 'nombre': p.nombre, 'descripcion': p.descripcion, 'precio': p.precio, 'talla': p.talla, 'color': p.color, 'imagen_url': p.imagen_url, 'stock': p.stock} for p in productos]
+        limite = min(max(request.args.get('limite', LIMITE_BUSQUEDA_DEFECTO, type=int), 1), LIMITE_PAGINA_MAXIMO)
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        if fts_activa():
+            ids = busqueda.buscar_ids(db.session.connection(), query, limite, offset)
+            por_id = {p.id: p for p in Producto.query.filter(Producto.id.in_(ids)).all()} if ids else {}
+            productos = [por_id[i] for i in ids if i in por_id]
+        else:
+            productos = Producto.query.filter(db.or_(Producto.nombre.ilike(f'%{query}%'), Producto.descripcion.ilike(f'%{query}%'), Producto.color.ilike(f'%{query}%'))).order_by(Producto.id).limit(limite).offset(offset).all()
+        resultado = [serializar_producto(p) for p in productos]
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/productos/<int:id>', methods=['GET'])
+@tienda.route('/api/productos/<int:id>', methods=['GET'])
+@respuesta_cacheada(lambda id: [f'producto:{id}'])
+@lectura
 def obtener_producto(id):
     try:
         producto = Producto.query.get_or_404(id)
-        return jsonify({'id': producto.id, 'nombre': producto.nombre, 'descripcion': producto.descripcion, 'precio': producto.precio, 'talla': producto.talla, 'color': producto.color, 'imagen_url': producto.imagen_url, 'stock': producto.stock}), 200
+        return jsonify(serializar_producto(producto)), 200
     except:
         return jsonify({'mensaje': 'Producto no encontrado'}), 404
 
-@app.route('/api/productos', methods=['POST'])
+@tienda.route('/api/productos/<int:id>/disponibilidad', methods=['GET'])
+@respuesta_cacheada(lambda id: [f'producto:{id}', 'disponibilidad'])
+@lectura
+def obtener_disponibilidad(id):
+    # Unidades libres por día entre desde y hasta (por defecto los próximos 30 días)
+    try:
+        try:
+            periodo = leer_periodo(request.args, 'desde', 'hasta', current_app.config['DISPONIBILIDAD_MAX_DIAS'])
+        except ValueError as e:
+            return jsonify({'mensaje': str(e)}), 400
+        hoy = datetime.datetime.utcnow().date()
+        inicio, fin = periodo or (hoy, hoy + datetime.timedelta(days=29))
+        producto = db.session.get(Producto, id)
+        if not producto:
+            return jsonify({'mensaje': 'Producto no encontrado'}), 404
+        refrescar_indice_alquileres()
+        dias = [{'fecha': dia.isoformat(), 'libres': max((producto.stock or 0) - ocupadas, 0)} for dia, ocupadas in indice_alquileres.calendario(id, inicio, fin)]
+        return jsonify({'producto_id': id, 'stock': producto.stock, 'dias': dias}), 200
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+@tienda.route('/api/productos/<int:id>/similares', methods=['GET'])
+@lectura
+def obtener_similares(id):
+    # Responde desde el índice en memoria; solo se leen de la base los productos a mostrar
+    try:
+        if not similares.NUMPY_DISPONIBLE or not current_app.config['SIMILARES_ACTIVAS']:
+            return jsonify({'mensaje': 'Recomendaciones no disponibles: requieren numpy'}), 503
+        iniciar_recomendador(current_app._get_current_object())
+        limite = min(max(request.args.get('limite', current_app.config['SIMILARES_K'], type=int), 1), current_app.config['SIMILARES_K'])
+        vecinos = indice_similares.similares(id, limite)
+        if vecinos is None:
+            if indice_similares.construido is None:
+                return jsonify({'mensaje': 'Recomendaciones en preparación, intenta de nuevo en unos segundos'}), 503, {'Retry-After': '5'}
+            # Un producto recién creado entra al índice en la próxima actualización
+            if not db.session.get(Producto, id):
+                return jsonify({'mensaje': 'Producto no encontrado'}), 404
+            vecinos = []
+        por_id = {p.id: p for p in Producto.query.filter(Producto.id.in_([i for i, _ in vecinos])).all()} if vecinos else {}
+        resultado = [{**serializar_producto(por_id[i]), 'similitud': round(puntaje, 4)} for i, puntaje in vecinos if i in por_id]
+        return jsonify({'producto_id': id, 'productos': resultado}), 200
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+COLUMNAS_SIMILARES = (Producto.id, Producto.categoria_id, Producto.talla, Producto.color, Producto.precio, Producto.nombre, Producto.descripcion)
+
+def actualizar_similares():
+    # Reconstruye el índice de similares la primera vez, cada SIMILARES_RECONSTRUCCION segundos o si hay
+    # demasiados cambios; si no, aplica los productos del registro de cambios y los pedidos nuevos
+    conexion = db.session.connection()
+    indice = indice_similares
+    pendientes = None
+    if indice.construido is not None and not indice.necesita_reconstruir and time.monotonic() - indice.construido < current_app.config['SIMILARES_RECONSTRUCCION']:
+        pendientes = cambios.cambios_desde(conexion, indice.ultimo_cambio, current_app.config['FACETAS_MAX_CAMBIOS'])
+    vigente = Pedido.estado != 'cancelado'
+    if pendientes is None:
+        ultimo_cambio = cambios.ultimo_cambio(conexion)
+        ultimo_item = conexion.execute(db.select(db.func.coalesce(db.func.max(ItemPedido.id), 0))).scalar()
+        productos = conexion.execute(db.select(*COLUMNAS_SIMILARES))
+        otro = db.aliased(ItemPedido)
+        pares = conexion.execute(db.select(ItemPedido.producto_id, otro.producto_id, db.func.count(db.distinct(ItemPedido.pedido_id)))
+                                 .join(otro, db.and_(otro.pedido_id == ItemPedido.pedido_id, otro.producto_id != ItemPedido.producto_id))
+                                 .join(Pedido, Pedido.id == ItemPedido.pedido_id)
+                                 .where(vigente, ItemPedido.id <= ultimo_item, otro.id <= ultimo_item)
+                                 .group_by(ItemPedido.producto_id, otro.producto_id))
+        pedidos = conexion.execute(db.select(ItemPedido.producto_id, db.func.count(db.distinct(ItemPedido.pedido_id))).join(Pedido).where(vigente, ItemPedido.id <= ultimo_item).group_by(ItemPedido.producto_id))
+        indice.construir(productos, pares, pedidos, ultimo_cambio, ultimo_item)
+        return
+    ids = {producto_id for _, producto_id in pendientes}
+    filas = {fila[0]: fila for fila in conexion.execute(db.select(*COLUMNAS_SIMILARES).where(Producto.id.in_(ids)))} if ids else {}
+    nuevos = conexion.execute(db.select(ItemPedido.id, ItemPedido.pedido_id, ItemPedido.producto_id, Pedido.estado).join(Pedido).where(ItemPedido.id > indice.ultimo_item).order_by(ItemPedido.id)).all()
+    pedidos = {}
+    for _, pedido_id, producto_id, estado in nuevos:
+        if estado != 'cancelado':
+            pedidos.setdefault(pedido_id, []).append(producto_id)
+    ultimo_item = nuevos[-1][0] if nuevos else indice.ultimo_item
+    if ids or pedidos:
+        indice.actualizar([(i, filas.get(i)) for i in ids], list(pedidos.values()), pendientes[-1][0] if pendientes else indice.ultimo_cambio, ultimo_item)
+    else:
+        indice.ultimo_item = ultimo_item
+
+recomendador = {'pid': None, 'lock': threading.Lock()}
+
+def iniciar_recomendador(app):
+    # Un hilo por proceso, como el liberador de reservas: construye el índice de similares y lo mantiene al día
+    if not similares.NUMPY_DISPONIBLE or not app.config['SIMILARES_ACTIVAS']:
+        return
+    with recomendador['lock']:
+        if recomendador['pid'] == os.getpid():
+            return
+        recomendador['pid'] = os.getpid()
+
+    def ciclo():
+        while True:
+            with app.app_context():
+                try:
+                    actualizar_similares()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"ERROR SIMILARES: {str(e)}")
+            time.sleep(app.config['SIMILARES_INTERVALO'])
+    threading.Thread(target=ciclo, name='recomendador', daemon=True).start()
+
+@tienda.route('/api/productos', methods=['POST'])
 def crear_producto():
     try:
         data = request.get_json()
@@ -190,98 +916,130 @@ def crear_producto():
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/carrito', methods=['GET'])
+ItemCarrito = namedtuple('ItemCarrito', ['producto_id', 'cantidad', 'producto'])
+
+def serializar_carrito(usuario_id, carrito=None):
+    carrito = almacen_carritos.obtener(usuario_id) if carrito is None else carrito
+    productos = {p.id: p for p in Producto.query.filter(Producto.id.in_(list(carrito)))} if carrito else {}
+    resultado = []
+    total = 0
+    for producto_id, (cantidad, _) in carrito.items():
+        producto = productos.get(producto_id)
+        if not producto:
+            continue
+        subtotal = producto.precio * cantidad
+        total += subtotal
+        resultado.append({'id': producto.id, 'producto': {'id': producto.id, 'nombre': producto.nombre, 'precio': producto.precio, 'imagen_url': producto.imagen_url}, 'cantidad': cantidad, 'subtotal': subtotal})
+    return {'items': resultado, 'total': total}
+
+@tienda.route('/api/carrito', methods=['GET'])
 @token_requerido
 def obtener_carrito(usuario_actual):
     try:
-        items = Carrito.query.filter_by(usuario_id=usuario_actual.id).all()
-        resultado = []
-        total = 0
-        for item in items:
-            subtotal = item.producto.precio * item.cantidad
-            total += subtotal
-            resultado.append({'id': item.id, 'producto': {'id': item.producto.id, 'nombre': item.producto.nombre, 'precio': item.producto.precio, 'imagen_url': item.producto.imagen_url}, 'cantidad': item.cantidad, 'subtotal': subtotal})
-        return jsonify({'items': resultado, 'total': total}), 200
+        return jsonify(serializar_carrito(usuario_actual.id)), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/carrito', methods=['POST'])
+OPERACIONES_CARRITO = ('agregar', 'fijar', 'eliminar')
+# Cantidad mínima por tipo: aplicar_operaciones tomaría un 'agregar' de 0 o negativo como una resta
+CANTIDAD_MINIMA_CARRITO = {'agregar': 1, 'fijar': 0}
+
+@tienda.route('/api/carrito/lote', methods=['POST'])
+@token_requerido
+def actualizar_carrito_lote(usuario_actual):
+    # Aplica varias operaciones sobre el carrito de una vez y devuelve el carrito resultante.
+    # Sirve también para fusionar el carrito de localStorage al iniciar sesión (una operación 'agregar' por producto).
+    try:
+        data = request.get_json() or {}
+        operaciones = data.get('operaciones')
+        if not isinstance(operaciones, list):
+            return jsonify({'mensaje': 'Se requiere una lista de operaciones'}), 400
+        for op in operaciones:
+            # type() y no isinstance: true y false son int para Python
+            if not isinstance(op, dict) or op.get('tipo') not in OPERACIONES_CARRITO or type(op.get('producto_id')) is not int or type(op.get('cantidad', 1)) is not int:
+                return jsonify({'mensaje': 'Operación inválida', 'operacion': op}), 400
+            if op['tipo'] == 'fijar' and 'cantidad' not in op:
+                return jsonify({'mensaje': 'Cantidad requerida', 'operacion': op}), 400
+            if op.get('cantidad', 1) < CANTIDAD_MINIMA_CARRITO.get(op['tipo'], 0):
+                return jsonify({'mensaje': f"La cantidad de '{op['tipo']}' debe ser al menos {CANTIDAD_MINIMA_CARRITO[op['tipo']]}", 'operacion': op}), 400
+        ids = {op['producto_id'] for op in operaciones}
+        existentes = {pid for (pid,) in db.session.query(Producto.id).filter(Producto.id.in_(ids))} if ids else set()
+        carrito = almacen_carritos.aplicar(usuario_actual.id, [(op['tipo'], op['producto_id'], op.get('cantidad', 1)) for op in operaciones if op['producto_id'] in existentes])
+        return jsonify({**serializar_carrito(usuario_actual.id, carrito), 'omitidos': sorted(ids - existentes)}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+@tienda.route('/api/carrito', methods=['POST'])
 @token_requerido
 def agregar_al_carrito(usuario_actual):
     try:
         data = request.get_json()
         if not data or not data.get('producto_id'):
             return jsonify({'mensaje': 'ID requerido'}), 400
-        producto = Producto.query.get(data['producto_id'])
+        producto = db.session.get(Producto, data['producto_id'])
         if not producto:
             return jsonify({'mensaje': 'Producto no encontrado'}), 404
-        item_existente = Carrito.query.filter_by(usuario_id=usuario_actual.id, producto_id=data['producto_id']).first()
-        if item_existente:
-            item_existente.cantidad += data.get('cantidad', 1)
-            db.session.commit()
+        existia = producto.id in almacen_carritos.obtener(usuario_actual.id)
+        almacen_carritos.aplicar(usuario_actual.id, [('agregar', producto.id, data.get('cantidad', 1))])
+        if existia:
             return jsonify({'mensaje': 'Cantidad actualizada'}), 200
-        nuevo_item = Carrito(usuario_id=usuario_actual.id, producto_id=data['producto_id'], cantidad=data.get('cantidad', 1))
-        db.session.add(nuevo_item)
-        db.session.commit()
         return jsonify({'mensaje': 'Añadido al carrito'}), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/carrito/<int:id>', methods=['DELETE'])
+# En las rutas /api/carrito/<id> el id del item es el id del producto
+@tienda.route('/api/carrito/<int:id>', methods=['DELETE'])
 @token_requerido
 def eliminar_del_carrito(usuario_actual, id):
     try:
-        item = Carrito.query.filter_by(id=id, usuario_id=usuario_actual.id).first()
-        if not item:
+        if id not in almacen_carritos.obtener(usuario_actual.id):
             return jsonify({'mensaje': 'Item no encontrado'}), 404
-        db.session.delete(item)
-        db.session.commit()
+        almacen_carritos.aplicar(usuario_actual.id, [('eliminar', id, 0)])
         return jsonify({'mensaje': 'Eliminado'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/carrito/<int:id>', methods=['PUT'])
+@tienda.route('/api/carrito/<int:id>', methods=['PUT'])
 @token_requerido
 def actualizar_cantidad_carrito(usuario_actual, id):
     try:
         data = request.get_json()
-        item = Carrito.query.filter_by(id=id, usuario_id=usuario_actual.id).first()
-        if not item:
+        if id not in almacen_carritos.obtener(usuario_actual.id):
             return jsonify({'mensaje': 'Item no encontrado'}), 404
-        cantidad = data.get('cantidad', 1)
-        if cantidad <= 0:
-            db.session.delete(item)
-        else:
-            item.cantidad = cantidad
-        db.session.commit()
+        almacen_carritos.aplicar(usuario_actual.id, [('fijar', id, data.get('cantidad', 1))])
         return jsonify({'mensaje': 'Actualizado'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/carrito/vaciar', methods=['DELETE'])
+@tienda.route('/api/carrito/vaciar', methods=['DELETE'])
 @token_requerido
 def vaciar_carrito(usuario_actual):
     try:
-        Carrito.query.filter_by(usuario_id=usuario_actual.id).delete()
-        db.session.commit()
+        almacen_carritos.vaciar(usuario_actual.id)
         return jsonify({'mensaje': 'Carrito vaciado'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/categorias', methods=['GET'])
+@tienda.route('/api/categorias', methods=['GET'])
+@respuesta_cacheada(lambda: ['categorias'])
+@lectura
 def obtener_categorias():
     try:
         categorias = Categoria.query.all()
-        resultado = [{'id': c.id, 'nombre': c.nombre, 'descripcion': c.descripcion, 'num_productos': len(c.productos)} for c in categorias]
+        # Conteos del índice de facetas en vez de cargar todos los productos de cada categoría
+        refrescar_indice_facetas()
+        _, conteos = indice_facetas.contar({})
+        resultado = [{'id': c.id, 'nombre': c.nombre, 'descripcion': c.descripcion, 'num_productos': conteos['categoria_id'].get(c.id, 0)} for c in categorias]
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/categorias', methods=['POST'])
+@tienda.route('/api/categorias', methods=['POST'])
 @admin_requerido
 def crear_categoria(usuario_actual):
     try:
@@ -296,52 +1054,242 @@ def crear_categoria(usuario_actual):
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/pedidos', methods=['POST'])
+# Reservas de stock: el stock se descuenta al crear el pedido con UPDATE condicionales y se
+# devuelve si el pedido se cancela o la reserva vence sin pago. En un alquiler (pedido con fechas)
+# el stock es el número de unidades del producto y no se descuenta: cada item ocupa sus fechas
+# mientras el pedido no esté cancelado.
+def ajustar_stock(producto_id, delta):
+    stock_actual = db.func.coalesce(Producto.stock, 0)
+    consulta = db.update(Producto).where(Producto.id == producto_id)
+    if delta < 0:
+        consulta = consulta.where(stock_actual >= -delta)
+    stock = db.session.execute(consulta.values(stock=stock_actual + delta).returning(Producto.stock)).scalar()
+    if stock is None:
+        return None
+    # El UPDATE masivo no dispara los eventos del ORM, así que se actualizan aquí las estadísticas y el cache
+    ajustar_contadores(db.session.connection(), {'productos_sin_stock': int(stock <= 0) - int(stock - delta <= 0)})
+    db.session.info.setdefault('grupos_cache', set()).update(['productos', f'producto:{producto_id}'])
+    return stock
+
+def cantidades_por_producto(items):
+    cantidades = {}
+    for item in items:
+        cantidades[item.producto_id] = cantidades.get(item.producto_id, 0) + item.cantidad
+    return cantidades
+
+def reservar_stock(cantidades):
+    # Devuelve el id del primer producto sin stock suficiente (devolviendo lo ya reservado), o None si todo quedó reservado
+    reservados = []
+    for producto_id, cantidad in sorted(cantidades.items()):
+        if ajustar_stock(producto_id, -cantidad) is None:
+            for reservado, cantidad_reservada in reservados:
+                ajustar_stock(reservado, cantidad_reservada)
+            return producto_id
+        reservados.append((producto_id, cantidad))
+    return None
+
+def alquileres_vigentes():
+    # Lo que carga el índice en memoria: alquileres que no terminaron, de pedidos no cancelados
+    hoy = datetime.datetime.utcnow().date()
+    return db.session.query(ItemPedido.producto_id, ItemPedido.fecha_inicio, ItemPedido.fecha_fin, ItemPedido.cantidad).join(Pedido).filter(ItemPedido.fecha_fin >= hoy, Pedido.estado != 'cancelado')
+
+def reservar_alquiler(cantidades, inicio, fin):
+    # Devuelve el id del primer producto sin unidades libres en todo el periodo, o None. El UPDATE sin
+    # cambios toma el bloqueo de escritura (de la base en SQLite, de las filas en otros motores) antes
+    # de leer la ocupación, así que dos checkouts simultáneos no pueden quedarse con la misma unidad
+    ids = sorted(cantidades)
+    db.session.execute(db.update(Producto).where(Producto.id.in_(ids)).values(stock=Producto.stock).execution_options(synchronize_session=False))
+    stock = dict(db.session.query(Producto.id, Producto.stock).filter(Producto.id.in_(ids)))
+    filas = db.session.query(ItemPedido.producto_id, ItemPedido.fecha_inicio, ItemPedido.fecha_fin, ItemPedido.cantidad).join(Pedido).filter(ItemPedido.producto_id.in_(ids), ItemPedido.fecha_inicio <= fin, ItemPedido.fecha_fin >= inicio, Pedido.estado != 'cancelado')
+    ocupados = disponibilidad.IndiceDisponibilidad.desde_filas(filas).ocupados(inicio, fin)
+    for producto_id in ids:
+        if ocupados.get(producto_id, 0) + cantidades[producto_id] > (stock.get(producto_id) or 0):
+            return producto_id
+    return None
+
+def reservar_items(items):
+    # Vuelve a reservar un pedido liberado: descuenta el stock de lo vendido y comprueba que las fechas de lo alquilado sigan libres
+    vendidos = cantidades_por_producto(item for item in items if item.fecha_inicio is None)
+    producto_sin_stock = reservar_stock(vendidos)
+    if producto_sin_stock is not None:
+        return producto_sin_stock
+    periodos = {}
+    for item in items:
+        if item.fecha_inicio is not None:
+            periodos.setdefault((item.fecha_inicio, item.fecha_fin), []).append(item)
+    for (inicio, fin), alquilados in periodos.items():
+        producto_ocupado = reservar_alquiler(cantidades_por_producto(alquilados), inicio, fin)
+        if producto_ocupado is not None:
+            for producto_id, cantidad in vendidos.items():
+                ajustar_stock(producto_id, cantidad)
+            return producto_ocupado
+    return None
+
+def liberar_reserva(pedido, solo_vencida=False):
+    # Marcar stock_reservado con un UPDATE condicional garantiza que solo un proceso devuelva el stock
+    consulta = db.update(Pedido).where(Pedido.id == pedido.id, Pedido.stock_reservado.is_(True))
+    if solo_vencida:
+        consulta = consulta.where(Pedido.estado == 'pendiente', Pedido.reserva_expira < datetime.datetime.utcnow())
+    if db.session.execute(consulta.values(stock_reservado=False, reserva_expira=None)).rowcount != 1:
+        return False
+    # Los items alquilados no descuentan stock: dejan de ocupar sus fechas al cancelarse el pedido
+    for producto_id, cantidad in cantidades_por_producto(item for item in pedido.items if item.fecha_inicio is None).items():
+        ajustar_stock(producto_id, cantidad)
+    return True
+
+def liberar_reservas_vencidas(limite=100):
+    vencidos = Pedido.query.filter(Pedido.estado == 'pendiente', Pedido.reserva_expira < datetime.datetime.utcnow()).options(db.selectinload(Pedido.items)).limit(limite).all()
+    liberados = 0
+    for pedido in vencidos:
+        if liberar_reserva(pedido, solo_vencida=True):
+            pedido.estado = 'cancelado'
+            liberados += 1
+    db.session.commit()
+    return liberados
+
+liberador_reservas = {'pid': None, 'lock': threading.Lock()}
+
+def iniciar_liberador_reservas(app):
+    # Un hilo por proceso, como el procesador de eventos de pago: cada worker libera lo vencido
+    # y el UPDATE condicional de liberar_reserva evita que dos procesos devuelvan el mismo stock
+    with liberador_reservas['lock']:
+        if liberador_reservas['pid'] == os.getpid():
+            return
+        liberador_reservas['pid'] = os.getpid()
+
+    def ciclo():
+        while True:
+            time.sleep(app.config['RESERVA_INTERVALO_LIBERACION'])
+            with app.app_context():
+                try:
+                    liberar_reservas_vencidas()
+                    # De paso poda los registros de cambios del catálogo, de los pedidos y de la cache
+                    with db.engine.begin() as conexion:
+                        cambios.podar(conexion, app.config['CAMBIOS_CONSERVAR'])
+                        cambios.podar(conexion, app.config['CAMBIOS_CONSERVAR'], cambios.TABLA_PEDIDOS)
+                        cambios.podar(conexion, app.config['CAMBIOS_CONSERVAR'], cambios.TABLA_CACHE)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"ERROR RESERVAS: {str(e)}")
+    threading.Thread(target=ciclo, name='liberador-reservas', daemon=True).start()
+
+@tienda.route('/api/pedidos', methods=['POST'])
 @token_requerido
 def crear_pedido(usuario_actual):
     try:
-        data = request.get_json()
-        items_carrito = Carrito.query.filter_by(usuario_id=usuario_actual.id).all()
+        data = request.get_json() or {}
+        try:
+            periodo = leer_periodo(data, 'fecha_inicio', 'fecha_fin', current_app.config['ALQUILER_MAX_DIAS'])
+        except ValueError as e:
+            return jsonify({'mensaje': str(e)}), 400
+        if periodo and periodo[0] < datetime.datetime.utcnow().date():
+            return jsonify({'mensaje': 'La fecha de inicio ya pasó'}), 400
+        liberar_reservas_vencidas()
+        # El pedido se arma con una instantánea del carrito ya volcada a la tabla
+        almacen_carritos.volcar([usuario_actual.id])
+        carrito = almacen_carritos.obtener(usuario_actual.id)
+        productos = {p.id: p for p in Producto.query.filter(Producto.id.in_(list(carrito)))} if carrito else {}
+        items_carrito = [ItemCarrito(pid, cantidad, productos[pid]) for pid, (cantidad, _) in carrito.items() if pid in productos]
         if not items_carrito:
             return jsonify({'mensaje': 'Carrito vacío'}), 400
-        total = 0
-        items_pedido = []
-        for item in items_carrito:
-            if item.producto.stock < item.cantidad:
-                return jsonify({'mensaje': f'Stock insuficiente para {item.producto.nombre}'}), 400
-            subtotal = item.producto.precio * item.cantidad
-            total += subtotal
-            items_pedido.append({'producto_id': item.producto.id, 'cantidad': item.cantidad, 'precio_unitario': item.producto.precio})
-        nuevo_pedido = Pedido(usuario_id=usuario_actual.id, total=total, estado='pendiente', direccion_envio=data.get('direccion_envio', ''))
+        if periodo:
+            producto_ocupado = reservar_alquiler(cantidades_por_producto(items_carrito), *periodo)
+            if producto_ocupado is not None:
+                db.session.rollback()
+                return jsonify({'mensaje': f'{productos[producto_ocupado].nombre} no tiene unidades libres en esas fechas'}), 409
+        else:
+            producto_sin_stock = reservar_stock(cantidades_por_producto(items_carrito))
+            if producto_sin_stock is not None:
+                db.session.rollback()
+                return jsonify({'mensaje': f'Stock insuficiente para {productos[producto_sin_stock].nombre}'}), 400
+        inicio, fin = periodo or (None, None)
+        total = sum(item.producto.precio * item.cantidad for item in items_carrito)
+        nuevo_pedido = Pedido(usuario_id=usuario_actual.id, total=total, estado='pendiente', direccion_envio=data.get('direccion_envio', ''), stock_reservado=True, reserva_expira=datetime.datetime.utcnow() + datetime.timedelta(minutes=current_app.config['RESERVA_MINUTOS']))
+        nuevo_pedido.items = [ItemPedido(producto_id=item.producto_id, cantidad=item.cantidad, precio_unitario=item.producto.precio, fecha_inicio=inicio, fecha_fin=fin) for item in items_carrito]
         db.session.add(nuevo_pedido)
-        db.session.flush()
-        for item_data in items_pedido:
-            item_pedido = ItemPedido(pedido_id=nuevo_pedido.id, producto_id=item_data['producto_id'], cantidad=item_data['cantidad'], precio_unitario=item_data['precio_unitario'])
-            db.session.add(item_pedido)
         db.session.commit()
-        return jsonify({'mensaje': 'Pedido creado', 'pedido_id': nuevo_pedido.id, 'total': total}), 201
+        resultado = {'mensaje': 'Pedido creado', 'pedido_id': nuevo_pedido.id, 'total': total, 'reserva_expira': nuevo_pedido.reserva_expira.strftime('%Y-%m-%d %H:%M:%S')}
+        if periodo:
+            resultado.update(fecha_inicio=inicio.isoformat(), fecha_fin=fin.isoformat())
+        return jsonify(resultado), 201
     except Exception as e:
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/pedidos', methods=['GET'])
+# Los listados de pedidos leen columnas sueltas en vez de objetos del ORM y las pasan por serializadores compilados
+COLUMNAS_PEDIDO = (Pedido.id, Pedido.fecha_pedido, Pedido.total, Pedido.estado, Pedido.usuario_id, Pedido.direccion_envio)
+COLUMNAS_ITEM = (ItemPedido.pedido_id, ItemPedido.producto_id, ItemPedido.cantidad, ItemPedido.precio_unitario, ItemPedido.fecha_inicio, ItemPedido.fecha_fin, Producto.nombre, Producto.imagen_url, Producto.stock)
+serializar_cabecera_pedido = serializacion.compilar(('id', 'fecha', 'total', 'estado'), fecha=lambda fila: fila.fecha_pedido.strftime('%Y-%m-%d %H:%M:%S'))
+serializar_item_pedido = serializacion.compilar(('producto', 'cantidad', 'precio_unitario', 'subtotal', 'fecha_inicio', 'fecha_fin'),
+    producto=lambda fila: {'id': fila.producto_id, 'nombre': fila.nombre, 'imagen_url': fila.imagen_url},
+    subtotal=lambda fila: fila.cantidad * fila.precio_unitario,
+    fecha_inicio=lambda fila: fila.fecha_inicio and fila.fecha_inicio.isoformat(),
+    fecha_fin=lambda fila: fila.fecha_fin and fila.fecha_fin.isoformat())
+serializar_usuario_pedido = serializacion.compilar(('id', 'nombre', 'email'))
+
+def serializar_pedidos(filas, con_usuario=False, existencias=None):
+    # filas con COLUMNAS_PEDIDO; items con sus productos y usuarios en dos consultas más. Si se pasa
+    # `existencias`, anota ahí el stock actual de los productos de cada pedido
+    ids = [fila.id for fila in filas]
+    items = {}
+    if ids:
+        for item in db.session.execute(db.select(*COLUMNAS_ITEM).outerjoin(Producto, Producto.id == ItemPedido.producto_id).where(ItemPedido.pedido_id.in_(ids)).order_by(ItemPedido.id)):
+            items.setdefault(item.pedido_id, []).append(item)
+            if existencias is not None:
+                existencias.setdefault(item.pedido_id, {})[item.producto_id] = item.stock
+    usuarios = {}
+    if con_usuario and ids:
+        usuarios = {fila.id: serializar_usuario_pedido(fila) for fila in db.session.execute(db.select(Usuario.id, Usuario.nombre, Usuario.email).where(Usuario.id.in_({fila.usuario_id for fila in filas})))}
+    resultado = []
+    for fila in filas:
+        pedido = serializar_cabecera_pedido(fila)
+        pedido['items'] = [serializar_item_pedido(item) for item in items.get(fila.id, ())]
+        if con_usuario:
+            pedido['usuario'] = usuarios.get(fila.usuario_id)
+            pedido['direccion_envio'] = fila.direccion_envio
+        resultado.append(pedido)
+    return resultado
+
+def filtrar_pedidos(consulta, args):
+    if args.get('estado'):
+        consulta = consulta.filter(Pedido.estado == args['estado'])
+    if args.get('desde'):
+        consulta = consulta.filter(Pedido.fecha_pedido >= datetime.datetime.fromisoformat(args['desde']))
+    if args.get('hasta'):
+        consulta = consulta.filter(Pedido.fecha_pedido < datetime.datetime.fromisoformat(args['hasta']) + datetime.timedelta(days=1))
+    return consulta
+
+def listar_pedidos(consulta, args, con_usuario=False):
+    # Carga pedidos, items, productos y usuarios en un número fijo de consultas sin importar cuántos pedidos haya
+    consulta = filtrar_pedidos(consulta, args).with_entities(*COLUMNAS_PEDIDO)
+    if args.get('cursor'):
+        fecha, pedido_id = decodificar_cursor(args['cursor'], (str, int))
+        consulta = consulta.filter(db.tuple_(Pedido.fecha_pedido, Pedido.id) < (datetime.datetime.fromisoformat(fecha), pedido_id))
+    limite = min(max(args.get('limite', LIMITE_PAGINA_DEFECTO, type=int), 1), LIMITE_PAGINA_MAXIMO)
+    pedidos = consulta.order_by(Pedido.fecha_pedido.desc(), Pedido.id.desc()).limit(limite + 1).all()
+    siguiente_cursor = None
+    if len(pedidos) > limite:
+        pedidos = pedidos[:limite]
+        siguiente_cursor = codificar_cursor([pedidos[-1].fecha_pedido.isoformat(), pedidos[-1].id])
+    return {'pedidos': serializar_pedidos(pedidos, con_usuario), 'siguiente_cursor': siguiente_cursor}
+
+@tienda.route('/api/pedidos', methods=['GET'])
 @token_requerido
 def obtener_pedidos_usuario(usuario_actual):
     try:
-        pedidos = Pedido.query.filter_by(usuario_id=usuario_actual.id).order_by(Pedido.fecha_pedido.desc()).all()
-        resultado = []
-        for pedido in pedidos:
-            items = [{'producto': {'id': item.producto.id, 'nombre': item.producto.nombre, 'imagen_url': item.producto.imagen_url}, 'cantidad': item.cantidad, 'precio_unitario': item.precio_unitario, 'subtotal': item.cantidad * item.precio_unitario} for item in pedido.items]
-            resultado.append({'id': pedido.id, 'fecha': pedido.fecha_pedido.strftime('%Y-%m-%d %H:%M:%S'), 'total': pedido.total, 'estado': pedido.estado, 'items': items})
+        try:
+            resultado = listar_pedidos(Pedido.query.filter_by(usuario_id=usuario_actual.id), request.args)
+        except (ValueError, TypeError):
+            return jsonify({'mensaje': 'Parámetros inválidos'}), 400
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/stripe/config', methods=['GET'])
+@tienda.route('/api/stripe/config', methods=['GET'])
 def get_stripe_config():
     return jsonify({'publicKey': 'pk_test_51SK66nHRBYJxFtD5khzWfFhqkIjOwzKsTs3PYNnyZaiM2n0LlRzxk5TtfO2CrR6zMsAEqI9PYIsZ4vmFeWcwjZJf00XJG4HYgf'})
 
-@app.route('/api/stripe/create-payment-intent', methods=['POST'])
+@tienda.route('/api/stripe/create-payment-intent', methods=['POST'])
 @token_requerido
 def create_payment_intent(usuario_actual):
     try:
@@ -352,61 +1300,332 @@ def create_payment_intent(usuario_actual):
         pedido = Pedido.query.get(pedido_id)
         if not pedido or pedido.usuario_id != usuario_actual.id:
             return jsonify({'mensaje': 'Pedido no encontrado'}), 404
-        intent = stripe.PaymentIntent.create(amount=int(pedido.total), currency='cop', metadata={'pedido_id': pedido.id, 'usuario_id': usuario_actual.id})
-        return jsonify({'clientSecret': intent.client_secret, 'pedido_id': pedido.id}), 200
+        pedido_id, monto = pedido.id, int(pedido.total)
+        # Devuelve la conexión al pool mientras se espera a la pasarela
+        db.session.close()
+        # Los reintentos del mismo pedido (doble clic, recarga) devuelven el intent ya creado sin llamar a la pasarela
+        intent = cliente_pagos.obtener_intent(pedido_id, monto, 'cop', {'pedido_id': pedido_id, 'usuario_id': usuario_actual.id})
+        return jsonify({'clientSecret': intent.client_secret, 'pedido_id': pedido_id}), 200
+    except pagos.PasarelaTimeout as e:
+        return jsonify({'mensaje': str(e)}), 503, {'Retry-After': '2'}
     except Exception as e:
         print(f"ERROR STRIPE: {str(e)}")
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/pedidos/<int:pedido_id>/confirmar-pago', methods=['POST'])
+@tienda.route('/api/pedidos/<int:pedido_id>/confirmar-pago', methods=['POST'])
 @token_requerido
 def confirmar_pago(usuario_actual, pedido_id):
+    # El aviso del navegador no confirma nada por sí mismo: se encola y el procesador lo verifica con la pasarela
     try:
-        data = request.get_json()
-        pedido = Pedido.query.get(pedido_id)
+        data = request.get_json() or {}
+        pedido = db.session.get(Pedido, pedido_id)
         if not pedido or pedido.usuario_id != usuario_actual.id:
             return jsonify({'mensaje': 'Pedido no encontrado'}), 404
-        pedido.estado = 'pagado'
-        pedido.stripe_payment_id = data.get('payment_intent_id')
-        for item in pedido.items:
-            producto = Producto.query.get(item.producto_id)
-            if producto:
-                producto.stock -= item.cantidad
-        Carrito.query.filter_by(usuario_id=usuario_actual.id).delete()
+        intent_id = data.get('payment_intent_id')
+        if not intent_id:
+            return jsonify({'mensaje': 'ID de pago requerido'}), 400
+        evento = {'id': f'cliente:{intent_id}', 'type': 'payment_intent.succeeded', 'data': {'object': {'id': intent_id, 'metadata': {'pedido_id': str(pedido.id)}}}}
+        encolar_evento_pago(evento, json.dumps(evento), 'cliente')
         db.session.commit()
-        return jsonify({'mensaje': 'Pago confirmado'}), 200
+        notificar_procesador_eventos()
+        return jsonify({'mensaje': 'Pago recibido', 'estado': pedido.estado}), 202
     except Exception as e:
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/admin/pedidos', methods=['GET'])
+@tienda.route('/api/pagos/webhook', methods=['POST'])
+def webhook_pagos():
+    # Solo verifica la firma y guarda el evento; el procesamiento va por el hilo de eventos
+    try:
+        secreto = current_app.config['PAGOS_WEBHOOK_SECRETO']
+        if not secreto:
+            return jsonify({'mensaje': 'Webhook no configurado (falta PAGOS_WEBHOOK_SECRETO)'}), 503
+        payload = request.get_data()
+        try:
+            evento = pagos.verificar_webhook(payload, request.headers.get('Stripe-Signature', ''), secreto)
+        except pagos.FirmaInvalida:
+            return jsonify({'mensaje': 'Firma inválida'}), 400
+        if not isinstance(evento, dict) or not isinstance(evento.get('id'), str) or not evento['id'] or not isinstance(evento.get('type'), str):
+            return jsonify({'mensaje': 'El evento debe tener id y type'}), 400
+        encolar_evento_pago(evento, payload.decode('utf-8'), 'webhook')
+        db.session.commit()
+        notificar_procesador_eventos()
+        return jsonify({'recibido': True}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+def encolar_evento_pago(evento, payload, origen):
+    # Un evento repetido (reintento de la pasarela, doble aviso) se ignora por su evento_id, salvo que la pasarela
+    # todavía no lo hubiera confirmado: entonces vuelve a la cola
+    insercion = sqlite_insert(EventoPago).values(evento_id=evento['id'], tipo=evento['type'], origen=origen, payload=payload, recibido=datetime.datetime.utcnow())
+    db.session.execute(insercion.on_conflict_do_update(index_elements=['evento_id'], set_={'procesado': None, 'resultado': None}, where=EventoPago.resultado == 'no_verificado'))
+
+def confirmar_pedido_pagado(pedido, payment_id):
+    # El UPDATE toma el bloqueo de escritura de SQLite: el estado releído después es el vigente aunque otro proceso confirme el mismo pedido
+    db.session.execute(db.update(Pedido).where(Pedido.id == pedido.id).values(reserva_expira=None))
+    db.session.refresh(pedido, ['estado', 'stock_reservado', 'reserva_expira'])
+    if pedido.estado in ESTADOS_VENTA:
+        return 'duplicado'
+    if not pedido.stock_reservado:
+        # El liberador devolvió el stock antes del pago: se vuelve a reservar
+        if reservar_items(pedido.items) is not None:
+            return 'sin_stock'
+        pedido.stock_reservado = True
+    pedido.estado = 'pagado'
+    pedido.stripe_payment_id = payment_id
+    return 'pagado'
+
+def datos_evento_pago(datos):
+    objeto = datos.get('data', {}).get('object', {})
+    pedido_id = str((objeto.get('metadata') or {}).get('pedido_id', ''))
+    return objeto.get('id'), int(pedido_id) if pedido_id.isdigit() else None
+
+def verificar_evento_cliente(datos):
+    # Los avisos del navegador no vienen firmados: se comprueba el intent con la pasarela
+    intent_id, pedido_id = datos_evento_pago(datos)
+    intent = cliente_pagos.consultar_intent(intent_id)
+    return intent.estado == 'succeeded' and str(intent.metadata.get('pedido_id')) == str(pedido_id)
+
+def aplicar_evento_pago(evento, datos, pedidos, verificado):
+    if evento.tipo != 'payment_intent.succeeded':
+        return 'ignorado'
+    intent_id, pedido_id = datos_evento_pago(datos)
+    pedido = pedidos.get(pedido_id)
+    if pedido is None:
+        return 'pedido_inexistente'
+    if not verificado:
+        return 'no_verificado'
+    return confirmar_pedido_pagado(pedido, intent_id)
+
+def aplicar_lote_eventos(eventos):
+    datos = {evento.id: json.loads(evento.payload) for evento in eventos}
+    ids = {pedido_id for pedido_id in (datos_evento_pago(d)[1] for d in datos.values()) if pedido_id is not None}
+    pedidos = {p.id: p for p in Pedido.query.filter(Pedido.id.in_(ids)).options(db.selectinload(Pedido.items))} if ids else {}
+    # Las consultas a la pasarela se hacen antes de la primera escritura para no retener el bloqueo de SQLite durante la red
+    verificados = {evento.id: evento.origen != 'cliente' or evento.tipo != 'payment_intent.succeeded' or verificar_evento_cliente(datos[evento.id]) for evento in eventos}
+    pagados = set()
+    ahora = datetime.datetime.utcnow()
+    for evento in eventos:
+        evento.resultado = aplicar_evento_pago(evento, datos[evento.id], pedidos, verificados[evento.id])
+        evento.procesado = ahora
+        evento.intentos += 1
+        evento.error = None
+        if evento.resultado == 'pagado':
+            pagados.add(pedidos[datos_evento_pago(datos[evento.id])[1]].usuario_id)
+    if pagados:
+        db.session.execute(db.delete(Carrito).where(Carrito.usuario_id.in_(pagados)))
+    return pagados
+
+def procesar_eventos_pago(limite=None):
+    # Procesa un lote de eventos pendientes en una transacción; devuelve cuántos tomó
+    eventos = EventoPago.query.filter(EventoPago.procesado.is_(None)).order_by(EventoPago.id).limit(limite or current_app.config['PAGOS_LOTE_EVENTOS']).all()
+    if not eventos:
+        return 0
+    ids = [evento.id for evento in eventos]
+    try:
+        pagados = aplicar_lote_eventos(eventos)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Un evento con error no debe frenar al resto del lote: se procesan uno por uno
+        pagados = set()
+        for evento_id in ids:
+            try:
+                pagados |= aplicar_lote_eventos([db.session.get(EventoPago, evento_id)])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                evento = db.session.get(EventoPago, evento_id)
+                evento.intentos += 1
+                evento.error = str(e)
+                if evento.intentos >= current_app.config['PAGOS_MAX_INTENTOS']:
+                    evento.procesado = datetime.datetime.utcnow()
+                    evento.resultado = 'error'
+                db.session.commit()
+    for usuario_id in pagados:
+        almacen_carritos.descartar(usuario_id)
+    return len(ids)
+
+aviso_eventos_pago = threading.Event()
+procesador_eventos = {'pid': None, 'lock': threading.Lock()}
+
+def iniciar_procesador_eventos(app):
+    # Un hilo por proceso; al arrancar retoma los eventos que quedaron sin procesar
+    with procesador_eventos['lock']:
+        if procesador_eventos['pid'] == os.getpid():
+            return
+        procesador_eventos['pid'] = os.getpid()
+
+    def ciclo():
+        while True:
+            with app.app_context():
+                try:
+                    while procesar_eventos_pago() >= app.config['PAGOS_LOTE_EVENTOS']:
+                        pass
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"ERROR EVENTOS DE PAGO: {str(e)}")
+            aviso_eventos_pago.wait(app.config['PAGOS_INTERVALO_EVENTOS'])
+            aviso_eventos_pago.clear()
+    threading.Thread(target=ciclo, name='procesador-eventos-pago', daemon=True).start()
+
+def notificar_procesador_eventos():
+    iniciar_procesador_eventos(current_app._get_current_object())
+    aviso_eventos_pago.set()
+
+@tienda.route('/api/admin/pedidos', methods=['GET'])
 @admin_requerido
 def obtener_todos_pedidos(usuario_actual):
     try:
-        estado = request.args.get('estado')
-        if estado:
-            pedidos = Pedido.query.filter_by(estado=estado).order_by(Pedido.fecha_pedido.desc()).all()
-        else:
-            pedidos = Pedido.query.order_by(Pedido.fecha_pedido.desc()).all()
-        resultado = []
-        for pedido in pedidos:
-            items = [{'producto': {'id': item.producto.id, 'nombre': item.producto.nombre, 'imagen_url': item.producto.imagen_url}, 'cantidad': item.cantidad, 'precio_unitario': item.precio_unitario, 'subtotal': item.cantidad * item.precio_unitario} for item in pedido.items]
-            resultado.append({'id': pedido.id, 'usuario': {'id': pedido.usuario.id, 'nombre': pedido.usuario.nombre, 'email': pedido.usuario.email}, 'fecha': pedido.fecha_pedido.strftime('%Y-%m-%d %H:%M:%S'), 'total': pedido.total, 'estado': pedido.estado, 'direccion_envio': pedido.direccion_envio, 'items': items})
+        # Secuencia de novedades leída en la misma transacción que la lista: desde ahí sigue el panel
+        seq = cambios.ultimo_cambio(db.session.connection(), cambios.TABLA_PEDIDOS)
+        try:
+            resultado = listar_pedidos(Pedido.query, request.args, con_usuario=True)
+        except (ValueError, TypeError):
+            return jsonify({'mensaje': 'Parámetros inválidos'}), 400
+        resultado['seq'] = seq
         return jsonify(resultado), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/admin/pedidos/<int:pedido_id>/estado', methods=['PUT'])
+def sincronizar_novedades(buffer):
+    # Lee los pedidos anotados en cambio_pedido desde el último evento y agrega su estado actual al
+    # buffer; varios cambios del mismo pedido quedan en un solo evento con la secuencia del último
+    conexion = db.session.connection()
+    pendientes = None if buffer.ultimo is None else cambios.cambios_desde(conexion, buffer.ultimo, current_app.config['NOVEDADES_MAX_CAMBIOS'], cambios.TABLA_PEDIDOS)
+    if pendientes is None:
+        buffer.reiniciar(cambios.ultimo_cambio(conexion, cambios.TABLA_PEDIDOS))
+        return
+    if not pendientes:
+        return
+    secuencias = {pedido_id: secuencia for secuencia, pedido_id in pendientes}
+    existencias = {}
+    filas = db.session.execute(db.select(*COLUMNAS_PEDIDO).where(Pedido.id.in_(list(secuencias)))).all()
+    pedidos = {pedido['id']: pedido for pedido in serializar_pedidos(filas, con_usuario=True, existencias=existencias)}
+    eventos = []
+    for pedido_id, secuencia in sorted(secuencias.items(), key=lambda par: par[1]):
+        pedido = pedidos.get(pedido_id)
+        if pedido is None:
+            evento = {'seq': secuencia, 'pedido_id': pedido_id, 'eliminado': True}
+        else:
+            evento = {'seq': secuencia, 'pedido': pedido, 'stock': existencias.get(pedido_id, {})}
+        eventos.append((secuencia, serializacion.volcar(evento).decode('utf-8')))
+    buffer.agregar(eventos, pendientes[-1][0])
+
+aviso_novedades = threading.Event()
+seguidor_novedades = {'pid': None, 'lock': threading.Lock()}
+
+def iniciar_seguidor_novedades(app):
+    # Un hilo por proceso que llena el buffer de novedades; arranca con la primera conexión de un admin,
+    # así que los workers que nunca atienden el panel no leen el registro
+    with seguidor_novedades['lock']:
+        if seguidor_novedades['pid'] == os.getpid():
+            return
+        seguidor_novedades['pid'] = os.getpid()
+
+    def ciclo():
+        while True:
+            with app.app_context():
+                try:
+                    sincronizar_novedades(novedades_pedidos)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"ERROR NOVEDADES: {str(e)}")
+            aviso_novedades.wait(app.config['NOVEDADES_INTERVALO'])
+            aviso_novedades.clear()
+    threading.Thread(target=ciclo, name='seguidor-novedades', daemon=True).start()
+
+def preparar_novedades():
+    # False si el buffer de este proceso todavía no tiene su primera lectura
+    iniciar_seguidor_novedades(current_app._get_current_object())
+    if novedades_pedidos.ultimo is None:
+        aviso_novedades.set()
+        novedades_pedidos.esperar(-1, 5)
+    return novedades_pedidos.ultimo is not None
+
+@tienda.route('/api/admin/pedidos/novedades', methods=['GET'])
+@admin_requerido
+def obtener_novedades_pedidos(usuario_actual):
+    # Consulta puntual: los pedidos que cambiaron después de ?since=<seq> (la de la lista o la última recibida)
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'mensaje': 'Parámetro since requerido'}), 400
+        if not preparar_novedades():
+            return jsonify({'mensaje': 'Novedades no disponibles todavía'}), 503, {'Retry-After': '1'}
+        resultado = novedades_pedidos.desde(since)
+        if resultado is None:
+            return jsonify({'eventos': [], 'seq': novedades_pedidos.ultimo, 'recargar': True}), 200
+        eventos, ultimo = resultado
+        # Los eventos ya están serializados: se pegan tal cual
+        return Response(f'{{"eventos": [{", ".join(evento for _, evento in eventos)}], "seq": {ultimo}, "recargar": false}}', mimetype='application/json'), 200
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+def flujo_novedades(secuencia, espera, reintento):
+    # Solo NOVEDADES_MAX_CONEXIONES flujos por proceso quedan abiertos esperando eventos; los demás
+    # envían lo pendiente y terminan, y el navegador se reconecta tras `retry` con la última secuencia.
+    # Así muchos admins conectados no ocupan un hilo del worker cada uno. El cupo se toma dentro del
+    # generador para que siempre lo devuelva el finally
+    mantener = conexiones_novedades.acquire(blocking=False)
+    try:
+        yield f'retry: {reintento}\n\n'
+        limite = time.monotonic() + espera
+        while True:
+            resultado = novedades_pedidos.desde(secuencia)
+            if resultado is None:
+                yield f'event: recargar\ndata: {{"seq": {novedades_pedidos.ultimo}}}\n\n'
+                return
+            eventos, secuencia = resultado
+            if eventos:
+                yield ''.join(f'id: {numero}\nevent: pedido\ndata: {evento}\n\n' for numero, evento in eventos)
+            restante = limite - time.monotonic()
+            if not mantener or restante <= 0 or not novedades_pedidos.esperar(secuencia, restante):
+                return
+    finally:
+        if mantener:
+            conexiones_novedades.release()
+
+@tienda.route('/api/admin/pedidos/novedades/stream', methods=['GET'])
+@admin_requerido
+def flujo_novedades_pedidos(usuario_actual):
+    # Server-sent events; al reconectarse el cliente manda Last-Event-ID (o ?since=<seq>)
+    try:
+        since = request.headers.get('Last-Event-ID', type=int)
+        if since is None:
+            since = request.args.get('since', type=int)
+        if since is None:
+            return jsonify({'mensaje': 'Parámetro since requerido'}), 400
+        if not preparar_novedades():
+            return jsonify({'mensaje': 'Novedades no disponibles todavía'}), 503, {'Retry-After': '1'}
+        # El flujo no consulta la base: la conexión vuelve al pool antes de empezar a esperar
+        db.session.close()
+        flujo = flujo_novedades(since, current_app.config['NOVEDADES_ESPERA'], current_app.config['NOVEDADES_REINTENTO_MS'])
+        return Response(flujo, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+@tienda.route('/api/admin/pedidos/<int:pedido_id>/estado', methods=['PUT'])
 @admin_requerido
 def actualizar_estado_pedido(usuario_actual, pedido_id):
     try:
         data = request.get_json()
         nuevo_estado = data.get('estado')
-        if not nuevo_estado or nuevo_estado not in ['pendiente', 'pagado', 'despachado', 'completado', 'cancelado']:
+        if not nuevo_estado or nuevo_estado not in ESTADOS_PEDIDO:
             return jsonify({'mensaje': 'Estado inválido'}), 400
         pedido = Pedido.query.get(pedido_id)
         if not pedido:
             return jsonify({'mensaje': 'Pedido no encontrado'}), 404
+        if nuevo_estado == 'cancelado':
+            liberar_reserva(pedido)
+        elif pedido.estado == 'cancelado' and not pedido.stock_reservado:
+            if reservar_items(pedido.items) is not None:
+                db.session.rollback()
+                return jsonify({'mensaje': 'Stock insuficiente para reactivar el pedido'}), 409
+            pedido.stock_reservado = True
+            if nuevo_estado == 'pendiente':
+                pedido.reserva_expira = datetime.datetime.utcnow() + datetime.timedelta(minutes=current_app.config['RESERVA_MINUTOS'])
         pedido.estado = nuevo_estado
         db.session.commit()
         return jsonify({'mensaje': 'Estado actualizado'}), 200
@@ -414,7 +1633,7 @@ def actualizar_estado_pedido(usuario_actual, pedido_id):
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/admin/productos/<int:producto_id>', methods=['PUT'])
+@tienda.route('/api/admin/productos/<int:producto_id>', methods=['PUT'])
 @admin_requerido
 def actualizar_producto(usuario_actual, producto_id):
     try:
@@ -431,7 +1650,7 @@ def actualizar_producto(usuario_actual, producto_id):
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/admin/productos/<int:producto_id>', methods=['DELETE'])
+@tienda.route('/api/admin/productos/<int:producto_id>', methods=['DELETE'])
 @admin_requerido
 def eliminar_producto(usuario_actual, producto_id):
     try:
@@ -445,7 +1664,7 @@ def eliminar_producto(usuario_actual, producto_id):
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/admin/productos', methods=['POST'])
+@tienda.route('/api/admin/productos', methods=['POST'])
 @admin_requerido
 def crear_producto_admin(usuario_actual):
     try:
@@ -460,7 +1679,410 @@ def crear_producto_admin(usuario_actual):
         db.session.rollback()
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/admin/upload-imagen', methods=['POST'])
+# Tope de cualquier precio que escriben la importación y el inventario masivo: más es un error de tipeo
+MAX_PRECIO = 100000000
+
+def precio_valido(valor):
+    # True/False no son precios aunque Python los trate como 1/0; inf y NaN tampoco (orjson los escribe como null)
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or not math.isfinite(valor) or not 0 <= valor <= MAX_PRECIO:
+        raise ValueError(f'precio inválido: {valor!r} (debe estar entre 0 y {MAX_PRECIO})')
+    return float(valor)
+
+# Columnas que acepta la importación, con su tipo y el valor por defecto de los productos nuevos
+CAMPOS_IMPORTACION = {'nombre': (str, None), 'descripcion': (str, ''), 'precio': (float, None), 'talla': (str, ''), 'color': (str, ''), 'imagen_url': (str, ''), 'stock': (int, 0), 'categoria_id': (int, None)}
+
+def valor_importado(tipo, valor):
+    # El CSV trae texto y el JSONL tipos de JSON; ninguno se convierte a la fuerza: true no es stock=1
+    # ni 2.9 es stock=2. ValueError si no vale
+    if tipo is str:
+        return str(valor)
+    if isinstance(valor, bool):
+        raise ValueError(valor)
+    if isinstance(valor, str):
+        valor = tipo(valor)
+    if not isinstance(valor, (int, float)) or not math.isfinite(valor):
+        raise ValueError(valor)
+    if tipo is int:
+        if isinstance(valor, float) and not valor.is_integer():
+            raise ValueError(valor)
+        return int(valor)
+    return float(valor)
+
+def validar_fila_producto(fila, categorias):
+    # Devuelve {columna: valor} con solo las columnas presentes en la fila; 'categoria' admite el nombre en vez del id
+    desconocidas = set(fila) - set(CAMPOS_IMPORTACION) - {'id', 'categoria'}
+    if desconocidas:
+        raise formatos.FilaInvalida(f"Columnas desconocidas: {', '.join(sorted(desconocidas))}")
+    valores = {}
+    for campo, (tipo, _) in [('id', (int, None)), *CAMPOS_IMPORTACION.items()]:
+        if fila.get(campo) is None:
+            continue
+        try:
+            valores[campo] = valor_importado(tipo, fila[campo])
+        except (TypeError, ValueError):
+            raise formatos.FilaInvalida(f'{campo} inválido: {fila[campo]!r}')
+    if fila.get('categoria') is not None:
+        if fila['categoria'] not in categorias:
+            raise formatos.FilaInvalida(f"Categoría desconocida: {fila['categoria']}")
+        valores['categoria_id'] = categorias[fila['categoria']]
+    if valores.get('id', 1) <= 0 or valores.get('stock', 0) < 0:
+        raise formatos.FilaInvalida('id y stock no pueden ser negativos')
+    if 'precio' in valores:
+        try:
+            precio_valido(valores['precio'])
+        except ValueError as e:
+            raise formatos.FilaInvalida(str(e))
+    if valores.get('categoria_id') is not None and valores['categoria_id'] not in categorias.values():
+        raise formatos.FilaInvalida(f"Categoría desconocida: {valores['categoria_id']}")
+    if 'nombre' in valores and not valores['nombre']:
+        raise formatos.FilaInvalida('nombre vacío')
+    return valores
+
+def registrar_error_importacion(resumen, numero, error):
+    resumen['total_errores'] += 1
+    if len(resumen['errores']) < current_app.config['IMPORTACION_MAX_ERRORES']:
+        resumen['errores'].append({'fila': numero, 'error': str(error)})
+
+def aplicar_lote_importacion(lote, resumen):
+    # Un lote de filas validadas en una transacción: un executemany por grupo consecutivo de filas con
+    # las mismas columnas (UPDATE si el id ya existe, INSERT si no). El ORM no ve estas escrituras,
+    # así que se ajustan aquí estadísticas y cache, como en ajustar_stock
+    conexion = db.session.connection()
+    ids = {valores['id'] for _, valores in lote if 'id' in valores}
+    stock_previo = dict(conexion.execute(db.select(Producto.id, Producto.stock).where(Producto.id.in_(ids))).all()) if ids else {}
+    deltas = {'productos_total': 0, 'productos_sin_stock': 0}
+    grupos = []
+    creados = actualizados = 0
+    for numero, valores in lote:
+        existe = valores.get('id') in stock_previo
+        if not existe and ('nombre' not in valores or 'precio' not in valores):
+            raise formatos.FilaInvalida('nombre y precio son obligatorios para productos nuevos')
+        if existe:
+            actualizados += 1
+            if 'stock' in valores:
+                anterior = stock_previo[valores['id']] or 0
+                deltas['productos_sin_stock'] += int(valores['stock'] <= 0) - int(anterior <= 0)
+                stock_previo[valores['id']] = valores['stock']
+            grupos.append(('actualizar', tuple(sorted(c for c in valores if c != 'id')), {'b_id': valores['id'], **{c: v for c, v in valores.items() if c != 'id'}}))
+        else:
+            creados += 1
+            deltas['productos_total'] += 1
+            deltas['productos_sin_stock'] += int(valores.get('stock', 0) <= 0)
+            if 'id' in valores:
+                stock_previo[valores['id']] = valores.get('stock', 0)
+            fila = {c: valores.get(c, defecto) for c, (_, defecto) in CAMPOS_IMPORTACION.items()}
+            if 'id' in valores:
+                fila['id'] = valores['id']
+            grupos.append(('insertar', tuple(sorted(fila)), fila))
+    tabla = Producto.__table__
+    for (operacion, _), filas in itertools.groupby(grupos, key=lambda g: (g[0], g[1])):
+        filas = [f for _, _, f in filas]
+        if operacion == 'actualizar':
+            conexion.execute(tabla.update().where(tabla.c.id == db.bindparam('b_id')), filas)
+        else:
+            conexion.execute(tabla.insert(), filas)
+    ajustar_contadores(conexion, deltas)
+    db.session.info.setdefault('grupos_cache', set()).update(['productos', 'categorias', *[f'producto:{i}' for i in ids]])
+    db.session.commit()
+    resumen['creados'] += creados
+    resumen['actualizados'] += actualizados
+
+def importar_lote(lote, resumen):
+    try:
+        aplicar_lote_importacion(lote, resumen)
+    except Exception:
+        # Si falla el lote se reintenta fila por fila para reportar exactamente cuáles fallan
+        db.session.rollback()
+        for numero, valores in lote:
+            try:
+                aplicar_lote_importacion([(numero, valores)], resumen)
+            except Exception as e:
+                db.session.rollback()
+                registrar_error_importacion(resumen, numero, e.orig if hasattr(e, 'orig') else e)
+
+@tienda.route('/api/admin/productos/importar', methods=['POST'])
+@admin_requerido
+def importar_productos(usuario_actual):
+    # CSV o JSONL, como archivo multipart ('archivo') o como cuerpo de la petición. Las filas con id
+    # actualizan ese producto (solo las columnas presentes) o lo crean; las demás crean productos nuevos
+    resumen = {'filas': 0, 'creados': 0, 'actualizados': 0, 'total_errores': 0, 'errores': []}
+    try:
+        archivo = request.files.get('archivo')
+        if archivo:
+            flujo, formato = archivo.stream, formatos.formato_de(archivo.filename, archivo.content_type, request.args.get('formato'))
+        else:
+            flujo, formato = request.stream, formatos.formato_de(None, request.content_type, request.args.get('formato'))
+        if formato is None:
+            return jsonify({'mensaje': 'Formato no soportado: usa CSV o JSONL'}), 400
+        categorias = {nombre: id for id, nombre in db.session.query(Categoria.id, Categoria.nombre)}
+        lote = []
+        for numero, fila in formatos.leer_filas(flujo, formato):
+            resumen['filas'] += 1
+            try:
+                if isinstance(fila, formatos.FilaInvalida):
+                    raise fila
+                lote.append((numero, validar_fila_producto(fila, categorias)))
+            except formatos.FilaInvalida as e:
+                registrar_error_importacion(resumen, numero, e)
+            if len(lote) >= current_app.config['IMPORTACION_LOTE']:
+                importar_lote(lote, resumen)
+                lote = []
+        if lote:
+            importar_lote(lote, resumen)
+        resumen['errores'].sort(key=lambda error: error['fila'])
+        return jsonify(resumen), 200
+    except formatos.ArchivoInvalido as e:
+        # Los lotes anteriores ya quedaron guardados: el resumen indica hasta dónde se llegó
+        db.session.rollback()
+        return jsonify({**resumen, 'mensaje': f'Archivo inválido: {str(e)}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({**resumen, 'mensaje': f'Error: {str(e)}'}), 500
+
+# Operaciones masivas de inventario. Cada operación elige productos por `ids` o por `filtro` (los
+# filtros de /api/productos) y cambia stock (absoluto o relativo), precio (porcentaje) o categoría
+# con un solo UPDATE; `filas` fija valores distintos por producto con un executemany. Todas van en una
+# transacción y, como en la importación, el ORM no ve estas escrituras: estadísticas y cache se
+# ajustan aquí, una sola vez al confirmar
+FILTROS_INVENTARIO = ('categoria_id', 'talla', 'color', 'rango_precio', 'precio_min', 'precio_max', 'en_stock')
+COLUMNAS_INVENTARIO = (Producto.id, Producto.stock, Producto.precio, Producto.categoria_id)
+# Hasta multiplicar el precio por 11: más que eso es casi seguro un error de tipeo
+MAX_PRECIO_PORCENTAJE = 1000
+
+def entero(valor, campo, minimo=None):
+    if isinstance(valor, bool) or not isinstance(valor, int) or (minimo is not None and valor < minimo):
+        raise ValueError(f'{campo} inválido: {valor!r}')
+    return valor
+
+def categoria_valida(valor, categorias):
+    # True == 1 para Python: sin el isinstance, "categoria_id": true pasaría como la categoría 1
+    if isinstance(valor, bool) or valor not in categorias:
+        raise ValueError(f'Categoría desconocida: {valor!r}')
+    return valor
+
+def validar_operacion_inventario(operacion, categorias, maximo):
+    # La operación normalizada: {'filas': [...]} o {'ids' | 'filtro', 'cambios'}; ValueError si no es válida
+    if not isinstance(operacion, dict):
+        raise ValueError('debe ser un objeto')
+    if 'filas' in operacion:
+        if set(operacion) != {'filas'} or not isinstance(operacion['filas'], list) or not 0 < len(operacion['filas']) <= maximo:
+            raise ValueError(f'filas debe ser una lista de 1 a {maximo} productos y no combinarse con otros campos')
+        filas = []
+        for fila in operacion['filas']:
+            if not isinstance(fila, dict) or 'id' not in fila or set(fila) - {'id', 'stock', 'precio', 'categoria_id'} or len(fila) < 2:
+                raise ValueError('cada fila lleva id y al menos uno de stock, precio o categoria_id')
+            valores = {'id': entero(fila['id'], 'id', 1)}
+            if 'stock' in fila:
+                valores['stock'] = entero(fila['stock'], 'stock', 0)
+            if 'precio' in fila:
+                valores['precio'] = precio_valido(fila['precio'])
+            if 'categoria_id' in fila:
+                valores['categoria_id'] = categoria_valida(fila['categoria_id'], categorias)
+            filas.append(valores)
+        if len({fila['id'] for fila in filas}) != len(filas):
+            raise ValueError('ids repetidos en filas')
+        return {'filas': filas}
+    normalizada = {'cambios': {}}
+    if ('ids' in operacion) == ('filtro' in operacion):
+        raise ValueError('indica ids o filtro (uno de los dos)')
+    if 'ids' in operacion:
+        if not isinstance(operacion['ids'], list) or not 0 < len(operacion['ids']) <= maximo:
+            raise ValueError(f'ids debe ser una lista de 1 a {maximo} ids')
+        normalizada['ids'] = list(dict.fromkeys(entero(i, 'id', 1) for i in operacion['ids']))
+    else:
+        filtro = operacion['filtro']
+        if not isinstance(filtro, dict) or not filtro or set(filtro) - set(FILTROS_INVENTARIO):
+            raise ValueError(f"filtro debe tener al menos uno de: {', '.join(FILTROS_INVENTARIO)}")
+        # Mismo formato que los parámetros de /api/productos; una lista equivale a repetir el parámetro
+        normalizada['filtro'] = MultiDict([(clave, str(v)) for clave, valor in filtro.items() for v in (valor if isinstance(valor, list) else [valor])])
+        # filtros_facetas rechaza los valores que no entiende: ignorarlos aquí cambiaría todo el catálogo
+        if not filtros_facetas(normalizada['filtro']) and not set(normalizada['filtro']) & {'precio_min', 'precio_max'}:
+            raise ValueError('el filtro no elige nada: usa ids para cambiar productos concretos')
+    cambios = normalizada['cambios']
+    if 'stock' in operacion and 'stock_delta' in operacion:
+        raise ValueError('stock y stock_delta no se combinan')
+    if 'stock' in operacion:
+        cambios['stock'] = entero(operacion['stock'], 'stock', 0)
+    if 'stock_delta' in operacion:
+        cambios['stock_delta'] = entero(operacion['stock_delta'], 'stock_delta')
+    if 'precio_porcentaje' in operacion:
+        porcentaje = operacion['precio_porcentaje']
+        if isinstance(porcentaje, bool) or not isinstance(porcentaje, (int, float)) or not -100 < porcentaje <= MAX_PRECIO_PORCENTAJE:
+            raise ValueError(f'precio_porcentaje debe estar entre -100 (excluido) y {MAX_PRECIO_PORCENTAJE}: {porcentaje!r}')
+        cambios['precio_porcentaje'] = porcentaje
+    if 'categoria_id' in operacion:
+        cambios['categoria_id'] = categoria_valida(operacion['categoria_id'], categorias)
+    desconocidos = set(operacion) - {'ids', 'filtro', 'stock', 'stock_delta', 'precio_porcentaje', 'categoria_id'}
+    if desconocidos or not cambios:
+        raise ValueError('cambia al menos uno de stock, stock_delta, precio_porcentaje o categoria_id' + (f" (campos desconocidos: {', '.join(sorted(desconocidos))})" if desconocidos else ''))
+    return normalizada
+
+def seleccion_inventario(consulta, operacion):
+    if 'ids' in operacion:
+        return consulta.filter(Producto.id.in_(operacion['ids']))
+    return filtrar_productos(consulta, operacion['filtro'])
+
+def aplicar_operacion_inventario(conexion, operacion):
+    # (resultado, delta de productos_sin_stock, ids cambiados). Lee el stock previo de los productos
+    # elegidos y aplica el cambio con un UPDATE ... RETURNING de todos a la vez
+    if 'filas' in operacion:
+        return aplicar_filas_inventario(conexion, operacion['filas'])
+    previos = {fila.id: fila for fila in conexion.execute(seleccion_inventario(db.select(Producto.id, Producto.stock, Producto.precio), operacion))}
+    cambios = operacion['cambios']
+    stock_actual = db.func.coalesce(Producto.stock, 0)
+    consulta = seleccion_inventario(db.update(Producto), operacion)
+    valores = {}
+    if 'stock' in cambios:
+        valores['stock'] = cambios['stock']
+    if 'stock_delta' in cambios:
+        valores['stock'] = stock_actual + cambios['stock_delta']
+        if cambios['stock_delta'] < 0:
+            # Los que no alcanzan quedan como estaban y se informan en omitidos
+            consulta = consulta.filter(stock_actual >= -cambios['stock_delta'])
+    factor = 1 + cambios.get('precio_porcentaje', 0) / 100
+    if 'precio_porcentaje' in cambios:
+        valores['precio'] = db.func.round(Producto.precio * factor, 2)
+        # Los que pasarían de MAX_PRECIO quedan como estaban y se informan en precio_excedido
+        consulta = consulta.filter(db.func.coalesce(Producto.precio, 0) * factor <= MAX_PRECIO)
+    if 'categoria_id' in cambios:
+        valores['categoria_id'] = cambios['categoria_id']
+    filas = conexion.execute(consulta.values(**valores).returning(*COLUMNAS_INVENTARIO)).all()
+    cambiados = {fila.id for fila in filas}
+    resultado = {'actualizados': len(filas), 'filas': [list(fila) for fila in filas]}
+    if 'ids' in operacion:
+        resultado['no_encontrados'] = [i for i in operacion['ids'] if i not in previos]
+    omitidos = [i for i in previos if i not in cambiados]
+    excedidos = [i for i in omitidos if 'precio_porcentaje' in cambios and (previos[i].precio or 0) * factor > MAX_PRECIO]
+    if excedidos:
+        resultado['precio_excedido'] = excedidos
+    if len(excedidos) < len(omitidos):
+        resultado['stock_insuficiente'] = [i for i in omitidos if i not in excedidos]
+    delta = sum(int((fila.stock or 0) <= 0) - int((previos[fila.id].stock or 0) <= 0) for fila in filas)
+    return resultado, delta, cambiados
+
+def aplicar_filas_inventario(conexion, filas):
+    # Valores propios por producto: un executemany por grupo de filas con las mismas columnas
+    ids = [fila['id'] for fila in filas]
+    previos = dict(conexion.execute(db.select(Producto.id, Producto.stock).where(Producto.id.in_(ids))).all())
+    existentes = [fila for fila in filas if fila['id'] in previos]
+    tabla = Producto.__table__
+    columnas_de = lambda fila: tuple(sorted(c for c in fila if c != 'id'))
+    for columnas, grupo in itertools.groupby(sorted(existentes, key=columnas_de), key=columnas_de):
+        conexion.execute(tabla.update().where(tabla.c.id == db.bindparam('b_id')), [{'b_id': fila['id'], **{c: fila[c] for c in columnas}} for fila in grupo])
+    nuevas = {fila.id: fila for fila in conexion.execute(db.select(*COLUMNAS_INVENTARIO).where(Producto.id.in_(ids)))}
+    resultado = {'actualizados': len(existentes), 'filas': [list(nuevas[fila['id']]) for fila in existentes], 'no_encontrados': [i for i in ids if i not in previos]}
+    delta = sum(int((nuevas[i].stock or 0) <= 0) - int((previos[i] or 0) <= 0) for i in nuevas)
+    return resultado, delta, set(nuevas)
+
+@tienda.route('/api/admin/productos/inventario', methods=['POST'])
+@admin_requerido
+def inventario_masivo(usuario_actual):
+    # {"operaciones": [...]} en orden y en una sola transacción: si una falla no se aplica ninguna
+    try:
+        data = request.get_json(silent=True) or {}
+        operaciones = data.get('operaciones')
+        maximo = current_app.config['INVENTARIO_MAX_OPERACIONES']
+        if not isinstance(operaciones, list) or not 0 < len(operaciones) <= maximo:
+            return jsonify({'mensaje': f'operaciones debe ser una lista de 1 a {maximo} operaciones'}), 400
+        categorias = {id for (id,) in db.session.query(Categoria.id)}
+        normalizadas = []
+        for i, operacion in enumerate(operaciones):
+            try:
+                normalizadas.append(validar_operacion_inventario(operacion, categorias, current_app.config['INVENTARIO_MAX_FILAS']))
+            except ValueError as e:
+                return jsonify({'mensaje': f'Operación {i}: {str(e)}'}), 400
+        conexion = db.session.connection()
+        # El UPDATE sin cambios toma el bloqueo de escritura antes de leer el stock previo, así que
+        # nadie lo cambia entre la lectura y los UPDATE de las operaciones
+        conexion.execute(db.update(Estadistica).where(Estadistica.clave == 'productos_total').values(valor=Estadistica.valor))
+        resultados, sin_stock, ids = [], 0, set()
+        for operacion in normalizadas:
+            resultado, delta, cambiados = aplicar_operacion_inventario(conexion, operacion)
+            resultados.append(resultado)
+            sin_stock += delta
+            ids |= cambiados
+        ajustar_contadores(conexion, {'productos_sin_stock': sin_stock})
+        db.session.info.setdefault('grupos_cache', set()).update(['productos', 'categorias', *[f'producto:{i}' for i in ids]])
+        db.session.commit()
+        return jsonify({'columnas': [c.name for c in COLUMNAS_INVENTARIO], 'operaciones': resultados, 'productos_actualizados': len(ids)}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+def filas_en_flujo(consulta):
+    # Iteración del lado del servidor con yield_per sobre una conexión de lectura propia: la memoria
+    # no depende de cuántas filas haya y la sesión de la petición no queda retenida
+    motor = db.engines.get(base_datos.BIND_LECTURA, db.engine)
+    with motor.connect() as conexion:
+        yield from conexion.execution_options(yield_per=current_app.config['EXPORTACION_LOTE']).execute(consulta)
+
+def respuesta_en_flujo(nombre, formato, cuerpo):
+    archivo = f"{nombre}-{datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{formato}"
+    return Response(stream_with_context(cuerpo), content_type=formatos.FORMATOS[formato], headers={'Content-Disposition': f'attachment; filename={archivo}'})
+
+@tienda.route('/api/admin/productos/exportar', methods=['GET'])
+@admin_requerido
+def exportar_productos(usuario_actual):
+    # Acepta los mismos filtros que /api/productos; el CSV exportado se puede volver a importar
+    try:
+        formato = request.args.get('formato', 'csv')
+        if formato not in formatos.FORMATOS:
+            return jsonify({'mensaje': 'Formato no soportado: usa csv o jsonl'}), 400
+        try:
+            consulta = filtrar_productos(db.select(*[getattr(Producto, c) for c in CAMPOS_PRODUCTO]), request.args).order_by(Producto.id)
+        except ValueError as e:
+            return jsonify({'mensaje': str(e)}), 400
+        filas = filas_en_flujo(consulta)
+        if formato == 'csv':
+            cuerpo = formatos.escribir_csv(CAMPOS_PRODUCTO, filas)
+        else:
+            cuerpo = formatos.escribir_jsonl(dict(fila._mapping) for fila in filas)
+        return respuesta_en_flujo('productos', formato, cuerpo)
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+COLUMNAS_EXPORTACION_PEDIDOS = ('pedido_id', 'fecha', 'estado', 'total', 'usuario_id', 'usuario_nombre', 'usuario_email', 'direccion_envio', 'stripe_payment_id', 'producto_id', 'producto_nombre', 'cantidad', 'precio_unitario', 'fecha_inicio', 'fecha_fin')
+
+def pedidos_exportados(filas):
+    # Las filas llegan agrupadas por pedido (una por ítem), así que se arma cada pedido sin acumular los demás
+    for _, grupo in itertools.groupby(filas, key=lambda fila: fila.pedido_id):
+        grupo = list(grupo)
+        p = grupo[0]
+        yield {
+            'id': p.pedido_id, 'fecha': p.fecha, 'estado': p.estado, 'total': p.total,
+            'usuario': {'id': p.usuario_id, 'nombre': p.usuario_nombre, 'email': p.usuario_email},
+            'direccion_envio': p.direccion_envio, 'stripe_payment_id': p.stripe_payment_id,
+            'items': [{'producto_id': i.producto_id, 'nombre': i.producto_nombre, 'cantidad': i.cantidad, 'precio_unitario': i.precio_unitario, 'fecha_inicio': i.fecha_inicio, 'fecha_fin': i.fecha_fin} for i in grupo if i.cantidad is not None],
+        }
+
+@tienda.route('/api/admin/pedidos/exportar', methods=['GET'])
+@admin_requerido
+def exportar_pedidos(usuario_actual):
+    # CSV con una fila por ítem o JSONL con un pedido por línea; filtros estado, desde y hasta
+    try:
+        formato = request.args.get('formato', 'csv')
+        if formato not in formatos.FORMATOS:
+            return jsonify({'mensaje': 'Formato no soportado: usa csv o jsonl'}), 400
+        consulta = db.select(
+            Pedido.id.label('pedido_id'), Pedido.fecha_pedido.label('fecha'), Pedido.estado, Pedido.total, Pedido.usuario_id,
+            Usuario.nombre.label('usuario_nombre'), Usuario.email.label('usuario_email'), Pedido.direccion_envio, Pedido.stripe_payment_id,
+            ItemPedido.producto_id, Producto.nombre.label('producto_nombre'), ItemPedido.cantidad, ItemPedido.precio_unitario, ItemPedido.fecha_inicio, ItemPedido.fecha_fin,
+        ).select_from(Pedido).join(Usuario, Usuario.id == Pedido.usuario_id).outerjoin(ItemPedido, ItemPedido.pedido_id == Pedido.id).outerjoin(Producto, Producto.id == ItemPedido.producto_id)
+        try:
+            consulta = filtrar_pedidos(consulta, request.args)
+        except (ValueError, TypeError):
+            return jsonify({'mensaje': 'Parámetros inválidos'}), 400
+        # Sin ordenar por ítem: así SQLite recorre el índice de fecha sin ordenar en memoria, y los ítems de un pedido salen juntos
+        filas = filas_en_flujo(consulta.order_by(Pedido.fecha_pedido, Pedido.id))
+        if formato == 'csv':
+            cuerpo = formatos.escribir_csv(COLUMNAS_EXPORTACION_PEDIDOS, filas)
+        else:
+            cuerpo = formatos.escribir_jsonl(pedidos_exportados(filas))
+        return respuesta_en_flujo('pedidos', formato, cuerpo)
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+@tienda.route('/api/admin/upload-imagen', methods=['POST'])
 @admin_requerido
 def upload_imagen(usuario_actual):
     try:
@@ -470,56 +2092,186 @@ def upload_imagen(usuario_actual):
         if file.filename == '':
             return jsonify({'mensaje': 'No se seleccionó archivo'}), 400
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_')
-            filename = timestamp + filename
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            return jsonify({'mensaje': 'Imagen subida', 'imagen_url': f'imagenes/{filename}'}), 200
+            extension = secure_filename(file.filename).rsplit('.', 1)[1].lower()
+            datos = file.read()
+            if not almacen_imagenes.es_imagen(datos):
+                return jsonify({'mensaje': 'El archivo no es una imagen válida'}), 400
+            filename, es_nueva = almacen_imagenes.guardar_imagen(datos, extension, CARPETA_IMAGENES)
+            almacen_imagenes.programar_variantes(filename, CARPETA_IMAGENES)
+            imagen_url = f"{current_app.config['UPLOAD_FOLDER']}/{filename}"
+            return jsonify({'mensaje': 'Imagen subida' if es_nueva else 'Imagen ya existente', 'imagen_url': imagen_url, 'imagenes': imagenes_producto(imagen_url)}), 200
         return jsonify({'mensaje': 'Tipo no permitido'}), 400
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/admin/estadisticas', methods=['GET'])
+@tienda.route('/api/admin/estadisticas', methods=['GET'])
 @admin_requerido
 def obtener_estadisticas(usuario_actual):
     try:
-        total_pedidos = Pedido.query.count()
-        pedidos_pendientes = Pedido.query.filter_by(estado='pendiente').count()
-        pedidos_pagados = Pedido.query.filter_by(estado='pagado').count()
-        pedidos_despachados = Pedido.query.filter_by(estado='despachado').count()
-        total_ventas = db.session.query(db.func.sum(Pedido.total)).filter(Pedido.estado.in_(['pagado', 'despachado', 'completado'])).scalar() or 0
-        total_productos = Producto.query.count()
-        productos_sin_stock = Producto.query.filter_by(stock=0).count()
-        return jsonify({'pedidos': {'total': total_pedidos, 'pendientes': pedidos_pendientes, 'pagados': pedidos_pagados, 'despachados': pedidos_despachados}, 'ventas': {'total': total_ventas}, 'productos': {'total': total_productos, 'sin_stock': productos_sin_stock}}), 200
+        valores = {e.clave: e.valor for e in Estadistica.query.all()}
+        contador = lambda clave: int(valores.get(clave, 0))
+        return jsonify({'pedidos': {'total': contador('pedidos_total'), 'pendientes': contador('pedidos_pendiente'), 'pagados': contador('pedidos_pagado'), 'despachados': contador('pedidos_despachado')}, 'ventas': {'total': valores.get('ventas_total', 0)}, 'productos': {'total': contador('productos_total'), 'sin_stock': contador('productos_sin_stock')}}), 200
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+@tienda.route('/api/admin/estadisticas/series', methods=['GET'])
+@admin_requerido
+def obtener_series_estadisticas(usuario_actual):
+    try:
+        dias = min(max(request.args.get('dias', 30, type=int), 1), 366)
+        semanas = min(max(request.args.get('semanas', 12, type=int), 1), 104)
+        hoy = datetime.datetime.utcnow().date()
+        serie = lambda tipo, desde: [{'inicio': v.inicio.isoformat(), 'pedidos': v.pedidos, 'ventas': v.ventas} for v in VentaPeriodo.query.filter(VentaPeriodo.tipo == tipo, VentaPeriodo.inicio >= desde).order_by(VentaPeriodo.inicio)]
+        productos = db.session.query(VentaProducto, Producto.nombre).outerjoin(Producto, Producto.id == VentaProducto.producto_id).order_by(VentaProducto.unidades.desc()).limit(request.args.get('top', 10, type=int)).all()
+        return jsonify({'dias': serie('dia', hoy - datetime.timedelta(days=dias - 1)), 'semanas': serie('semana', hoy - datetime.timedelta(days=hoy.weekday(), weeks=semanas - 1)), 'productos': [{'producto_id': v.producto_id, 'nombre': nombre, 'unidades': v.unidades, 'ventas': v.ventas} for v, nombre in productos]}), 200
+    except Exception as e:
+        return jsonify({'mensaje': f'Error: {str(e)}'}), 500
+
+@tienda.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    token = current_app.config['METRICAS_TOKEN']
+    if token:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'mensaje': 'Acceso denegado'}), 403
+    elif request.remote_addr not in ('127.0.0.1', '::1') or request.headers.get('X-Forwarded-For'):
+        # Un proxy en la misma máquina llega desde 127.0.0.1 pero agrega X-Forwarded-For
+        return jsonify({'mensaje': 'Acceso denegado (define METRICAS_TOKEN para exponer /metrics)'}), 403
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+@tienda.route('/api/admin/metricas/n-mas-1', methods=['GET'])
+@admin_requerido
+def obtener_n_mas_1(usuario_actual):
+    # Las sentencias repetidas llevan SQL, así que no salen en /metrics
+    try:
+        return jsonify({'umbral': metricas.umbral_n_mas_1, 'ultimos': metricas.ultimos_n_mas_1_lista()}), 200
     except Exception as e:
         return jsonify({'mensaje': f'Error: {str(e)}'}), 500
 
-@app.route('/api/health', methods=['GET'])
+@tienda.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok', 'mensaje': 'Servidor funcionando'}), 200
 
-@app.route('/')
+def obtener_manifiesto(app):
+    # Se construye en el primer uso; con gunicorn (preload_app) lo construye el proceso maestro
+    # antes del fork y los workers lo comparten
+    if manifiesto['actual'] is None:
+        with manifiesto['lock']:
+            if manifiesto['actual'] is None:
+                manifiesto['actual'] = estaticos.Manifiesto(BASE_DIR, os.path.join(app.instance_path, 'estaticos')).construir(['index.html', 'admin.html'])
+    return manifiesto['actual']
+
+@tienda.route('/')
 def index():
-    return send_file(os.path.join(BASE_DIR, 'index.html'))
+    return obtener_manifiesto(current_app).responder('index.html')
 
-@app.route('/admin.html')
+@tienda.route('/admin.html')
 def admin():
-    return send_file(os.path.join(BASE_DIR, 'admin.html'))
+    return obtener_manifiesto(current_app).responder('admin.html')
 
-@app.route('/<path:filename>')
+@tienda.route('/<path:filename>')
 def serve_static(filename):
+    respuesta = obtener_manifiesto(current_app).responder(filename)
+    if respuesta is not None:
+        return respuesta
     try:
-        return send_from_directory(BASE_DIR, filename)
+        respuesta = send_from_directory(BASE_DIR, filename)
+        if filename.startswith(f"{current_app.config['UPLOAD_FOLDER']}/") and almacen_imagenes.es_nombre_por_contenido(filename):
+            respuesta.headers['Cache-Control'] = estaticos.CACHE_INMUTABLE
+        return respuesta
     except:
         return jsonify({'error': 'Archivo no encontrado'}), 404
 
-with app.app_context():
+
+def migrar():
+    # Crea las tablas, columnas e índices que falten, el índice de búsqueda y las estadísticas. Es
+    # idempotente y corre con "flask --app app migrar" (o al iniciar python app.py / gunicorn), no al importar
     db.create_all()
+    base_datos.agregar_columnas_faltantes(db)
+    # create_all no agrega índices nuevos a tablas que ya existen
+    for indice in [*Producto.__table__.indexes, *Carrito.__table__.indexes, *Pedido.__table__.indexes, *ItemPedido.__table__.indexes]:
+        indice.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conexion:
+        busqueda_fts['activa'] = busqueda.crear_indice_busqueda(conexion)
+        cambios.crear_registro_cambios(conexion)
+    if not Estadistica.query.first():
+        recalcular_estadisticas()
+
+@tienda.cli.command('migrar')
+def comando_migrar():
+    migrar()
+    print('✅ Base de datos al día')
+
+def armar_app():
+    # Arma la app sin tocar la base de datos: los motores conectan en la primera consulta, el esquema
+    # lo crea migrar() y los hilos de fondo arrancan con iniciar_tareas(). No es una fábrica: los
+    # servicios (caches, pool de contraseñas, carritos, pagos, métricas, índices) son globales del
+    # módulo y las rutas los usan directamente, así que hay una sola app por proceso y se arma al
+    # importar. Para otra configuración se fija el entorno antes de importar o se cambia app.config.
+    if 'app' in globals():
+        raise RuntimeError('La app ya está armada: hay una sola por proceso (usa app.app)')
+    global cache_tokens, cache_usuarios, cache_respuestas, metricas, pasarela_pagos, cliente_pagos, pool_hash, almacen_carritos, indice_alquileres, indice_facetas, indice_similares, novedades_pedidos, conexiones_novedades
+    app = Flask(__name__)
+    app.request_class = Peticion
+    app.json = serializacion.ProveedorJSON(app)
+    configurar(app)
+    cache_tokens = CacheTTL(app.config['AUTH_CACHE_MAX'], app.config['AUTH_CACHE_TTL'])
+    cache_usuarios = CacheTTL(app.config['AUTH_CACHE_MAX'], app.config['AUTH_CACHE_TTL'])
+    cache_respuestas = CacheRespuestas(CacheTTL(app.config['CACHE_RESPUESTAS_MAX'], app.config['CACHE_RESPUESTAS_TTL']))
+    indice_alquileres = disponibilidad.IndiceDisponibilidad(app.config['DISPONIBILIDAD_TTL'])
+    indice_facetas = facetas.IndiceFacetas(app.config['FACETAS_RANGOS_PRECIO'], app.config['FACETAS_INTERVALO'])
+    indice_similares = similares.IndiceSimilares(app.config['FACETAS_RANGOS_PRECIO'], app.config['SIMILARES_K'], app.config['SIMILARES_PESO_COMPRAS'])
+    novedades_pedidos = novedades.BufferNovedades(app.config['NOVEDADES_CAPACIDAD'])
+    conexiones_novedades = threading.BoundedSemaphore(app.config['NOVEDADES_MAX_CONEXIONES'])
+    metricas = Metricas(app.config['METRICAS_UMBRAL_N_MAS_1'])
+    pasarela_pagos = pagos.PasarelaStripe('sk_test_51SK66nHRBYJxFtD5oxnQMGyoZ8GnJNm3dtX3rJmdEifjDOE4GIy1xKteVJwXtIx5RWaqlKG8fxYcKbYb9D9fAJSa00vNLS43XS', app.config['PAGOS_API_BASE'], app.config['PAGOS_TIMEOUT_CONEXION'], app.config['PAGOS_TIMEOUT_LECTURA'], app.config['PAGOS_REINTENTOS'], app.config['PAGOS_TRABAJADORES'])
+    cliente_pagos = pagos.ClientePagos(pasarela_pagos, app.config['PAGOS_TRABAJADORES'], app.config['PAGOS_ESPERA'])
+    pool_hash = contrasenas.PoolHash(app.config['HASH_METODO'], app.config['HASH_PROCESOS'], app.config['HASH_MAX_PENDIENTES'], app.config['HASH_ESPERA'])
+    almacen_carritos = carritos.AlmacenCarritosSQL(db, Carrito)
+    if app.config['CARRITO_ALMACEN'] == 'memoria':
+        almacen_carritos = carritos.AlmacenCarritosMemoria(almacen_carritos, app.app_context, app.config['CARRITO_INTERVALO_VOLCADO'], app.config['CARRITO_INACTIVIDAD'])
+
+    base_datos.configurar_app(app)
+    CORS(app)
+    db.init_app(app)
+    app.register_blueprint(tienda)
+    with app.app_context():
+        base_datos.registrar_pragmas(db)
+        if app.config['METRICAS_ACTIVAS']:
+            metricas.instrumentar(app, db.engines.values(), peticion_de_admin)
+    return app
+
+def calentar(app):
+    # Lo que conviene cargar una sola vez en el proceso maestro antes del fork (gunicorn.conf.py):
+    # los workers heredan estas páginas de memoria por copy-on-write en vez de repetir el trabajo
+    obtener_manifiesto(app)
+    try:
+        with app.app_context():
+            refrescar_indice_facetas()
+    except Exception:
+        # Precargar es opcional (cada worker lo carga en su primera petición), pero un fallo aquí suele
+        # ser una base sin migrar: queda en el log con la traza en vez de perderse en stdout
+        app.logger.exception('No se pudo precargar el índice de facetas (¿falta correr migrar()?)')
+    for modulo in ('stripe', 'requests', 'PIL.Image', 'numpy'):
+        try:
+            importlib.import_module(modulo)
+        except ImportError:
+            pass
+
+def iniciar_tareas(app):
+    # Hilos de fondo del proceso actual; con gunicorn se llama en cada worker, nunca en el maestro
+    iniciar_liberador_reservas(app)
+    iniciar_procesador_eventos(app)
+    iniciar_recomendador(app)
+
+app = armar_app()
 
 if __name__ == '__main__':
     print("🚀 Servidor iniciado en http://localhost:5000")
     print("📦 Base de datos: tienda_vestidos.db")
     print("✨ GLAM RENT - Backend activo")
     print("💳 Stripe configurado y listo")
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    with app.app_context():
+        migrar()
+    calentar(app)
+    iniciar_tareas(app)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', port=5000, threaded=True)
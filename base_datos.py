@@ -0,0 +1,89 @@
+import os
+from functools import wraps
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, inspect, text
+
+# Configuración del motor SQLite para producción: WAL para que lectores y escritores no se
+# bloqueen entre sí, busy_timeout en vez de "database is locked" inmediato, y un pool aparte
+# de conexiones de solo lectura para las consultas del catálogo.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+BIND_LECTURA = 'lectura'
+OPCIONES_ESCRITURA = {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'connect_args': {'timeout': 5, 'check_same_thread': False}}
+OPCIONES_LECTURA = {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 30, 'connect_args': {'timeout': 5, 'check_same_thread': False}}
+
+def optimizacion_activa():
+    return os.environ.get('SQLITE_TUNING', '1') != '0'
+
+def es_sqlite_en_archivo(uri):
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') not in ('sqlite:', 'sqlite:/')
+
+def configurar_app(app):
+    # Debe llamarse antes de SQLAlchemy(app)
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    if not es_sqlite_en_archivo(uri) or not optimizacion_activa():
+        return
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', OPCIONES_ESCRITURA)
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[BIND_LECTURA] = {'url': uri, **OPCIONES_LECTURA}
+
+def aplicar_pragmas(conexion_dbapi, registro, solo_lectura=False):
+    cursor = conexion_dbapi.cursor()
+    for pragma, valor in PRAGMAS.items():
+        if solo_lectura and pragma == 'journal_mode':
+            continue
+        cursor.execute(f'PRAGMA {pragma} = {valor}')
+    if solo_lectura:
+        cursor.execute('PRAGMA query_only = ON')
+    cursor.close()
+
+def registrar_pragmas(db):
+    # Debe llamarse dentro de un contexto de aplicación, después de SQLAlchemy(app)
+    if not optimizacion_activa():
+        return
+    for nombre, motor in db.engines.items():
+        if motor.dialect.name == 'sqlite' and es_sqlite_en_archivo(str(motor.url)):
+            solo_lectura = nombre == BIND_LECTURA
+            event.listen(motor, 'connect', lambda conexion, registro, solo_lectura=solo_lectura: aplicar_pragmas(conexion, registro, solo_lectura))
+
+class SesionEnrutada(Session):
+    # Dentro de una vista marcada con @solo_lectura las consultas sin bind explícito van al pool de lectura
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(BIND_LECTURA) and BIND_LECTURA in self._db.engines:
+            return self._db.engines[BIND_LECTURA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def solo_lectura(db):
+    def envoltura(f):
+        @wraps(f)
+        def decorador(*args, **kwargs):
+            db.session.info[BIND_LECTURA] = True
+            try:
+                return f(*args, **kwargs)
+            finally:
+                db.session.info.pop(BIND_LECTURA, None)
+        return decorador
+    return envoltura
+
+def agregar_columnas_faltantes(db):
+    # create_all no modifica tablas existentes: agrega con ALTER TABLE las columnas nuevas de los modelos
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conexion:
+        for tabla in db.metadata.sorted_tables:
+            if not inspector.has_table(tabla.name):
+                continue
+            existentes = {c['name'] for c in inspector.get_columns(tabla.name)}
+            for columna in tabla.columns:
+                if columna.name in existentes:
+                    continue
+                sql = f'ALTER TABLE "{tabla.name}" ADD COLUMN "{columna.name}" {columna.type.compile(db.engine.dialect)}'
+                if columna.default is not None and columna.default.is_scalar:
+                    valor = columna.default.arg
+                    valor = int(valor) if isinstance(valor, bool) else repr(valor)
+                    sql += f' DEFAULT {valor}' if columna.nullable else f' NOT NULL DEFAULT {valor}'
+                conexion.execute(text(sql))
@@ -0,0 +1,161 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+import datetime
+
+# Alquileres por fechas. Primero N compradores alquilan a la vez el mismo vestido (STOCK unidades)
+# en periodos que se solapan: ningún día puede quedar con más unidades alquiladas que el stock.
+# Después, sobre catálogos de distinto tamaño con alquileres ya cargados, compara el listado
+# filtrado por fechas (índice en memoria) con el listado sin filtro y con calcular la ocupación
+# leyendo de la base todos los alquileres del rango, y comprueba que el filtro da lo mismo.
+COMPRADORES = int(os.environ.get('BENCH_COMPRADORES', 100))
+STOCK = int(os.environ.get('BENCH_STOCK', 3))
+TAMANOS = [int(n) for n in os.environ.get('BENCH_PRODUCTOS', '2000,20000').split(',')]
+ALQUILERES_POR_PRODUCTO = int(os.environ.get('BENCH_ALQUILERES_POR_PRODUCTO', 4))
+HORIZONTE_DIAS = 180
+REPETICIONES = 30
+
+def preparar(ruta_db):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    os.environ['HASH_METODO'] = 'pbkdf2:sha256:1000'
+    os.environ['CARRITO_ALMACEN'] = 'db'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as tienda
+    with tienda.app.app_context():
+        tienda.migrar()
+    return tienda
+
+def concurrencia(ruta_db):
+    tienda = preparar(ruta_db)
+    from werkzeug.security import generate_password_hash
+    db, Producto, Usuario, Carrito, ItemPedido, Pedido = tienda.db, tienda.Producto, tienda.Usuario, tienda.Carrito, tienda.ItemPedido, tienda.Pedido
+    app = tienda.app
+    with app.app_context():
+        producto = Producto(nombre='Corsé talla M', precio=180000, stock=STOCK, talla='M')
+        db.session.add(producto)
+        db.session.add_all([Usuario(nombre=f'U{i}', email=f'u{i}@bench', password=generate_password_hash('x', method='pbkdf2:sha256:1000')) for i in range(COMPRADORES)])
+        db.session.flush()
+        db.session.add_all([Carrito(usuario_id=u.id, producto_id=producto.id, cantidad=1) for u in Usuario.query.all()])
+        db.session.commit()
+        producto_id = producto.id
+    cliente = app.test_client()
+    tokens = [cliente.post('/api/login', json={'email': f'u{i}@bench', 'password': 'x'}).get_json()['token'] for i in range(COMPRADORES)]
+    hoy = datetime.date.today()
+    estados = Counter()
+    lock = threading.Lock()
+    barrera = threading.Barrier(COMPRADORES)
+
+    def alquilar(token, desplazamiento):
+        cliente = app.test_client()
+        inicio = hoy + datetime.timedelta(days=10 + desplazamiento)
+        barrera.wait()
+        r = cliente.post('/api/pedidos', json={'fecha_inicio': inicio.isoformat(), 'fecha_fin': (inicio + datetime.timedelta(days=2)).isoformat()}, headers={'Authorization': f'Bearer {token}'})
+        with lock:
+            estados[r.status_code] += 1
+
+    random.seed(7)
+    hilos = [threading.Thread(target=alquilar, args=(t, random.randrange(10))) for t in tokens]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    with app.app_context():
+        filas = db.session.query(ItemPedido.fecha_inicio, ItemPedido.fecha_fin, ItemPedido.cantidad).join(Pedido).filter(ItemPedido.producto_id == producto_id, Pedido.estado != 'cancelado').all()
+    ocupacion = Counter()
+    for desde, hasta, cantidad in filas:
+        for n in range((hasta - desde).days + 1):
+            ocupacion[desde + datetime.timedelta(days=n)] += cantidad
+    maximo = max(ocupacion.values(), default=0)
+    print(f'{COMPRADORES} alquileres simultáneos de 3 días sobre {STOCK} unidades en {duracion:.2f}s: respuestas {dict(estados)}, alquileres creados {len(filas)}, máximo alquilado en un día {maximo}')
+    if maximo > STOCK or estados.get(500):
+        print('❌ Unidades alquiladas dos veces o errores en el checkout')
+        sys.exit(1)
+
+def escalado(ruta_db, productos):
+    tienda = preparar(ruta_db)
+    db, Producto, Usuario, Pedido, ItemPedido, disponibilidad = tienda.db, tienda.Producto, tienda.Usuario, tienda.Pedido, tienda.ItemPedido, tienda.disponibilidad
+    app = tienda.app
+    app.config['CACHE_RESPUESTAS_TTL'] = 0
+    random.seed(11)
+    hoy = datetime.date.today()
+    with app.app_context():
+        db.session.execute(db.insert(Producto), [{'nombre': f'Vestido {i}', 'precio': 100000 + i, 'stock': random.randint(1, 3)} for i in range(productos)])
+        db.session.execute(db.insert(Usuario), [{'nombre': 'Cliente', 'email': 'cliente@bench', 'password': 'x'}])
+        total = productos * ALQUILERES_POR_PRODUCTO
+        db.session.execute(db.insert(Pedido), [{'usuario_id': 1, 'total': 100000, 'estado': 'cancelado' if i % 10 == 0 else 'pagado', 'stock_reservado': i % 10 != 0} for i in range(total)])
+        items = []
+        for i in range(total):
+            inicio = hoy + datetime.timedelta(days=random.randrange(HORIZONTE_DIAS))
+            items.append({'pedido_id': i + 1, 'producto_id': random.randint(1, productos), 'cantidad': 1, 'precio_unitario': 100000, 'fecha_inicio': inicio, 'fecha_fin': inicio + datetime.timedelta(days=random.randint(1, 4))})
+        db.session.execute(db.insert(ItemPedido), items)
+        db.session.commit()
+    cliente = app.test_client()
+    desde = hoy + datetime.timedelta(days=60)
+    hasta = desde + datetime.timedelta(days=6)
+    ruta = f'/api/productos?limite=50&fields=id&disponible_desde={desde}&disponible_hasta={hasta}'
+
+    def mediana(funcion):
+        funcion()
+        tiempos = []
+        for _ in range(REPETICIONES):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return statistics.median(tiempos) * 1000
+
+    def ocupacion_desde_base():
+        with app.app_context():
+            filas = db.session.query(ItemPedido.producto_id, ItemPedido.fecha_inicio, ItemPedido.fecha_fin, ItemPedido.cantidad).join(Pedido).filter(ItemPedido.fecha_inicio <= hasta, ItemPedido.fecha_fin >= desde, Pedido.estado != 'cancelado')
+            return disponibilidad.IndiceDisponibilidad.desde_filas(filas).ocupados(desde, hasta)
+
+    resultado = {
+        'sin_filtro_ms': mediana(lambda: cliente.get('/api/productos?limite=50&fields=id')),
+        'con_fechas_ms': mediana(lambda: cliente.get(ruta)),
+        'indice_ms': mediana(lambda: tienda.indice_alquileres.ocupados(desde, hasta)),
+        'desde_base_ms': mediana(ocupacion_desde_base),
+    }
+    # El filtro recorrido página a página debe dar exactamente los productos con alguna unidad libre todos los días
+    ocupados = ocupacion_desde_base()
+    with app.app_context():
+        esperados = {pid for pid, stock in db.session.query(Producto.id, Producto.stock) if stock - ocupados.get(pid, 0) >= 1}
+    obtenidos, cursor = set(), None
+    while True:
+        pagina = cliente.get(ruta.replace('limite=50', 'limite=200') + (f'&cursor={cursor}' if cursor else '')).get_json()
+        obtenidos |= {p['id'] for p in pagina['productos']}
+        cursor = pagina['siguiente_cursor']
+        if not cursor:
+            break
+    resultado['coincide'] = obtenidos == esperados
+    resultado['disponibles'] = len(obtenidos)
+    print(json.dumps(resultado))
+
+def main():
+    subprocess.run([sys.executable, __file__, '--concurrencia', os.path.join(tempfile.mkdtemp(), 'alquileres.db')], check=True)
+    fallos = []
+    for productos in TAMANOS:
+        salida = subprocess.run([sys.executable, __file__, '--escalado', os.path.join(tempfile.mkdtemp(), 'alquileres.db'), str(productos)], capture_output=True, text=True, check=True)
+        r = json.loads(salida.stdout.strip().splitlines()[-1])
+        print(f"{productos:>7} productos, {productos * ALQUILERES_POR_PRODUCTO:>7} alquileres: listado {r['sin_filtro_ms']:6.1f} ms, con fechas {r['con_fechas_ms']:6.1f} ms | ocupación del rango: índice {r['indice_ms']:6.2f} ms, leyendo la base {r['desde_base_ms']:7.1f} ms | {r['disponibles']} disponibles")
+        if not r['coincide']:
+            fallos.append(f'{productos} productos: el filtro no coincide con la ocupación real')
+    if fallos:
+        print('❌ ' + '; '.join(fallos))
+        sys.exit(1)
+    print('✅ Sin unidades alquiladas dos veces y filtro por fechas correcto')
+
+if __name__ == '__main__':
+    if '--concurrencia' in sys.argv:
+        concurrencia(sys.argv[2])
+    elif '--escalado' in sys.argv:
+        escalado(sys.argv[2], int(sys.argv[3]))
+    else:
+        main()
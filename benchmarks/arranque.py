@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Tiempo de arranque en frío: importar app (que arma la app con armar_app) en un proceso nuevo,
+# la primera petición y migrar() sobre una base vacía y sobre una ya migrada. Falla si la
+# importación supera el presupuesto, si toca la base de datos o si deja hilos corriendo (con
+# preload_app el maestro de gunicorn hace fork después de importar). Con gunicorn instalado mide
+# también cuánto tardan N workers en responder y cuánta memoria comparten por copy-on-write.
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPETICIONES = int(os.environ.get('BENCH_REPETICIONES', 5))
+PRESUPUESTO_IMPORTACION_MS = float(os.environ.get('BENCH_PRESUPUESTO_IMPORTACION_MS', 1000))
+PRESUPUESTO_PRIMERA_PETICION_MS = float(os.environ.get('BENCH_PRESUPUESTO_PRIMERA_PETICION_MS', 250))
+WORKERS = int(os.environ.get('BENCH_WORKERS', 4))
+
+def medir_proceso(ruta_db):
+    # Corre en un proceso nuevo: nada importado todavía
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    sys.path.insert(0, DIRECTORIO)
+    import threading
+    inicio = time.perf_counter()
+    from app import app, migrar
+    importacion = time.perf_counter() - inicio
+    resultado = {'importacion_ms': importacion * 1000, 'base_creada': os.path.exists(ruta_db), 'hilos': [h.name for h in threading.enumerate() if h is not threading.main_thread()]}
+    inicio = time.perf_counter()
+    with app.app_context():
+        migrar()
+    resultado['migrar_ms'] = (time.perf_counter() - inicio) * 1000
+    cliente = app.test_client()
+    inicio = time.perf_counter()
+    cliente.get('/api/productos')
+    resultado['primera_peticion_ms'] = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    cliente.get('/')
+    resultado['primera_pagina_ms'] = (time.perf_counter() - inicio) * 1000
+    print(json.dumps(resultado))
+
+def ejecutar(ruta_db):
+    salida = subprocess.run([sys.executable, __file__, '--medir', ruta_db], capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+def importaciones_lentas(ruta_db, n=8):
+    salida = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=DIRECTORIO, env={**os.environ, 'DATABASE_URL': f'sqlite:///{ruta_db}'}, capture_output=True, text=True)
+    filas = []
+    for linea in salida.stderr.splitlines():
+        partes = linea.split('|')
+        if len(partes) == 3 and partes[1].strip().isdigit():
+            filas.append((int(partes[1]), partes[2].strip()))
+    return sorted(filas, reverse=True)[:n]
+
+def memoria_privada_kb(pid):
+    # Rss cuenta también las páginas compartidas con el maestro; Private_* solo las propias
+    valores = {}
+    with open(f'/proc/{pid}/smaps_rollup') as archivo:
+        for linea in archivo:
+            partes = linea.split()
+            if len(partes) >= 2 and partes[1].isdigit():
+                valores[partes[0].rstrip(':')] = int(partes[1])
+    return valores.get('Rss', 0), valores.get('Private_Clean', 0) + valores.get('Private_Dirty', 0)
+
+def medir_gunicorn(ruta_db):
+    import requests
+    puerto = 5078
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(DIRECTORIO, 'gunicorn.conf.py'), '--bind', f'127.0.0.1:{puerto}', '--log-level', 'warning'],
+                               cwd=DIRECTORIO, env={**os.environ, 'DATABASE_URL': f'sqlite:///{ruta_db}', 'WEB_CONCURRENCY': str(WORKERS)})
+    try:
+        listo = None
+        while time.perf_counter() - inicio < 60 and listo is None:
+            try:
+                if requests.get(f'http://127.0.0.1:{puerto}/api/health', timeout=1).status_code == 200:
+                    listo = time.perf_counter() - inicio
+            except requests.RequestException:
+                time.sleep(0.05)
+        if listo is None:
+            sys.exit('gunicorn no respondió')
+        for _ in range(WORKERS * 20):
+            requests.get(f'http://127.0.0.1:{puerto}/api/productos', timeout=5)
+        hijos = subprocess.run(['pgrep', '-P', str(proceso.pid)], capture_output=True, text=True).stdout.split()
+        memoria = [memoria_privada_kb(int(pid)) for pid in hijos if os.path.exists(f'/proc/{pid}/smaps_rollup')]
+        return listo, memoria
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+def main():
+    carpeta = tempfile.mkdtemp()
+    try:
+        medidas = [ejecutar(os.path.join(carpeta, f'arranque{i}.db')) for i in range(REPETICIONES)]
+        # Una base ya migrada: migrar() solo comprueba
+        ruta = os.path.join(carpeta, 'arranque0.db')
+        repetida = ejecutar(ruta)
+        mediana = lambda clave: statistics.median(m[clave] for m in medidas)
+        print(f'{REPETICIONES} arranques en frío (mediana):')
+        print(f"  importar app + armar_app: {mediana('importacion_ms'):7.1f} ms (presupuesto {PRESUPUESTO_IMPORTACION_MS:.0f} ms)")
+        print(f"  migrar base vacía:        {mediana('migrar_ms'):7.1f} ms   ya migrada: {repetida['migrar_ms']:7.1f} ms")
+        print(f"  primera petición API:     {mediana('primera_peticion_ms'):7.1f} ms (presupuesto {PRESUPUESTO_PRIMERA_PETICION_MS:.0f} ms)")
+        print(f"  primera página (manifiesto de estáticos): {mediana('primera_pagina_ms'):7.1f} ms")
+        fallos = []
+        if mediana('importacion_ms') > PRESUPUESTO_IMPORTACION_MS:
+            fallos.append('la importación supera el presupuesto')
+            print('  Importaciones más lentas (acumulado):')
+            for microsegundos, modulo in importaciones_lentas(ruta):
+                print(f'    {microsegundos / 1000:7.1f} ms  {modulo}')
+        if mediana('primera_peticion_ms') > PRESUPUESTO_PRIMERA_PETICION_MS:
+            fallos.append('la primera petición supera el presupuesto')
+        if any(m['base_creada'] for m in medidas):
+            fallos.append('importar app creó o abrió la base de datos')
+        if any(m['hilos'] for m in medidas):
+            fallos.append(f"importar app dejó hilos corriendo: {medidas[0]['hilos']}")
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            print('gunicorn no está instalado: se omite la medición con workers')
+        else:
+            listo, memoria = medir_gunicorn(ruta)
+            print(f'gunicorn con {WORKERS} workers: responde a los {listo * 1000:.0f} ms de lanzarlo')
+            for rss, privada in memoria:
+                print(f'  worker: RSS {rss / 1024:6.1f} MB, privada {privada / 1024:6.1f} MB ({1 - privada / rss:.0%} compartida con el maestro)')
+        if fallos:
+            print('❌ ' + '; '.join(fallos))
+            sys.exit(1)
+        print('✅ Arranque dentro del presupuesto')
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+if __name__ == '__main__':
+    medir_proceso(sys.argv[2]) if '--medir' in sys.argv else main()
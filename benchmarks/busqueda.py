@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+import tempfile
+import time
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import busqueda
+
+TAMANOS = [10_000, 100_000, 1_000_000]
+CONSULTAS = ['corsé', 'corset', 'cors', 'rojo', 'vestidos largos', 'perla encantada', 'xyz']
+# Deben encontrar exactamente los mismos productos: grafías con y sin acento, "corset" y plurales
+EQUIVALENTES = [('corsé', 'corse', 'corset', 'corsets', 'corsés', 'cors'), ('vestido largo', 'vestidos largos'), ('perla', 'perlas')]
+REPETICIONES = 5
+
+NOMBRES = ['Vestido', 'Corsé', 'Corset', 'Falda', 'Blusa', 'Enterizo']
+ADJETIVOS = ['Encantada', 'Carmesí', 'de Cristal', 'de Ensueño', 'Secreto', 'Largo', 'Corto', 'de Gala']
+COLORES = ['Rojo', 'Azul', 'Perla', 'Negro', 'Blanco', 'Rosa', 'Verde', 'Azul Cielo']
+PALABRAS = ['elegante', 'perlas', 'bordado', 'encaje', 'satén', 'seda', 'largo', 'fluido', 'diseño', 'exclusivo', 'noche', 'fiesta']
+
+def generar(conexion, n):
+    conexion.execute(text('CREATE TABLE producto (id INTEGER PRIMARY KEY, nombre VARCHAR(200) NOT NULL, descripcion TEXT, precio FLOAT NOT NULL, talla VARCHAR(10), color VARCHAR(50), imagen_url VARCHAR(300), stock INTEGER, categoria_id INTEGER)'))
+    aleatorio = random.Random(42)
+    filas = [{
+        'nombre': f'{aleatorio.choice(NOMBRES)} {aleatorio.choice(ADJETIVOS)} {i}',
+        'descripcion': ' '.join(aleatorio.choices(PALABRAS, k=8)),
+        'precio': aleatorio.randint(50, 500) * 1000,
+        'color': aleatorio.choice(COLORES),
+    } for i in range(n)]
+    conexion.execute(text('INSERT INTO producto (nombre, descripcion, precio, color) VALUES (:nombre, :descripcion, :precio, :color)'), filas)
+
+def medir(funcion):
+    tiempos = []
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return sorted(tiempos)[len(tiempos) // 2] * 1000
+
+def ilike(conexion, q):
+    # Mismo predicado que la ruta anterior de /api/productos/buscar: sin límite ni ranking
+    patron = f'%{q.lower()}%'
+    return conexion.execute(text('SELECT id FROM producto WHERE lower(nombre) LIKE :p OR lower(descripcion) LIKE :p OR lower(color) LIKE :p'), {'p': patron}).fetchall()
+
+def main():
+    tamanos = [int(a) for a in sys.argv[1:]] or TAMANOS
+    print(f"{'productos':>10} {'consulta':>18} {'ILIKE ms':>10} {'FTS5 ms':>10} {'resultados ILIKE/FTS':>22}")
+    print('(FTS5 devuelve los 20 primeros por relevancia bm25)')
+    for n in tamanos:
+        with tempfile.TemporaryDirectory() as directorio:
+            motor = create_engine(f"sqlite:///{os.path.join(directorio, 'bench.db')}")
+            with motor.begin() as conexion:
+                generar(conexion, n)
+                inicio = time.perf_counter()
+                busqueda.crear_indice_busqueda(conexion)
+                print(f'{n:>10} indexado en {time.perf_counter() - inicio:.2f}s')
+            with motor.connect() as conexion:
+                for q in CONSULTAS:
+                    t_ilike = medir(lambda: ilike(conexion, q))
+                    t_fts = medir(lambda: busqueda.buscar_ids(conexion, q, 20))
+                    resultados = f'{len(ilike(conexion, q))}/{len(busqueda.buscar_ids(conexion, q, 20))}'
+                    print(f'{n:>10} {q:>18} {t_ilike:>10.2f} {t_fts:>10.2f} {resultados:>22}')
+                for grupo in EQUIVALENTES:
+                    encontrados = {q: set(busqueda.buscar_ids(conexion, q, n)) for q in grupo}
+                    distintas = [q for q in grupo if encontrados[q] != encontrados[grupo[0]]]
+                    if distintas or not encontrados[grupo[0]]:
+                        sys.exit(f'❌ {", ".join(distintas or grupo)} no encuentran lo mismo que "{grupo[0]}"')
+            motor.dispose()
+
+if __name__ == '__main__':
+    main()
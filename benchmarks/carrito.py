@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+USUARIOS = int(os.environ.get('BENCH_USUARIOS', 16))
+DURACION = float(os.environ.get('BENCH_DURACION', 10))
+PRODUCTOS = 50
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))] * 1000
+
+def ejecutar():
+    # Corre dentro de un subproceso con CARRITO_ALMACEN ya fijado
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    # Mismo método que los hashes de prueba, para que el login no los actualice a scrypt
+    os.environ['HASH_METODO'] = 'pbkdf2:sha256:1000'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from sqlalchemy import event
+    from werkzeug.security import generate_password_hash
+    from app import app, migrar, db, Usuario, Producto, Carrito, almacen_carritos
+    with app.app_context():
+        migrar()
+        db.session.add_all([Producto(nombre=f'Vestido {i}', precio=100000 + i, stock=100) for i in range(PRODUCTOS)])
+        db.session.add_all([Usuario(nombre=f'U{i}', email=f'u{i}@bench', password=generate_password_hash('x', method='pbkdf2:sha256:1000')) for i in range(USUARIOS)])
+        db.session.commit()
+        motor = db.engine
+    cliente = app.test_client()
+    tokens = [cliente.post('/api/login', json={'email': f'u{i}@bench', 'password': 'x'}).get_json()['token'] for i in range(USUARIOS)]
+    commits = [0]
+    event.listen(motor, 'commit', lambda conexion: commits.__setitem__(0, commits[0] + 1))
+    latencias = []
+    errores = [0]
+    esperado = {}
+    lock = threading.Lock()
+    fin = time.monotonic() + DURACION
+
+    def comprador(i):
+        cliente = app.test_client()
+        cabeceras = {'Authorization': f'Bearer {tokens[i]}'}
+        n = 0
+        while time.monotonic() < fin:
+            # Clics típicos: agregar, subir la cantidad, quitar
+            producto_id = 1 + (i * 7 + n // 3) % PRODUCTOS
+            op = ({'tipo': 'agregar', 'producto_id': producto_id}, {'tipo': 'fijar', 'producto_id': producto_id, 'cantidad': 3}, {'tipo': 'eliminar', 'producto_id': 1 + (i * 7 + n // 3 - 1) % PRODUCTOS})[n % 3]
+            inicio = time.perf_counter()
+            r = cliente.post('/api/carrito/lote', json={'operaciones': [op]}, headers=cabeceras)
+            duracion = time.perf_counter() - inicio
+            with lock:
+                if r.status_code >= 500:
+                    errores[0] += 1
+                else:
+                    latencias.append(duracion)
+                    esperado[i + 1] = {item['id']: item['cantidad'] for item in r.get_json()['items']}
+            n += 1
+
+    hilos = [threading.Thread(target=comprador, args=(i,)) for i in range(USUARIOS)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    commits_carga = commits[0]
+    with app.app_context():
+        almacen_carritos.volcar()
+        en_tabla = {}
+        for item in Carrito.query.all():
+            en_tabla.setdefault(item.usuario_id, {})[item.producto_id] = item.cantidad
+    consistente = all(en_tabla.get(u, {}) == c for u, c in esperado.items())
+    print(json.dumps({'ops_s': len(latencias) / DURACION, 'commits_s': commits_carga / DURACION, 'p50_ms': percentil(latencias, 50), 'p99_ms': percentil(latencias, 99), 'errores': errores[0], 'consistente': consistente}))
+
+def main():
+    print(f'{USUARIOS} compradores editando su carrito, {DURACION:.0f}s por almacén')
+    fallo = False
+    for nombre, almacen in (('commit por clic', 'db'), ('memoria + volcado', 'memoria')):
+        salida = subprocess.run([sys.executable, __file__, '--ejecutar'], env={**os.environ, 'CARRITO_ALMACEN': almacen}, capture_output=True, text=True, check=True)
+        m = json.loads(salida.stdout.strip().splitlines()[-1])
+        print(f"{nombre:>18}: {m['ops_s']:8.1f} ops/s  {m['commits_s']:8.1f} commits/s  p50 {m['p50_ms']:6.1f} ms  p99 {m['p99_ms']:6.1f} ms  errores {m['errores']}  tabla consistente: {'sí' if m['consistente'] else 'NO'}")
+        fallo = fallo or m['errores'] > 0 or not m['consistente']
+    sys.exit(1 if fallo else 0)
+
+if __name__ == '__main__':
+    ejecutar() if '--ejecutar' in sys.argv else main()
@@ -0,0 +1,86 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ESCRITORES = int(os.environ.get('BENCH_ESCRITORES', 16))
+LECTORES = int(os.environ.get('BENCH_LECTORES', 16))
+DURACION = float(os.environ.get('BENCH_DURACION', 10))
+PRODUCTOS = 200
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))] * 1000
+
+def ejecutar():
+    # Corre dentro de un subproceso con SQLITE_TUNING ya fijado
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    # Mismo método que los hashes de prueba, para que el login no los actualice a scrypt
+    os.environ['HASH_METODO'] = 'pbkdf2:sha256:1000'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from werkzeug.security import generate_password_hash
+    from app import app, migrar, db, Usuario, Producto
+    app.config['CACHE_RESPUESTAS_TTL'] = 0
+    with app.app_context():
+        migrar()
+        db.session.add_all([Producto(nombre=f'Vestido {i}', precio=100000 + i, stock=100) for i in range(PRODUCTOS)])
+        db.session.add_all([Usuario(nombre=f'U{i}', email=f'u{i}@bench', password=generate_password_hash('x', method='pbkdf2:sha256:1000')) for i in range(ESCRITORES)])
+        db.session.commit()
+    cliente = app.test_client()
+    tokens = [cliente.post('/api/login', json={'email': f'u{i}@bench', 'password': 'x'}).get_json()['token'] for i in range(ESCRITORES)]
+    resultados = {'escritura': [], 'lectura': []}
+    errores = {'escritura': 0, 'lectura': 0}
+    lock = threading.Lock()
+    fin = time.monotonic() + DURACION
+
+    def escritor(i):
+        cliente = app.test_client()
+        cabeceras = {'Authorization': f'Bearer {tokens[i]}'}
+        n = 0
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            r = cliente.post('/api/carrito', json={'producto_id': 1 + (i * 7 + n) % PRODUCTOS}, headers=cabeceras)
+            duracion = time.perf_counter() - inicio
+            with lock:
+                if r.status_code >= 500:
+                    errores['escritura'] += 1
+                else:
+                    resultados['escritura'].append(duracion)
+            n += 1
+            if n % 10 == 0:
+                cliente.delete('/api/carrito/vaciar', headers=cabeceras)
+
+    def lector(i):
+        cliente = app.test_client()
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            r = cliente.get(f'/api/productos?limite=50&precio_min={100000 + i}')
+            duracion = time.perf_counter() - inicio
+            with lock:
+                if r.status_code >= 500:
+                    errores['lectura'] += 1
+                else:
+                    resultados['lectura'].append(duracion)
+
+    hilos = [threading.Thread(target=escritor, args=(i,)) for i in range(ESCRITORES)] + [threading.Thread(target=lector, args=(i,)) for i in range(LECTORES)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    print(json.dumps({tipo: {'ops_s': len(v) / DURACION, 'p50_ms': percentil(v, 50), 'p99_ms': percentil(v, 99), 'errores': errores[tipo]} for tipo, v in resultados.items()}))
+
+def main():
+    print(f'{ESCRITORES} escritores de carrito, {LECTORES} lectores de catálogo, {DURACION:.0f}s por configuración')
+    for nombre, tuning in (('SQLite por defecto', '0'), ('WAL + pool de lectura', '1')):
+        salida = subprocess.run([sys.executable, __file__, '--ejecutar'], env={**os.environ, 'SQLITE_TUNING': tuning}, capture_output=True, text=True, check=True)
+        datos = json.loads(salida.stdout.strip().splitlines()[-1])
+        for tipo, m in datos.items():
+            print(f"{nombre:>24} {tipo:>10}: {m['ops_s']:8.1f} ops/s  p50 {m['p50_ms']:7.1f} ms  p99 {m['p99_ms']:7.1f} ms  errores {m['errores']}")
+
+if __name__ == '__main__':
+    ejecutar() if '--ejecutar' in sys.argv else main()
@@ -0,0 +1,81 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Exportación de pedidos y productos e importación de productos sobre bases de distinto tamaño
+# (generadas con benchmarks/generar_datos.py). Mide filas por segundo y el pico de memoria de
+# Python durante cada operación: al ir por flujo el pico no debe crecer con el número de filas.
+TAMANOS = [int(n) for n in os.environ.get('BENCH_PEDIDOS', '10000,100000').split(',')]
+PRODUCTOS_POR_PEDIDO = 0.2
+
+def medir(funcion):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    filas = funcion()
+    duracion = time.perf_counter() - inicio
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'filas': filas, 's': duracion, 'pico_mb': pico / 1024 / 1024}
+
+def ejecutar(ruta_db):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app
+    cliente = app.test_client()
+    token = cliente.post('/api/login', json={'email': 'admin@carga.test', 'password': 'carga1234'}).get_json()['token']
+    cabeceras = {'Authorization': f'Bearer {token}'}
+    archivo_productos = os.path.join(os.path.dirname(ruta_db), 'productos.csv')
+
+    def exportar(ruta, destino=None):
+        respuesta = cliente.get(ruta, headers=cabeceras, buffered=False)
+        lineas = 0
+        salida = open(destino, 'wb') if destino else None
+        for trozo in respuesta.response:
+            trozo = trozo.encode('utf-8') if isinstance(trozo, str) else trozo
+            lineas += trozo.count(b'\n')
+            if salida:
+                salida.write(trozo)
+        respuesta.close()
+        if salida:
+            salida.close()
+        return lineas - 1 if 'formato=jsonl' not in ruta else lineas
+
+    def importar():
+        with open(archivo_productos, 'rb') as archivo:
+            resumen = cliente.post('/api/admin/productos/importar?formato=csv', input_stream=archivo, headers={**cabeceras, 'Content-Length': str(os.path.getsize(archivo_productos))}).get_json()
+        if resumen['total_errores']:
+            sys.exit(f"errores en la importación: {resumen['errores'][:5]}")
+        return resumen['actualizados'] + resumen['creados']
+
+    resultado = {
+        'pedidos csv': medir(lambda: exportar('/api/admin/pedidos/exportar')),
+        'pedidos jsonl': medir(lambda: exportar('/api/admin/pedidos/exportar?formato=jsonl')),
+        'productos csv': medir(lambda: exportar('/api/admin/productos/exportar', archivo_productos)),
+        'importar productos': medir(importar),
+    }
+    print(json.dumps(resultado))
+
+def main():
+    generador = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generar_datos.py')
+    resultados = {}
+    for pedidos in TAMANOS:
+        ruta_db = os.path.join(tempfile.mkdtemp(), 'exportacion.db')
+        subprocess.run([sys.executable, generador, '--db', ruta_db, '--pedidos', str(pedidos), '--productos', str(int(pedidos * PRODUCTOS_POR_PEDIDO)), '--usuarios', '2000', '--carritos', '0'], check=True, capture_output=True)
+        salida = subprocess.run([sys.executable, __file__, '--ejecutar', ruta_db], capture_output=True, text=True, check=True)
+        resultados[pedidos] = json.loads(salida.stdout.strip().splitlines()[-1])
+        for operacion, m in resultados[pedidos].items():
+            print(f"{pedidos:>8} pedidos  {operacion:>18}: {m['filas']:>8} filas en {m['s']:6.2f}s ({m['filas'] / m['s']:8.0f}/s)  pico de memoria {m['pico_mb']:6.1f} MB")
+    chico, grande = resultados[min(TAMANOS)], resultados[max(TAMANOS)]
+    # Memoria constante: con 10 veces más filas el pico apenas cambia
+    crecen = [op for op in chico if grande[op]['pico_mb'] > chico[op]['pico_mb'] * 1.5 + 2]
+    if crecen:
+        print(f"❌ El pico de memoria crece con el tamaño en: {', '.join(crecen)}")
+        sys.exit(1)
+    print('✅ Memoria constante en exportaciones e importación')
+
+if __name__ == '__main__':
+    ejecutar(sys.argv[2]) if '--ejecutar' in sys.argv else main()
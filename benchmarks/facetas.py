@@ -0,0 +1,129 @@
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Navegación por facetas sobre catálogos de 100k+ productos (generados con generar_datos.py).
+# Para varias combinaciones de filtros compara la página del catálogo y los conteos por faceta
+# resueltos con el índice de bitmaps contra hacerlo en SQL (una consulta GROUP BY por faceta),
+# comprueba que ambos den lo mismo, mide la carga del índice y su memoria, la edición de un
+# producto por el panel, la sincronización de 1000 cambios escritos por otro proceso (registro de
+# cambios) y /api/categorias frente a len(c.productos).
+TAMANOS = [int(n) for n in os.environ.get('BENCH_PRODUCTOS', '100000,300000').split(',')]
+REPETICIONES = 20
+COMBINACIONES = [
+    '',
+    'talla=M',
+    'talla=M&color=Rojo',
+    'categoria_id=2&talla=S&talla=M&en_stock=1',
+    'color=Negro&color=Vino&rango_precio=300000-500000&en_stock=1',
+]
+
+def ejecutar(ruta_db):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as tienda
+    from werkzeug.datastructures import MultiDict
+    from urllib.parse import parse_qsl
+    app, db, Producto, Categoria, facetas = tienda.app, tienda.db, tienda.Producto, tienda.Categoria, tienda.facetas
+    app.config['CACHE_RESPUESTAS_TTL'] = 0
+    cliente = app.test_client()
+    token = cliente.post('/api/login', json={'email': 'admin@carga.test', 'password': 'carga1234'}).get_json()['token']
+
+    def mediana(funcion):
+        funcion()
+        tiempos = []
+        for _ in range(REPETICIONES):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+        return statistics.median(tiempos) * 1000
+
+    def conteos_sql(args):
+        # Lo mismo que contar() del índice, con una consulta por faceta que aplica los filtros de las demás
+        total = db.session.execute(tienda.filtrar_productos(db.select(db.func.count(Producto.id)), args)).scalar()
+        rango = db.case(*[(Producto.precio < limite, tienda.indice_facetas.rango_precio(limite - 1)) for limite in tienda.indice_facetas.limites_precio], else_=tienda.indice_facetas.rangos()[-1])
+        expresiones = {'categoria_id': Producto.categoria_id, 'talla': Producto.talla, 'color': Producto.color, 'rango_precio': rango, 'en_stock': db.case((Producto.stock > 0, '1'), else_='0')}
+        conteos = {}
+        for faceta, expresion in expresiones.items():
+            otras = MultiDict([(k, v) for k, v in args.items(multi=True) if k != faceta])
+            consulta = tienda.filtrar_productos(db.select(expresion, db.func.count(Producto.id)), otras).group_by(expresion)
+            conteos[faceta] = {str(valor): n for valor, n in db.session.execute(consulta) if valor not in (None, '')}
+        return total, conteos
+
+    def pagina_sql(args):
+        return [fila.id for fila in tienda.filtrar_productos(db.session.query(Producto.id), args).order_by(Producto.id).limit(50)]
+
+    resultado = {'combinaciones': {}}
+    with app.app_context():
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        tienda.refrescar_indice_facetas()
+        resultado['carga_s'] = time.perf_counter() - inicio
+        resultado['memoria_mb'] = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+        tracemalloc.stop()
+        for consulta in COMBINACIONES:
+            args = MultiDict(parse_qsl(consulta))
+            ruta = f'/api/productos?fields=id&limite=50&facetas=1&{consulta}'
+            respuesta = cliente.get(ruta).get_json()
+            total, conteos = conteos_sql(args)
+            coincide = respuesta['total'] == total and [p['id'] for p in respuesta['productos']] == pagina_sql(args) and respuesta['facetas'] == {f: {v: n for v, n in c.items()} for f, c in conteos.items()}
+            resultado['combinaciones'][consulta or '(sin filtros)'] = {
+                'total': total,
+                'indice_ms': mediana(lambda: cliente.get(ruta)),
+                'sql_ms': mediana(lambda: (conteos_sql(args), pagina_sql(args))),
+                'coincide': coincide,
+            }
+        # Edición por el panel: el índice se actualiza al confirmar, sin recargar
+        producto = db.session.execute(db.select(Producto.id, Producto.talla).where(Producto.talla == 'M').limit(1)).first()
+        antes = cliente.get('/api/productos?facetas=1&fields=id&limite=1').get_json()['facetas']['talla']
+        antes_color = cliente.get('/api/productos?facetas=1&fields=id&limite=1').get_json()['facetas']['color']
+        inicio = time.perf_counter()
+        cliente.put(f'/api/admin/productos/{producto.id}', json={'talla': 'XXL'}, headers={'Authorization': f'Bearer {token}'})
+        resultado['edicion_ms'] = (time.perf_counter() - inicio) * 1000
+        despues = cliente.get('/api/productos?facetas=1&fields=id&limite=1').get_json()['facetas']['talla']
+        resultado['edicion_ok'] = despues.get('XXL') == 1 and despues['M'] == antes['M'] - 1
+        # Otro proceso cambia 1000 productos por fuera del ORM: la siguiente sincronización solo relee esos
+        externa = sqlite3.connect(ruta_db)
+        externa.execute("UPDATE producto SET color = 'Champán' WHERE id IN (SELECT id FROM producto WHERE color = 'Rojo' LIMIT 1000)")
+        externa.commit()
+        externa.close()
+        tienda.indice_facetas.marcar_pendiente()
+        inicio = time.perf_counter()
+        tienda.refrescar_indice_facetas()
+        resultado['sincronizacion_ms'] = (time.perf_counter() - inicio) * 1000
+        despues = cliente.get('/api/productos?facetas=1&fields=id&limite=1').get_json()['facetas']['color']
+        resultado['externo_ok'] = despues.get('Champán') == 1000 and despues['Rojo'] == antes_color['Rojo'] - 1000
+        resultado['categorias_ms'] = mediana(lambda: cliente.get('/api/categorias'))
+        resultado['categorias_antes_ms'] = mediana(lambda: [len(c.productos) for c in Categoria.query.all()] and db.session.expunge_all())
+    print(json.dumps(resultado))
+
+def main():
+    generador = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generar_datos.py')
+    fallos = []
+    for productos in TAMANOS:
+        ruta_db = os.path.join(tempfile.mkdtemp(), 'facetas.db')
+        subprocess.run([sys.executable, generador, '--db', ruta_db, '--productos', str(productos), '--usuarios', '10', '--pedidos', '0', '--carritos', '0'], check=True, capture_output=True)
+        salida = subprocess.run([sys.executable, __file__, '--ejecutar', ruta_db], capture_output=True, text=True, check=True)
+        r = json.loads(salida.stdout.strip().splitlines()[-1])
+        print(f"{productos:,} productos: índice cargado en {r['carga_s']:.2f}s, {r['memoria_mb']:.1f} MB; editar un producto {r['edicion_ms']:.1f} ms; 1000 cambios de otro proceso {r['sincronizacion_ms']:.1f} ms; /api/categorias {r['categorias_ms']:.1f} ms (len(c.productos): {r['categorias_antes_ms']:.0f} ms)")
+        for consulta, m in r['combinaciones'].items():
+            print(f"  {consulta:<62} {m['total']:>7} productos  página + facetas: índice {m['indice_ms']:6.1f} ms, SQL {m['sql_ms']:7.1f} ms{'' if m['coincide'] else '  ❌ no coincide'}")
+            if not m['coincide']:
+                fallos.append(f'{productos}: {consulta}')
+        if not r['edicion_ok']:
+            fallos.append(f'{productos}: la edición no se reflejó en las facetas')
+        if not r['externo_ok']:
+            fallos.append(f'{productos}: los cambios de otro proceso no se reflejaron en las facetas')
+    if fallos:
+        print('❌ ' + '; '.join(fallos))
+        sys.exit(1)
+    print('✅ Facetas iguales a SQL y actualizadas al editar, también desde otro proceso')
+
+if __name__ == '__main__':
+    ejecutar(sys.argv[2]) if '--ejecutar' in sys.argv else main()
@@ -0,0 +1,206 @@
+import argparse
+import datetime
+from array import array
+import os
+import random
+import sys
+import time
+
+# Genera una base de datos sintética de tamaño realista para las pruebas de carga, sin preguntar
+# nada por stdin. Todo se inserta con executemany por lotes sobre Core (sin el ORM ni sus eventos)
+# y al final se reconstruyen una vez el índice de búsqueda y las estadísticas del dashboard.
+# Con la misma semilla y los mismos tamaños el resultado es idéntico.
+# Uso: python benchmarks/generar_datos.py --db /tmp/carga.db [--productos 1000000] [--usuarios 100000] ...
+# Todos los usuarios tienen la contraseña CONTRASENA; el admin es ADMIN_EMAIL.
+CONTRASENA = 'carga1234'
+ADMIN_EMAIL = 'admin@carga.test'
+
+def email_usuario(n):
+    return f'usuario{n}@carga.test'
+
+CATEGORIAS = {
+    'Vestidos de Gala': 'Elegantes vestidos para eventos especiales y ocasiones formales',
+    'Corsés': 'Corsés de diseño exclusivo con ajuste perfecto',
+    'Vestidos Corset': 'Vestidos con detalles de corsé, combinación perfecta de elegancia y estilo',
+    'Vestidos de Noche': 'Vestidos largos para cenas y fiestas de noche',
+    'Vestidos de Coctel': 'Vestidos cortos y midi para cocteles',
+    'Vestidos de Graduación': 'Vestidos para grados y fiestas de promoción',
+}
+TIPOS = ['Vestido', 'Corsé', 'Vestido Corset', 'Vestido Largo', 'Vestido Midi', 'Vestido Sirena', 'Vestido Strapless', 'Vestido Princesa']
+ESTILOS = ['Aurora', 'Luna', 'Brisa', 'Cartagena', 'Esmeralda', 'Perla', 'Jardín', 'Velvet', 'Encanto', 'Gala', 'Reina', 'Marfil', 'Coral', 'Imperial', 'Bohemia', 'Sol']
+DETALLES = ['con encaje', 'de seda', 'con pedrería', 'de satén', 'con escote corazón', 'de tul', 'con transparencias', 'de terciopelo', 'con cola', 'con bordados']
+COLORES = ['Negro', 'Rojo', 'Azul', 'Verde', 'Rosa', 'Blanco', 'Dorado', 'Plateado', 'Vino', 'Lila', 'Beige', 'Esmeralda']
+TALLAS = ['XS', 'S', 'M', 'L', 'XL', 'S/M/L']
+IMAGENES = ['imagenes/vestido 1.png', 'imagenes/vestido 2.png', 'imagenes/vestido 3.png', 'imagenes/CORSET 3.png', 'imagenes/CORSET 4.png', 'imagenes/CORSET 5.png', 'imagenes/CORSET 6.png', 'imagenes/CORSET 7.png', 'imagenes/VESTIDO CORSET 1.png']
+NOMBRES = ['María', 'Laura', 'Camila', 'Valentina', 'Daniela', 'Sofía', 'Isabella', 'Juliana', 'Andrea', 'Paula', 'Carlos', 'Andrés', 'Juan', 'Santiago']
+APELLIDOS = ['Gómez', 'Rodríguez', 'Martínez', 'López', 'García', 'Pérez', 'Díaz', 'Torres', 'Ramírez', 'Castro']
+CIUDADES = ['Cartagena', 'Barranquilla', 'Bogotá', 'Medellín', 'Cali', 'Santa Marta']
+# Reparto de estados de los pedidos históricos: los pendientes no tienen stock reservado
+ESTADOS = [('completado', 55), ('pagado', 15), ('despachado', 12), ('pendiente', 10), ('cancelado', 8)]
+
+def argumentos():
+    parser = argparse.ArgumentParser(description='Genera datos sintéticos para las pruebas de carga')
+    parser.add_argument('--db', required=True, help='Archivo SQLite de destino (se crea si no existe)')
+    parser.add_argument('--productos', type=int, default=1000000)
+    parser.add_argument('--usuarios', type=int, default=100000)
+    parser.add_argument('--pedidos', type=int, default=2000000)
+    parser.add_argument('--carritos', type=int, default=1000000, help='Filas de carrito repartidas entre los usuarios')
+    parser.add_argument('--dias', type=int, default=365, help='Antigüedad máxima de los pedidos')
+    parser.add_argument('--lote', type=int, default=20000)
+    parser.add_argument('--semilla', type=int, default=2024)
+    return parser.parse_args()
+
+def insertar(conexion, tabla, filas, lote, etiqueta):
+    inicio = time.perf_counter()
+    total = 0
+    pendientes = []
+    for fila in filas:
+        pendientes.append(fila)
+        if len(pendientes) >= lote:
+            conexion.execute(tabla.insert(), pendientes)
+            total += len(pendientes)
+            pendientes = []
+    if pendientes:
+        conexion.execute(tabla.insert(), pendientes)
+        total += len(pendientes)
+    duracion = time.perf_counter() - inicio
+    print(f'  {etiqueta}: {total:,} filas en {duracion:.1f}s ({total / max(duracion, 1e-9):,.0f}/s)')
+    return total
+
+def generar_productos(rng, n, primer_id, categorias, precios):
+    # Los precios quedan en un array compacto para calcular el total de los pedidos sin consultar
+    for i in range(n):
+        tipo, estilo, detalle, color = rng.choice(TIPOS), rng.choice(ESTILOS), rng.choice(DETALLES), rng.choice(COLORES)
+        precios.append(float(rng.randrange(89999, 600000, 10000)))
+        yield {
+            'id': primer_id + i,
+            'nombre': f'{tipo} {estilo} {color} {i + 1}',
+            'descripcion': f'{tipo} {detalle} en color {color.lower()}, ideal para {rng.choice(["bodas", "grados", "cenas de gala", "quinceañeros", "cocteles"])}',
+            'precio': precios[-1],
+            'talla': rng.choice(TALLAS),
+            'color': color,
+            'imagen_url': rng.choice(IMAGENES),
+            'stock': 0 if rng.random() < 0.05 else rng.randint(1, 30),
+            'categoria_id': rng.choice(categorias),
+        }
+
+def generar_usuarios(rng, n, primer_id, password, ahora):
+    yield {'id': primer_id, 'nombre': 'Admin Carga', 'email': ADMIN_EMAIL, 'password': password, 'es_admin': True, 'fecha_registro': ahora}
+    for i in range(n):
+        yield {
+            'id': primer_id + 1 + i,
+            'nombre': f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}',
+            'email': email_usuario(i),
+            'password': password,
+            'es_admin': False,
+            'fecha_registro': ahora - datetime.timedelta(days=rng.randint(0, 3 * 365)),
+        }
+
+def generar_pedidos(rng, n, primer_id, primer_item, usuarios, productos, precios, dias, ahora, items):
+    # Los ítems se acumulan en la lista items; se vacía por tandas desde el bucle de inserción
+    estados = [e for e, peso in ESTADOS for _ in range(peso)]
+    id_item = primer_item
+    for i in range(n):
+        pedido_id = primer_id + i
+        total = 0
+        for producto_id in rng.sample(productos, min(len(productos), rng.choice((1, 1, 1, 2, 2, 3)))):
+            cantidad = rng.choice((1, 1, 1, 2))
+            precio = precios(producto_id)
+            total += precio * cantidad
+            items.append({'id': id_item, 'pedido_id': pedido_id, 'producto_id': producto_id, 'cantidad': cantidad, 'precio_unitario': precio})
+            id_item += 1
+        fecha = ahora - datetime.timedelta(seconds=rng.randrange(dias * 86400))
+        yield {
+            'id': pedido_id,
+            'usuario_id': rng.choice(usuarios),
+            'fecha_pedido': fecha,
+            'total': total,
+            'estado': rng.choice(estados),
+            'stripe_payment_id': None,
+            'direccion_envio': f'Calle {rng.randint(1, 120)} # {rng.randint(1, 99)}-{rng.randint(1, 99)}, {rng.choice(CIUDADES)}',
+            'stock_reservado': False,
+            'reserva_expira': None,
+        }
+
+def generar_carritos(rng, n, primer_id, usuarios, productos, ahora):
+    i = 0
+    while i < n:
+        usuario_id = rng.choice(usuarios)
+        for producto_id in rng.sample(productos, min(len(productos), rng.randint(1, 8), n - i)):
+            yield {'id': primer_id + i, 'usuario_id': usuario_id, 'producto_id': producto_id, 'cantidad': rng.choice((1, 1, 2)), 'fecha_agregado': ahora - datetime.timedelta(minutes=rng.randrange(60 * 24 * 30))}
+            i += 1
+
+def siguiente_id(conexion, modelo):
+    from modelos import db
+    return (conexion.execute(db.select(db.func.max(modelo.id))).scalar() or 0) + 1
+
+def main():
+    args = argumentos()
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from werkzeug.security import generate_password_hash
+    import busqueda
+    from app import app, migrar, db, Usuario, Categoria, Producto, Carrito, Pedido, ItemPedido, recalcular_estadisticas
+    rng = random.Random(args.semilla)
+    ahora = datetime.datetime.utcnow().replace(microsecond=0)
+    inicio = time.perf_counter()
+    print(f'Generando datos en {args.db} (semilla {args.semilla})')
+    with app.app_context():
+        migrar()
+        with db.engine.begin() as conexion:
+            if conexion.execute(db.select(Usuario.id).where(Usuario.email == ADMIN_EMAIL)).first():
+                print(f'La base ya tiene datos de carga ({ADMIN_EMAIL}); usa otro archivo')
+                sys.exit(1)
+            existentes = {nombre: id for id, nombre in conexion.execute(db.select(Categoria.id, Categoria.nombre))}
+            nuevas = [{'nombre': nombre, 'descripcion': descripcion} for nombre, descripcion in CATEGORIAS.items() if nombre not in existentes]
+            if nuevas:
+                conexion.execute(Categoria.__table__.insert(), nuevas)
+            categorias = [id for (id,) in conexion.execute(db.select(Categoria.id).where(Categoria.nombre.in_(CATEGORIAS)).order_by(Categoria.id))]
+            busqueda.suspender_indice_busqueda(conexion)
+        with db.engine.begin() as conexion:
+            primer_producto = siguiente_id(conexion, Producto)
+            lista_precios = array('d')
+            insertar(conexion, Producto.__table__, generar_productos(rng, args.productos, primer_producto, categorias, lista_precios), args.lote, 'productos')
+            productos = range(primer_producto, primer_producto + args.productos)
+            precios = lambda producto_id: lista_precios[producto_id - primer_producto]
+        with db.engine.begin() as conexion:
+            # Una sola contraseña hasheada para todos: hashear 100k contraseñas tardaría horas
+            password = generate_password_hash(CONTRASENA)
+            primer_usuario = siguiente_id(conexion, Usuario)
+            insertar(conexion, Usuario.__table__, generar_usuarios(rng, args.usuarios, primer_usuario, password, ahora), args.lote, 'usuarios')
+            usuarios = range(primer_usuario + 1, primer_usuario + 1 + args.usuarios)
+        if args.pedidos and args.usuarios and args.productos:
+            with db.engine.begin() as conexion:
+                primer_pedido, primer_item = siguiente_id(conexion, Pedido), siguiente_id(conexion, ItemPedido)
+                items = []
+                inicio_pedidos = time.perf_counter()
+                total_items = 0
+                pedidos = generar_pedidos(rng, args.pedidos, primer_pedido, primer_item, usuarios, productos, precios, args.dias, ahora, items)
+                total_pedidos = 0
+                while True:
+                    lote = [p for _, p in zip(range(args.lote), pedidos)]
+                    if not lote:
+                        break
+                    conexion.execute(Pedido.__table__.insert(), lote)
+                    conexion.execute(ItemPedido.__table__.insert(), items)
+                    total_pedidos += len(lote)
+                    total_items += len(items)
+                    items.clear()
+                duracion = time.perf_counter() - inicio_pedidos
+                print(f'  pedidos: {total_pedidos:,} pedidos y {total_items:,} ítems en {duracion:.1f}s ({(total_pedidos + total_items) / max(duracion, 1e-9):,.0f} filas/s)')
+        if args.carritos and args.usuarios and args.productos:
+            with db.engine.begin() as conexion:
+                insertar(conexion, Carrito.__table__, generar_carritos(rng, args.carritos, siguiente_id(conexion, Carrito), usuarios, productos, ahora), args.lote, 'carritos')
+        with db.engine.begin() as conexion:
+            paso = time.perf_counter()
+            if busqueda.reconstruir_indice_busqueda(conexion):
+                print(f'  índice de búsqueda reconstruido en {time.perf_counter() - paso:.1f}s')
+        paso = time.perf_counter()
+        recalcular_estadisticas()
+        print(f'  estadísticas recalculadas en {time.perf_counter() - paso:.1f}s')
+        with db.engine.begin() as conexion:
+            conexion.exec_driver_sql('ANALYZE')
+    print(f'Listo en {time.perf_counter() - inicio:.1f}s. Usuarios {email_usuario(0)}..{email_usuario(max(args.usuarios - 1, 0))} y {ADMIN_EMAIL}, contraseña {CONTRASENA}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+# Invalidación de las caches con gunicorn en varios workers. Llena las caches de todos los workers
+# (producto, catálogo, búsqueda y la sesión de un segundo admin), cambia el precio de un producto por
+# la API, degrada a ese admin con SQL directo (como un script de mantenimiento) y justo después pide
+# lo mismo por conexiones nuevas, que gunicorn reparte entre los workers. Falla si alguna respuesta
+# muestra el precio anterior, si el ETag anterior todavía da 304 o si el admin degradado sigue
+# entrando. Además mide la latencia de un acierto de cache, que ahora lee cambio_cache.
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = int(os.environ.get('BENCH_WORKERS', 4))
+HILOS = int(os.environ.get('BENCH_HILOS', 4))
+PETICIONES = int(os.environ.get('BENCH_PETICIONES', 200))
+PUERTO = 5081
+
+def main():
+    import jwt
+    import requests
+    sys.path.insert(0, DIRECTORIO)
+    from app import app
+    carpeta = tempfile.mkdtemp()
+    ruta_db = os.path.join(carpeta, 'invalidacion.db')
+    subprocess.run([sys.executable, os.path.join(DIRECTORIO, 'benchmarks', 'generar_datos.py'), '--db', ruta_db, '--productos', '2000', '--usuarios', '100', '--pedidos', '0', '--carritos', '0'], check=True, capture_output=True)
+    with sqlite3.connect(ruta_db) as conexion:
+        conexion.execute('UPDATE usuario SET es_admin = 1 WHERE id IN (1, 2)')
+        producto_id, precio = conexion.execute('SELECT id, precio FROM producto ORDER BY id LIMIT 1').fetchone()
+    token = lambda usuario_id: jwt.encode({'usuario_id': usuario_id, 'exp': int(time.time()) + 3600}, app.config['SECRET_KEY'], algorithm='HS256')
+    admin, degradado = {'Authorization': f'Bearer {token(1)}'}, {'Authorization': f'Bearer {token(2)}'}
+    url = f'http://127.0.0.1:{PUERTO}'
+    rutas = [f'/api/productos/{producto_id}', '/api/productos?limite=20', '/api/productos/buscar?q=vestido&limite=50']
+    servidor = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(DIRECTORIO, 'gunicorn.conf.py'), '--bind', f'127.0.0.1:{PUERTO}', '--log-level', 'warning'],
+                                cwd=DIRECTORIO, env={**os.environ, 'DATABASE_URL': f'sqlite:///{ruta_db}', 'WEB_CONCURRENCY': str(WORKERS), 'GUNICORN_THREADS': str(HILOS), 'SIMILARES_ACTIVAS': '0'})
+    fallos = []
+    try:
+        limite = time.time() + 60
+        while time.time() < limite:
+            try:
+                if requests.get(f'{url}/api/health', timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                time.sleep(0.1)
+        else:
+            sys.exit('gunicorn no respondió')
+
+        # Cada petición va por una conexión nueva, así que pasan por todos los workers
+        for _ in range(PETICIONES):
+            for ruta in rutas:
+                requests.get(url + ruta, timeout=10)
+            requests.get(f'{url}/api/admin/estadisticas', headers=degradado, timeout=10)
+        etag = requests.get(url + rutas[0], timeout=10).headers['ETag']
+        latencias = []
+        for _ in range(PETICIONES):
+            inicio = time.perf_counter()
+            requests.get(url + rutas[0], timeout=10)
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        nuevo = round(precio * 1.5, 2)
+        if requests.put(f'{url}/api/admin/productos/{producto_id}', json={'precio': nuevo}, headers=admin, timeout=10).status_code != 200:
+            sys.exit('no se pudo cambiar el precio')
+        with sqlite3.connect(ruta_db, timeout=30) as conexion:
+            conexion.execute('UPDATE usuario SET es_admin = 0 WHERE id = 2')
+        viejos = {ruta: 0 for ruta in rutas}
+        revalidados = entradas = 0
+        for _ in range(PETICIONES):
+            producto = requests.get(url + rutas[0], timeout=10).json()
+            viejos[rutas[0]] += producto['precio'] != nuevo
+            catalogo = requests.get(url + rutas[1], timeout=10).json()
+            viejos[rutas[1]] += any(p['id'] == producto_id and p['precio'] != nuevo for p in catalogo['productos'])
+            revalidados += requests.get(url + rutas[0], headers={'If-None-Match': etag}, timeout=10).status_code == 304
+            entradas += requests.get(f'{url}/api/admin/estadisticas', headers=degradado, timeout=10).status_code == 200
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    latencias.sort()
+    print(f'gunicorn con {WORKERS} workers x {HILOS} hilos; {PETICIONES} peticiones por comprobación tras cada cambio')
+    print(f'  acierto de cache del producto: p50 {latencias[len(latencias) // 2]:.1f} ms, p95 {latencias[int(len(latencias) * 0.95)]:.1f} ms')
+    for ruta, cantidad in viejos.items():
+        if cantidad:
+            fallos.append(f'{ruta} mostró el precio anterior {cantidad} veces')
+    if revalidados:
+        fallos.append(f'el ETag anterior dio 304 {revalidados} veces')
+    if entradas:
+        fallos.append(f'el admin degradado entró {entradas} veces')
+    if fallos:
+        print('❌ ' + '; '.join(fallos))
+        sys.exit(1)
+    print('✅ Ningún worker sirvió el precio anterior ni dejó entrar al admin degradado')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+# Cambios de inventario del panel de administración: los mismos cambios hechos producto a producto
+# con PUT /api/admin/productos/<id> (lo único que había) y con una sola petición a
+# POST /api/admin/productos/inventario, cada uno sobre su copia de una base generada con
+# generar_datos.py. Los cambios: subir un 10 % el precio y sumar stock a unos productos, descontar
+# stock a otros (sin dejarlo negativo) y mover de categoría los de un filtro. Falla si las dos bases
+# no quedan iguales (precio con tolerancia de un centavo: el redondeo de SQLite y el de Python pueden
+# diferir en los empates), si el contador de productos sin stock no sigue al catálogo o si la cache
+# sigue sirviendo el producto anterior.
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTOS = int(os.environ.get('BENCH_PRODUCTOS', 20000))
+REPRECIOS = int(os.environ.get('BENCH_REPRECIOS', 500))
+DESCUENTOS = int(os.environ.get('BENCH_DESCUENTOS', 300))
+
+def planear(ruta_db):
+    rng = random.Random(7)
+    with sqlite3.connect(ruta_db) as conexion:
+        ids = [i for (i,) in conexion.execute('SELECT id FROM producto ORDER BY id')]
+        origen, destino = [c for (c,) in conexion.execute('SELECT id FROM categoria ORDER BY id LIMIT 2')]
+    elegidos = rng.sample(ids, REPRECIOS + DESCUENTOS)
+    return {'repreciar': elegidos[:REPRECIOS], 'descontar': elegidos[REPRECIOS:], 'filtro': {'categoria_id': origen, 'talla': 'M'}, 'destino': destino}
+
+def operaciones(plan):
+    return [
+        {'ids': plan['repreciar'], 'precio_porcentaje': 10, 'stock_delta': 5},
+        {'ids': plan['descontar'], 'stock_delta': -3},
+        {'filtro': plan['filtro'], 'categoria_id': plan['destino']},
+    ]
+
+def ejecutar(ruta_db, modo, plan):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    sys.path.insert(0, DIRECTORIO)
+    import jwt
+    import app as tienda
+    app, db = tienda.app, tienda.db
+    Producto = tienda.Producto
+    with app.app_context():
+        tienda.migrar()
+        db.session.execute(db.update(tienda.Usuario).where(tienda.Usuario.id == 1).values(es_admin=True))
+        db.session.commit()
+        contador = lambda: db.session.query(tienda.Estadistica.valor).filter_by(clave='productos_sin_stock').scalar() or 0
+        sin_stock = lambda: db.session.query(Producto).filter(db.func.coalesce(Producto.stock, 0) <= 0).count()
+        antes = (contador(), sin_stock())
+    token = jwt.encode({'usuario_id': 1, 'exp': int(time.time()) + 3600}, app.config['SECRET_KEY'], algorithm='HS256')
+    cabeceras = {'Authorization': f'Bearer {token}'}
+    cliente = app.test_client()
+    muestra = plan['repreciar'][0]
+    # Deja el producto y el catálogo en la cache antes de cambiarlos
+    previo = cliente.get(f'/api/productos/{muestra}').get_json()
+    cliente.get('/api/productos?limite=20')
+    resultado = {'fallos': []}
+    inicio = time.perf_counter()
+    if modo == 'masivo':
+        respuesta = cliente.post('/api/admin/productos/inventario', json={'operaciones': operaciones(plan)}, headers=cabeceras)
+        if respuesta.status_code != 200:
+            resultado['fallos'].append(f'inventario respondió {respuesta.status_code}: {respuesta.get_data(as_text=True)[:200]}')
+        resultado['peticiones'] = 1
+        resultado['bytes'] = len(respuesta.data)
+    else:
+        # Lo que hace el panel: leer cada producto y mandar sus nuevos valores
+        peticiones = 0
+        def poner(producto_id, cambio):
+            nonlocal peticiones
+            peticiones += 1
+            if cliente.put(f'/api/admin/productos/{producto_id}', json=cambio, headers=cabeceras).status_code != 200:
+                resultado['fallos'].append(f'PUT {producto_id} falló')
+        for producto_id in plan['repreciar']:
+            peticiones += 1
+            producto = cliente.get(f'/api/productos/{producto_id}').get_json()
+            poner(producto_id, {'precio': round(producto['precio'] * 1.1, 2), 'stock': (producto['stock'] or 0) + 5})
+        for producto_id in plan['descontar']:
+            peticiones += 1
+            producto = cliente.get(f'/api/productos/{producto_id}').get_json()
+            if (producto['stock'] or 0) >= 3:
+                poner(producto_id, {'stock': producto['stock'] - 3})
+        # Los del filtro, recorriendo el catálogo por cursor
+        elegidos, cursor = [], None
+        while True:
+            peticiones += 1
+            datos = cliente.get('/api/productos', query_string={**plan['filtro'], 'limite': 100, 'fields': 'id', **({'cursor': cursor} if cursor else {})}).get_json()
+            elegidos += [p['id'] for p in datos['productos']]
+            cursor = datos['siguiente_cursor']
+            if not cursor:
+                break
+        for producto_id in elegidos:
+            poner(producto_id, {'categoria_id': plan['destino']})
+        resultado['peticiones'] = peticiones
+    resultado['segundos'] = time.perf_counter() - inicio
+    despues = cliente.get(f'/api/productos/{muestra}').get_json()
+    if despues['precio'] == previo['precio']:
+        resultado['fallos'].append(f'la cache sigue sirviendo el precio anterior del producto {muestra}')
+    with app.app_context():
+        db.session.expire_all()
+        ahora = (contador(), sin_stock())
+        if ahora[0] - antes[0] != ahora[1] - antes[1]:
+            resultado['fallos'].append(f'productos_sin_stock cambió {ahora[0] - antes[0]} y el catálogo {ahora[1] - antes[1]}')
+        resultado['sin_stock'] = ahora[1] - antes[1]
+    print(json.dumps(resultado))
+
+def estado(ruta_db):
+    with sqlite3.connect(ruta_db) as conexion:
+        return {i: (stock, precio, categoria) for i, stock, precio, categoria in conexion.execute('SELECT id, stock, precio, categoria_id FROM producto')}
+
+def main():
+    carpeta = tempfile.mkdtemp()
+    ruta_db = os.path.join(carpeta, 'inventario.db')
+    subprocess.run([sys.executable, os.path.join(DIRECTORIO, 'benchmarks', 'generar_datos.py'), '--db', ruta_db, '--productos', str(PRODUCTOS), '--usuarios', '100', '--pedidos', '0', '--carritos', '0'], check=True, capture_output=True)
+    plan = planear(ruta_db)
+    original = estado(ruta_db)
+    resultados, estados = {}, {}
+    for modo in ('individual', 'masivo'):
+        copia = os.path.join(carpeta, f'{modo}.db')
+        shutil.copy(ruta_db, copia)
+        salida = subprocess.run([sys.executable, __file__, '--ejecutar', copia, modo, json.dumps(plan)], capture_output=True, text=True, check=True, env={**os.environ, 'SIMILARES_ACTIVAS': '0'})
+        resultados[modo] = json.loads(salida.stdout.strip().splitlines()[-1])
+        estados[modo] = estado(copia)
+    fallos = [f'{modo}: {fallo}' for modo, r in resultados.items() for fallo in r['fallos']]
+    distintos = [i for i in original if estados['individual'][i][0::2] != estados['masivo'][i][0::2] or abs(estados['individual'][i][1] - estados['masivo'][i][1]) > 0.011]
+    if distintos:
+        fallos.append(f'{len(distintos)} productos quedan distintos, por ejemplo {distintos[0]}: {estados["individual"][distintos[0]]} y {estados["masivo"][distintos[0]]}')
+    cambiados = sum(estados['masivo'][i] != original[i] for i in original)
+    print(f'{PRODUCTOS:,} productos; {cambiados} cambiados ({REPRECIOS} con precio +10 % y stock +5, {DESCUENTOS} con stock -3, filtro {plan["filtro"]} a otra categoría)')
+    for modo, r in resultados.items():
+        print(f"  {modo:<10} {r['peticiones']:5d} peticiones en {r['segundos'] * 1000:8.0f} ms; productos sin stock {r['sin_stock']:+d}")
+    print(f"  respuesta del masivo: {resultados['masivo']['bytes'] / 1024:.1f} KB; {resultados['individual']['segundos'] / resultados['masivo']['segundos']:.0f}x más rápido")
+    if fallos:
+        print('❌ ' + '; '.join(fallos))
+        sys.exit(1)
+    print('✅ Mismo catálogo, contadores y cache con una sola transacción')
+
+if __name__ == '__main__':
+    ejecutar(sys.argv[2], sys.argv[3], json.loads(sys.argv[4])) if '--ejecutar' in sys.argv else main()
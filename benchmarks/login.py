@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# Ráfaga de logins con hashes scrypt reales mientras otros clientes leen el catálogo: compara
+# hashear en el hilo de la petición (HASH_PROCESOS=0) con el pool de procesos acotado, y mide
+# cuántas sesiones por segundo se renuevan con el refresh token.
+LOGINS = int(os.environ.get('BENCH_LOGINS', 32))
+LECTORES = int(os.environ.get('BENCH_LECTORES', 4))
+DURACION = float(os.environ.get('BENCH_DURACION', 10))
+USUARIOS = 200
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))] * 1000
+
+def ejecutar():
+    # Corre dentro de un subproceso con HASH_PROCESOS ya fijado
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from werkzeug.security import generate_password_hash
+    from app import app, migrar, db, Usuario, Producto, pool_hash
+    with app.app_context():
+        migrar()
+        db.session.add(Producto(nombre='Vestido', precio=100000, stock=10))
+        password = generate_password_hash('secreta123', pool_hash.metodo)
+        db.session.add_all([Usuario(nombre=f'U{i}', email=f'u{i}@bench', password=password) for i in range(USUARIOS)])
+        db.session.commit()
+    cliente = app.test_client()
+    refresh_tokens = [cliente.post('/api/login', json={'email': f'u{i}@bench', 'password': 'secreta123'}).get_json()['refresh_token'] for i in range(LECTORES)]
+    logins, lecturas = [], []
+    estados = Counter()
+    lock = threading.Lock()
+    fin = time.monotonic() + DURACION
+
+    def login(i):
+        cliente = app.test_client()
+        n = 0
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            r = cliente.post('/api/login', json={'email': f'u{(i + n * LOGINS) % USUARIOS}@bench', 'password': 'secreta123'})
+            duracion = time.perf_counter() - inicio
+            with lock:
+                estados[r.status_code] += 1
+                if r.status_code == 200:
+                    logins.append(duracion)
+            if r.status_code in (429, 503):
+                time.sleep(float(r.headers.get('Retry-After', 1)))
+            n += 1
+
+    def lector():
+        cliente = app.test_client()
+        while time.monotonic() < fin:
+            inicio = time.perf_counter()
+            r = cliente.get('/api/productos/1')
+            with lock:
+                lecturas.append(time.perf_counter() - inicio)
+                estados[f'lectura {r.status_code}'] += 1
+
+    hilos = [threading.Thread(target=login, args=(i,)) for i in range(LOGINS)] + [threading.Thread(target=lector) for _ in range(LECTORES)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    # Renovación de sesiones sin contraseña: cada refresh devuelve otro refresh token
+    renovaciones = 0
+    fin_refresh = time.monotonic() + 2
+    while time.monotonic() < fin_refresh:
+        r = cliente.post('/api/token/refrescar', json={'refresh_token': refresh_tokens[renovaciones % LECTORES]})
+        estados[f'refresh {r.status_code}'] += 1
+        if r.status_code == 200:
+            refresh_tokens[renovaciones % LECTORES] = r.get_json()['refresh_token']
+        renovaciones += 1
+    print(json.dumps({'logins_s': len(logins) / DURACION, 'login_p50_ms': percentil(logins, 50), 'login_p99_ms': percentil(logins, 99), 'lectura_p50_ms': percentil(lecturas, 50), 'lectura_p99_ms': percentil(lecturas, 99), 'lecturas_s': len(lecturas) / DURACION, 'refresh_s': renovaciones / 2, 'estados': {str(k): v for k, v in estados.items()}}))
+
+def main():
+    print(f'{LOGINS} clientes iniciando sesión y {LECTORES} leyendo el catálogo durante {DURACION:.0f}s (scrypt, {os.cpu_count()} CPUs)')
+    fallo = False
+    for nombre, procesos in (('hash en el hilo', '0'), ('pool de procesos', str(os.cpu_count() or 1))):
+        salida = subprocess.run([sys.executable, __file__, '--ejecutar'], env={**os.environ, 'HASH_PROCESOS': procesos}, capture_output=True, text=True, check=True)
+        m = json.loads(salida.stdout.strip().splitlines()[-1])
+        estados = m['estados']
+        print(f"{nombre:>16}: {m['logins_s']:6.1f} logins/s (p50 {m['login_p50_ms']:6.0f} ms, p99 {m['login_p99_ms']:6.0f} ms, 429: {estados.get('429', 0)}, 503: {estados.get('503', 0)})  "
+              f"lecturas {m['lecturas_s']:7.1f}/s p50 {m['lectura_p50_ms']:6.1f} ms p99 {m['lectura_p99_ms']:6.1f} ms  refresh {m['refresh_s']:7.1f}/s")
+        errores = sum(v for k, v in estados.items() if k.split()[-1].startswith('5') and k != '503')
+        fallo = fallo or errores > 0 or estados.get('refresh 200', 0) == 0
+    sys.exit(1 if fallo else 0)
+
+if __name__ == '__main__':
+    ejecutar() if '--ejecutar' in sys.argv else main()
@@ -0,0 +1,52 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Costo de la instrumentación: tandas cortas de las mismas peticiones con las métricas apagadas
+# y encendidas, alternadas en el mismo proceso. Se mide tiempo de CPU y se toma la mediana de la
+# diferencia entre tandas vecinas, para que el ruido de la máquina no se confunda con sobrecosto.
+# Falla si el sobrecosto por petición supera el presupuesto (microsegundos).
+PETICIONES = int(os.environ.get('BENCH_PETICIONES', 200))
+TANDAS = int(os.environ.get('BENCH_TANDAS', 40))
+PRESUPUESTO_US = float(os.environ.get('BENCH_PRESUPUESTO_US', 100))
+RUTAS = ('/api/health', '/api/productos/1', '/api/productos?limite=50')
+
+def medir(cliente, ruta):
+    inicio = time.process_time()
+    for _ in range(PETICIONES):
+        cliente.get(ruta)
+    return (time.process_time() - inicio) / PETICIONES * 1e6
+
+def main():
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    os.environ['METRICAS_ACTIVAS'] = '1'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app, migrar, db, Producto, metricas
+    # Sin cache de respuestas para que cada petición llegue a SQL
+    app.config['CACHE_RESPUESTAS_TTL'] = 0
+    with app.app_context():
+        migrar()
+        db.session.add_all([Producto(nombre=f'Vestido {i}', precio=100000 + i, stock=10) for i in range(200)])
+        db.session.commit()
+    cliente = app.test_client()
+    print(f'{TANDAS} pares de tandas de {PETICIONES} peticiones por ruta (mediana, tiempo de CPU), presupuesto {PRESUPUESTO_US:.0f} µs')
+    fallo = False
+    for ruta in RUTAS:
+        for _ in range(200):
+            cliente.get(ruta)
+        sin, con = [], []
+        for tanda in range(TANDAS):
+            for activa in ((False, True) if tanda % 2 else (True, False)):
+                metricas.activa = activa
+                (con if activa else sin).append(medir(cliente, ruta))
+        extra = statistics.median(c - s for c, s in zip(con, sin))
+        base = statistics.median(sin)
+        fallo = fallo or extra > PRESUPUESTO_US
+        print(f'{ruta:>28}: sin métricas {base:7.1f} µs  con métricas {statistics.median(con):7.1f} µs  sobrecosto {extra:6.1f} µs ({extra / base:+.1%})')
+    metricas.activa = True
+    sys.exit(1 if fallo else 0)
+
+if __name__ == '__main__':
+    main()
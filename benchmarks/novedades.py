@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Novedades de pedidos para el panel de administración contra gunicorn con varios workers y pocos
+# hilos. Compara lo que transfiere recargar la lista de pedidos con lo que transfiere ?since=<seq>
+# tras cambiar unos pedidos, y mide cuánto tarda un cambio escrito por otro proceso (sqlite3, como
+# el liberador de reservas de otro worker) en llegar a N admins conectados por SSE, junto con la
+# latencia del catálogo mientras tanto. Falla si algún admin no recibe todos los cambios, si tardan
+# más de lo que permiten la reconexión y el intervalo del seguidor, o si los flujos abiertos dejan
+# sin hilos al resto de las peticiones.
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PEDIDOS = int(os.environ.get('BENCH_PEDIDOS', 20000))
+ADMINS = int(os.environ.get('BENCH_ADMINS', 40))
+WORKERS = int(os.environ.get('BENCH_WORKERS', 2))
+HILOS = int(os.environ.get('BENCH_HILOS', 4))
+CAMBIOS = 50
+PUERTO = 5079
+PRESUPUESTO_ENTREGA_S = 5
+PRESUPUESTO_CATALOGO_MS = 500
+
+def seguir(url, token, seq, recibidos, parar):
+    # Un admin: sigue el flujo SSE y se reconecta tras el "retry" desde la última secuencia, como admin.js
+    import requests
+    reintento = 2
+    while not parar.is_set():
+        try:
+            respuesta = requests.get(f'{url}/api/admin/pedidos/novedades/stream', params={'since': seq}, headers={'Authorization': f'Bearer {token}'}, stream=True, timeout=60)
+            campos = {}
+            for linea in respuesta.iter_lines(decode_unicode=True):
+                if linea:
+                    campo, _, valor = linea.partition(': ')
+                    campos[campo] = valor
+                    continue
+                if 'retry' in campos:
+                    reintento = int(campos['retry']) / 1000
+                if campos.get('event') == 'pedido':
+                    evento = json.loads(campos['data'])
+                    seq = max(seq, evento['seq'])
+                    recibidos.setdefault(evento['pedido']['id'], time.time())
+                campos = {}
+        except requests.RequestException:
+            pass
+        parar.wait(reintento)
+
+def main():
+    import jwt
+    import requests
+    sys.path.insert(0, DIRECTORIO)
+    from app import app
+    carpeta = tempfile.mkdtemp()
+    ruta_db = os.path.join(carpeta, 'novedades.db')
+    subprocess.run([sys.executable, os.path.join(DIRECTORIO, 'benchmarks', 'generar_datos.py'), '--db', ruta_db, '--productos', '2000', '--usuarios', '500', '--pedidos', str(PEDIDOS), '--carritos', '0'], check=True, capture_output=True)
+    with sqlite3.connect(ruta_db) as conexion:
+        conexion.execute('UPDATE usuario SET es_admin = 1 WHERE id = 1')
+        pedidos = [i for (i,) in conexion.execute("SELECT id FROM pedido WHERE estado = 'pagado' ORDER BY random() LIMIT ?", (CAMBIOS,))]
+    token = jwt.encode({'usuario_id': 1, 'exp': int(time.time()) + 3600}, app.config['SECRET_KEY'], algorithm='HS256')
+    cabeceras = {'Authorization': f'Bearer {token}'}
+    url = f'http://127.0.0.1:{PUERTO}'
+    servidor = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(DIRECTORIO, 'gunicorn.conf.py'), '--bind', f'127.0.0.1:{PUERTO}', '--log-level', 'warning'],
+                                cwd=DIRECTORIO, env={**os.environ, 'DATABASE_URL': f'sqlite:///{ruta_db}', 'WEB_CONCURRENCY': str(WORKERS), 'GUNICORN_THREADS': str(HILOS), 'SIMILARES_ACTIVAS': '0'})
+    parar = threading.Event()
+    try:
+        limite = time.time() + 60
+        while time.time() < limite:
+            try:
+                if requests.get(f'{url}/api/health', timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                time.sleep(0.1)
+        else:
+            sys.exit('gunicorn no respondió')
+
+        # Recarga completa (lo que hacía el panel tras cada cambio): la primera página del listado
+        inicio = time.perf_counter()
+        lista = requests.get(f'{url}/api/admin/pedidos', params={'limite': 200}, headers=cabeceras, timeout=30)
+        lista_ms = (time.perf_counter() - inicio) * 1000
+        seq = lista.json()['seq']
+
+        recibidos = [{} for _ in range(ADMINS)]
+        admins = [threading.Thread(target=seguir, args=(url, token, seq, r, parar), daemon=True) for r in recibidos]
+        for admin in admins:
+            admin.start()
+        time.sleep(3)
+
+        latencias_catalogo = []
+        def catalogo():
+            while not parar.is_set():
+                inicio = time.perf_counter()
+                requests.get(f'{url}/api/productos', params={'limite': 20}, timeout=30)
+                latencias_catalogo.append((time.perf_counter() - inicio) * 1000)
+                time.sleep(0.05)
+        threading.Thread(target=catalogo, daemon=True).start()
+
+        escritos = {}
+        conexion = sqlite3.connect(ruta_db, timeout=30)
+        for pedido_id in pedidos:
+            conexion.execute("UPDATE pedido SET estado = 'despachado' WHERE id = ?", (pedido_id,))
+            conexion.commit()
+            escritos[pedido_id] = time.time()
+            time.sleep(0.1)
+        conexion.close()
+        limite = time.time() + 20
+        while time.time() < limite and any(len(set(r) & set(escritos)) < len(escritos) for r in recibidos):
+            time.sleep(0.2)
+
+        inicio = time.perf_counter()
+        novedades = requests.get(f'{url}/api/admin/pedidos/novedades', params={'since': seq}, headers=cabeceras, timeout=30)
+        novedades_ms = (time.perf_counter() - inicio) * 1000
+    finally:
+        parar.set()
+        servidor.terminate()
+        servidor.wait()
+
+    entregas = sorted(r[p] - escritos[p] for r in recibidos for p in escritos if p in r)
+    completos = sum(all(p in r for p in escritos) for r in recibidos)
+    cuantil = lambda valores, q: valores[min(len(valores) - 1, int(q * len(valores)))] if valores else float('nan')
+    catalogo_p95 = cuantil(sorted(latencias_catalogo), 0.95)
+    print(f'gunicorn con {WORKERS} workers x {HILOS} hilos, {PEDIDOS:,} pedidos')
+    print(f"  recarga de la lista (200 pedidos): {len(lista.content) / 1024:.1f} KB en {lista_ms:.0f} ms")
+    print(f"  ?since= tras {CAMBIOS} pedidos cambiados: {len(novedades.json()['eventos'])} eventos, {len(novedades.content) / 1024:.1f} KB en {novedades_ms:.0f} ms")
+    print(f'  {ADMINS} admins por SSE: {completos}/{ADMINS} recibieron los {CAMBIOS} cambios; entrega p50 {cuantil(entregas, 0.5):.2f} s, p95 {cuantil(entregas, 0.95):.2f} s, máx {entregas[-1] if entregas else float("nan"):.2f} s')
+    print(f'  catálogo mientras tanto: p50 {statistics.median(latencias_catalogo):.0f} ms, p95 {catalogo_p95:.0f} ms ({len(latencias_catalogo)} peticiones)')
+    fallos = []
+    if completos < ADMINS:
+        fallos.append(f'{ADMINS - completos} admins no recibieron todos los cambios')
+    if entregas and entregas[-1] > PRESUPUESTO_ENTREGA_S:
+        fallos.append(f'algún cambio tardó {entregas[-1]:.1f} s en llegar')
+    if catalogo_p95 > PRESUPUESTO_CATALOGO_MS:
+        fallos.append(f'el catálogo se degrada con {ADMINS} admins conectados (p95 {catalogo_p95:.0f} ms)')
+    if fallos:
+        print('❌ ' + '; '.join(fallos))
+        sys.exit(1)
+    print('✅ Novedades entregadas a todos los admins sin ocupar un hilo por conexión')
+
+if __name__ == '__main__':
+    main()
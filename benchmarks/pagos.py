@@ -0,0 +1,83 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Prueba de carga del flujo de pago contra la pasarela falsa: cada comprador pide el intent de su
+# pedido varias veces (doble clic simultáneo y reintento). Falla si un pedido recibe más de un intent.
+COMPRADORES = int(os.environ.get('BENCH_COMPRADORES', 100))
+REPETICIONES = int(os.environ.get('BENCH_REPETICIONES', 3))
+LATENCIA = float(os.environ.get('BENCH_LATENCIA', 0.2))
+FALLOS = float(os.environ.get('BENCH_FALLOS', 0.1))
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))] * 1000
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import pasarela_falsa
+    servidor = pasarela_falsa.iniciar(latencia=LATENCIA, fallos=FALLOS)
+    os.environ['PAGOS_API_BASE'] = f'http://127.0.0.1:{servidor.server_port}'
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    # Mismo método que los hashes de prueba, para que el login no los actualice a scrypt
+    os.environ['HASH_METODO'] = 'pbkdf2:sha256:1000'
+    from werkzeug.security import generate_password_hash
+    from app import app, calentar, migrar, db, Usuario, Pedido, cliente_pagos
+    # Como al servir: primero las migraciones y después se precarga lo de solo lectura (incluida la
+    # librería de la pasarela) antes de la primera petición
+    with app.app_context():
+        migrar()
+    calentar(app)
+    with app.app_context():
+        usuarios = [Usuario(nombre=f'U{i}', email=f'u{i}@bench', password=generate_password_hash('x', method='pbkdf2:sha256:1000')) for i in range(COMPRADORES)]
+        db.session.add_all(usuarios)
+        db.session.flush()
+        pedidos = [Pedido(usuario_id=u.id, total=100000 + i, estado='pendiente') for i, u in enumerate(usuarios)]
+        db.session.add_all(pedidos)
+        db.session.commit()
+        pedido_ids = [p.id for p in pedidos]
+    cliente = app.test_client()
+    tokens = [cliente.post('/api/login', json={'email': f'u{i}@bench', 'password': 'x'}).get_json()['token'] for i in range(COMPRADORES)]
+    latencias, errores, secretos = [], [], {}
+    lock = threading.Lock()
+
+    def pedir(i):
+        inicio = time.perf_counter()
+        r = app.test_client().post('/api/stripe/create-payment-intent', json={'pedido_id': pedido_ids[i]}, headers={'Authorization': f'Bearer {tokens[i]}'})
+        with lock:
+            latencias.append(time.perf_counter() - inicio)
+            if r.status_code == 200:
+                secretos.setdefault(pedido_ids[i], set()).add(r.get_json()['clientSecret'])
+            else:
+                errores.append(r.status_code)
+
+    def comprador(i):
+        # Doble clic: dos peticiones a la vez, luego reintentos secuenciales
+        hilos = [threading.Thread(target=pedir, args=(i,)) for _ in range(2)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        for _ in range(REPETICIONES - 2):
+            pedir(i)
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=comprador, args=(i,)) for i in range(COMPRADORES)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    duplicados = sum(1 for s in secretos.values() if len(s) > 1)
+    print(f'{COMPRADORES} compradores x {REPETICIONES} peticiones, pasarela con latencia {LATENCIA}s y {FALLOS:.0%} de errores 5xx')
+    print(f'peticiones: {len(latencias)} en {duracion:.1f}s  p50 {percentil(latencias, 50):.1f} ms  p99 {percentil(latencias, 99):.1f} ms  errores {len(errores)}')
+    print(f'llamadas a la pasarela: {cliente_pagos.llamadas} intents creados, {servidor.estado.peticiones} peticiones HTTP (con reintentos)')
+    print(f'pedidos con más de un intent: {duplicados}')
+    sys.exit(1 if duplicados or errores else 0)
+
+if __name__ == '__main__':
+    main()
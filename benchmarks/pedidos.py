@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import time
+
+DIRECTORIO = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(DIRECTORIO, 'bench.db')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import request
+from app import app, migrar, db, Usuario, Producto, Pedido, ItemPedido, listar_pedidos, LIMITE_PAGINA_MAXIMO
+
+TAMANOS = [10, 100, 1000]
+ITEMS_POR_PEDIDO = 3
+
+class ContadorSQL:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, *args):
+        self.total += 1
+
+def poblar(n):
+    db.session.query(ItemPedido).delete()
+    db.session.query(Pedido).delete()
+    if not Usuario.query.first():
+        db.session.add(Usuario(nombre='Bench', email='bench@glamrent.com', password='x', es_admin=True))
+        db.session.add_all([Producto(nombre=f'Vestido {i}', precio=100000 + i, stock=10) for i in range(50)])
+        db.session.flush()
+    usuarios = [u.id for u in Usuario.query.all()]
+    productos = [p.id for p in Producto.query.all()]
+    for i in range(n):
+        pedido = Pedido(usuario_id=usuarios[i % len(usuarios)], total=0, estado='pagado')
+        db.session.add(pedido)
+        db.session.flush()
+        db.session.add_all([ItemPedido(pedido_id=pedido.id, producto_id=productos[(i + j) % len(productos)], cantidad=1, precio_unitario=100000) for j in range(ITEMS_POR_PEDIDO)])
+    db.session.commit()
+
+def main():
+    contador = ContadorSQL()
+    conteos = {}
+    with app.app_context():
+        migrar()
+        db.event.listen(db.engine, 'before_cursor_execute', contador)
+        for n in TAMANOS:
+            poblar(n)
+            db.session.expunge_all()
+            with app.test_request_context(f'/api/admin/pedidos?limite={LIMITE_PAGINA_MAXIMO}'):
+                contador.total = 0
+                inicio = time.perf_counter()
+                resultado = listar_pedidos(Pedido.query, request.args, con_usuario=True)
+                duracion = (time.perf_counter() - inicio) * 1000
+            conteos[n] = contador.total
+            print(f'{n:>6} pedidos -> {len(resultado["pedidos"]):>4} en página, {contador.total} consultas SQL, {duracion:.1f} ms')
+    # La regresión N+1 (mismas consultas con cualquier cantidad de pedidos) la comprueba tests/test_pedidos.py
+    print(f"Consultas por listado: {', '.join(str(conteos[n]) for n in TAMANOS)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+# Mismo método que los hashes de prueba, para que el login no los actualice a scrypt
+os.environ['HASH_METODO'] = 'pbkdf2:sha256:1000'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from werkzeug.security import generate_password_hash
+from app import app, migrar, db, Usuario, Producto, Carrito, Pedido
+
+COMPRADORES = int(os.environ.get('BENCH_COMPRADORES', 300))
+STOCK = int(os.environ.get('BENCH_STOCK', 1))
+
+def main():
+    with app.app_context():
+        migrar()
+        producto = Producto(nombre='Vestido único', precio=250000, stock=STOCK)
+        db.session.add(producto)
+        db.session.add_all([Usuario(nombre=f'U{i}', email=f'u{i}@bench', password=generate_password_hash('x', method='pbkdf2:sha256:1000')) for i in range(COMPRADORES)])
+        db.session.flush()
+        db.session.add_all([Carrito(usuario_id=u.id, producto_id=producto.id, cantidad=1) for u in Usuario.query.all()])
+        db.session.commit()
+        producto_id = producto.id
+    cliente = app.test_client()
+    tokens = [cliente.post('/api/login', json={'email': f'u{i}@bench', 'password': 'x'}).get_json()['token'] for i in range(COMPRADORES)]
+    estados = Counter()
+    lock = threading.Lock()
+    barrera = threading.Barrier(COMPRADORES)
+
+    def comprar(token):
+        cliente = app.test_client()
+        barrera.wait()
+        r = cliente.post('/api/pedidos', json={}, headers={'Authorization': f'Bearer {token}'})
+        with lock:
+            estados[r.status_code] += 1
+
+    hilos = [threading.Thread(target=comprar, args=(t,)) for t in tokens]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    with app.app_context():
+        stock_final = db.session.get(Producto, producto_id).stock
+        pedidos = Pedido.query.count()
+    print(f'{COMPRADORES} checkouts simultáneos sobre stock {STOCK} en {duracion:.2f}s: respuestas {dict(estados)}, pedidos creados {pedidos}, stock final {stock_final}')
+    if pedidos != STOCK or stock_final != 0 or estados.get(500):
+        print('❌ Sobreventa o errores en la reserva de stock')
+        sys.exit(1)
+    print('✅ Sin sobreventa')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Bytes y CPU por petición del catálogo y del listado de pedidos del panel con cada backend de JSON
+# (json de la biblioteca estándar, como el jsonify de Flask, u orjson) y cada compresión (ninguna,
+# gzip, brotli), sobre una base generada con generar_datos.py. El catálogo se mide sin cache (cada
+# petición la invalida antes) y con acierto de cache. Aparte compara, sin HTTP, el dict armado campo
+# por campo con el serializador compilado y json.dumps con orjson. Falla si las respuestas no
+# decodifican al mismo JSON con todos los backends y compresiones o si el ETag deja de dar 304.
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTOS = int(os.environ.get('BENCH_PRODUCTOS', 20000))
+PEDIDOS = int(os.environ.get('BENCH_PEDIDOS', 20000))
+REPETICIONES = int(os.environ.get('BENCH_REPETICIONES', 50))
+RUTAS = [
+    ('catálogo 50', '/api/productos?limite=50'),
+    ('catálogo 200', '/api/productos?limite=200'),
+    ('catálogo 200 (fields)', '/api/productos?limite=200&fields=id,nombre,precio,imagenes'),
+    ('búsqueda 50', '/api/productos/buscar?q=vestido&limite=50'),
+    ('pedidos admin 200', '/api/admin/pedidos?limite=200'),
+]
+MODOS = [('json', None), ('orjson', None), ('orjson', 'gzip'), ('orjson', 'br')]
+
+def decodificar(respuesta):
+    datos = respuesta.data
+    if respuesta.headers.get('Content-Encoding') == 'gzip':
+        datos = gzip.decompress(datos)
+    elif respuesta.headers.get('Content-Encoding') == 'br':
+        import brotli
+        datos = brotli.decompress(datos)
+    return json.loads(datos)
+
+def ejecutar(ruta_db):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    sys.path.insert(0, DIRECTORIO)
+    import jwt
+    from flask.json.provider import DefaultJSONProvider
+    import app as tienda
+    import serializacion
+    app, db = tienda.app, tienda.db
+    with app.app_context():
+        tienda.migrar()
+        db.session.execute(db.update(tienda.Usuario).where(tienda.Usuario.id == 1).values(es_admin=True))
+        db.session.commit()
+    token = jwt.encode({'usuario_id': 1, 'exp': int(time.time()) + 3600}, app.config['SECRET_KEY'], algorithm='HS256')
+    cliente = app.test_client()
+    resultado = {'rutas': {}, 'fallos': []}
+    for nombre, ruta in RUTAS:
+        referencia = None
+        for backend, codificacion in MODOS:
+            app.json = serializacion.ProveedorJSON(app) if backend == 'orjson' else DefaultJSONProvider(app)
+            app.config['COMPRESION_ACTIVA'] = codificacion is not None
+            cabeceras = {'Authorization': f'Bearer {token}', 'Accept-Encoding': codificacion or 'identity'}
+            cpu_sin_cache, cpu_con_cache = 0.0, 0.0
+            for _ in range(REPETICIONES):
+                with app.app_context():
+                    tienda.cache_respuestas.invalidar('productos')
+                inicio = time.process_time()
+                respuesta = cliente.get(ruta, headers=cabeceras)
+                cpu_sin_cache += time.process_time() - inicio
+                inicio = time.process_time()
+                cliente.get(ruta, headers=cabeceras)
+                cpu_con_cache += time.process_time() - inicio
+            datos = decodificar(respuesta)
+            if referencia is None:
+                referencia = datos
+            elif datos != referencia:
+                resultado['fallos'].append(f'{nombre}: {backend}/{codificacion} no da el mismo JSON')
+            etag = respuesta.headers.get('ETag')
+            if etag and cliente.get(ruta, headers={**cabeceras, 'If-None-Match': etag}).status_code != 304:
+                resultado['fallos'].append(f'{nombre}: {backend}/{codificacion} no responde 304 con su ETag')
+            cacheada = not ruta.startswith('/api/admin')
+            resultado['rutas'].setdefault(nombre, []).append({'modo': f'{backend}+{codificacion}' if codificacion else backend, 'bytes': len(respuesta.data), 'cpu_ms': cpu_sin_cache / REPETICIONES * 1000, 'cpu_cache_ms': cpu_con_cache / REPETICIONES * 1000 if cacheada else None})
+    # Sin HTTP: armar 200 productos y volcarlos
+    with app.app_context():
+        filas = db.session.query(*[getattr(tienda.Producto, c) for c in ('id', 'nombre', 'descripcion', 'precio', 'talla', 'color', 'imagen_url', 'stock')]).limit(200).all()
+        campos = tienda.CAMPOS_PRODUCTO_DEFECTO
+        por_campo = lambda: [{c: tienda.imagenes_producto(fila.imagen_url) if c == 'imagenes' else getattr(fila, c) for c in campos} for fila in filas]
+        serializar = tienda.serializador_producto(campos)
+        compilado = lambda: [serializar(fila) for fila in filas]
+        productos = compilado()
+        if productos != por_campo():
+            resultado['fallos'].append('el serializador compilado no da los mismos dicts')
+        medir = lambda funcion: min(_tiempo(funcion) for _ in range(20)) * 1000
+        resultado['armar_por_campo_ms'] = medir(por_campo)
+        resultado['armar_compilado_ms'] = medir(compilado)
+        resultado['volcar_json_ms'] = medir(lambda: json.dumps({'productos': productos}, sort_keys=True))
+        resultado['volcar_orjson_ms'] = medir(lambda: serializacion.volcar({'productos': productos}))
+    print(json.dumps(resultado))
+
+def _tiempo(funcion):
+    inicio = time.perf_counter()
+    funcion()
+    return time.perf_counter() - inicio
+
+def main():
+    ruta_db = os.path.join(tempfile.mkdtemp(), 'serializacion.db')
+    subprocess.run([sys.executable, os.path.join(DIRECTORIO, 'benchmarks', 'generar_datos.py'), '--db', ruta_db, '--productos', str(PRODUCTOS), '--usuarios', '1000', '--pedidos', str(PEDIDOS), '--carritos', '0'], check=True, capture_output=True)
+    salida = subprocess.run([sys.executable, __file__, '--ejecutar', ruta_db], capture_output=True, text=True, check=True, env={**os.environ, 'SIMILARES_ACTIVAS': '0'})
+    r = json.loads(salida.stdout.strip().splitlines()[-1])
+    print(f'{PRODUCTOS:,} productos, {PEDIDOS:,} pedidos; CPU media de {REPETICIONES} peticiones')
+    for nombre, modos in r['rutas'].items():
+        print(f'  {nombre}')
+        for m in modos:
+            cache = f", acierto de cache {m['cpu_cache_ms']:.2f} ms" if m['cpu_cache_ms'] is not None else ''
+            print(f"    {m['modo']:<12} {m['bytes'] / 1024:8.1f} KB  CPU {m['cpu_ms']:6.2f} ms{cache}")
+    print(f"  200 productos sin HTTP: armar dicts campo a campo {r['armar_por_campo_ms']:.3f} ms, compilado {r['armar_compilado_ms']:.3f} ms; json.dumps {r['volcar_json_ms']:.3f} ms, orjson {r['volcar_orjson_ms']:.3f} ms")
+    if r['fallos']:
+        print('❌ ' + '; '.join(r['fallos']))
+        sys.exit(1)
+    print('✅ Mismo JSON con todos los backends y compresiones')
+
+if __name__ == '__main__':
+    ejecutar(sys.argv[2]) if '--ejecutar' in sys.argv else main()
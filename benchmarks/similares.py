@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Índice de "vestidos parecidos" sobre catálogos de 100k+ productos con historial de pedidos
+# (generados con generar_datos.py). Mide la construcción completa, la memoria del índice, la
+# consulta al índice y a /api/productos/<id>/similares frente a calcular por petición (producto
+# punto contra toda la categoría o leer las compras conjuntas del historial), y la actualización
+# incremental tras editar productos y crear pedidos, comprobando que da los mismos vecinos que
+# reconstruir todo. El catálogo sintético tiene muchos productos con los mismos atributos, así que
+# los vecinos se comparan por puntaje (empates intercambiables) y no por id.
+TAMANOS = [int(n) for n in os.environ.get('BENCH_PRODUCTOS', '100000').split(',')]
+PEDIDOS_POR_PRODUCTO = float(os.environ.get('BENCH_PEDIDOS_POR_PRODUCTO', 2))
+EDITADOS = 200
+PEDIDOS_NUEVOS = 100
+COINCIDENCIA_MINIMA = 0.95
+
+def ejecutar(ruta_db):
+    os.environ['DATABASE_URL'] = f'sqlite:///{ruta_db}'
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import numpy as np
+    import app as tienda
+    app, db, Producto, Pedido, ItemPedido = tienda.app, tienda.db, tienda.Producto, tienda.Pedido, tienda.ItemPedido
+    cliente = app.test_client()
+    rng = random.Random(5)
+
+    def mediana(funcion, argumentos):
+        tiempos = []
+        for argumento in argumentos:
+            inicio = time.perf_counter()
+            funcion(argumento)
+            tiempos.append(time.perf_counter() - inicio)
+        return statistics.median(tiempos)
+
+    resultado = {}
+    with app.app_context():
+        inicio = time.perf_counter()
+        tienda.actualizar_similares()
+        resultado['construccion_s'] = time.perf_counter() - inicio
+        indice = tienda.indice_similares
+        resultado['memoria_mb'] = sum(a.nbytes for a in (indice._ids, indice._vectores, indice._categorias, indice._pedidos, indice._vecinos, indice._puntajes)) / 1024 / 1024
+        ids = [i for (i,) in db.session.execute(db.select(Producto.id))]
+        muestra = rng.sample(ids, 2000)
+        resultado['indice_us'] = mediana(lambda i: indice.similares(i, 12), muestra) * 1e6
+        resultado['endpoint_ms'] = mediana(lambda i: cliente.get(f'/api/productos/{i}/similares'), muestra[:300]) * 1000
+        # Lo mismo sin índice: puntajes contra toda la categoría en cada petición, o las compras conjuntas leídas del historial
+        n = indice._n
+        resultado['por_peticion_vectores_ms'] = mediana(lambda i: np.argpartition(-(indice._vectores[:n][indice._categorias[:n] == indice._categorias[indice._posiciones[i]]] @ indice._vectores[indice._posiciones[i]]), 12)[:12], muestra[:300]) * 1000
+        otro = db.aliased(ItemPedido)
+        compras = lambda i: db.session.execute(db.select(otro.producto_id, db.func.count()).join(ItemPedido, db.and_(ItemPedido.pedido_id == otro.pedido_id, ItemPedido.producto_id != otro.producto_id)).join(Pedido, Pedido.id == otro.pedido_id).where(ItemPedido.producto_id == i, Pedido.estado != 'cancelado').group_by(otro.producto_id).order_by(db.func.count().desc()).limit(12)).all()
+        resultado['por_peticion_historial_ms'] = mediana(compras, muestra[:300]) * 1000
+        # Cambios: productos editados (por fuera del ORM, como la importación) y pedidos nuevos de dos o tres productos
+        editados = rng.sample(ids, EDITADOS)
+        for i in editados:
+            db.session.execute(db.update(Producto).where(Producto.id == i).values(color=rng.choice(['Rojo', 'Negro', 'Azul']), precio=rng.randint(80, 600) * 1000, nombre=Producto.nombre + ' edición especial'))
+        for _ in range(PEDIDOS_NUEVOS):
+            pedido = Pedido(usuario_id=1, total=1, estado='pagado')
+            db.session.add(pedido)
+            db.session.flush()
+            db.session.add_all([ItemPedido(pedido_id=pedido.id, producto_id=p, cantidad=1, precio_unitario=1) for p in rng.sample(ids, rng.choice((2, 3)))])
+        db.session.commit()
+        inicio = time.perf_counter()
+        tienda.actualizar_similares()
+        resultado['incremental_ms'] = (time.perf_counter() - inicio) * 1000
+        incremental = {i: [p for _, p in indice.similares(i, 12)] for i in editados + muestra}
+        # Referencia: índice reconstruido desde cero con los mismos datos
+        tienda.indice_similares = tienda.similares.IndiceSimilares(app.config['FACETAS_RANGOS_PRECIO'], app.config['SIMILARES_K'], app.config['SIMILARES_PESO_COMPRAS'])
+        tienda.actualizar_similares()
+        completo = {i: [p for _, p in tienda.indice_similares.similares(i, 12)] for i in incremental}
+        # Reconstruir recalcula el idf de las palabras: se toleran diferencias chicas de puntaje
+        resultado['coincidencia'] = statistics.mean(len(incremental[i]) == len(completo[i]) and all(abs(a - b) < 0.02 for a, b in zip(incremental[i], completo[i])) for i in incremental)
+    print(json.dumps(resultado))
+
+def main():
+    generador = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'generar_datos.py')
+    fallos = []
+    for productos in TAMANOS:
+        ruta_db = os.path.join(tempfile.mkdtemp(), 'similares.db')
+        pedidos = int(productos * PEDIDOS_POR_PRODUCTO)
+        subprocess.run([sys.executable, generador, '--db', ruta_db, '--productos', str(productos), '--usuarios', '1000', '--pedidos', str(pedidos), '--carritos', '0'], check=True, capture_output=True)
+        salida = subprocess.run([sys.executable, __file__, '--ejecutar', ruta_db], capture_output=True, text=True, check=True)
+        r = json.loads(salida.stdout.strip().splitlines()[-1])
+        print(f"{productos:,} productos, {pedidos:,} pedidos: construcción {r['construccion_s']:.1f}s, índice {r['memoria_mb']:.1f} MB")
+        print(f"  consulta al índice {r['indice_us']:.1f} µs; /api/productos/<id>/similares {r['endpoint_ms']:.2f} ms")
+        print(f"  por petición sin índice: puntajes contra la categoría {r['por_peticion_vectores_ms']:.2f} ms, compras conjuntas del historial {r['por_peticion_historial_ms']:.2f} ms")
+        print(f"  {EDITADOS} productos editados y {PEDIDOS_NUEVOS} pedidos nuevos: actualización incremental {r['incremental_ms']:.0f} ms, {r['coincidencia']:.1%} de productos con los mismos vecinos que al reconstruir todo")
+        if r['coincidencia'] < COINCIDENCIA_MINIMA:
+            fallos.append(f'{productos}: la actualización incremental se aleja de la reconstrucción ({r["coincidencia"]:.1%})')
+    if fallos:
+        print('❌ ' + '; '.join(fallos))
+        sys.exit(1)
+    print('✅ Actualización incremental equivalente a reconstruir')
+
+if __name__ == '__main__':
+    ejecutar(sys.argv[2]) if '--ejecutar' in sys.argv else main()
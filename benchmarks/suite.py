@@ -0,0 +1,311 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+# Prueba de carga sobre los endpoints reales (catálogo, búsqueda, carrito, checkout y dashboard)
+# con una base generada por benchmarks/generar_datos.py. Por defecto levanta el servidor en un
+# proceso aparte sobre --db; con --url ataca un servidor ya en marcha. Reporta throughput y
+# p50/p95/p99 por ruta y guarda el resultado en JSON para comparar entre commits:
+#   python benchmarks/generar_datos.py --db /tmp/carga.db
+#   python benchmarks/suite.py --db /tmp/carga.db --concurrencia 32 --duracion 60
+#   python benchmarks/suite.py --db /tmp/carga.db --comparar benchmarks/resultados/<anterior>.json
+#   python benchmarks/suite.py --db /tmp/carga.db --workers 4   (gunicorn con gunicorn.conf.py)
+# Ojo: el checkout crea pedidos y reserva stock, así que cada corrida modifica la base; para
+# comparar commits conviene partir de una copia de la misma base generada.
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEZCLA_DEFECTO = 'catalogo=35,detalle=20,busqueda=15,carrito=15,checkout=5,dashboard=10'
+TERMINOS = ['vestido', 'corset', 'encaje', 'seda', 'rojo', 'negro', 'sirena', 'gala', 'perla', 'esmeralda', 'tul', 'dorado', 'vestido largo', 'corsé rosa']
+COLORES = ['Negro', 'Rojo', 'Azul', 'Verde', 'Rosa', 'Blanco', 'Dorado', 'Vino']
+TALLAS = ['XS', 'S', 'M', 'L', 'XL']
+
+def argumentos():
+    parser = argparse.ArgumentParser(description='Prueba de carga de la tienda')
+    parser.add_argument('--db', help='Base SQLite generada; se levanta el servidor sobre ella')
+    parser.add_argument('--url', help='Servidor ya en marcha (en vez de --db)')
+    parser.add_argument('--puerto', type=int, default=5077)
+    parser.add_argument('--workers', type=int, default=0, help='Con --db, sirve con gunicorn y este número de workers en vez del servidor de desarrollo')
+    parser.add_argument('--concurrencia', type=int, default=16)
+    parser.add_argument('--duracion', type=float, default=30)
+    parser.add_argument('--calentamiento', type=float, default=3, help='Segundos iniciales que no se miden')
+    parser.add_argument('--mezcla', default=MEZCLA_DEFECTO, help='Pesos de los escenarios, p. ej. catalogo=1,busqueda=1')
+    parser.add_argument('--sesiones', type=int, default=200, help='Usuarios distintos que inician sesión')
+    parser.add_argument('--email-admin', default='admin@carga.test')
+    parser.add_argument('--contrasena', default='carga1234')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto benchmarks/resultados/<fecha>-<commit>.json)')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior contra el que comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.15, help='Empeoramiento relativo permitido en p95 y throughput')
+    parser.add_argument('--servir', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if not args.servir and bool(args.db) == bool(args.url):
+        parser.error('Indica --db o --url')
+    return args
+
+def servir(args):
+    # Proceso del servidor: así el cliente de carga no compite por el GIL con la aplicación
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.db)}'
+    sys.path.insert(0, DIRECTORIO)
+    import logging
+    from werkzeug.serving import make_server
+    from app import app, calentar, iniciar_tareas
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    calentar(app)
+    iniciar_tareas(app)
+    # Salida ordenada con SIGTERM: así se cierran también los procesos del pool de contraseñas,
+    # que si no quedan huérfanos con el socket del servidor abierto
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    make_server('127.0.0.1', args.puerto, app, threaded=True).serve_forever()
+
+def esperar_servidor(url, proceso, espera=120):
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if proceso is not None and proceso.poll() is not None:
+            sys.exit(f'El servidor terminó con código {proceso.returncode}')
+        try:
+            if requests.get(f'{url}/api/health', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    sys.exit(f'El servidor no respondió en {espera}s')
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'desconocido'
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))] * 1000
+
+def iniciar_sesion(url, email, contrasena):
+    r = requests.post(f'{url}/api/login', json={'email': email, 'password': contrasena}, timeout=60)
+    # El pool de contraseñas rechaza con 429/503 cuando está lleno: se reintenta tras Retry-After
+    while r.status_code in (429, 503):
+        time.sleep(float(r.headers.get('Retry-After', 1)))
+        r = requests.post(f'{url}/api/login', json={'email': email, 'password': contrasena}, timeout=60)
+    if r.status_code != 200:
+        sys.exit(f'No se pudo iniciar sesión como {email} ({r.status_code}); ¿se generó la base con benchmarks/generar_datos.py?')
+    return r.json()['token']
+
+class Carga:
+    def __init__(self, url, args, tokens, token_admin, total_productos):
+        self.url = url
+        self.args = args
+        self.tokens = tokens
+        self.token_admin = token_admin
+        self.total_productos = total_productos
+        self.escenarios = []
+        for parte in args.mezcla.split(','):
+            nombre, _, peso = parte.partition('=')
+            if not hasattr(self, f'escenario_{nombre.strip()}'):
+                sys.exit(f'Escenario desconocido: {nombre}')
+            self.escenarios.append((getattr(self, f'escenario_{nombre.strip()}'), float(peso or 1)))
+        self.latencias = defaultdict(list)
+        self.codigos = defaultdict(Counter)
+        self.lock = threading.Lock()
+        self.medir_desde = None
+
+    def pedir(self, sesion, metodo, ruta, plantilla, token=None, **kwargs):
+        cabeceras = {'Authorization': f'Bearer {token}'} if token else {}
+        inicio = time.perf_counter()
+        try:
+            r = sesion.request(metodo, f'{self.url}{ruta}', headers=cabeceras, timeout=60, **kwargs)
+            codigo = r.status_code
+        except requests.RequestException:
+            r, codigo = None, 'conexion'
+        duracion = time.perf_counter() - inicio
+        if time.monotonic() >= self.medir_desde:
+            clave = f'{metodo} {plantilla}'
+            with self.lock:
+                self.latencias[clave].append(duracion)
+                self.codigos[clave][codigo] += 1
+        return r
+
+    def producto_al_azar(self, rng):
+        return rng.randint(1, self.total_productos)
+
+    def escenario_catalogo(self, sesion, rng, token):
+        # Primera página con filtros al azar y a veces la siguiente con el cursor
+        params = {'limite': 24}
+        if rng.random() < 0.5:
+            params['color'] = rng.choice(COLORES)
+        if rng.random() < 0.3:
+            params['talla'] = rng.choice(TALLAS)
+        if rng.random() < 0.3:
+            params['orden'] = 'precio'
+            params['precio_min'] = rng.randrange(100000, 400000, 50000)
+        r = self.pedir(sesion, 'GET', '/api/productos', '/api/productos', params=params)
+        if r is not None and r.status_code == 200 and rng.random() < 0.4 and r.json().get('siguiente_cursor'):
+            self.pedir(sesion, 'GET', '/api/productos', '/api/productos', params={**params, 'cursor': r.json()['siguiente_cursor']})
+
+    def escenario_detalle(self, sesion, rng, token):
+        self.pedir(sesion, 'GET', f'/api/productos/{self.producto_al_azar(rng)}', '/api/productos/<id>')
+
+    def escenario_busqueda(self, sesion, rng, token):
+        self.pedir(sesion, 'GET', '/api/productos/buscar', '/api/productos/buscar', params={'q': rng.choice(TERMINOS), 'limite': 24})
+
+    def escenario_carrito(self, sesion, rng, token):
+        producto_id = self.producto_al_azar(rng)
+        operaciones = [{'tipo': 'agregar', 'producto_id': producto_id}]
+        if rng.random() < 0.3:
+            operaciones.append({'tipo': 'eliminar', 'producto_id': producto_id})
+        self.pedir(sesion, 'POST', '/api/carrito/lote', '/api/carrito/lote', token, json={'operaciones': operaciones})
+        if rng.random() < 0.3:
+            self.pedir(sesion, 'GET', '/api/carrito', '/api/carrito', token)
+
+    def escenario_checkout(self, sesion, rng, token):
+        # Carrito con un solo producto y pedido; sin stock responde 409, que no cuenta como error
+        operaciones = [{'tipo': 'fijar', 'producto_id': self.producto_al_azar(rng), 'cantidad': 1}]
+        self.pedir(sesion, 'POST', '/api/carrito/lote', '/api/carrito/lote', token, json={'operaciones': operaciones})
+        self.pedir(sesion, 'DELETE', '/api/carrito/vaciar', '/api/carrito/vaciar', token)
+        self.pedir(sesion, 'POST', '/api/carrito/lote', '/api/carrito/lote', token, json={'operaciones': operaciones})
+        self.pedir(sesion, 'POST', '/api/pedidos', '/api/pedidos', token, json={'direccion_envio': 'Calle de la carga 1, Cartagena'})
+
+    def escenario_dashboard(self, sesion, rng, token):
+        self.pedir(sesion, 'GET', '/api/admin/estadisticas', '/api/admin/estadisticas', self.token_admin)
+        self.pedir(sesion, 'GET', '/api/admin/estadisticas/series', '/api/admin/estadisticas/series', self.token_admin)
+        params = {'limite': 20}
+        if rng.random() < 0.5:
+            params['estado'] = rng.choice(['pendiente', 'pagado', 'despachado'])
+        self.pedir(sesion, 'GET', '/api/admin/pedidos', '/api/admin/pedidos', self.token_admin, params=params)
+
+    def trabajador(self, i, fin):
+        rng = random.Random(self.args.semilla * 1000 + i)
+        sesion = requests.Session()
+        funciones, pesos = zip(*self.escenarios)
+        token = self.tokens[i % len(self.tokens)]
+        while time.monotonic() < fin:
+            rng.choices(funciones, pesos)[0](sesion, rng, token)
+
+    def ejecutar(self):
+        inicio = time.monotonic()
+        self.medir_desde = inicio + self.args.calentamiento
+        fin = self.medir_desde + self.args.duracion
+        hilos = [threading.Thread(target=self.trabajador, args=(i, fin)) for i in range(self.args.concurrencia)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return time.monotonic() - self.medir_desde
+
+def resumir(latencias, codigos, duracion):
+    rutas = {}
+    for clave in sorted(latencias):
+        valores = sorted(latencias[clave])
+        errores = sum(n for c, n in codigos[clave].items() if c == 'conexion' or c >= 500)
+        rutas[clave] = {
+            'peticiones': len(valores),
+            'rps': round(len(valores) / duracion, 2),
+            'p50_ms': round(percentil(valores, 50), 2),
+            'p95_ms': round(percentil(valores, 95), 2),
+            'p99_ms': round(percentil(valores, 99), 2),
+            'media_ms': round(sum(valores) / len(valores) * 1000, 2),
+            'errores': errores,
+            'codigos': {str(c): n for c, n in sorted(codigos[clave].items(), key=lambda item: str(item[0]))},
+        }
+    todas = sorted(v for valores in latencias.values() for v in valores)
+    total = {
+        'peticiones': len(todas),
+        'rps': round(len(todas) / duracion, 2),
+        'p50_ms': round(percentil(todas, 50), 2),
+        'p95_ms': round(percentil(todas, 95), 2),
+        'p99_ms': round(percentil(todas, 99), 2),
+        'errores': sum(r['errores'] for r in rutas.values()),
+    }
+    return rutas, total
+
+def imprimir(rutas, total):
+    print(f"{'ruta':42s} {'peticiones':>10s} {'rps':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'errores':>8s}")
+    for clave, r in list(rutas.items()) + [('TOTAL', total)]:
+        print(f"{clave:42s} {r['peticiones']:10d} {r['rps']:9.1f} {r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} {r['errores']:8d}")
+
+def comparar(actual, anterior, tolerancia):
+    # Regresión: p95 peor que la tolerancia (y por más de 1 ms) o throughput menor que la tolerancia
+    print(f"\nComparación con {anterior.get('commit')} ({anterior.get('fecha')}):")
+    distintas = [c for c in ('workers', 'concurrencia', 'duracion', 'mezcla', 'productos') if actual['config'].get(c) != anterior.get('config', {}).get(c)]
+    if distintas:
+        print(f"  ⚠️  Configuración distinta ({', '.join(distintas)}): las cifras no son comparables")
+    regresiones = []
+    for clave, r in actual['rutas'].items():
+        previo = anterior.get('rutas', {}).get(clave)
+        if not previo:
+            continue
+        cambio_p95 = (r['p95_ms'] - previo['p95_ms']) / max(previo['p95_ms'], 1e-9)
+        cambio_rps = (r['rps'] - previo['rps']) / max(previo['rps'], 1e-9)
+        marca = ''
+        if (cambio_p95 > tolerancia and r['p95_ms'] - previo['p95_ms'] > 1) or cambio_rps < -tolerancia:
+            marca = '  ← regresión'
+            regresiones.append(clave)
+        print(f"  {clave:42s} p95 {previo['p95_ms']:8.1f} → {r['p95_ms']:8.1f} ms ({cambio_p95:+.0%})  rps {previo['rps']:8.1f} → {r['rps']:8.1f} ({cambio_rps:+.0%}){marca}")
+    return regresiones
+
+def main():
+    args = argumentos()
+    if args.servir:
+        return servir(args)
+    proceso = None
+    url = (args.url or f'http://127.0.0.1:{args.puerto}').rstrip('/')
+    if args.db:
+        if not os.path.exists(args.db):
+            sys.exit(f'No existe {args.db}; genérala con benchmarks/generar_datos.py')
+        if args.workers:
+            entorno = {**os.environ, 'DATABASE_URL': f'sqlite:///{os.path.abspath(args.db)}', 'WEB_CONCURRENCY': str(args.workers)}
+            proceso = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(DIRECTORIO, 'gunicorn.conf.py'), '--bind', f'127.0.0.1:{args.puerto}', '--log-level', 'warning'], cwd=DIRECTORIO, env=entorno)
+        else:
+            proceso = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--servir', '--db', args.db, '--puerto', str(args.puerto)])
+    try:
+        esperar_servidor(url, proceso)
+        token_admin = iniciar_sesion(url, args.email_admin, args.contrasena)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            tokens = list(pool.map(lambda n: iniciar_sesion(url, f'usuario{n}@carga.test', args.contrasena), range(args.sesiones)))
+        estadisticas = requests.get(f'{url}/api/admin/estadisticas', headers={'Authorization': f'Bearer {token_admin}'}, timeout=60).json()
+        total_productos = estadisticas['productos']['total']
+        print(f"{url}: {total_productos:,} productos, {estadisticas['pedidos']['total']:,} pedidos; {args.concurrencia} clientes durante {args.duracion:g}s (+{args.calentamiento:g}s de calentamiento)")
+        carga = Carga(url, args, tokens, token_admin, total_productos)
+        duracion = carga.ejecutar()
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            proceso.wait()
+    rutas, total = resumir(carga.latencias, carga.codigos, duracion)
+    imprimir(rutas, total)
+    commit = commit_actual()
+    fecha = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    resultado = {
+        'fecha': fecha,
+        'commit': commit,
+        'config': {'url': args.url, 'db': args.db, 'workers': args.workers, 'concurrencia': args.concurrencia, 'duracion': args.duracion, 'mezcla': args.mezcla, 'sesiones': args.sesiones, 'semilla': args.semilla, 'productos': total_productos},
+        'total': total,
+        'rutas': rutas,
+    }
+    salida = args.salida or os.path.join(DIRECTORIO, 'benchmarks', 'resultados', f'{fecha}-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+    print(f'\nResultados guardados en {salida}')
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            regresiones = comparar(resultado, json.load(archivo), args.tolerancia)
+        if regresiones:
+            print(f'❌ Regresiones en {len(regresiones)} rutas')
+            sys.exit(1)
+        print('✅ Sin regresiones')
+    if total['errores']:
+        print(f"❌ {total['errores']} errores 5xx o de conexión")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
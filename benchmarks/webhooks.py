@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+# Arnés de eventos de pago: dispara miles de webhooks firmados (con duplicados, eventos ajenos y
+# firmas inválidas) contra /api/pagos/webhook, espera a que el procesador vacíe la bandeja y
+# comprueba que cada pedido quedó pagado una sola vez. Después simula un reinicio que vuelve a
+# procesar todos los eventos y verifica que nada cambie.
+PEDIDOS = int(os.environ.get('BENCH_PEDIDOS', 1000))
+DUPLICADOS = int(os.environ.get('BENCH_DUPLICADOS', 2))
+HILOS = int(os.environ.get('BENCH_HILOS', 16))
+PRODUCTOS = 20
+
+def percentil(valores, p):
+    if not valores:
+        return 0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p / 100))] * 1000
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    import pagos
+    from app import app, migrar, db, Usuario, Producto, Pedido, ItemPedido, Carrito, EventoPago, Estadistica, procesar_eventos_pago
+    app.config['PAGOS_INTERVALO_EVENTOS'] = 0.2
+    app.config['PAGOS_LOTE_EVENTOS'] = int(os.environ.get('BENCH_LOTE', app.config['PAGOS_LOTE_EVENTOS']))
+    secreto = app.config['PAGOS_WEBHOOK_SECRETO'] = 'whsec_bench'
+    with app.app_context():
+        migrar()
+        db.session.add_all([Producto(nombre=f'Vestido {i}', precio=100000 + i, stock=1000) for i in range(PRODUCTOS)])
+        usuarios = [Usuario(nombre=f'U{i}', email=f'u{i}@bench', password='x') for i in range(PEDIDOS)]
+        db.session.add_all(usuarios)
+        db.session.flush()
+        expira = datetime_futuro()
+        for i, usuario in enumerate(usuarios):
+            producto_id = 1 + i % PRODUCTOS
+            db.session.add(Pedido(usuario_id=usuario.id, total=100000, estado='pendiente', stock_reservado=True, reserva_expira=expira, items=[ItemPedido(producto_id=producto_id, cantidad=1, precio_unitario=100000)]))
+            db.session.add(Carrito(usuario_id=usuario.id, producto_id=producto_id, cantidad=1))
+        db.session.commit()
+        pedido_ids = [p.id for p in Pedido.query.all()]
+        stock_inicial = dict(db.session.query(Producto.id, Producto.stock))
+
+    entregas = []
+    for n, pedido_id in enumerate(pedido_ids):
+        exito = json.dumps({'id': f'evt_{n}', 'type': 'payment_intent.succeeded', 'data': {'object': {'id': f'pi_{n}', 'metadata': {'pedido_id': str(pedido_id)}}}})
+        entregas += [(exito, True)] * DUPLICADOS
+        if n % 10 == 0:
+            entregas.append((json.dumps({'id': f'evt_f{n}', 'type': 'payment_intent.payment_failed', 'data': {'object': {'id': f'pi_{n}', 'metadata': {'pedido_id': str(pedido_id)}}}}), True))
+            entregas.append((exito, False))
+    random.shuffle(entregas)
+    latencias, codigos = [], {}
+    lock = threading.Lock()
+    pendientes = list(enumerate(entregas))
+
+    def emisor():
+        cliente = app.test_client()
+        while True:
+            with lock:
+                if not pendientes:
+                    return
+                _, (cuerpo, firma_valida) = pendientes.pop()
+            firma = pagos.firmar_webhook(cuerpo, secreto if firma_valida else 'whsec_otro')
+            inicio = time.perf_counter()
+            r = cliente.post('/api/pagos/webhook', data=cuerpo, headers={'Stripe-Signature': firma, 'Content-Type': 'application/json'})
+            duracion = time.perf_counter() - inicio
+            with lock:
+                latencias.append(duracion)
+                codigos[r.status_code] = codigos.get(r.status_code, 0) + 1
+
+    inicio = time.perf_counter()
+    hilos = [threading.Thread(target=emisor) for _ in range(HILOS)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion_ingesta = time.perf_counter() - inicio
+    with app.app_context():
+        while EventoPago.query.filter(EventoPago.procesado.is_(None)).count():
+            time.sleep(0.1)
+    duracion_total = time.perf_counter() - inicio
+    print(f'{len(entregas)} entregas ({PEDIDOS} pedidos x {DUPLICADOS} + fallidos + firmas inválidas) con {HILOS} hilos')
+    print(f'ingesta: {len(entregas) / duracion_ingesta:.0f} webhooks/s  p50 {percentil(latencias, 50):.1f} ms  p99 {percentil(latencias, 99):.1f} ms  códigos {codigos}')
+    print(f'bandeja vacía a los {duracion_total:.1f}s')
+
+    def verificar(etapa):
+        with app.app_context():
+            db.session.expire_all()
+            estados = dict(db.session.query(Pedido.estado, db.func.count()).group_by(Pedido.estado).all())
+            pagados = db.session.get(Estadistica, 'pedidos_pagado')
+            errores = [
+                not (estados == {'pagado': PEDIDOS}),
+                pagados is None or pagados.valor != PEDIDOS,
+                dict(db.session.query(Producto.id, Producto.stock)) != stock_inicial,
+                Carrito.query.count() != 0,
+                EventoPago.query.filter_by(resultado='error').count() != 0,
+            ]
+            resultados = dict(db.session.query(EventoPago.resultado, db.func.count()).group_by(EventoPago.resultado).all())
+        ok = not any(errores)
+        print(f'{etapa}: pedidos {estados}, resultados {resultados} -> {"OK" if ok else "FALLO"}')
+        return ok
+
+    ok = verificar('tras la ingesta')
+    # Reinicio que reprocesa todo: los efectos no deben repetirse
+    with app.app_context():
+        db.session.execute(db.update(EventoPago).values(procesado=None, resultado=None))
+        db.session.commit()
+        while procesar_eventos_pago():
+            pass
+    ok = verificar('tras reprocesar todo') and ok
+    sys.exit(0 if ok else 1)
+
+def datetime_futuro():
+    import datetime
+    return datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+if __name__ == '__main__':
+    main()
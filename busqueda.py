@@ -0,0 +1,95 @@
+import re
+import unicodedata
+from sqlalchemy import text
+
+# Índice FTS5 de contenido externo sobre la tabla producto: los triggers lo mantienen
+# sincronizado con cada INSERT, UPDATE y DELETE, sin duplicar el texto de los productos.
+TABLA_FTS = 'producto_fts'
+PESOS_BM25 = (10.0, 2.0, 5.0)  # nombre, descripcion, color
+
+SQL_CREAR_FTS = f"""CREATE VIRTUAL TABLE {TABLA_FTS} USING fts5(
+    nombre, descripcion, color,
+    content='producto', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+)"""
+
+SQL_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON producto BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, nombre, descripcion, color) VALUES (new.id, new.nombre, new.descripcion, new.color);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON producto BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, nombre, descripcion, color) VALUES ('delete', old.id, old.nombre, old.descripcion, old.color);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF nombre, descripcion, color ON producto BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, nombre, descripcion, color) VALUES ('delete', old.id, old.nombre, old.descripcion, old.color);
+        INSERT INTO {TABLA_FTS}(rowid, nombre, descripcion, color) VALUES (new.id, new.nombre, new.descripcion, new.color);
+    END""",
+]
+
+def quitar_acentos(texto):
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+
+# Grafías que el prefijo no une: "corsé" queda en el índice como "corse", que no es prefijo de "corset"
+VARIANTES = {'corset': 'corse'}
+
+def tokenizar(texto):
+    return re.findall(r'\w+', quitar_acentos(texto).lower())
+
+def raiz(termino):
+    # Stemming ligero del español, solo en la consulta: sin el plural y con la grafía común. Como el
+    # término se busca por prefijo, "vestidos" -> "vestido"* encuentra el singular y el plural
+    # Las palabras cortas quedan igual: "cors" no debe pasar a "cor", que también encuentra "corto"
+    if len(termino) > 5 and termino.endswith('es'):
+        termino = termino[:-2]
+    elif len(termino) > 4 and termino.endswith('s'):
+        termino = termino[:-1]
+    return VARIANTES.get(termino, termino)
+
+def consulta_fts(texto):
+    # Cada término se busca por prefijo ("cors" encuentra "corsé" y "corset") y todos deben aparecer
+    return ' '.join(f'"{raiz(t)}"*' for t in tokenizar(texto))
+
+def fts_disponible(conexion):
+    if conexion.dialect.name != 'sqlite':
+        return False
+    try:
+        return 'ENABLE_FTS5' in {fila[0] for fila in conexion.execute(text('PRAGMA compile_options'))}
+    except Exception:
+        return False
+
+def indice_disponible(conexion):
+    return fts_disponible(conexion) and conexion.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {'n': TABLA_FTS}).first() is not None
+
+def crear_indice_busqueda(conexion):
+    if not fts_disponible(conexion):
+        return False
+    existe = conexion.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {'n': TABLA_FTS}).first()
+    if not existe:
+        conexion.execute(text(SQL_CREAR_FTS))
+        conexion.execute(text(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')"))
+    for sql in SQL_TRIGGERS:
+        conexion.execute(text(sql))
+    return True
+
+def suspender_indice_busqueda(conexion):
+    # Para cargas masivas: sin triggers, insertar es mucho más barato y luego se reconstruye una vez
+    for sufijo in ('ai', 'ad', 'au'):
+        conexion.execute(text(f'DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}'))
+
+def reconstruir_indice_busqueda(conexion):
+    if not fts_disponible(conexion):
+        return False
+    crear_indice_busqueda(conexion)
+    conexion.execute(text(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')"))
+    return True
+
+def buscar_ids(conexion, texto, limite, offset=0):
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    pesos = ', '.join(str(p) for p in PESOS_BM25)
+    filas = conexion.execute(
+        text(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH :q ORDER BY bm25({TABLA_FTS}, {pesos}) LIMIT :limite OFFSET :offset'),
+        {'q': consulta, 'limite': limite, 'offset': offset},
+    )
+    return [fila[0] for fila in filas]
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+class CacheTTL:
+    # Cache LRU acotado con expiración por entrada, seguro entre hilos del mismo proceso
+    def __init__(self, max_entradas=1024, ttl=60):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def get(self, clave, defecto=None):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return defecto
+            expira, valor = entrada
+            if expira <= time.monotonic():
+                del self._datos[clave]
+                return defecto
+            self._datos.move_to_end(clave)
+            return valor
+
+    def set(self, clave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def incr(self, clave):
+        # Los contadores no expiran ni se desalojan: son las generaciones de invalidación
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + 1
+            return self._contadores[clave]
+
+    def get_contador(self, clave):
+        return self._contadores.get(clave, 0)
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self):
+        return len(self._datos)
+
+class CacheRespuestas:
+    # Cache de respuestas ya serializadas. Cada entrada se guarda bajo una clave que incluye la
+    # generación actual de sus grupos (p.ej. 'productos', 'producto:3'); invalidar un grupo solo
+    # incrementa su generación, así que funciona igual con cualquier backend que implemente
+    # get/set/incr/get_contador (CacheTTL en memoria o un adaptador Redis con GET/SETEX/INCR).
+    def __init__(self, backend):
+        self.backend = backend
+
+    def clave(self, ruta, args, grupos):
+        generaciones = ','.join(f'{g}={self.backend.get_contador(f"gen:{g}")}' for g in grupos)
+        texto = f'{ruta}?{"&".join(f"{k}={v}" for k, v in sorted(args))}|{generaciones}'
+        return 'resp:' + hashlib.sha1(texto.encode('utf-8')).hexdigest()
+
+    def get(self, clave):
+        return self.backend.get(clave)
+
+    def set(self, clave, cuerpo, ttl=None):
+        etag = hashlib.sha1(cuerpo).hexdigest()[:16]
+        self.backend.set(clave, (cuerpo, etag), ttl)
+        return cuerpo, etag
+
+    def variante(self, clave, nombre, generar, ttl=None):
+        # Otra representación de una entrada (p.ej. comprimida) guardada bajo su propia clave;
+        # `nombre` incluye el etag del cuerpo, así que nunca corresponde a un cuerpo anterior
+        clave = f'{clave}:{nombre}'
+        datos = self.backend.get(clave)
+        if datos is None:
+            datos = generar()
+            self.backend.set(clave, datos, ttl)
+        return datos
+
+    def invalidar(self, *grupos):
+        for grupo in grupos:
+            self.backend.incr(f'gen:{grupo}')
+
+    def limpiar(self):
+        # Cuando no se sabe qué grupos cambiaron
+        self.backend.clear()
@@ -0,0 +1,64 @@
+from sqlalchemy import text
+
+# Registros de cambios. Triggers de SQLite anotan en cambio_producto el id de cada producto
+# insertado, modificado o eliminado, y en cambio_pedido el de cada pedido, incluidas las escrituras
+# masivas por Core que el ORM no ve (importación, reservas de stock, liberación de reservas). El id
+# del cambio siempre crece (AUTOINCREMENT), así que cada proceso recuerda el último que aplicó a sus
+# índices en memoria y después solo lee los nuevos. En cambio_cache van los grupos de cache
+# invalidados (los anota la app al confirmar y, para los usuarios, también un trigger).
+TABLA = 'cambio_producto'
+COLUMNAS = ('nombre', 'descripcion', 'precio', 'talla', 'color', 'imagen_url', 'stock', 'categoria_id')
+TABLA_PEDIDOS = 'cambio_pedido'
+# reserva_expira no: el UPDATE que toma el bloqueo al confirmar un pago solo la borra
+COLUMNAS_PEDIDO = ('estado', 'total', 'direccion_envio', 'stock_reservado', 'stripe_payment_id')
+TABLA_CACHE = 'cambio_cache'
+# Lo que guarda la cache de usuarios; un usuario degradado o eliminado fuera de la app (script, SQL a mano) también se invalida
+COLUMNAS_USUARIO = ('nombre', 'email', 'es_admin')
+COLUMNA = {TABLA: 'producto_id', TABLA_PEDIDOS: 'pedido_id', TABLA_CACHE: 'grupo'}
+
+def triggers(tabla, origen, columna, columnas):
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {tabla}_ai AFTER INSERT ON {origen} BEGIN
+            INSERT INTO {tabla}({columna}) VALUES (new.id);
+        END""",
+        # Un UPDATE que no cambia nada (el que toma el bloqueo en los alquileres) no se anota
+        f"""CREATE TRIGGER IF NOT EXISTS {tabla}_au AFTER UPDATE ON {origen}
+            WHEN {' OR '.join(f'old.{c} IS NOT new.{c}' for c in columnas)} BEGIN
+            INSERT INTO {tabla}({columna}) VALUES (new.id);
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {tabla}_ad AFTER DELETE ON {origen} BEGIN
+            INSERT INTO {tabla}({columna}) VALUES (old.id);
+        END""",
+    ]
+
+SQL_TRIGGERS = triggers(TABLA, 'producto', 'producto_id', COLUMNAS) + triggers(TABLA_PEDIDOS, 'pedido', 'pedido_id', COLUMNAS_PEDIDO) + [
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_CACHE}_usuario_au AFTER UPDATE ON usuario
+        WHEN {' OR '.join(f'old.{c} IS NOT new.{c}' for c in COLUMNAS_USUARIO)} BEGIN
+        INSERT INTO {TABLA_CACHE}(grupo) VALUES ('usuario:' || new.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA_CACHE}_usuario_ad AFTER DELETE ON usuario BEGIN
+        INSERT INTO {TABLA_CACHE}(grupo) VALUES ('usuario:' || old.id);
+    END""",
+]
+
+def crear_registro_cambios(conexion):
+    if conexion.dialect.name != 'sqlite':
+        return False
+    for sql in SQL_TRIGGERS:
+        conexion.execute(text(sql))
+    return True
+
+def ultimo_cambio(conexion, tabla=TABLA):
+    return conexion.execute(text(f'SELECT coalesce(max(id), 0) FROM {tabla}')).scalar()
+
+def cambios_desde(conexion, ultimo, limite, tabla=TABLA):
+    # [(id, fila_id)] posteriores a `ultimo`, o None si no se pueden aplicar uno a uno: hay más de
+    # `limite` o ya se podaron algunos (hueco tras `ultimo`) y hay que recargar todo
+    filas = conexion.execute(text(f'SELECT id, {COLUMNA[tabla]} FROM {tabla} WHERE id > :ultimo ORDER BY id LIMIT :limite'), {'ultimo': ultimo, 'limite': limite + 1}).all()
+    if len(filas) > limite or (filas and filas[0][0] != ultimo + 1):
+        return None
+    return filas
+
+def podar(conexion, conservar, tabla=TABLA):
+    # Deja los últimos `conservar` cambios; un proceso que se atrasó más que eso recarga todo
+    return conexion.execute(text(f'DELETE FROM {tabla} WHERE id <= (SELECT max(id) FROM {tabla}) - :conservar'), {'conservar': conservar}).rowcount
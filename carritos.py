@@ -0,0 +1,181 @@
+import atexit
+import contextlib
+import datetime
+import os
+import threading
+import time
+
+# Almacenes de carritos. Un carrito es un dict ordenado {producto_id: [cantidad, fecha_agregado]}.
+# AlmacenCarritosSQL escribe cada cambio en la tabla carrito con su propio commit;
+# AlmacenCarritosMemoria mantiene los carritos en memoria, marca los modificados y los vuelca
+# a la tabla por lotes (periódicamente, al apagar y antes del checkout).
+
+def aplicar_operaciones(carrito, operaciones):
+    ahora = datetime.datetime.utcnow()
+    for tipo, producto_id, cantidad in operaciones:
+        actual = carrito.get(producto_id, [0, ahora])[0]
+        nueva = actual + cantidad if tipo == 'agregar' else cantidad if tipo == 'fijar' else 0
+        if nueva <= 0:
+            carrito.pop(producto_id, None)
+        elif producto_id in carrito:
+            carrito[producto_id][0] = nueva
+        else:
+            carrito[producto_id] = [nueva, ahora]
+    return carrito
+
+class AlmacenCarritosSQL:
+    def __init__(self, db, modelo):
+        self.db = db
+        self.modelo = modelo
+
+    def obtener(self, usuario_id):
+        filas = self.db.session.query(self.modelo.producto_id, self.modelo.cantidad, self.modelo.fecha_agregado).filter(self.modelo.usuario_id == usuario_id).order_by(self.modelo.id)
+        carrito = {}
+        for producto_id, cantidad, fecha in filas:
+            if producto_id in carrito:
+                carrito[producto_id][0] += cantidad
+            else:
+                carrito[producto_id] = [cantidad, fecha]
+        return carrito
+
+    def aplicar(self, usuario_id, operaciones):
+        Carrito = self.modelo
+        ids = {producto_id for _, producto_id, _ in operaciones}
+        actuales = {item.producto_id: item for item in Carrito.query.filter(Carrito.usuario_id == usuario_id, Carrito.producto_id.in_(ids))} if ids else {}
+        carrito = aplicar_operaciones({pid: [item.cantidad, item.fecha_agregado] for pid, item in actuales.items()}, operaciones)
+        eliminar = [pid for pid in actuales if pid not in carrito]
+        actualizar = [{'id': actuales[pid].id, 'cantidad': cantidad} for pid, (cantidad, _) in carrito.items() if pid in actuales and actuales[pid].cantidad != cantidad]
+        insertar = [{'usuario_id': usuario_id, 'producto_id': pid, 'cantidad': cantidad, 'fecha_agregado': fecha} for pid, (cantidad, fecha) in carrito.items() if pid not in actuales]
+        if eliminar:
+            self.db.session.execute(self.db.delete(Carrito).where(Carrito.usuario_id == usuario_id, Carrito.producto_id.in_(eliminar)))
+        if actualizar:
+            self.db.session.execute(self.db.update(Carrito), actualizar)
+        if insertar:
+            self.db.session.execute(self.db.insert(Carrito), insertar)
+        self.db.session.commit()
+        return self.obtener(usuario_id)
+
+    def vaciar(self, usuario_id):
+        self.db.session.query(self.modelo).filter_by(usuario_id=usuario_id).delete()
+        self.db.session.commit()
+
+    def reemplazar(self, carritos):
+        # Escribe el estado completo de varios carritos en una sola transacción
+        Carrito = self.modelo
+        try:
+            self.db.session.execute(self.db.delete(Carrito).where(Carrito.usuario_id.in_(list(carritos))))
+            filas = [{'usuario_id': usuario_id, 'producto_id': pid, 'cantidad': cantidad, 'fecha_agregado': fecha} for usuario_id, carrito in carritos.items() for pid, (cantidad, fecha) in carrito.items()]
+            if filas:
+                self.db.session.execute(self.db.insert(Carrito), filas)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            raise
+
+    def descartar(self, usuario_id):
+        pass
+
+    def volcar(self, usuarios=None):
+        return 0
+
+class AlmacenCarritosMemoria:
+    # contexto() debe devolver el contexto en el que corre el volcado periódico (p.ej. app.app_context)
+    def __init__(self, respaldo, contexto, intervalo=2, inactividad=1800):
+        self.respaldo = respaldo
+        self.contexto = contexto
+        self.intervalo = intervalo
+        self.inactividad = inactividad
+        self._pid_volcador = None
+        self._carritos = {}
+        self._versiones = {}
+        self._accesos = {}
+        self._sucios = set()
+        self._lock = threading.Lock()
+        self._lock_volcado = threading.Lock()
+
+    @contextlib.contextmanager
+    def _cargado(self, usuario_id):
+        # Entrega el carrito con self._lock tomado: la expulsión por inactividad de volcar()
+        # no puede colarse entre la carga y el uso. La lectura de la tabla va fuera del lock.
+        carrito = None
+        while True:
+            with self._lock:
+                if usuario_id in self._carritos or carrito is not None:
+                    self._carritos.setdefault(usuario_id, carrito)
+                    self._versiones.setdefault(usuario_id, 0)
+                    self._accesos[usuario_id] = time.monotonic()
+                    yield self._carritos[usuario_id]
+                    return
+            carrito = self.respaldo.obtener(usuario_id)
+
+    def obtener(self, usuario_id):
+        with self._cargado(usuario_id) as carrito:
+            return {pid: list(valor) for pid, valor in carrito.items()}
+
+    def aplicar(self, usuario_id, operaciones):
+        self._asegurar_volcador()
+        with self._cargado(usuario_id) as carrito:
+            aplicar_operaciones(carrito, operaciones)
+            self._versiones[usuario_id] += 1
+            self._sucios.add(usuario_id)
+            return {pid: list(valor) for pid, valor in carrito.items()}
+
+    def vaciar(self, usuario_id):
+        self._asegurar_volcador()
+        with self._cargado(usuario_id):
+            self._carritos[usuario_id] = {}
+            self._versiones[usuario_id] += 1
+            self._sucios.add(usuario_id)
+
+    def descartar(self, usuario_id):
+        # La tabla ya quedó vacía dentro de otra transacción (p.ej. confirmar_pago)
+        with self._lock:
+            self._carritos[usuario_id] = {}
+            self._versiones[usuario_id] = self._versiones.get(usuario_id, 0) + 1
+            self._accesos[usuario_id] = time.monotonic()
+            self._sucios.discard(usuario_id)
+
+    def volcar(self, usuarios=None):
+        with self._lock_volcado:
+            with self._lock:
+                pendientes = self._sucios if usuarios is None else self._sucios.intersection(usuarios)
+                instantanea = {u: ({pid: list(v) for pid, v in self._carritos[u].items()}, self._versiones[u]) for u in pendientes}
+            if instantanea:
+                self.respaldo.reemplazar({u: carrito for u, (carrito, _) in instantanea.items()})
+            with self._lock:
+                for usuario_id, (_, version) in instantanea.items():
+                    if self._versiones[usuario_id] == version:
+                        self._sucios.discard(usuario_id)
+                if usuarios is None:
+                    limite = time.monotonic() - self.inactividad
+                    for usuario_id in [u for u, t in self._accesos.items() if t < limite and u not in self._sucios]:
+                        self._carritos.pop(usuario_id, None)
+                        self._versiones.pop(usuario_id, None)
+                        self._accesos.pop(usuario_id, None)
+            return len(instantanea)
+
+    def pendientes(self):
+        return len(self._sucios)
+
+    def _volcar_en_contexto(self):
+        with self.contexto():
+            try:
+                self.volcar()
+            except Exception as e:
+                print(f"ERROR CARRITOS: {str(e)}")
+
+    def _asegurar_volcador(self):
+        # El hilo se arranca con la primera escritura de cada proceso, así sobrevive a un fork del servidor
+        if self._pid_volcador == os.getpid():
+            return
+        with self._lock:
+            if self._pid_volcador == os.getpid():
+                return
+            self._pid_volcador = os.getpid()
+
+        def ciclo():
+            while True:
+                time.sleep(self.intervalo)
+                self._volcar_en_contexto()
+        threading.Thread(target=ciclo, name='volcador-carritos', daemon=True).start()
+        atexit.register(self._volcar_en_contexto)
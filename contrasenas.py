@@ -0,0 +1,100 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturoTimeout
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Hash de contraseñas fuera de los hilos del servidor: scrypt/PBKDF2 tardan 100 ms o más de CPU
+# y una ráfaga de logins dejaba sin hilos al resto de endpoints. Las operaciones van a un pool
+# de procesos acotado; si ya hay max_pendientes en cola se rechaza de inmediato (PoolSaturado)
+# para que la vista responda 503 con Retry-After en vez de encolar sin límite. Una misma cuenta
+# solo puede tener una verificación en curso (IntentosSimultaneos, 429): así un cliente que
+# insiste sobre un email no acapara el pool.
+class PoolSaturado(Exception):
+    pass
+
+class IntentosSimultaneos(Exception):
+    pass
+
+def metodo_de(password_hash):
+    # 'scrypt:32768:8:1$sal$hash' -> 'scrypt:32768:8:1'
+    return password_hash.split('$', 1)[0]
+
+class PoolHash:
+    def __init__(self, metodo='scrypt:32768:8:1', procesos=None, max_pendientes=64, espera=10):
+        self.metodo = metodo
+        # procesos=0 hashea en el hilo de la petición (solo para comparar en benchmarks/login.py)
+        self.procesos = (os.cpu_count() or 1) if procesos is None else procesos
+        self.max_pendientes = max_pendientes
+        self.espera = espera
+        self.pendientes = 0
+        self.rechazadas = 0
+        self._claves = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _pool(self):
+        # Un pool por proceso: los procesos heredados de un fork no pueden usar el del padre
+        if self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.procesos)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _descartar(self, pool):
+        # Con el lock tomado. Solo si sigue siendo el actual: otro hilo puede haber creado ya el siguiente
+        if self._executor is pool:
+            self._executor = None
+            self._pid = None
+            pool.shutdown(wait=False)
+
+    def _ejecutar(self, clave, funcion, *args):
+        if not self.procesos:
+            return funcion(*args)
+        with self._lock:
+            if clave is not None and clave in self._claves:
+                self.rechazadas += 1
+                raise IntentosSimultaneos('Ya hay un intento en curso para esta cuenta')
+            if self.pendientes >= self.max_pendientes:
+                self.rechazadas += 1
+                raise PoolSaturado('Demasiadas operaciones de contraseña en cola')
+            self.pendientes += 1
+            if clave is not None:
+                self._claves.add(clave)
+            pool = None
+            try:
+                pool = self._pool()
+                futuro = pool.submit(funcion, *args)
+            except BaseException as e:
+                # Sin futuro no hay callback que libere el lugar ni la cuenta
+                self.pendientes -= 1
+                self._claves.discard(clave)
+                if isinstance(e, BrokenProcessPool):
+                    self._descartar(pool)
+                    raise PoolSaturado('El pool de contraseñas se reinició')
+                raise
+        futuro.add_done_callback(lambda f: self._terminada(clave))
+        try:
+            return futuro.result(timeout=self.espera)
+        except FuturoTimeout:
+            futuro.cancel()
+            raise PoolSaturado('La operación de contraseña no terminó a tiempo')
+        except BrokenProcessPool:
+            # Murió un proceso del pool: el siguiente intento crea uno nuevo
+            with self._lock:
+                self._descartar(pool)
+            raise PoolSaturado('El pool de contraseñas se reinició')
+
+    def _terminada(self, clave):
+        with self._lock:
+            self.pendientes -= 1
+            self._claves.discard(clave)
+
+    def hashear(self, password, clave=None):
+        return self._ejecutar(clave, generate_password_hash, password, self.metodo)
+
+    def verificar(self, password_hash, password, clave=None):
+        return self._ejecutar(clave, check_password_hash, password_hash, password)
+
+    def necesita_rehash(self, password_hash):
+        return metodo_de(password_hash) != self.metodo
@@ -0,0 +1,80 @@
+import datetime
+import threading
+import time
+
+# Índice de ocupación de los alquileres. Un alquiler cubre días completos (fecha_inicio y
+# fecha_fin incluidas), así que el índice guarda por día {producto_id: unidades alquiladas}:
+# saber qué productos tienen algo alquilado en un rango cuesta O(días del rango × alquileres de
+# esos días) y no depende del tamaño del catálogo. Es una copia en memoria por proceso que se
+# recarga cada `ttl` segundos; la base de datos es la fuente de verdad y el checkout vuelve a
+# comprobar ahí, así que un índice atrasado nunca deja alquilar dos veces la misma unidad.
+
+def dias(inicio, fin):
+    for n in range((fin - inicio).days + 1):
+        yield inicio + datetime.timedelta(days=n)
+
+def sumar(por_dia, producto_id, inicio, fin, cantidad):
+    for dia in dias(inicio, fin):
+        productos = por_dia.setdefault(dia, {})
+        total = productos.get(producto_id, 0) + cantidad
+        if total > 0:
+            productos[producto_id] = total
+        else:
+            productos.pop(producto_id, None)
+            if not productos:
+                del por_dia[dia]
+
+class IndiceDisponibilidad:
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._por_dia = {}
+        self._cargado = None
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()
+
+    @classmethod
+    def desde_filas(cls, filas):
+        indice = cls()
+        indice.cargar(filas)
+        return indice
+
+    def cargar(self, filas):
+        # filas: (producto_id, fecha_inicio, fecha_fin, cantidad); reemplaza todo el contenido
+        por_dia = {}
+        for producto_id, inicio, fin, cantidad in filas:
+            sumar(por_dia, producto_id, inicio, fin, cantidad)
+        with self._lock:
+            self._por_dia = por_dia
+            self._cargado = time.monotonic()
+
+    def vencido(self):
+        return self._cargado is None or time.monotonic() - self._cargado >= self.ttl
+
+    def refrescar(self, leer_filas):
+        # Un solo hilo recarga; los demás siguen con la copia anterior (o esperan si es la primera carga)
+        if not self.vencido() or not self._lock_carga.acquire(blocking=self._cargado is None):
+            return
+        try:
+            if self.vencido():
+                self.cargar(leer_filas())
+        finally:
+            self._lock_carga.release()
+
+    def agregar(self, producto_id, inicio, fin, cantidad):
+        # cantidad negativa para quitar un alquiler (pedido cancelado)
+        with self._lock:
+            sumar(self._por_dia, producto_id, inicio, fin, cantidad)
+
+    def ocupados(self, inicio, fin):
+        # {producto_id: máximo de unidades alquiladas en un mismo día del rango}, solo los que tienen alguna
+        resultado = {}
+        with self._lock:
+            for dia in dias(inicio, fin):
+                for producto_id, cantidad in self._por_dia.get(dia, {}).items():
+                    if cantidad > resultado.get(producto_id, 0):
+                        resultado[producto_id] = cantidad
+        return resultado
+
+    def calendario(self, producto_id, inicio, fin):
+        with self._lock:
+            return [(dia, self._por_dia.get(dia, {}).get(producto_id, 0)) for dia in dias(inicio, fin)]
@@ -0,0 +1,149 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Pipeline de archivos estáticos: al arrancar se calcula un hash del contenido de cada archivo
+# referenciado desde el HTML/CSS/JS, se sirven con nombres con hash (cacheables para siempre)
+# y los de texto se precomprimen en gzip y brotli.
+EXTENSIONES_HASH = {'.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.svg', '.ico', '.woff', '.woff2'}
+EXTENSIONES_TEXTO = {'.css', '.js', '.html', '.svg', '.json'}
+PATRON_REFERENCIA = re.compile(r'''(["'(])([^"'()\s][^"'()]*?)(["')])''')
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_REVALIDAR = 'no-cache'
+# Los archivos con hash que ya no están en el manifiesto se borran pasado este tiempo: una página
+# vieja en el navegador, o un worker que todavía no se reinició, puede seguir pidiéndolos un rato
+GRACIA_LIMPIEZA = 3600
+
+Asset = namedtuple('Asset', ['ruta', 'tipo', 'etag', 'comprimidos'])
+Pagina = namedtuple('Pagina', ['contenido', 'etag', 'comprimidos'])
+
+def escribir_atomico(ruta, datos):
+    # Otros workers pueden estar sirviendo el archivo: nunca ven uno a medio escribir
+    temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(datos)
+    os.replace(temporal, ruta)
+
+def comprimir(datos):
+    comprimidos = {}
+    gz = gzip.compress(datos, compresslevel=9, mtime=0)
+    if len(gz) < len(datos):
+        comprimidos['gzip'] = gz
+    if brotli is not None:
+        br = brotli.compress(datos, quality=11)
+        if len(br) < len(datos):
+            comprimidos['br'] = br
+    return comprimidos
+
+def elegir_codificacion(comprimidos):
+    for codificacion in ('br', 'gzip'):
+        if codificacion in comprimidos and request.accept_encodings[codificacion] > 0:
+            return codificacion
+    return None
+
+class Manifiesto:
+    def __init__(self, base_dir, carpeta_salida):
+        self.base_dir = base_dir
+        self.carpeta_salida = carpeta_salida
+        self.rutas = {}
+        self.archivos = {}
+        self.paginas = {}
+
+    def construir(self, paginas):
+        for nombre in paginas:
+            with open(os.path.join(self.base_dir, nombre), encoding='utf-8') as archivo:
+                contenido = self.reescribir(archivo.read()).encode('utf-8')
+            self.paginas[nombre] = Pagina(contenido, hashlib.sha256(contenido).hexdigest()[:16], comprimir(contenido))
+        self.limpiar(GRACIA_LIMPIEZA)
+        return self
+
+    def limpiar(self, gracia):
+        # Borra de la carpeta de salida lo que no generó este manifiesto y tiene más de `gracia` segundos
+        vigentes = {asset.ruta for asset in self.archivos.values()} | {ruta for asset in self.archivos.values() for ruta in asset.comprimidos.values()}
+        limite = time.time() - gracia
+        for carpeta, _, archivos in os.walk(self.carpeta_salida):
+            for nombre in archivos:
+                ruta = os.path.join(carpeta, nombre)
+                try:
+                    if ruta not in vigentes and os.path.getmtime(ruta) < limite:
+                        os.remove(ruta)
+                except FileNotFoundError:
+                    # Otro proceso lo borró o lo reemplazó antes
+                    pass
+
+    def es_referencia_local(self, referencia):
+        if referencia.startswith(('/', 'http:', 'https:', 'data:')) or '..' in referencia:
+            return False
+        return os.path.splitext(referencia)[1].lower() in EXTENSIONES_HASH and os.path.isfile(os.path.join(self.base_dir, referencia))
+
+    def reescribir(self, texto):
+        return PATRON_REFERENCIA.sub(lambda m: m.group(1) + self.fingerprint(m.group(2)) + m.group(3) if self.es_referencia_local(m.group(2)) else m.group(0), texto)
+
+    def fingerprint(self, logico):
+        if logico in self.rutas:
+            return self.rutas[logico]
+        raiz, extension = os.path.splitext(logico)
+        ruta = os.path.join(self.base_dir, logico)
+        tipo = mimetypes.guess_type(logico)[0] or 'application/octet-stream'
+        if extension.lower() in EXTENSIONES_TEXTO:
+            with open(ruta, encoding='utf-8') as archivo:
+                datos = self.reescribir(archivo.read()).encode('utf-8')
+        else:
+            with open(ruta, 'rb') as archivo:
+                datos = archivo.read()
+        digest = hashlib.sha256(datos).hexdigest()
+        url = f'{raiz}.{digest[:12]}{extension}'
+        comprimidos = {}
+        if extension.lower() in EXTENSIONES_TEXTO:
+            ruta = os.path.join(self.carpeta_salida, url)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            escribir_atomico(ruta, datos)
+            for codificacion, contenido in comprimir(datos).items():
+                comprimidos[codificacion] = f'{ruta}.{"br" if codificacion == "br" else "gz"}'
+                escribir_atomico(comprimidos[codificacion], contenido)
+        self.rutas[logico] = url
+        self.archivos[url] = Asset(ruta, tipo, digest[:16], comprimidos)
+        return url
+
+    def responder_asset(self, asset, cache_control):
+        codificacion = elegir_codificacion(asset.comprimidos)
+        ruta = asset.comprimidos[codificacion] if codificacion else asset.ruta
+        respuesta = send_file(ruta, mimetype=asset.tipo, etag=f'{asset.etag}-{codificacion}' if codificacion else asset.etag, conditional=True, max_age=None)
+        if codificacion:
+            respuesta.headers['Content-Encoding'] = codificacion
+        if asset.comprimidos:
+            respuesta.vary.add('Accept-Encoding')
+        respuesta.headers['Cache-Control'] = cache_control
+        return respuesta
+
+    def responder_pagina(self, nombre):
+        pagina = self.paginas[nombre]
+        codificacion = elegir_codificacion(pagina.comprimidos)
+        respuesta = Response(pagina.comprimidos[codificacion] if codificacion else pagina.contenido, mimetype='text/html')
+        respuesta.set_etag(f'{pagina.etag}-{codificacion}' if codificacion else pagina.etag)
+        if codificacion:
+            respuesta.headers['Content-Encoding'] = codificacion
+        respuesta.vary.add('Accept-Encoding')
+        respuesta.headers['Cache-Control'] = CACHE_REVALIDAR
+        return respuesta.make_conditional(request)
+
+    def responder(self, nombre):
+        # None si el archivo no pertenece al manifiesto
+        if nombre in self.paginas:
+            return self.responder_pagina(nombre)
+        if nombre in self.archivos:
+            return self.responder_asset(self.archivos[nombre], CACHE_INMUTABLE)
+        if nombre in self.rutas:
+            return self.responder_asset(self.archivos[self.rutas[nombre]], CACHE_REVALIDAR)
+        return None
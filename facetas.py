@@ -0,0 +1,151 @@
+import bisect
+import threading
+import time
+
+# Motor de facetas del catálogo. Por cada valor de cada faceta (categoría, talla, color, rango de
+# precio, en stock) guarda los ids de sus productos como un bitmap: un int de Python cuyo bit i
+# corresponde al producto i. Filtrar es intersecar bitmaps (&) y contar es int.bit_count(), ambas
+# operaciones en C y sin consultar la base; una página sale recorriendo los bits en orden de id.
+# Cada bitmap ocupa id_máximo / 8 bytes, así que sirve para facetas de pocos valores como estas.
+# Es una copia en memoria por proceso: se carga entera una vez y después, cada `intervalo`
+# segundos (o enseguida tras un commit propio), solo se releen los productos anotados en el
+# registro de cambios (cambios.py) desde el último aplicado, así que también ve lo que escriben
+# los demás procesos.
+FACETAS = ('categoria_id', 'talla', 'color', 'rango_precio', 'en_stock')
+CAMPOS = ('categoria_id', 'talla', 'color', 'precio', 'stock')
+
+def bitmap(ids):
+    ids = list(ids)
+    bytes_ = bytearray(max(ids, default=0) // 8 + 1)
+    for i in ids:
+        bytes_[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bytes_, 'little')
+
+class IndiceFacetas:
+    def __init__(self, limites_precio, intervalo=1):
+        self.limites_precio = sorted(limites_precio)
+        self.intervalo = intervalo
+        self.ultimo_cambio = None
+        self._bitmaps = {faceta: {} for faceta in FACETAS}
+        self._productos = {}
+        self._todos = 0
+        self._sincronizado = 0
+        self._pendiente = False
+        self._rangos = {}
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()
+
+    def rango_precio(self, precio):
+        # '100000-200000' incluye el límite inferior y no el superior; el último rango es abierto ('500000-')
+        rango = self._rangos.get(precio)
+        if rango is None:
+            i = bisect.bisect_right(self.limites_precio, precio)
+            desde = self.limites_precio[i - 1] if i else 0
+            rango = self._rangos[precio] = f'{desde:.0f}-{self.limites_precio[i]:.0f}' if i < len(self.limites_precio) else f'{desde:.0f}-'
+        return rango
+
+    def rangos(self):
+        return [self.rango_precio(limite) for limite in (0, *self.limites_precio)]
+
+    def valores(self, fila):
+        # Valor de cada faceta para una fila (categoria_id, talla, color, precio, stock); None si no tiene
+        categoria_id, talla, color, precio, stock = fila
+        return (categoria_id, talla or None, color or None, self.rango_precio(precio) if precio is not None else None, '1' if (stock or 0) > 0 else '0')
+
+    def cargar(self, filas, ultimo_cambio):
+        # filas: (id, categoria_id, talla, color, precio, stock) leídas después de `ultimo_cambio`; reemplaza todo el contenido
+        productos, ids_por_valor = {}, tuple({} for _ in FACETAS)
+        for id, *fila in filas:
+            productos[id] = fila = tuple(fila)
+            for por_valor, valor in zip(ids_por_valor, self.valores(fila)):
+                if valor is not None:
+                    ids = por_valor.get(valor)
+                    if ids is None:
+                        por_valor[valor] = [id]
+                    else:
+                        ids.append(id)
+        bitmaps = {faceta: {valor: bitmap(ids) for valor, ids in por_valor.items()} for faceta, por_valor in zip(FACETAS, ids_por_valor)}
+        todos = bitmap(productos)
+        with self._lock:
+            self._productos, self._bitmaps, self._todos = productos, bitmaps, todos
+            self.ultimo_cambio = ultimo_cambio
+
+    def vencido(self):
+        return self.ultimo_cambio is None or self._pendiente or time.monotonic() - self._sincronizado >= self.intervalo
+
+    def marcar_pendiente(self):
+        # Tras un commit del propio proceso que tocó productos: la próxima consulta sincroniza sin esperar el intervalo
+        self._pendiente = True
+
+    def refrescar(self, sincronizar):
+        # sincronizar(indice) aplica los cambios pendientes (actualizar) o recarga todo (cargar). Solo
+        # espera la primera carga; después, si otro hilo ya está sincronizando, responde con lo que hay
+        if not self.vencido() or not self._lock_carga.acquire(blocking=self.ultimo_cambio is None):
+            return
+        try:
+            if self.vencido():
+                self._pendiente = False
+                sincronizar(self)
+                self._sincronizado = time.monotonic()
+        finally:
+            self._lock_carga.release()
+
+    def actualizar(self, id, nueva):
+        # nueva: fila (categoria_id, talla, color, precio, stock) actual del producto, o None si ya no existe
+        with self._lock:
+            anterior = self._productos.get(id)
+            viejos = self.valores(anterior) if anterior is not None else (None,) * len(FACETAS)
+            nuevos = self.valores(nueva) if nueva is not None else (None,) * len(FACETAS)
+            bit = 1 << id
+            for faceta, viejo, nuevo in zip(FACETAS, viejos, nuevos):
+                if viejo == nuevo:
+                    continue
+                por_valor = self._bitmaps[faceta]
+                if viejo is not None:
+                    restantes = por_valor.pop(viejo, 0) & ~bit
+                    if restantes:
+                        por_valor[viejo] = restantes
+                if nuevo is not None:
+                    por_valor[nuevo] = por_valor.get(nuevo, 0) | bit
+            if nueva is None:
+                self._productos.pop(id, None)
+                self._todos &= ~bit
+            else:
+                self._productos[id] = tuple(nueva)
+                self._todos |= bit
+
+    def _filtrar(self, filtros, excepto=None):
+        # filtros: {faceta: [valores]}; dentro de una faceta los valores se unen (OR) y entre facetas se intersecan (AND)
+        resultado = self._todos
+        for faceta, valores in filtros.items():
+            if faceta != excepto and valores:
+                union = 0
+                for valor in valores:
+                    union |= self._bitmaps[faceta].get(valor, 0)
+                resultado &= union
+        return resultado
+
+    def contar(self, filtros):
+        # Total filtrado y, por faceta, cuántos productos habría al elegir cada valor manteniendo los
+        # filtros de las demás facetas (así una faceta ya filtrada sigue mostrando sus alternativas)
+        with self._lock:
+            total = self._filtrar(filtros).bit_count()
+            conteos = {}
+            for faceta in FACETAS:
+                base = self._filtrar(filtros, excepto=faceta)
+                conteos[faceta] = {valor: n for valor, bits in self._bitmaps[faceta].items() if (n := (base & bits).bit_count())}
+        return total, conteos
+
+    def pagina(self, filtros, despues_de, n):
+        # Los primeros n ids mayores que despues_de que cumplen los filtros, en orden
+        with self._lock:
+            bits = self._filtrar(filtros)
+        inicio = despues_de + 1
+        bits >>= inicio
+        ids = []
+        while bits and len(ids) < n:
+            salto = (bits & -bits).bit_length()
+            inicio += salto
+            ids.append(inicio - 1)
+            bits >>= salto
+        return ids
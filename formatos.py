@@ -0,0 +1,87 @@
+import csv
+import datetime
+import io
+import json
+
+# Lectura y escritura por flujo de CSV y JSONL para las importaciones y exportaciones masivas:
+# nada se carga entero en memoria, se lee fila a fila del cuerpo de la petición y se escribe
+# en trozos de TAMANO_TROZO bytes hacia la respuesta.
+FORMATOS = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+TAMANO_TROZO = 64 * 1024
+
+class FilaInvalida(Exception):
+    pass
+
+class ArchivoInvalido(Exception):
+    pass
+
+def formato_de(nombre_archivo=None, tipo_contenido=None, formato=None):
+    # Se elige por el parámetro explícito, la extensión del archivo o el Content-Type
+    if formato:
+        return formato if formato in FORMATOS else None
+    if nombre_archivo:
+        extension = nombre_archivo.rsplit('.', 1)[-1].lower()
+        if extension in ('csv', 'jsonl', 'ndjson'):
+            return 'csv' if extension == 'csv' else 'jsonl'
+    if tipo_contenido:
+        if 'csv' in tipo_contenido:
+            return 'csv'
+        if 'ndjson' in tipo_contenido or 'jsonl' in tipo_contenido:
+            return 'jsonl'
+    return None
+
+def leer_filas(flujo, formato):
+    # Genera (número de fila, dict); una línea JSONL mal formada se entrega como FilaInvalida y un
+    # archivo que no se puede seguir leyendo (no es UTF-8, CSV roto) corta con ArchivoInvalido
+    try:
+        yield from _leer_filas(io.TextIOWrapper(flujo, encoding='utf-8-sig', newline=''), formato)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ArchivoInvalido(str(e))
+
+def _leer_filas(texto, formato):
+    if formato == 'csv':
+        lector = csv.DictReader(texto)
+        for numero, fila in enumerate(lector, start=2):
+            # En CSV una celda vacía significa "sin valor"
+            yield numero, {k.strip(): v.strip() for k, v in fila.items() if k and v is not None and v.strip() != ''}
+        return
+    for numero, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError as e:
+            yield numero, FilaInvalida(f'JSON inválido: {e}')
+            continue
+        yield numero, fila if isinstance(fila, dict) else FilaInvalida('Cada línea debe ser un objeto JSON')
+
+def valor_texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    return valor
+
+def escribir_csv(columnas, filas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(columnas)
+    for fila in filas:
+        escritor.writerow([valor_texto(v) for v in fila])
+        if buffer.tell() >= TAMANO_TROZO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def escribir_jsonl(objetos):
+    partes = []
+    tamano = 0
+    for objeto in objetos:
+        linea = json.dumps(objeto, ensure_ascii=False, default=valor_texto) + '\n'
+        partes.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_TROZO:
+            yield ''.join(partes)
+            partes, tamano = [], 0
+    yield ''.join(partes)
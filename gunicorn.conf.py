@@ -0,0 +1,59 @@
+import gc
+import os
+
+# Servidor de producción: gunicorn -c gunicorn.conf.py
+# El proceso maestro importa la app una sola vez (preload_app), aplica las migraciones, carga lo
+# que es de solo lectura (manifiesto de estáticos, índice de facetas, librerías pesadas) y congela
+# el recolector de basura antes del fork: así los workers comparten esas páginas por copy-on-write.
+# Nada deja conexiones, hilos ni pools abiertos antes del fork; cada worker crea los suyos al arrancar.
+wsgi_app = 'app:app'
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+# Recicla los workers de a poco para acotar la fragmentación de memoria
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Los carritos en memoria viven en un solo proceso: con varios workers y sin sesiones fijas
+# tienen que ir a la base de datos
+if workers > 1:
+    os.environ.setdefault('CARRITO_ALMACEN', 'db')
+# Los hashes de contraseñas de todos los workers se reparten los núcleos en vez de multiplicarlos
+os.environ.setdefault('HASH_PROCESOS', str(max(1, (os.cpu_count() or 1) // workers)))
+
+# Sin recolecciones durante la importación: cada pasada del recolector escribiría en los objetos
+# del maestro y esas páginas dejarían de compartirse
+gc.disable()
+
+def when_ready(server):
+    from app import app, calentar, migrar
+    from modelos import db
+    if os.environ.get('MIGRAR_AL_INICIAR', '1') != '0':
+        with app.app_context():
+            migrar()
+    calentar(app)
+    # Las conexiones usadas al migrar y al cargar el índice de facetas no deben heredarse a los workers
+    with app.app_context():
+        for motor in db.engines.values():
+            motor.dispose()
+    gc.freeze()
+    gc.enable()
+    if workers > 1 and os.environ.get('CARRITO_ALMACEN') == 'memoria':
+        server.log.warning('CARRITO_ALMACEN=memoria con varios workers: hacen falta sesiones fijas por proceso')
+
+def post_fork(server, worker):
+    gc.enable()
+    from app import app
+    from modelos import db
+    with app.app_context():
+        for motor in db.engines.values():
+            motor.dispose(close=False)
+
+def post_worker_init(worker):
+    from app import app, iniciar_tareas
+    iniciar_tareas(app)
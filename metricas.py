@@ -0,0 +1,165 @@
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import deque
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+# Métricas de peticiones y SQL en formato de texto de Prometheus. Cada petición guarda sus
+# contadores en g y al terminar se vuelcan, con un único lock, a los agregados del proceso.
+# Con varios procesos cada uno expone los suyos (Prometheus los suma por instancia).
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+CABECERA_PERFIL = 'X-Perfil'
+
+class Histograma:
+    __slots__ = ('limites', 'cuentas', 'suma', 'total')
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0
+        self.total = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+def escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def etiquetas(**valores):
+    return '{' + ','.join(f'{k}="{escapar(v)}"' for k, v in valores.items()) + '}'
+
+class Metricas:
+    def __init__(self, umbral_n_mas_1=10):
+        # Una misma sentencia repetida más de umbral_n_mas_1 veces en una petición se marca como N+1
+        self.umbral_n_mas_1 = umbral_n_mas_1
+        # Se puede apagar en caliente sin quitar los hooks (lo usa benchmarks/metricas.py)
+        self.activa = True
+        self._lock = threading.Lock()
+        self.latencias = {}
+        self.respuestas = {}
+        self.en_curso = {}
+        self.consultas = {}
+        self.tiempo_sql = {}
+        self.n_mas_1 = {}
+        self.ultimos_n_mas_1 = deque(maxlen=20)
+
+    def instrumentar(self, app, motores, es_admin):
+        # es_admin() decide, dentro de la petición, si se puede devolver el perfil de cProfile
+        self.es_admin = es_admin
+        app.before_request(self._inicio)
+        app.after_request(self._respuesta)
+        app.teardown_request(self._fin)
+        for motor in motores:
+            event.listen(motor, 'before_cursor_execute', self._antes_sql)
+            event.listen(motor, 'after_cursor_execute', self._despues_sql)
+
+    def _inicio(self):
+        if not self.activa:
+            return
+        endpoint = request.url_rule.rule if request.url_rule else 'sin_ruta'
+        g._metricas = {'inicio': time.perf_counter(), 'endpoint': endpoint, 'consultas': 0, 'tiempo_sql': 0.0, 'sentencias': {}}
+        with self._lock:
+            self.en_curso[endpoint] = self.en_curso.get(endpoint, 0) + 1
+        if request.headers.get(CABECERA_PERFIL) and self.es_admin():
+            g._perfil = cProfile.Profile()
+            g._perfil.enable()
+
+    def _antes_sql(self, conexion, cursor, sentencia, parametros, contexto, varias):
+        if has_request_context() and '_metricas' in g:
+            g._metricas['inicio_sql'] = time.perf_counter()
+
+    def _despues_sql(self, conexion, cursor, sentencia, parametros, contexto, varias):
+        if not has_request_context() or '_metricas' not in g:
+            return
+        m = g._metricas
+        m['consultas'] += 1
+        m['tiempo_sql'] += time.perf_counter() - m.pop('inicio_sql', time.perf_counter())
+        m['sentencias'][sentencia] = m['sentencias'].get(sentencia, 0) + 1
+
+    def _respuesta(self, respuesta):
+        m = g.get('_metricas')
+        if m is None:
+            return respuesta
+        m['estado'] = respuesta.status_code
+        perfil = g.pop('_perfil', None)
+        if perfil is None:
+            return respuesta
+        perfil.disable()
+        return Response(self.informe_perfil(perfil, m, respuesta), mimetype='text/plain')
+
+    def _fin(self, error=None):
+        m = g.pop('_metricas', None)
+        if m is None:
+            return
+        duracion = time.perf_counter() - m['inicio']
+        endpoint = m['endpoint']
+        repetida, veces = max(m['sentencias'].items(), key=lambda item: item[1], default=(None, 0))
+        with self._lock:
+            self.en_curso[endpoint] -= 1
+            clave = (endpoint, request.method)
+            histograma = self.latencias.get(clave)
+            if histograma is None:
+                histograma = self.latencias[clave] = Histograma(LIMITES_LATENCIA)
+            histograma.observar(duracion)
+            clave_estado = (endpoint, request.method, m.get('estado', 500))
+            self.respuestas[clave_estado] = self.respuestas.get(clave_estado, 0) + 1
+            histograma = self.consultas.get(endpoint)
+            if histograma is None:
+                histograma = self.consultas[endpoint] = Histograma(LIMITES_CONSULTAS)
+            histograma.observar(m['consultas'])
+            self.tiempo_sql[endpoint] = self.tiempo_sql.get(endpoint, 0.0) + m['tiempo_sql']
+            if veces > self.umbral_n_mas_1:
+                self.n_mas_1[endpoint] = self.n_mas_1.get(endpoint, 0) + 1
+                self.ultimos_n_mas_1.append((endpoint, veces, ' '.join(repetida.split())[:300]))
+
+    def informe_perfil(self, perfil, m, respuesta):
+        salida = io.StringIO()
+        salida.write(f"{request.method} {request.full_path} -> {respuesta.status_code} en {(time.perf_counter() - m['inicio']) * 1000:.1f} ms\n")
+        salida.write(f"SQL: {m['consultas']} sentencias, {m['tiempo_sql'] * 1000:.1f} ms\n")
+        for sentencia, veces in sorted(m['sentencias'].items(), key=lambda item: -item[1])[:10]:
+            salida.write(f"  {veces:5d}x {' '.join(sentencia.split())[:200]}\n")
+        salida.write('\n')
+        pstats.Stats(perfil, stream=salida).sort_stats('cumulative').print_stats(40)
+        return salida.getvalue()
+
+    def exportar(self):
+        lineas = []
+        with self._lock:
+            lineas += ['# HELP http_request_duration_seconds Latencia de las peticiones HTTP por endpoint', '# TYPE http_request_duration_seconds histogram']
+            for (endpoint, metodo), h in sorted(self.latencias.items()):
+                lineas += self._histograma('http_request_duration_seconds', h, endpoint=endpoint, metodo=metodo)
+            lineas += ['# HELP http_requests_total Peticiones HTTP por endpoint y código de estado', '# TYPE http_requests_total counter']
+            lineas += [f'http_requests_total{etiquetas(endpoint=e, metodo=me, estado=s)} {n}' for (e, me, s), n in sorted(self.respuestas.items())]
+            lineas += ['# HELP http_requests_in_flight Peticiones en curso por endpoint', '# TYPE http_requests_in_flight gauge']
+            lineas += [f'http_requests_in_flight{etiquetas(endpoint=e)} {n}' for e, n in sorted(self.en_curso.items())]
+            lineas += ['# HELP sql_queries_per_request Sentencias SQL ejecutadas por petición', '# TYPE sql_queries_per_request histogram']
+            for endpoint, h in sorted(self.consultas.items()):
+                lineas += self._histograma('sql_queries_per_request', h, endpoint=endpoint)
+            lineas += ['# HELP sql_duration_seconds_total Tiempo total en SQL por endpoint', '# TYPE sql_duration_seconds_total counter']
+            lineas += [f'sql_duration_seconds_total{etiquetas(endpoint=e)} {t:.6f}' for e, t in sorted(self.tiempo_sql.items())]
+            lineas += [f'# HELP sql_n_plus_one_total Peticiones con una sentencia repetida más de {self.umbral_n_mas_1} veces', '# TYPE sql_n_plus_one_total counter']
+            lineas += [f'sql_n_plus_one_total{etiquetas(endpoint=e)} {n}' for e, n in sorted(self.n_mas_1.items())]
+        return '\n'.join(lineas) + '\n'
+
+    def ultimos_n_mas_1_lista(self):
+        # Las últimas sentencias N+1 con su SQL: solo para administradores, no para /metrics
+        with self._lock:
+            return [{'endpoint': endpoint, 'veces': veces, 'sentencia': sentencia} for endpoint, veces, sentencia in self.ultimos_n_mas_1]
+
+    def _histograma(self, nombre, h, **valores):
+        lineas = []
+        acumulado = 0
+        for limite, cuenta in zip(h.limites, h.cuentas):
+            acumulado += cuenta
+            lineas.append(f'{nombre}_bucket{etiquetas(**valores, le=limite)} {acumulado}')
+        lineas.append(f'{nombre}_bucket{etiquetas(**valores, le="+Inf")} {h.total}')
+        lineas.append(f'{nombre}_sum{etiquetas(**valores)} {h.suma:g}')
+        lineas.append(f'{nombre}_count{etiquetas(**valores)} {h.total}')
+        return lineas
@@ -0,0 +1,136 @@
+import datetime
+from flask_sqlalchemy import SQLAlchemy
+import base_datos
+
+# Modelos compartidos por la aplicación, seed_products.py y los benchmarks. db no queda atado a
+# ninguna app al importarse: armar_app lo enlaza con db.init_app, así que importar este módulo
+# no abre conexiones ni toca la base de datos.
+db = SQLAlchemy(session_options={'class_': base_datos.SesionEnrutada})
+
+class Usuario(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password = db.Column(db.String(200), nullable=False)
+    es_admin = db.Column(db.Boolean, default=False)
+    fecha_registro = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    carritos = db.relationship('Carrito', backref='usuario', lazy=True, cascade='all, delete-orphan')
+    pedidos = db.relationship('Pedido', backref='usuario', lazy=True)
+
+class Categoria(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(100), nullable=False, unique=True)
+    descripcion = db.Column(db.Text)
+    productos = db.relationship('Producto', backref='categoria', lazy=True)
+
+class Producto(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(200), nullable=False)
+    descripcion = db.Column(db.Text)
+    precio = db.Column(db.Float, nullable=False)
+    talla = db.Column(db.String(10))
+    color = db.Column(db.String(50))
+    imagen_url = db.Column(db.String(300))
+    stock = db.Column(db.Integer, default=0)
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'))
+    # Índices compuestos que terminan en id para que la paginación por cursor use el índice con cada filtro
+    __table_args__ = (
+        db.Index('ix_producto_categoria_id', 'categoria_id', 'id'),
+        db.Index('ix_producto_categoria_precio', 'categoria_id', 'precio', 'id'),
+        db.Index('ix_producto_talla_id', 'talla', 'id'),
+        db.Index('ix_producto_color_id', 'color', 'id'),
+        db.Index('ix_producto_precio_id', 'precio', 'id'),
+        db.Index('ix_producto_stock_id', 'stock', 'id'),
+    )
+
+# Registros de cambios del catálogo y de los pedidos, los llenan los triggers de cambios.py. AUTOINCREMENT
+# para que un id podado nunca se reutilice y cada proceso pueda seguir leyendo desde el último que vio
+class CambioProducto(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    producto_id = db.Column(db.Integer, nullable=False)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class CambioPedido(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, nullable=False)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+# Invalidaciones de la cache de respuestas y de usuarios: cada transacción anota aquí los grupos que
+# invalidó y cada proceso los aplica a su propia cache antes de servir desde ella
+class CambioCache(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    grupo = db.Column(db.String(100), nullable=False)
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class Carrito(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False, index=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
+    cantidad = db.Column(db.Integer, default=1)
+    fecha_agregado = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    producto = db.relationship('Producto')
+
+class Pedido(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    fecha_pedido = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    total = db.Column(db.Float, nullable=False)
+    estado = db.Column(db.String(50), default='pendiente')
+    stripe_payment_id = db.Column(db.String(200))
+    direccion_envio = db.Column(db.Text)
+    stock_reservado = db.Column(db.Boolean, nullable=False, default=False)
+    reserva_expira = db.Column(db.DateTime)
+    items = db.relationship('ItemPedido', backref='pedido', lazy=True, cascade='all, delete-orphan')
+    __table_args__ = (
+        db.Index('ix_pedido_usuario_fecha', 'usuario_id', 'fecha_pedido', 'id'),
+        db.Index('ix_pedido_estado_fecha', 'estado', 'fecha_pedido', 'id'),
+        db.Index('ix_pedido_fecha_id', 'fecha_pedido', 'id'),
+        db.Index('ix_pedido_reserva_expira', 'estado', 'reserva_expira'),
+    )
+
+class ItemPedido(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedido.id'), nullable=False, index=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    precio_unitario = db.Column(db.Float, nullable=False)
+    # Periodo de alquiler (ambos días incluidos); vacío en los items vendidos
+    fecha_inicio = db.Column(db.Date)
+    fecha_fin = db.Column(db.Date)
+    producto = db.relationship('Producto')
+    __table_args__ = (
+        db.Index('ix_item_pedido_alquiler', 'producto_id', 'fecha_inicio', 'fecha_fin'),
+        db.Index('ix_item_pedido_fecha_fin', 'fecha_fin'),
+    )
+
+# Estadísticas del dashboard mantenidas incrementalmente en la misma transacción que cada escritura
+class Estadistica(db.Model):
+    clave = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Float, nullable=False, default=0)
+
+class VentaPeriodo(db.Model):
+    tipo = db.Column(db.String(10), primary_key=True)
+    inicio = db.Column(db.Date, primary_key=True)
+    pedidos = db.Column(db.Integer, nullable=False, default=0)
+    ventas = db.Column(db.Float, nullable=False, default=0)
+
+class VentaProducto(db.Model):
+    producto_id = db.Column(db.Integer, primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+    ventas = db.Column(db.Float, nullable=False, default=0)
+
+# Bandeja de entrada de eventos de pago: se guardan tal cual llegan y un hilo los procesa después
+class EventoPago(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    evento_id = db.Column(db.String(255), unique=True, nullable=False)
+    tipo = db.Column(db.String(100), nullable=False)
+    origen = db.Column(db.String(20), nullable=False, default='webhook')
+    payload = db.Column(db.Text, nullable=False)
+    recibido = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    procesado = db.Column(db.DateTime)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    resultado = db.Column(db.String(50))
+    error = db.Column(db.Text)
+    __table_args__ = (
+        db.Index('ix_evento_pago_pendiente', 'procesado', 'id'),
+    )
@@ -0,0 +1,52 @@
+import threading
+from collections import deque
+
+# Novedades de los pedidos para el panel de administración. Cada evento es el estado actual de un
+# pedido (y el stock de sus productos) con el id de su cambio en cambio_pedido como número de
+# secuencia: crece siempre y es el mismo en todos los procesos, así que un cliente puede pedir
+# "lo posterior a N" a cualquier worker. Cada proceso guarda los últimos `capacidad` eventos en un
+# buffer circular, ya serializados a JSON una sola vez para todas las conexiones. `inicio` es la
+# secuencia desde la que el buffer está completo: quien pide algo anterior tiene que recargar la lista.
+class BufferNovedades:
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.inicio = None
+        self.ultimo = None
+        self._eventos = deque()
+        self._condicion = threading.Condition()
+
+    def reiniciar(self, ultimo):
+        # Primera carga o atraso mayor que el registro: lo anterior a `ultimo` ya no se puede servir
+        with self._condicion:
+            self._eventos.clear()
+            self.inicio = self.ultimo = ultimo
+            self._condicion.notify_all()
+
+    def agregar(self, eventos, ultimo):
+        # eventos: [(secuencia, json)] en orden, todos posteriores a self.ultimo
+        with self._condicion:
+            for evento in eventos:
+                if len(self._eventos) >= self.capacidad:
+                    self.inicio = self._eventos.popleft()[0]
+                self._eventos.append(evento)
+            self.ultimo = ultimo
+            self._condicion.notify_all()
+
+    def desde(self, secuencia):
+        # ([(secuencia, json)], última secuencia) de los eventos posteriores a `secuencia`, o None si ya salieron del buffer
+        with self._condicion:
+            if self.inicio is None or secuencia < self.inicio:
+                return None
+            nuevos = []
+            for evento in reversed(self._eventos):
+                if evento[0] <= secuencia:
+                    break
+                nuevos.append(evento)
+            nuevos.reverse()
+            # Un cliente que ya vio más (lo atendió un proceso más adelantado) no retrocede
+            return nuevos, max(secuencia, self.ultimo)
+
+    def esperar(self, secuencia, espera):
+        # Bloquea hasta que haya algo posterior a `secuencia` o pase `espera`; True si llegó algo
+        with self._condicion:
+            return self._condicion.wait_for(lambda: self.ultimo is not None and self.ultimo > secuencia, espera)
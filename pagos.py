@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from cache import CacheTTL
+
+# Cliente de la pasarela de pagos. Las vistas solo conocen ClientePagos.obtener_intent; la
+# pasarela concreta (Stripe o la falsa de pasarela_falsa.py, que habla el mismo protocolo)
+# se elige con api_base. Las llamadas salen por un pool de conexiones con timeouts acotados,
+# reintentos con backoff y una idempotency key por pedido, y corren en un pool de hilos propio
+# para que una pasarela lenta no acapare los hilos del servidor. La librería de stripe (más de
+# medio segundo de import) se carga en la primera llamada y no al arrancar.
+IntentPago = namedtuple('IntentPago', ['id', 'client_secret'])
+EstadoIntent = namedtuple('EstadoIntent', ['id', 'estado', 'monto', 'metadata'])
+
+_stripe = {'modulo': None, 'lock': threading.Lock()}
+
+def cargar_stripe():
+    # Import serializado: dos hilos importando stripe a la vez pueden ver el módulo a medio cargar
+    if _stripe['modulo'] is None:
+        with _stripe['lock']:
+            if _stripe['modulo'] is None:
+                import stripe
+                _stripe['modulo'] = stripe
+    return _stripe['modulo']
+
+class PasarelaTimeout(Exception):
+    pass
+
+class FirmaInvalida(Exception):
+    pass
+
+def firmar_webhook(payload, secreto, marca=None):
+    # Cabecera Stripe-Signature para un cuerpo dado (la usan la pasarela falsa y las pruebas de carga)
+    marca = int(time.time()) if marca is None else marca
+    firma = hmac.new(secreto.encode('utf-8'), f'{marca}.{payload}'.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f't={marca},v1={firma}'
+
+def verificar_webhook(payload, cabecera, secreto, tolerancia=300):
+    # Devuelve el evento si la firma HMAC es válida y reciente
+    stripe = cargar_stripe()
+    try:
+        texto = payload.decode('utf-8')
+        stripe.WebhookSignature.verify_header(texto, cabecera, secreto, tolerancia)
+        return json.loads(texto)
+    except (stripe.error.SignatureVerificationError, UnicodeDecodeError, ValueError) as e:
+        raise FirmaInvalida(str(e))
+
+class PasarelaStripe:
+    def __init__(self, api_key, api_base=None, timeout_conexion=3, timeout_lectura=10, reintentos=2, conexiones=20):
+        self._opciones = (api_key, api_base, timeout_conexion, timeout_lectura, reintentos, conexiones)
+        self._stripe = None
+        self._lock = threading.Lock()
+
+    def _cliente(self):
+        if self._stripe is None:
+            with self._lock:
+                if self._stripe is None:
+                    self._stripe = self._configurar(*self._opciones)
+        return self._stripe
+
+    def _configurar(self, api_key, api_base, timeout_conexion, timeout_lectura, reintentos, conexiones):
+        import requests
+        from requests.adapters import HTTPAdapter
+        stripe = cargar_stripe()
+        sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=conexiones, pool_maxsize=conexiones)
+        sesion.mount('https://', adaptador)
+        sesion.mount('http://', adaptador)
+        stripe.api_key = api_key
+        if api_base:
+            stripe.api_base = api_base
+        # El cliente de stripe reintenta errores de red, 409 y 5xx con backoff exponencial y jitter
+        stripe.max_network_retries = reintentos
+        stripe.default_http_client = stripe.http_client.RequestsClient(timeout=(timeout_conexion, timeout_lectura), session=sesion)
+        return stripe
+
+    def crear_intent(self, clave, monto, moneda, metadata):
+        stripe = self._cliente()
+        intent = stripe.PaymentIntent.create(amount=monto, currency=moneda, metadata=metadata, idempotency_key=clave)
+        return IntentPago(intent.id, intent.client_secret)
+
+    def consultar_intent(self, intent_id):
+        stripe = self._cliente()
+        intent = stripe.PaymentIntent.retrieve(intent_id)
+        return EstadoIntent(intent.id, intent.status, intent.amount, dict(intent.metadata or {}))
+
+class ClientePagos:
+    def __init__(self, pasarela, trabajadores=8, espera=15, max_intents=10000, ttl_intents=3600):
+        self.pasarela = pasarela
+        self.espera = espera
+        self.intents = CacheTTL(max_intents, ttl_intents)
+        self._en_curso = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix='pagos')
+        self.llamadas = 0
+
+    def clave(self, pedido_id, monto, moneda):
+        # Si cambia el monto del pedido se crea otro intent
+        return f'pedido-{pedido_id}-{monto}-{moneda}'
+
+    def _crear(self, clave, monto, moneda, metadata):
+        try:
+            with self._lock:
+                self.llamadas += 1
+            intent = self.pasarela.crear_intent(clave, monto, moneda, metadata)
+            self.intents.set(clave, intent)
+            return intent
+        finally:
+            with self._lock:
+                self._en_curso.pop(clave, None)
+
+    def solicitar_intent(self, pedido_id, monto, moneda, metadata):
+        # Devuelve un Future; los pedidos repetidos comparten la llamada en curso o el intent ya creado
+        clave = self.clave(pedido_id, monto, moneda)
+        with self._lock:
+            futuro = self._en_curso.get(clave)
+            if futuro is None:
+                intent = self.intents.get(clave)
+                if intent is not None:
+                    futuro = Future()
+                    futuro.set_result(intent)
+                else:
+                    futuro = self._en_curso[clave] = self._executor.submit(self._crear, clave, monto, moneda, metadata)
+        return futuro
+
+    def consultar_intent(self, intent_id):
+        return self.pasarela.consultar_intent(intent_id)
+
+    def obtener_intent(self, pedido_id, monto, moneda, metadata):
+        clave = self.clave(pedido_id, monto, moneda)
+        intent = self.intents.get(clave)
+        if intent is not None:
+            return intent
+        futuro = self.solicitar_intent(pedido_id, monto, moneda, metadata)
+        try:
+            return futuro.result(timeout=self.espera)
+        except FuturoTimeout:
+            # La llamada sigue en curso y su resultado queda en cache para el siguiente intento
+            raise PasarelaTimeout('La pasarela de pagos no respondió a tiempo')
@@ -0,0 +1,139 @@
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+import pagos
+
+# Pasarela de pagos falsa que imita los endpoints de PaymentIntent de Stripe, para probar el
+# flujo de pago sin red. Respeta Idempotency-Key y puede simular latencia y errores 5xx.
+# Confirmar un intent (POST /v1/payment_intents/<id>/confirm) lo marca como pagado y, si hay
+# PAGOS_WEBHOOK_URL, envía el evento payment_intent.succeeded firmado con PAGOS_WEBHOOK_SECRETO.
+# Uso: PAGOS_API_BASE=http://127.0.0.1:12111 python app.py  y en otra terminal
+#      PAGOS_WEBHOOK_URL=http://127.0.0.1:5000/api/pagos/webhook PAGOS_WEBHOOK_SECRETO=<secreto> python pasarela_falsa.py [puerto] [latencia_segundos] [probabilidad_de_fallo]
+
+class EstadoPasarela:
+    def __init__(self, latencia=0, fallos=0, webhook_url=None, webhook_secreto=None):
+        self.latencia = latencia
+        self.fallos = fallos
+        self.webhook_url = webhook_url
+        self.webhook_secreto = webhook_secreto
+        self.intents = {}
+        self.idempotencia = {}
+        self.peticiones = 0
+        self.lock = threading.Lock()
+
+class ManejadorPasarela(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, formato, *args):
+        pass
+
+    def responder(self, estado, cuerpo, cabeceras=None):
+        datos = json.dumps(cuerpo).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def simular_red(self):
+        estado = self.server.estado
+        with estado.lock:
+            estado.peticiones += 1
+        if estado.latencia:
+            time.sleep(estado.latencia * random.uniform(0.5, 1.5))
+        return random.random() < estado.fallos
+
+    def do_POST(self):
+        cuerpo = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if self.path.startswith('/v1/payment_intents/') and self.path.endswith('/confirm'):
+            return self.confirmar(self.path[len('/v1/payment_intents/'):-len('/confirm')])
+        if self.path.rstrip('/') != '/v1/payment_intents':
+            return self.responder(404, {'error': {'type': 'invalid_request_error', 'message': 'Ruta desconocida'}})
+        if self.simular_red():
+            return self.responder(500, {'error': {'type': 'api_error', 'message': 'Fallo simulado'}})
+        estado = self.server.estado
+        clave = self.headers.get('Idempotency-Key')
+        with estado.lock:
+            if clave and clave in estado.idempotencia:
+                return self.responder(200, estado.intents[estado.idempotencia[clave]], {'Idempotent-Replayed': 'true'})
+            params = dict(parse_qsl(cuerpo))
+            if not params.get('amount', '').isdigit():
+                return self.responder(400, {'error': {'type': 'invalid_request_error', 'message': 'amount inválido', 'param': 'amount'}})
+            intent_id = f'pi_falso_{secrets.token_hex(12)}'
+            intent = {
+                'id': intent_id,
+                'object': 'payment_intent',
+                'amount': int(params['amount']),
+                'currency': params.get('currency', 'cop'),
+                'client_secret': f'{intent_id}_secret_{secrets.token_hex(12)}',
+                'status': 'requires_payment_method',
+                'metadata': {k[len('metadata['):-1]: v for k, v in params.items() if k.startswith('metadata[')},
+                'created': int(time.time()),
+                'livemode': False,
+            }
+            estado.intents[intent_id] = intent
+            if clave:
+                estado.idempotencia[clave] = intent_id
+        self.responder(200, intent)
+
+    def confirmar(self, intent_id):
+        if self.simular_red():
+            return self.responder(500, {'error': {'type': 'api_error', 'message': 'Fallo simulado'}})
+        estado = self.server.estado
+        with estado.lock:
+            intent = estado.intents.get(intent_id)
+            if intent is None:
+                return self.responder(404, {'error': {'type': 'invalid_request_error', 'message': 'No existe el PaymentIntent'}})
+            intent['status'] = 'succeeded'
+        if estado.webhook_url:
+            threading.Thread(target=enviar_webhook, args=(estado, 'payment_intent.succeeded', dict(intent)), daemon=True).start()
+        self.responder(200, intent)
+
+    def do_GET(self):
+        prefijo = '/v1/payment_intents/'
+        if self.simular_red():
+            return self.responder(500, {'error': {'type': 'api_error', 'message': 'Fallo simulado'}})
+        intent = self.server.estado.intents.get(self.path[len(prefijo):]) if self.path.startswith(prefijo) else None
+        if intent is None:
+            return self.responder(404, {'error': {'type': 'invalid_request_error', 'message': 'No existe el PaymentIntent'}})
+        self.responder(200, intent)
+
+def enviar_webhook(estado, tipo, objeto):
+    cuerpo = json.dumps({'id': f'evt_falso_{secrets.token_hex(12)}', 'object': 'event', 'type': tipo, 'created': int(time.time()), 'data': {'object': objeto}})
+    peticion = urllib.request.Request(estado.webhook_url, data=cuerpo.encode('utf-8'), headers={'Content-Type': 'application/json', 'Stripe-Signature': pagos.firmar_webhook(cuerpo, estado.webhook_secreto)})
+    for intento in range(5):
+        try:
+            with urllib.request.urlopen(peticion, timeout=10) as respuesta:
+                if respuesta.status < 300:
+                    return
+        except Exception:
+            pass
+        time.sleep(2 ** intento)
+
+def iniciar(puerto=0, latencia=0, fallos=0, webhook_url=None, webhook_secreto=None):
+    # Arranca el servidor en un hilo y lo devuelve; la URL base es f'http://127.0.0.1:{servidor.server_port}'
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), ManejadorPasarela)
+    servidor.daemon_threads = True
+    servidor.estado = EstadoPasarela(latencia, fallos, webhook_url, webhook_secreto)
+    threading.Thread(target=servidor.serve_forever, name='pasarela-falsa', daemon=True).start()
+    return servidor
+
+if __name__ == '__main__':
+    puerto = int(sys.argv[1]) if len(sys.argv) > 1 else 12111
+    latencia = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    fallos = float(sys.argv[3]) if len(sys.argv) > 3 else 0
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), ManejadorPasarela)
+    if os.environ.get('PAGOS_WEBHOOK_URL') and not os.environ.get('PAGOS_WEBHOOK_SECRETO'):
+        sys.exit('PAGOS_WEBHOOK_URL requiere PAGOS_WEBHOOK_SECRETO (el mismo que usa la app)')
+    servidor.estado = EstadoPasarela(latencia, fallos, os.environ.get('PAGOS_WEBHOOK_URL'), os.environ.get('PAGOS_WEBHOOK_SECRETO'))
+    print(f'Pasarela falsa en http://127.0.0.1:{puerto} (latencia {latencia}s, fallos {fallos:.0%})')
+    servidor.serve_forever()
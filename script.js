@@ -4,6 +4,7 @@ const API_URL = 'http://localhost:5000/api';
 // Estado de la aplicación
 let userToken = localStorage.getItem('userToken') || null;
 let currentUser = JSON.parse(localStorage.getItem('currentUser')) || null;
+let refreshToken = localStorage.getItem('refreshToken') || null;
 let cart = JSON.parse(localStorage.getItem('cart')) || [];
 
 // Stripe
@@ -31,6 +32,9 @@ document.addEventListener('DOMContentLoaded', async function() {
     // Inicializar Stripe
     await initStripe();
     
+    // Renovar la sesión guardada sin pedir la contraseña
+    await refrescarSesion();
+    
     // Actualizar UI basado en autenticación
     updateUIBasedOnAuth();
     updateCartCount();
@@ -174,14 +178,14 @@ async function handleLogin() {
         const data = await response.json();
         
         if (response.ok) {
-            userToken = data.token;
-            currentUser = data.usuario;
-            localStorage.setItem('userToken', userToken);
-            localStorage.setItem('currentUser', JSON.stringify(currentUser));
+            guardarSesion(data);
             
             showNotification(`¡Bienvenido/a ${currentUser.nombre}!`, 'success');
             closeAllModals();
             updateUIBasedOnAuth();
+            await mergeLocalCart();
+        } else if (response.status === 429 || response.status === 503) {
+            showNotification('Hay muchos inicios de sesión en este momento. Intenta de nuevo en unos segundos.', 'error');
         } else {
             showNotification(data.mensaje || 'Error al iniciar sesión', 'error');
         }
@@ -225,11 +229,47 @@ async function handleRegister() {
     }
 }
 
+function guardarSesion(data) {
+    userToken = data.token;
+    currentUser = data.usuario;
+    refreshToken = data.refresh_token;
+    localStorage.setItem('userToken', userToken);
+    localStorage.setItem('currentUser', JSON.stringify(currentUser));
+    localStorage.setItem('refreshToken', refreshToken);
+}
+
+async function refrescarSesion() {
+    if (!refreshToken) return;
+    try {
+        const response = await fetch(`${API_URL}/token/refrescar`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ refresh_token: refreshToken })
+        });
+        if (response.ok) {
+            guardarSesion(await response.json());
+        } else if (response.status === 401) {
+            userToken = null;
+            currentUser = null;
+            refreshToken = null;
+            localStorage.removeItem('userToken');
+            localStorage.removeItem('currentUser');
+            localStorage.removeItem('refreshToken');
+        }
+    } catch (error) {
+        console.error('Error al renovar la sesión:', error);
+    }
+}
+
 function logout() {
     userToken = null;
     currentUser = null;
+    refreshToken = null;
     localStorage.removeItem('userToken');
     localStorage.removeItem('currentUser');
+    localStorage.removeItem('refreshToken');
     cart = [];
     saveCart();
     updateCartCount();
@@ -309,42 +349,62 @@ async function loadCartFromServer() {
         });
         
         if (response.ok) {
-            const data = await response.json();
-            
-            cart = data.items.map(item => ({
-                id: item.producto.id.toString(),
-                name: item.producto.nombre,
-                price: item.producto.precio,
-                image: item.producto.imagen_url,
-                quantity: item.cantidad
-            }));
-            
-            saveCart();
-            updateCartCount();
+            setCartFromServer(await response.json());
         }
     } catch (error) {
         console.error('Error al cargar carrito:', error);
     }
 }
 
+function setCartFromServer(data) {
+    cart = data.items.map(item => ({
+        id: item.producto.id.toString(),
+        name: item.producto.nombre,
+        price: item.producto.precio,
+        image: item.producto.imagen_url,
+        quantity: item.cantidad
+    }));
+    
+    saveCart();
+    updateCartCount();
+}
+
+// Aplica operaciones {tipo: 'agregar' | 'fijar' | 'eliminar', producto_id, cantidad} en una sola petición
+async function sendCartOperations(operaciones) {
+    const response = await fetch(`${API_URL}/carrito/lote`, {
+        method: 'POST',
+        headers: {
+            'Authorization': `Bearer ${userToken}`,
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ operaciones })
+    });
+    
+    if (!response.ok) return false;
+    setCartFromServer(await response.json());
+    return true;
+}
+
+async function mergeLocalCart() {
+    try {
+        const operaciones = cart.map(item => ({
+            tipo: 'agregar',
+            producto_id: parseInt(item.id),
+            cantidad: item.quantity
+        }));
+        await sendCartOperations(operaciones);
+    } catch (error) {
+        console.error('Error al fusionar carrito:', error);
+    }
+}
+
 async function addToCart(product) {
     if (userToken) {
         try {
-            const response = await fetch(`${API_URL}/carrito`, {
-                method: 'POST',
-                headers: {
-                    'Authorization': `Bearer ${userToken}`,
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    producto_id: product.id,
-                    cantidad: 1
-                })
-            });
+            const ok = await sendCartOperations([{ tipo: 'agregar', producto_id: parseInt(product.id), cantidad: 1 }]);
             
-            if (response.ok) {
+            if (ok) {
                 showNotification(`"${product.name}" añadido al carrito! 🛍️`, 'success');
-                await loadCartFromServer();
             } else {
                 showNotification('Error al agregar al carrito', 'error');
             }
@@ -369,28 +429,14 @@ async function addToCart(product) {
 
 async function removeFromCart(productId) {
     if (userToken) {
-        const item = cart.find(i => i.id == productId);
-        if (item) {
-            try {
-                const serverCartResponse = await fetch(`${API_URL}/carrito`, {
-                    headers: { 'Authorization': `Bearer ${userToken}` }
-                });
-                const serverCart = await serverCartResponse.json();
-                const serverItem = serverCart.items.find(i => i.producto.id == productId);
-                
-                if (serverItem) {
-                    await fetch(`${API_URL}/carrito/${serverItem.id}`, {
-                        method: 'DELETE',
-                        headers: { 'Authorization': `Bearer ${userToken}` }
-                    });
-                }
-            } catch (error) {
-                console.error('Error:', error);
-            }
+        try {
+            await sendCartOperations([{ tipo: 'eliminar', producto_id: parseInt(productId) }]);
+        } catch (error) {
+            console.error('Error:', error);
         }
     }
     
-    cart = cart.filter(item => item.id !== productId);
+    cart = cart.filter(item => item.id != productId);
     saveCart();
     updateCartCount();
     renderCart();
@@ -404,6 +450,13 @@ async function updateQuantity(productId, quantity) {
             removeFromCart(productId);
         } else {
             product.quantity = quantity;
+            if (userToken) {
+                try {
+                    await sendCartOperations([{ tipo: 'fijar', producto_id: parseInt(productId), cantidad: quantity }]);
+                } catch (error) {
+                    console.error('Error:', error);
+                }
+            }
             saveCart();
             renderCart();
             updateCartCount();
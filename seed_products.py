@@ -1,43 +1,23 @@
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+import sys
+from app import app, migrar, recalcular_estadisticas
+from modelos import db, Producto, Categoria
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tienda_vestidos.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
-
-class Producto(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(200), nullable=False)
-    descripcion = db.Column(db.Text)
-    precio = db.Column(db.Float, nullable=False)
-    talla = db.Column(db.String(10))
-    color = db.Column(db.String(50))
-    imagen_url = db.Column(db.String(300))
-    stock = db.Column(db.Integer, default=0)
-    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'))
-
-class Categoria(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), nullable=False, unique=True)
-    descripcion = db.Column(db.Text)
-
-def seed_products():
+def seed_products(reemplazar=False):
     with app.app_context():
-        # Crear tablas
-        db.create_all()
+        # Crear o actualizar tablas, índices y búsqueda con el mismo esquema que la aplicación
+        migrar()
         
         # Verificar si ya hay productos
         if Producto.query.count() > 0:
             print("⚠️  Ya existen productos en la base de datos.")
-            respuesta = input("¿Deseas eliminarlos y crear nuevos? (s/n): ")
-            if respuesta.lower() == 's':
+            # Sin preguntar por stdin para poder usarlo en scripts: se reemplazan solo con --reemplazar
+            if reemplazar:
                 Producto.query.delete()
-                db.session.commit()
+                # El DELETE masivo no pasa por los eventos del ORM: se recalculan las estadísticas
+                recalcular_estadisticas()
                 print("🗑️  Productos anteriores eliminados.")
             else:
-                print("❌ Operación cancelada.")
+                print("❌ Operación cancelada. Usa --reemplazar para eliminarlos y crear nuevos.")
                 return
         
         # Crear categorías si no existen
@@ -187,4 +167,4 @@ def seed_products():
 if __name__ == '__main__':
     print("🌟 GLAM RENT - Inicializador de Base de Datos")
     print("=" * 70)
-    seed_products()
\ No newline at end of file
+    seed_products(reemplazar='--reemplazar' in sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,100 @@
+import gzip
+import json
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Serialización de las respuestas de la API. jsonify pasa por ProveedorJSON, que usa orjson si
+# está instalado (varias veces más rápido que json) y si no el codificador de Flask; la salida es la
+# misma (claves ordenadas, fechas en formato HTTP) salvo que orjson no escapa lo que no es ASCII.
+# compilar() arma serializadores por esquema y comprimir_respuesta() comprime en brotli o gzip las
+# respuestas JSON grandes.
+BACKEND = 'orjson' if orjson is not None else 'json'
+# Niveles rápidos: la respuesta se comprime en cada petición (o una vez por entrada de la cache),
+# no una sola vez al arrancar como los estáticos
+NIVEL_GZIP = 6
+CALIDAD_BROTLI = 4
+if orjson is not None:
+    OPCIONES_ORJSON = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+def volcar(obj):
+    # bytes UTF-8
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=DefaultJSONProvider.default, option=OPCIONES_ORJSON)
+        except orjson.JSONEncodeError:
+            # Enteros de más de 64 bits y otros casos que orjson no cubre
+            pass
+    return json.dumps(obj, default=DefaultJSONProvider.default, sort_keys=True, ensure_ascii=False).encode('utf-8')
+
+class ProveedorJSON(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return volcar(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # Los bytes van directo al cuerpo, sin pasar por str
+        return self._app.response_class(volcar(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+
+def compilar(campos, **calculados):
+    # Devuelve una función fila -> {'campo': fila.campo, ...} generada con el dict literal de esos
+    # campos: sin bucle, getattr ni comparaciones por campo en cada fila. Sirve igual para objetos
+    # del ORM y para filas de db.session.query(columnas). Los campos de `calculados` se obtienen
+    # llamando a su función con la fila
+    for campo in campos:
+        if not campo.isidentifier():
+            raise ValueError(f'Campo inválido: {campo}')
+    valores = ', '.join(f"'{c}': {c}(fila)" if c in calculados else f"'{c}': fila.{c}" for c in campos)
+    espacio = dict(calculados)
+    exec(f'def serializar(fila):\n    return {{{valores}}}\n', espacio)
+    return espacio['serializar']
+
+def elegir_codificacion():
+    codificaciones = ('br', 'gzip') if brotli is not None else ('gzip',)
+    for codificacion in codificaciones:
+        if request.accept_encodings[codificacion] > 0:
+            return codificacion
+    return None
+
+def comprimir(datos, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=CALIDAD_BROTLI)
+    return gzip.compress(datos, compresslevel=NIVEL_GZIP, mtime=0)
+
+def marcar_comprimida(respuesta, codificacion):
+    respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    # Cada codificación es otra representación: el ETag pasa a débil, que If-None-Match compara igual
+    etag, debil = respuesta.get_etag()
+    if etag and not debil:
+        respuesta.set_etag(etag, weak=True)
+
+def comprimir_respuesta(respuesta, minimo):
+    # Respuestas JSON de al menos `minimo` bytes; deja pasar las que van por flujo (exportaciones,
+    # novedades) y las que ya vienen comprimidas (estáticos, cache de respuestas)
+    if respuesta.mimetype != 'application/json' or respuesta.is_streamed or respuesta.direct_passthrough or 'Content-Encoding' in respuesta.headers:
+        return respuesta
+    datos = respuesta.get_data()
+    if len(datos) < minimo:
+        return respuesta
+    respuesta.vary.add('Accept-Encoding')
+    codificacion = elegir_codificacion()
+    if codificacion is not None:
+        respuesta.set_data(comprimir(datos, codificacion))
+        marcar_comprimida(respuesta, codificacion)
+    return respuesta
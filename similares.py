@@ -0,0 +1,345 @@
+import importlib.util
+import math
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+NUMPY_DISPONIBLE = importlib.util.find_spec('numpy') is not None
+
+# Índice de "vestidos parecidos". Cada producto es un vector normalizado con un bloque por atributo:
+# categoría, talla y color (una columna por valor), rango de precio (el suyo y, a medias, los
+# vecinos) y las palabras del nombre y la descripción repartidas por hash en DIMENSIONES_TEXTO
+# columnas y pesadas por idf. La similitud de dos productos es el producto punto de sus vectores.
+# Los vecinos de cada producto se buscan con NumPy entre los de su misma categoría (una
+# multiplicación de matrices por tanda de filas) y se les suma la señal de compras conjuntas,
+# peso_compras * c / sqrt(n_a * n_b), con c los pedidos que llevan ambos y n los de cada uno; los
+# comprados juntos entran como candidatos aunque sean de otra categoría. Se guardan los k mejores
+# de cada producto, así que consultar es leer una fila. numpy se importa al construir, no al cargar
+# el módulo, para no sumar su importación al arranque.
+DIMENSIONES_TEXTO = 64
+PESOS = {'categoria': 1.0, 'talla': 0.5, 'color': 0.7, 'precio': 0.7, 'texto': 1.0}
+# Columnas libres por atributo para valores nuevos; al agotarse se reconstruye el índice
+HOLGURA = 4
+TANDA = 256
+PALABRAS_VACIAS = {'con', 'para', 'los', 'las', 'del', 'por', 'una', 'que', 'sus'}
+
+def palabras(nombre, descripcion):
+    # Como busqueda.tokenizar, pero quitando los acentos con encode('ascii'): construir el índice
+    # tokeniza todo el catálogo y recorrer el texto carácter a carácter era la mitad del tiempo
+    texto = unicodedata.normalize('NFKD', f'{nombre or ""} {descripcion or ""}').encode('ascii', 'ignore').decode().lower()
+    return [p for p in re.findall(r'\w+', texto) if len(p) > 2 and p not in PALABRAS_VACIAS]
+
+@lru_cache(maxsize=65536)
+def columna_texto(palabra):
+    # crc32 y no hash(): las columnas deben ser las mismas en todos los procesos
+    return zlib.crc32(palabra.encode()) % DIMENSIONES_TEXTO
+
+def mejores(puntajes, k):
+    # (columnas, valores) de los k mayores de cada fila, ordenados y con los empates a favor de la
+    # columna menor; -1 / -inf si la fila tiene menos. El k-ésimo mayor de una muestra de columnas es
+    # cota inferior del de la fila entera, así que filtrar por él deja solo unos pocos candidatos que
+    # ordenar, en vez de un argpartition sobre toda la fila
+    import numpy as np
+    filas, total = puntajes.shape
+    columnas = np.full((filas, k), -1, dtype=np.int64)
+    valores = np.full((filas, k), -np.inf, dtype=np.float32)
+    if total // 8 > k:
+        umbral = -np.partition(-puntajes[:, ::8], k, axis=1)[:, k]
+        # flatnonzero + divmod: nonzero sobre la matriz de dos dimensiones es varias veces más lento
+        fila, columna = np.divmod(np.flatnonzero(puntajes >= umbral[:, None]), total)
+        valor = puntajes[fila, columna]
+        # flatnonzero ya deja filas y columnas en orden: basta un argsort estable por fila y puntaje
+        # descendente (los puntajes son cosenos, entre -1 y 1)
+        orden = np.argsort(fila * 4.0 - valor, kind='stable')
+        fila, columna, valor = fila[orden], columna[orden], valor[orden]
+    else:
+        orden = np.argsort(-puntajes, axis=1, kind='stable')[:, :k]
+        fila = np.repeat(np.arange(filas), orden.shape[1])
+        columna, valor = orden.ravel(), np.take_along_axis(puntajes, orden, axis=1).ravel()
+    rango = np.arange(len(fila)) - np.searchsorted(fila, fila)
+    quedan = (rango < k) & np.isfinite(valor)
+    columnas[fila[quedan], rango[quedan]] = columna[quedan]
+    valores[fila[quedan], rango[quedan]] = valor[quedan]
+    return columnas, valores
+
+class IndiceSimilares:
+    def __init__(self, limites_precio, k=12, peso_compras=0.5, max_compras=50):
+        self.limites_precio = sorted(limites_precio)
+        self.k = k
+        self.peso_compras = peso_compras
+        self.max_compras = max_compras
+        self.ultimo_cambio = None
+        self.ultimo_item = None
+        self.construido = None
+        self.necesita_reconstruir = False
+        self._lock = threading.Lock()
+        self._posiciones = {}
+        self._n = 0
+
+    # Vectores
+
+    def _preparar_columnas(self, filas):
+        # Una columna por cada valor de categoría, talla y color visto, más HOLGURA libres por atributo
+        self._columnas = {}
+        inicio = 0
+        for atributo, indice in (('categoria', 1), ('talla', 2), ('color', 3)):
+            valores = sorted({fila[indice] for fila in filas if fila[indice] not in (None, '')}, key=str)
+            self._columnas[atributo] = (inicio, len(valores) + HOLGURA, {valor: i for i, valor in enumerate(valores)})
+            inicio += len(valores) + HOLGURA
+        self._inicio_precio = inicio
+        self._inicio_texto = inicio + len(self.limites_precio) + 1
+        self.dimensiones = self._inicio_texto + DIMENSIONES_TEXTO
+
+    def _columna(self, atributo, valor):
+        # Columna del valor dentro del bloque del atributo, o -1; los valores nuevos ocupan la holgura
+        if valor in (None, ''):
+            return -1
+        _, tamano, valores = self._columnas[atributo]
+        if valor not in valores:
+            if len(valores) == tamano:
+                self.necesita_reconstruir = True
+                return -1
+            valores[valor] = len(valores)
+        return valores[valor]
+
+    def _texto(self, palabras_por_fila):
+        # Peso 1 + log(veces) de las palabras de cada fila en las columnas de texto, todavía sin idf
+        import numpy as np
+        filas, columnas, pesos = [], [], []
+        for i, palabras_fila in enumerate(palabras_por_fila):
+            for palabra, veces in Counter(palabras_fila).items():
+                filas.append(i)
+                columnas.append(columna_texto(palabra))
+                pesos.append(1 + math.log(veces))
+        texto = np.zeros((len(palabras_por_fila), DIMENSIONES_TEXTO), dtype=np.float32)
+        np.add.at(texto, (filas, columnas), pesos)
+        return texto
+
+    def _vectores_de(self, filas, texto):
+        # Matriz con un vector normalizado por fila (id, categoria_id, talla, color, precio, nombre,
+        # descripcion); texto es el de _texto() para esas filas
+        import numpy as np
+        vectores = np.zeros((len(filas), self.dimensiones), dtype=np.float32)
+        indices = np.arange(len(filas))
+        for atributo, indice in (('categoria', 1), ('talla', 2), ('color', 3)):
+            columnas = np.array([self._columna(atributo, fila[indice]) for fila in filas], dtype=np.int64)
+            tiene = columnas >= 0
+            vectores[indices[tiene], self._columnas[atributo][0] + columnas[tiene]] = PESOS[atributo]
+        precios = np.array([np.nan if fila[4] is None else fila[4] for fila in filas], dtype=np.float64)
+        con_precio = np.flatnonzero(~np.isnan(precios))
+        rangos = np.searchsorted(self.limites_precio, precios[con_precio], side='right')
+        bandas = np.zeros((len(con_precio), len(self.limites_precio) + 1), dtype=np.float32)
+        orden = np.arange(len(con_precio))
+        bandas[orden, rangos] = 1
+        bandas[orden[rangos > 0], rangos[rangos > 0] - 1] = 0.5
+        bandas[orden[rangos < len(self.limites_precio)], rangos[rangos < len(self.limites_precio)] + 1] = 0.5
+        vectores[con_precio, self._inicio_precio:self._inicio_texto] = bandas * (PESOS['precio'] / np.linalg.norm(bandas, axis=1, keepdims=True))
+        texto = texto * self._idf
+        normas = np.linalg.norm(texto, axis=1, keepdims=True)
+        vectores[:, self._inicio_texto:] = np.divide(texto * PESOS['texto'], normas, out=np.zeros_like(texto), where=normas > 0)
+        normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+        return np.divide(vectores, normas, out=np.zeros_like(vectores), where=normas > 0)
+
+    def _codigo_categoria(self, categoria_id):
+        if categoria_id is None:
+            return -1
+        return self._codigos_categoria.setdefault(categoria_id, len(self._codigos_categoria))
+
+    # Construcción completa
+
+    def construir(self, productos, pares, pedidos, ultimo_cambio, ultimo_item):
+        # productos: (id, categoria_id, talla, color, precio, nombre, descripcion); pares: (producto_a,
+        # producto_b, pedidos en común) en ambos sentidos; pedidos: (producto_id, pedidos que lo llevan)
+        import numpy as np
+        filas = list(productos)
+        self._preparar_columnas(filas)
+        texto = self._texto([palabras(fila[5], fila[6]) for fila in filas])
+        documentos = (texto > 0).sum(axis=0)
+        self._idf = (np.log((len(filas) + 1) / (documentos + 1)) + 1).astype(np.float32)
+        self._codigos_categoria = {}
+        self.necesita_reconstruir = False
+        capacidad = max(len(filas) * 5 // 4, 16)
+        self._reservar(capacidad)
+        self._posiciones = {fila[0]: i for i, fila in enumerate(filas)}
+        self._n = len(filas)
+        self._ids[:self._n] = [fila[0] for fila in filas]
+        self._vectores[:self._n] = self._vectores_de(filas, texto)
+        self._categorias[:self._n] = [self._codigo_categoria(fila[1]) for fila in filas]
+        for producto_id, n in pedidos:
+            if producto_id in self._posiciones:
+                self._pedidos[self._posiciones[producto_id]] = n
+        self._compras = self._leer_pares(pares)
+        self._calcular(np.arange(self._n))
+        with self._lock:
+            self._publicado = (self._posiciones, self._ids, self._vecinos, self._puntajes)
+            self.ultimo_cambio, self.ultimo_item = ultimo_cambio, ultimo_item
+            self.construido = time.monotonic()
+
+    def _reservar(self, capacidad):
+        import numpy as np
+        self._ids = np.full(capacidad, -1, dtype=np.int64)
+        self._vectores = np.zeros((capacidad, self.dimensiones), dtype=np.float32)
+        self._categorias = np.full(capacidad, -2, dtype=np.int32)
+        self._pedidos = np.zeros(capacidad, dtype=np.float32)
+        self._vecinos = np.full((capacidad, self.k), -1, dtype=np.int32)
+        self._puntajes = np.full((capacidad, self.k), -np.inf, dtype=np.float32)
+
+    def _leer_pares(self, pares):
+        # {posición: (posiciones de los socios, pedidos en común)} con los max_compras socios más frecuentes
+        import numpy as np
+        datos = np.array([(self._posiciones[a], self._posiciones[b], c) for a, b, c in pares if a in self._posiciones and b in self._posiciones], dtype=np.int64).reshape(-1, 3)
+        if not len(datos):
+            return {}
+        datos = datos[np.lexsort((-datos[:, 2], datos[:, 0]))]
+        cortes = np.flatnonzero(np.diff(datos[:, 0])) + 1
+        compras = {}
+        for grupo in np.split(datos, cortes):
+            compras[int(grupo[0, 0])] = (grupo[:self.max_compras, 1].copy(), grupo[:self.max_compras, 2].astype(np.float32))
+        return compras
+
+    def _calcular(self, posiciones):
+        # Recalcula los k vecinos de las filas `posiciones` (productos vivos) contra su categoría y sus compras
+        import numpy as np
+        if not len(posiciones):
+            return
+        n = self._n
+        categorias, vivos = self._categorias[:n], self._ids[:n] >= 0
+        for codigo in np.unique(categorias[posiciones]):
+            bloque = np.flatnonzero((categorias == codigo) & vivos)
+            filas = posiciones[categorias[posiciones] == codigo]
+            vectores_bloque = np.ascontiguousarray(self._vectores[bloque].T)
+            for inicio in range(0, len(filas), TANDA):
+                tanda = filas[inicio:inicio + TANDA]
+                puntajes = self._vectores[tanda] @ vectores_bloque
+                puntajes[np.arange(len(tanda)), np.searchsorted(bloque, tanda)] = -np.inf
+                columnas, valores = mejores(puntajes, self.k)
+                self._guardar_vecinos(tanda, np.where(columnas >= 0, bloque[columnas], -1), valores)
+
+    def _guardar_vecinos(self, tanda, candidatos, puntajes):
+        # Suma a los candidatos de la categoría los socios de compras de cada fila y guarda los k mejores
+        import numpy as np
+        socios = np.full((len(tanda), self.max_compras), -1, dtype=np.int64)
+        comunes = np.zeros((len(tanda), self.max_compras), dtype=np.float32)
+        for fila, posicion in enumerate(tanda):
+            compras = self._compras.get(int(posicion))
+            if compras is not None:
+                socios[fila, :len(compras[0])], comunes[fila, :len(compras[1])] = compras
+        validos = (socios >= 0) & (self._ids[socios] >= 0)
+        if validos.any():
+            ancho = int(validos.sum(axis=1).max())
+            orden = np.argsort(~validos, axis=1, kind='stable')[:, :ancho]
+            socios, comunes, validos = (np.take_along_axis(m, orden, axis=1) for m in (socios, comunes, validos))
+            extra = np.einsum('rd,rmd->rm', self._vectores[tanda], self._vectores[socios])
+            extra += self.peso_compras * comunes / np.sqrt(np.maximum(self._pedidos[socios] * self._pedidos[tanda][:, None], 1))
+            extra[~validos] = -np.inf
+            # Un socio que también salió por similitud queda una sola vez, con la señal de compras
+            repetidos = (candidatos[:, :, None] == np.where(validos, socios, -2)[:, None, :]).any(axis=2)
+            candidatos = np.concatenate([np.where(validos, socios, -1), candidatos], axis=1)
+            puntajes = np.concatenate([extra, np.where(repetidos, -np.inf, puntajes)], axis=1)
+        orden = np.argsort(-puntajes, axis=1, kind='stable')[:, :self.k]
+        puntajes = np.take_along_axis(puntajes, orden, axis=1)
+        self._vecinos[tanda] = np.where(np.isfinite(puntajes), np.take_along_axis(candidatos, orden, axis=1), -1)
+        self._puntajes[tanda] = puntajes
+
+    # Actualización incremental
+
+    def actualizar(self, productos, pedidos, ultimo_cambio, ultimo_item):
+        # productos: [(id, fila o None si se eliminó)] de los productos que cambiaron, con las filas como
+        # en construir(); pedidos: [[producto_id, ...]] de cada pedido nuevo
+        import numpy as np
+        # Se trabaja sobre copias de lo que leen las consultas y se publican al final: una consulta
+        # nunca espera a la actualización ni ve una fila a medio escribir
+        self._posiciones, self._ids = dict(self._posiciones), self._ids.copy()
+        self._vecinos, self._puntajes = self._vecinos.copy(), self._puntajes.copy()
+        cambiados = set()
+        for producto_id, fila in productos:
+            posicion = self._posiciones.get(producto_id)
+            if fila is None:
+                if posicion is not None:
+                    del self._posiciones[producto_id]
+                    self._ids[posicion] = -1
+                    cambiados.add(posicion)
+                continue
+            if posicion is None:
+                posicion = self._agregar(producto_id)
+            self._vectores[posicion] = self._vectores_de([fila], self._texto([palabras(fila[5], fila[6])]))[0]
+            self._categorias[posicion] = self._codigo_categoria(fila[1])
+            cambiados.add(posicion)
+        recalcular = set()
+        for productos_pedido in pedidos:
+            posiciones = [self._posiciones[p] for p in set(productos_pedido) if p in self._posiciones]
+            for posicion in posiciones:
+                self._pedidos[posicion] += 1
+                for socio in posiciones:
+                    if socio != posicion:
+                        self._sumar_compra(posicion, socio)
+            if len(posiciones) > 1:
+                recalcular.update(posiciones)
+        if cambiados:
+            n = self._n
+            lista = np.fromiter(cambiados, dtype=np.int64)
+            # Las filas que tenían de vecino a un producto cambiado se recalculan enteras
+            recalcular.update(np.flatnonzero(np.isin(self._vecinos[:n], lista).any(axis=1)).tolist())
+            for posicion in cambiados:
+                if self._ids[posicion] < 0:
+                    continue
+                recalcular.add(posicion)
+                # En las demás filas de su categoría entra si supera al peor vecino
+                bloque = np.flatnonzero((self._categorias[:n] == self._categorias[posicion]) & (self._ids[:n] >= 0))
+                bloque = bloque[bloque != posicion]
+                puntajes = self._vectores[bloque] @ self._vectores[posicion]
+                entra = puntajes > self._puntajes[bloque, -1]
+                filas = bloque[entra]
+                self._vecinos[filas, -1] = posicion
+                self._puntajes[filas, -1] = puntajes[entra]
+                orden = np.argsort(-self._puntajes[filas], axis=1, kind='stable')
+                self._vecinos[filas] = np.take_along_axis(self._vecinos[filas], orden, axis=1)
+                self._puntajes[filas] = np.take_along_axis(self._puntajes[filas], orden, axis=1)
+        self._calcular(np.array(sorted(p for p in recalcular if self._ids[p] >= 0), dtype=np.int64))
+        with self._lock:
+            self._publicado = (self._posiciones, self._ids, self._vecinos, self._puntajes)
+            self.ultimo_cambio, self.ultimo_item = ultimo_cambio, ultimo_item
+
+    def _agregar(self, producto_id):
+        import numpy as np
+        if self._n == len(self._ids):
+            anteriores = (self._ids, self._vectores, self._categorias, self._pedidos, self._vecinos, self._puntajes)
+            self._reservar(len(self._ids) * 3 // 2)
+            for nuevo, anterior in zip((self._ids, self._vectores, self._categorias, self._pedidos, self._vecinos, self._puntajes), anteriores):
+                nuevo[:len(anterior)] = anterior
+        posicion = self._n
+        self._n += 1
+        self._ids[posicion] = producto_id
+        self._posiciones[producto_id] = posicion
+        return posicion
+
+    def _sumar_compra(self, posicion, socio):
+        import numpy as np
+        socios, comunes = self._compras.get(posicion, (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+        encontrado = np.flatnonzero(socios == socio)
+        if len(encontrado):
+            comunes[encontrado[0]] += 1
+            return
+        if len(socios) >= self.max_compras:
+            # Reemplaza al socio menos frecuente
+            menor = int(np.argmin(comunes))
+            socios[menor], comunes[menor] = socio, 1
+            return
+        self._compras[posicion] = (np.append(socios, socio), np.append(comunes, np.float32(1)))
+
+    # Consulta
+
+    def similares(self, producto_id, n):
+        # [(id, puntaje)] de los n productos más parecidos, o None si el producto no está en el índice
+        if self.construido is None:
+            return None
+        with self._lock:
+            posiciones, ids, vecinos, puntajes = self._publicado
+        posicion = posiciones.get(producto_id)
+        if posicion is None:
+            return None
+        return [(int(ids[v]), float(p)) for v, p in zip(vecinos[posicion, :n], puntajes[posicion, :n]) if v >= 0 and ids[v] >= 0]
@@ -0,0 +1,51 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app.py arma una sola app al importarse (ver armar_app): la base temporal y la configuración de las
+# pruebas van en el entorno antes de importarla. Todas las pruebas comparten esa base, así que cada
+# una crea sus propios datos y no cuenta con que el resto de las tablas esté vacío.
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'pruebas.db')}"
+os.environ['SIMILARES_ACTIVAS'] = '0'
+os.environ['HASH_METODO'] = 'pbkdf2:sha256:1000'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as tienda
+
+@pytest.fixture(scope='session')
+def app():
+    with tienda.app.app_context():
+        tienda.migrar()
+    return tienda.app
+
+@pytest.fixture
+def cliente(app):
+    return app.test_client()
+
+def crear_usuario(app, email, es_admin=False):
+    # Cabeceras con el token de un usuario nuevo
+    with app.app_context():
+        usuario = tienda.Usuario(nombre=email.split('@')[0], email=email, password='x', es_admin=es_admin)
+        tienda.db.session.add(usuario)
+        tienda.db.session.commit()
+        return {'Authorization': f"Bearer {tienda.emitir_tokens(usuario, usuario.password)['token']}"}
+
+@pytest.fixture(scope='session')
+def admin(app):
+    return crear_usuario(app, 'admin@pruebas.local', es_admin=True)
+
+@pytest.fixture
+def comprador(app, request):
+    return crear_usuario(app, f'{request.node.name}@pruebas.local')
+
+@pytest.fixture
+def crear_productos(app):
+    def crear(cantidad, **valores):
+        with app.app_context():
+            productos = [tienda.Producto(**{'nombre': f'Vestido {i}', 'precio': 100000 + i, 'stock': 10, **valores}) for i in range(cantidad)]
+            tienda.db.session.add_all(productos)
+            tienda.db.session.commit()
+            return [p.id for p in productos]
+    return crear
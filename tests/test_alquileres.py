@@ -0,0 +1,80 @@
+import datetime
+import random
+import threading
+from collections import Counter
+
+import app as tienda
+from conftest import crear_usuario
+
+def ocupacion_por_dia(app, producto_id):
+    with app.app_context():
+        filas = tienda.db.session.query(tienda.ItemPedido.fecha_inicio, tienda.ItemPedido.fecha_fin, tienda.ItemPedido.cantidad).join(tienda.Pedido).filter(tienda.ItemPedido.producto_id == producto_id, tienda.Pedido.estado != 'cancelado').all()
+    ocupacion = Counter()
+    for desde, hasta, cantidad in filas:
+        for n in range((hasta - desde).days + 1):
+            ocupacion[desde + datetime.timedelta(days=n)] += cantidad
+    return ocupacion, len(filas)
+
+def test_alquileres_simultaneos_no_pasan_del_stock(app, crear_productos):
+    stock, compradores = 2, 16
+    producto_id, = crear_productos(1, stock=stock)
+    cabeceras = [crear_usuario(app, f'alquiler{i}@pruebas.local') for i in range(compradores)]
+    cliente = app.test_client()
+    for c in cabeceras:
+        assert cliente.post('/api/carrito/lote', json={'operaciones': [{'tipo': 'agregar', 'producto_id': producto_id}]}, headers=c).status_code == 200
+    hoy = datetime.date.today()
+    estados = Counter()
+    lock = threading.Lock()
+    barrera = threading.Barrier(compradores)
+    rng = random.Random(7)
+
+    def alquilar(c, desplazamiento):
+        inicio = hoy + datetime.timedelta(days=10 + desplazamiento)
+        barrera.wait()
+        r = app.test_client().post('/api/pedidos', json={'fecha_inicio': inicio.isoformat(), 'fecha_fin': (inicio + datetime.timedelta(days=2)).isoformat()}, headers=c)
+        with lock:
+            estados[r.status_code] += 1
+
+    hilos = [threading.Thread(target=alquilar, args=(c, rng.randrange(6))) for c in cabeceras]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    ocupacion, creados = ocupacion_por_dia(app, producto_id)
+    assert set(estados) <= {201, 409}, estados
+    assert creados == estados[201] >= stock
+    assert max(ocupacion.values()) <= stock
+
+def test_filtro_por_fechas_igual_a_la_ocupacion_real(app, cliente, crear_productos, monkeypatch):
+    # Alquileres cargados por fuera de la app, como en otro proceso; con ttl 0 el índice los relee
+    monkeypatch.setattr(tienda.indice_alquileres, 'ttl', 0)
+    rng = random.Random(11)
+    hoy = datetime.date.today()
+    productos = crear_productos(60)
+    with app.app_context():
+        db = tienda.db
+        db.session.execute(db.update(tienda.Producto).where(tienda.Producto.id.in_(productos)).values(stock=db.func.abs(db.func.random()) % 3 + 1))
+        usuario = tienda.Usuario(nombre='Fechas', email='fechas@pruebas.local', password='x')
+        db.session.add(usuario)
+        db.session.flush()
+        for i in range(240):
+            pedido = tienda.Pedido(usuario_id=usuario.id, total=100000, estado='cancelado' if i % 10 == 0 else 'pagado', stock_reservado=i % 10 != 0)
+            db.session.add(pedido)
+            db.session.flush()
+            inicio = hoy + datetime.timedelta(days=90 + rng.randrange(30))
+            db.session.add(tienda.ItemPedido(pedido_id=pedido.id, producto_id=rng.choice(productos), cantidad=1, precio_unitario=100000, fecha_inicio=inicio, fecha_fin=inicio + datetime.timedelta(days=rng.randint(1, 4))))
+        db.session.commit()
+        desde, hasta = hoy + datetime.timedelta(days=100), hoy + datetime.timedelta(days=106)
+        filas = db.session.query(tienda.ItemPedido.producto_id, tienda.ItemPedido.fecha_inicio, tienda.ItemPedido.fecha_fin, tienda.ItemPedido.cantidad).join(tienda.Pedido).filter(tienda.ItemPedido.fecha_inicio <= hasta, tienda.ItemPedido.fecha_fin >= desde, tienda.Pedido.estado != 'cancelado')
+        ocupados = tienda.disponibilidad.IndiceDisponibilidad.desde_filas(filas).ocupados(desde, hasta)
+        esperados = {pid for pid, stock in db.session.query(tienda.Producto.id, tienda.Producto.stock) if (stock or 0) - ocupados.get(pid, 0) >= 1}
+    # Hay productos con unidades libres y productos sin ninguna en el rango
+    assert set(productos) & esperados and set(productos) - esperados
+    obtenidos, cursor = set(), None
+    while True:
+        pagina = cliente.get(f'/api/productos?limite=37&fields=id&disponible_desde={desde}&disponible_hasta={hasta}' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        obtenidos |= {p['id'] for p in pagina['productos']}
+        cursor = pagina['siguiente_cursor']
+        if not cursor:
+            break
+    assert obtenidos == esperados
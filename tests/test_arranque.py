@@ -0,0 +1,9 @@
+import logging
+
+import app as tienda
+
+def test_calentar_tras_migrar_no_registra_errores(app, caplog):
+    # Mismo orden que gunicorn.conf.py y python app.py: migrar() antes de calentar()
+    with caplog.at_level(logging.ERROR):
+        tienda.calentar(app)
+    assert [r.getMessage() for r in caplog.records] == []
@@ -0,0 +1,28 @@
+import pytest
+
+def lote(cliente, cabeceras, operaciones):
+    return cliente.post('/api/carrito/lote', json={'operaciones': operaciones}, headers=cabeceras)
+
+@pytest.mark.parametrize('operacion', [
+    {'tipo': 'agregar', 'producto_id': True},
+    {'tipo': 'agregar', 'producto_id': 'PRODUCTO', 'cantidad': True},
+    {'tipo': 'fijar', 'producto_id': 'PRODUCTO', 'cantidad': False},
+    {'tipo': 'agregar', 'producto_id': 'PRODUCTO', 'cantidad': 0},
+    {'tipo': 'agregar', 'producto_id': 'PRODUCTO', 'cantidad': -2},
+    {'tipo': 'fijar', 'producto_id': 'PRODUCTO', 'cantidad': -1},
+])
+def test_lote_rechaza_booleanos_y_cantidades_fuera_de_rango(cliente, comprador, crear_productos, operacion):
+    producto_id, = crear_productos(1)
+    lote(cliente, comprador, [{'tipo': 'agregar', 'producto_id': producto_id, 'cantidad': 3}])
+    operacion = {clave: producto_id if valor == 'PRODUCTO' else valor for clave, valor in operacion.items()}
+    respuesta = lote(cliente, comprador, [operacion])
+    assert respuesta.status_code == 400
+    # Nada se aplicó: el carrito sigue con las 3 unidades
+    assert [item['cantidad'] for item in cliente.get('/api/carrito', headers=comprador).get_json()['items']] == [3]
+
+def test_lote_acepta_fijar_en_cero(cliente, comprador, crear_productos):
+    producto_id, = crear_productos(1)
+    assert lote(cliente, comprador, [{'tipo': 'agregar', 'producto_id': producto_id, 'cantidad': 2}]).status_code == 200
+    respuesta = lote(cliente, comprador, [{'tipo': 'fijar', 'producto_id': producto_id, 'cantidad': 0}])
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['items'] == []
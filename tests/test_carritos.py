@@ -0,0 +1,79 @@
+import contextlib
+import threading
+import time
+
+import carritos
+import app as tienda
+
+class RespaldoMemoria:
+    # Hace de tabla carrito, con la demora de una consulta
+    def __init__(self):
+        self.tabla = {}
+        self.lock = threading.Lock()
+
+    def obtener(self, usuario_id):
+        time.sleep(0.0001)
+        with self.lock:
+            return {pid: list(valor) for pid, valor in self.tabla.get(usuario_id, {}).items()}
+
+    def reemplazar(self, carritos):
+        with self.lock:
+            self.tabla.update(carritos)
+
+def test_expulsion_no_se_cruza_con_las_cargas():
+    # Con inactividad 0 cada volcado expulsa todo carrito sin cambios pendientes; antes volcar() podía
+    # quitar un carrito entre la carga y el uso (KeyError)
+    respaldo = RespaldoMemoria()
+    almacen = carritos.AlmacenCarritosMemoria(respaldo, contextlib.nullcontext, intervalo=3600, inactividad=0)
+    hilos_compradores = 6
+    errores, ultimo = [], {}
+    fin = time.monotonic() + 1
+
+    def comprador(i):
+        n = 0
+        while time.monotonic() < fin:
+            try:
+                almacen.obtener((i + 1) % hilos_compradores)
+                ultimo[i] = almacen.aplicar(i, [('agregar', n % 5, 1)])
+                if n % 7 == 6:
+                    almacen.vaciar(i)
+                    ultimo[i] = {}
+                n += 1
+            except Exception as e:
+                errores.append(repr(e))
+
+    def volcador():
+        while time.monotonic() < fin:
+            try:
+                almacen.volcar()
+            except Exception as e:
+                errores.append(repr(e))
+
+    hilos = [threading.Thread(target=comprador, args=(i,)) for i in range(hilos_compradores)] + [threading.Thread(target=volcador) for _ in range(2)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    almacen.volcar()
+    assert errores == []
+    assert {i: respaldo.tabla.get(i, {}) for i in range(hilos_compradores)} == {i: ultimo.get(i, {}) for i in range(hilos_compradores)}
+
+def test_volcado_deja_la_tabla_igual_que_la_memoria(app, crear_productos):
+    productos = crear_productos(3)
+    with app.app_context():
+        usuario = tienda.Usuario(nombre='Volcado', email='volcado@pruebas.local', password='x')
+        tienda.db.session.add(usuario)
+        tienda.db.session.commit()
+        usuario_id = usuario.id
+    respaldo = carritos.AlmacenCarritosSQL(tienda.db, tienda.Carrito)
+    almacen = carritos.AlmacenCarritosMemoria(respaldo, app.app_context, intervalo=3600, inactividad=0)
+    with app.app_context():
+        almacen.aplicar(usuario_id, [('agregar', productos[0], 2), ('agregar', productos[1], 1), ('fijar', productos[2], 4), ('eliminar', productos[1], 0)])
+        assert almacen.pendientes() == 1
+        assert almacen.volcar() == 1
+        en_tabla = {pid: cantidad for pid, (cantidad, _) in respaldo.obtener(usuario_id).items()}
+        assert en_tabla == {productos[0]: 2, productos[2]: 4}
+        # Ya volcado y sin actividad: el siguiente volcado lo expulsa y se vuelve a cargar de la tabla
+        almacen.volcar()
+        assert usuario_id not in almacen._carritos
+        assert {pid: cantidad for pid, (cantidad, _) in almacen.obtener(usuario_id).items()} == en_tabla
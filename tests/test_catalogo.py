@@ -0,0 +1,24 @@
+import pytest
+
+@pytest.mark.parametrize('consulta', ['categoria_id=abc', 'categoria_id=1&categoria_id=x', 'precio_min=barato', 'precio_max=1e', 'rango_precio=1-2'])
+def test_filtros_invalidos_responden_400(cliente, admin, consulta):
+    assert cliente.get(f'/api/productos?{consulta}').status_code == 400
+    assert cliente.get(f'/api/productos?{consulta}&facetas=1').status_code == 400
+    assert cliente.get(f'/api/admin/productos/exportar?{consulta}', headers=admin).status_code == 400
+
+def test_filtro_de_categoria_valido(app, cliente, crear_productos):
+    from app import Categoria, db
+    with app.app_context():
+        categoria = Categoria(nombre='Filtro de prueba')
+        db.session.add(categoria)
+        db.session.commit()
+        categoria_id = categoria.id
+    ids = crear_productos(3, categoria_id=categoria_id)
+    crear_productos(2)
+    productos = cliente.get(f'/api/productos?categoria_id={categoria_id}&categoria_id=&fields=id').get_json()['productos']
+    assert [p['id'] for p in productos] == ids
+
+def test_filtro_de_inventario_invalido(cliente, admin):
+    respuesta = cliente.post('/api/admin/productos/inventario', json={'operaciones': [{'filtro': {'categoria_id': 'abc'}, 'stock': 0}]}, headers=admin)
+    assert respuesta.status_code == 400
+    assert 'categoria_id' in respuesta.get_json()['mensaje']
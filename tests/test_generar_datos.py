@@ -0,0 +1,38 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import app as tienda
+import busqueda
+
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='module')
+def base_generada(tmp_path_factory):
+    ruta_db = str(tmp_path_factory.mktemp('generar') / 'carga.db')
+    subprocess.run([sys.executable, os.path.join(DIRECTORIO, 'benchmarks', 'generar_datos.py'), '--db', ruta_db, '--productos', '300', '--usuarios', '20', '--pedidos', '200', '--carritos', '50', '--lote', '64'],
+                   check=True, capture_output=True, env={**os.environ, 'SIMILARES_ACTIVAS': '0'})
+    with sqlite3.connect(ruta_db) as conexion:
+        yield conexion
+
+def test_indice_de_busqueda_reconstruido_y_con_triggers(base_generada):
+    # La carga suspende los triggers de FTS y reconstruye el índice una vez: debe quedar completo y
+    # los triggers de vuelta para lo que se escriba después
+    productos = base_generada.execute('SELECT count(*) FROM producto').fetchone()[0]
+    assert base_generada.execute(f'SELECT count(*) FROM {busqueda.TABLA_FTS}').fetchone()[0] == productos == 300
+    triggers = {nombre for (nombre,) in base_generada.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert {f'{busqueda.TABLA_FTS}_{sufijo}' for sufijo in ('ai', 'ad', 'au')} <= triggers
+
+def test_ventas_por_producto_iguales_a_los_items(base_generada):
+    # recalcular_estadisticas llena venta_producto con un INSERT ... SELECT
+    estados = ','.join('?' * len(tienda.ESTADOS_VENTA))
+    esperadas = base_generada.execute(f'''SELECT i.producto_id, sum(i.cantidad), round(sum(i.cantidad * i.precio_unitario), 2) FROM item_pedido i JOIN pedido p ON p.id = i.pedido_id
+                                          WHERE p.estado IN ({estados}) GROUP BY i.producto_id ORDER BY i.producto_id''', tienda.ESTADOS_VENTA).fetchall()
+    assert esperadas
+    assert base_generada.execute('SELECT producto_id, unidades, round(ventas, 2) FROM venta_producto ORDER BY producto_id').fetchall() == esperadas
+    contadores = dict(base_generada.execute('SELECT clave, valor FROM estadistica'))
+    assert contadores['productos_total'] == 300
+    assert contadores['pedidos_total'] == base_generada.execute('SELECT count(*) FROM pedido').fetchone()[0] == 200
@@ -0,0 +1,34 @@
+import json
+
+import app as tienda
+
+def importar(cliente, admin, filas):
+    cuerpo = ''.join(json.dumps(fila) + '\n' for fila in filas)
+    respuesta = cliente.post('/api/admin/productos/importar?formato=jsonl', data=cuerpo, headers=admin)
+    assert respuesta.status_code == 200
+    return respuesta.get_json()
+
+def test_rechaza_precios_no_finitos_y_absurdos(app, cliente, admin):
+    # json.loads acepta Infinity y NaN, y 1e400 se vuelve inf
+    filas = [{'nombre': 'Inf', 'precio': 'inf'}, {'nombre': 'Infinity', 'precio': float('inf')}, {'nombre': 'NaN', 'precio': 'nan'},
+             {'nombre': 'Enorme', 'precio': '1e400'}, {'nombre': 'Absurdo', 'precio': tienda.MAX_PRECIO * 10}, {'nombre': 'Verdadero', 'precio': True}]
+    resumen = importar(cliente, admin, filas)
+    assert resumen['creados'] == 0
+    assert [e['fila'] for e in resumen['errores']] == [1, 2, 3, 4, 5, 6]
+    assert all('precio' in e['error'] for e in resumen['errores'])
+
+def test_rechaza_enteros_que_no_son_enteros(app, cliente, admin):
+    filas = [{'nombre': 'Booleano', 'precio': 1000, 'stock': True}, {'nombre': 'Decimal', 'precio': 1000, 'stock': 2.9},
+             {'nombre': 'Infinito', 'precio': 1000, 'stock': 'inf'}, {'nombre': 'Categoria', 'precio': 1000, 'categoria_id': False}]
+    resumen = importar(cliente, admin, filas)
+    assert resumen['creados'] == 0
+    assert [e['error'].split(' ')[0] for e in resumen['errores']] == ['stock', 'stock', 'stock', 'categoria_id']
+
+def test_acepta_valores_validos_de_csv_y_jsonl(app, cliente, admin):
+    resumen = importar(cliente, admin, [{'nombre': 'JSONL', 'precio': 150000.5, 'stock': 3.0}])
+    assert (resumen['creados'], resumen['total_errores']) == (1, 0)
+    cuerpo = 'nombre,precio,stock\nCSV,120000,4\nCSV inf,inf,1\n'
+    resumen = cliente.post('/api/admin/productos/importar?formato=csv', data=cuerpo, headers=admin).get_json()
+    assert (resumen['creados'], [e['fila'] for e in resumen['errores']]) == (1, [3])
+    with app.app_context():
+        assert tienda.db.session.query(tienda.Producto.precio, tienda.Producto.stock).filter(tienda.Producto.nombre.in_(['JSONL', 'CSV'])).order_by(tienda.Producto.nombre).all() == [(120000.0, 4), (150000.5, 3)]
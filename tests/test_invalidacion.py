@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import app as tienda
+from conftest import crear_usuario
+
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def otro_proceso(app):
+    # Conexión propia a la misma base, como la de otro worker de gunicorn o un script de mantenimiento
+    return sqlite3.connect(app.config['SQLALCHEMY_DATABASE_URI'].removeprefix('sqlite:///'), timeout=30)
+
+def test_cambio_de_otro_proceso_invalida_la_cache(app, cliente, crear_productos):
+    producto_id, = crear_productos(1, precio=1000)
+    ruta = f'/api/productos/{producto_id}'
+    primera = cliente.get(ruta)
+    assert cliente.get(ruta, headers={'If-None-Match': primera.headers['ETag']}).status_code == 304
+    # Lo que escribe el commit de otro worker: el cambio y los grupos que invalida
+    with otro_proceso(app) as conexion:
+        conexion.execute('UPDATE producto SET precio = 2000 WHERE id = ?', (producto_id,))
+        conexion.executemany('INSERT INTO cambio_cache(grupo) VALUES (?)', [(f'producto:{producto_id}',), ('productos',)])
+    assert cliente.get(ruta).get_json()['precio'] == 2000
+    assert cliente.get(ruta, headers={'If-None-Match': primera.headers['ETag']}).status_code == 200
+
+def test_admin_degradado_por_sql_deja_de_entrar(app, cliente):
+    cabeceras = crear_usuario(app, 'degradado@pruebas.local', es_admin=True)
+    assert cliente.get('/api/admin/estadisticas', headers=cabeceras).status_code == 200
+    # El trigger de usuario anota el grupo sin que la app intervenga
+    with otro_proceso(app) as conexion:
+        conexion.execute("UPDATE usuario SET es_admin = 0 WHERE email = 'degradado@pruebas.local'")
+    assert cliente.get('/api/admin/estadisticas', headers=cabeceras).status_code == 403
+
+def test_una_sola_app_por_proceso(app):
+    with pytest.raises(RuntimeError):
+        tienda.armar_app()
+
+def test_importar_no_toca_la_base_ni_deja_hilos(tmp_path):
+    # Con preload_app el maestro de gunicorn hace fork después de importar: nada de conexiones ni hilos antes
+    ruta_db = tmp_path / 'arranque.db'
+    codigo = 'import threading, app; print(len([h for h in threading.enumerate() if h is not threading.main_thread()]))'
+    salida = subprocess.run([sys.executable, '-c', codigo], cwd=DIRECTORIO, env={**os.environ, 'DATABASE_URL': f'sqlite:///{ruta_db}'}, capture_output=True, text=True, check=True)
+    assert salida.stdout.strip() == '0'
+    assert not ruta_db.exists()
@@ -0,0 +1,29 @@
+import json
+
+import app as tienda
+
+def inventario(cliente, admin, operaciones):
+    # json.dumps y no json=: el proveedor JSON de la app escribe inf como null
+    return cliente.post('/api/admin/productos/inventario', data=json.dumps({'operaciones': operaciones}), content_type='application/json', headers=admin)
+
+def test_filas_con_el_mismo_tope_de_precio_que_la_importacion(cliente, admin, crear_productos):
+    producto_id, = crear_productos(1)
+    # Infinity y NaN ni siquiera pasan el parser JSON de la app (orjson); el resto lo frena precio_valido
+    for precio in (float('inf'), float('nan')):
+        assert inventario(cliente, admin, [{'filas': [{'id': producto_id, 'precio': precio}]}]).status_code == 400
+    for precio in (tienda.MAX_PRECIO + 1, True, -1):
+        respuesta = inventario(cliente, admin, [{'filas': [{'id': producto_id, 'precio': precio}]}])
+        assert respuesta.status_code == 400, precio
+        assert 'precio inválido' in respuesta.get_json()['mensaje']
+    assert inventario(cliente, admin, [{'filas': [{'id': producto_id, 'precio': tienda.MAX_PRECIO}]}]).status_code == 200
+
+def test_porcentaje_no_pasa_del_tope(app, cliente, admin, crear_productos):
+    barato, caro = crear_productos(1, precio=1000) + crear_productos(1, precio=tienda.MAX_PRECIO / 2)
+    respuesta = inventario(cliente, admin, [{'ids': [barato, caro], 'precio_porcentaje': 150}])
+    assert respuesta.status_code == 200
+    resultado = respuesta.get_json()['operaciones'][0]
+    assert (resultado['actualizados'], resultado['precio_excedido']) == (1, [caro])
+    assert 'stock_insuficiente' not in resultado
+    with app.app_context():
+        assert tienda.db.session.get(tienda.Producto, barato).precio == 2500
+        assert tienda.db.session.get(tienda.Producto, caro).precio == tienda.MAX_PRECIO / 2
@@ -0,0 +1,47 @@
+import pytest
+from flask import request
+from sqlalchemy import event
+
+import app as tienda
+
+@pytest.fixture
+def contar_sql(app):
+    # Cuenta las sentencias que llegan a cualquiera de los motores (escritura y lectura)
+    cuenta = [0]
+    contar = lambda *args: cuenta.__setitem__(0, cuenta[0] + 1)
+    with app.app_context():
+        motores = list(tienda.db.engines.values())
+    for motor in motores:
+        event.listen(motor, 'before_cursor_execute', contar)
+    yield cuenta
+    for motor in motores:
+        event.remove(motor, 'before_cursor_execute', contar)
+
+def crear_pedidos(app, productos, cantidad):
+    with app.app_context():
+        db = tienda.db
+        usuario = tienda.Usuario(nombre='Pedidos', email=f'pedidos{cantidad}@pruebas.local', password='x')
+        db.session.add(usuario)
+        db.session.flush()
+        for i in range(cantidad):
+            pedido = tienda.Pedido(usuario_id=usuario.id, total=0, estado='pagado')
+            db.session.add(pedido)
+            db.session.flush()
+            db.session.add_all([tienda.ItemPedido(pedido_id=pedido.id, producto_id=productos[(i + j) % len(productos)], cantidad=1, precio_unitario=100000) for j in range(3)])
+        db.session.commit()
+        return usuario.id
+
+def test_listado_de_pedidos_con_consultas_constantes(app, crear_productos, contar_sql):
+    # Regresión N+1: cargar pedidos, items, productos y usuarios no depende de cuántos pedidos haya
+    productos = crear_productos(50)
+    consultas = {}
+    for cantidad in (1, 10, 100):
+        usuario_id = crear_pedidos(app, productos, cantidad)
+        with app.test_request_context(f'/api/admin/pedidos?limite={tienda.LIMITE_PAGINA_MAXIMO}'):
+            tienda.db.session.expunge_all()
+            contar_sql[0] = 0
+            resultado = tienda.listar_pedidos(tienda.Pedido.query.filter_by(usuario_id=usuario_id), request.args, con_usuario=True)
+            consultas[cantidad] = contar_sql[0]
+        assert len(resultado['pedidos']) == cantidad
+        assert all(len(pedido['items']) == 3 for pedido in resultado['pedidos'])
+    assert len(set(consultas.values())) == 1, consultas